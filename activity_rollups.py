@@ -0,0 +1,359 @@
+"""
+Activity Rollups
+Hour-bucketed rollups of user_activity_log maintained by the activity writer.
+
+Three tables keyed by hour bucket ('YYYY-MM-DD HH'):
+    activity_rollup_hourly    event counts per hour by action type
+    activity_rollup_sessions  per session and hour: user, first/last seen, events
+    activity_rollup_pages     per page, action type and hour: event count
+
+The session table is the compact set behind unique users and sessions, session
+durations and hourly concurrency. It holds one row per active session-hour
+instead of one row per request. Daily summaries are derived from these tables
+by index range scans on the hour key rather than DATE(timestamp) scans over the
+log. The tables are created on first use and backfilled from the existing log in
+a single pass within the same transaction.
+"""
+
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from activity_trend_store import sync_trend_store
+
+logger = logging.getLogger(__name__)
+
+# Log rows fetched per round trip during backfill
+BACKFILL_FETCH_SIZE = 5000
+
+# Pages kept in a daily summary's top_pages
+TOP_PAGES_LIMIT = 10
+
+ROLLUP_TABLES = ('activity_rollup_hourly', 'activity_rollup_sessions', 'activity_rollup_pages')
+
+ROLLUP_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS activity_rollup_hourly (
+        hour TEXT PRIMARY KEY,
+        events INTEGER NOT NULL DEFAULT 0,
+        page_views INTEGER NOT NULL DEFAULT 0,
+        api_calls INTEGER NOT NULL DEFAULT 0,
+        file_downloads INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS activity_rollup_sessions (
+        hour TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        first_seen TEXT NOT NULL,
+        last_seen TEXT NOT NULL,
+        events INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, session_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS activity_rollup_pages (
+        hour TEXT NOT NULL,
+        page_url TEXT NOT NULL,
+        action_type TEXT NOT NULL,
+        events INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, page_url, action_type)
+    )
+    '''
+)
+
+
+def normalize_timestamp(timestamp):
+    """Timestamp as 'YYYY-MM-DD HH:MM:SS[.ffffff]' so text order is time order"""
+    if isinstance(timestamp, datetime):
+        return timestamp.isoformat(' ')
+    return str(timestamp).replace('T', ' ', 1)
+
+
+def hour_bucket(timestamp):
+    """Rollup key for a timestamp: 'YYYY-MM-DD HH'"""
+    return normalize_timestamp(timestamp)[:13]
+
+
+def day_bounds(day):
+    """First and last hour keys of a day (date or 'YYYY-MM-DD...' string)"""
+    day = str(day)[:10]
+    return f'{day} 00', f'{day} 23'
+
+
+def _tables_exist(cursor):
+    placeholders = ','.join('?' * len(ROLLUP_TABLES))
+    count = cursor.execute(f'''
+        SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})
+    ''', ROLLUP_TABLES).fetchone()[0]
+    return count == len(ROLLUP_TABLES)
+
+
+def ensure_rollup_tables(cursor):
+    """
+    Create the rollup tables if missing and backfill them from user_activity_log
+    in the same transaction, so concurrent writers never count a row twice.
+    The caller commits. Returns True if the tables were created.
+    """
+    if _tables_exist(cursor):
+        return False
+    if not cursor.connection.in_transaction:
+        cursor.execute('BEGIN IMMEDIATE')
+    if _tables_exist(cursor):
+        return False
+
+    for statement in ROLLUP_SCHEMA:
+        cursor.execute(statement)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollup_sessions_user ON activity_rollup_sessions(hour, user_id)')
+    backfilled = backfill_rollups(cursor)
+    logger.info(f'Created activity rollups, backfilled {backfilled} log records')
+    return True
+
+
+class RollupAccumulator:
+    """Aggregates activity records into rollup deltas before they are written"""
+
+    def __init__(self):
+        self.hourly = defaultdict(lambda: [0, 0, 0, 0])  # hour -> [events, page_views, api_calls, file_downloads]
+        self.sessions = {}  # (hour, session_id) -> [user_id, first_seen, last_seen, events]
+        self.pages = defaultdict(int)  # (hour, page_url, action_type) -> events
+        self.records = 0
+
+    def add(self, session_id, user_id, timestamp, page_url, action_type):
+        """Add one activity record"""
+        seen = normalize_timestamp(timestamp)
+        hour = seen[:13]
+        action_type = action_type or 'page_view'
+
+        counts = self.hourly[hour]
+        counts[0] += 1
+        if action_type == 'page_view':
+            counts[1] += 1
+        elif action_type == 'api_call':
+            counts[2] += 1
+        elif action_type == 'file_download':
+            counts[3] += 1
+
+        session = self.sessions.get((hour, session_id))
+        if session is None:
+            self.sessions[(hour, session_id)] = [user_id, seen, seen, 1]
+        else:
+            session[1] = min(session[1], seen)
+            session[2] = max(session[2], seen)
+            session[3] += 1
+
+        if page_url is not None:
+            self.pages[(hour, page_url, action_type)] += 1
+        self.records += 1
+
+    def write(self, cursor):
+        """Upsert the accumulated deltas into the rollup tables"""
+        cursor.executemany('''
+            INSERT INTO activity_rollup_hourly (hour, events, page_views, api_calls, file_downloads)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(hour) DO UPDATE SET
+                events = events + excluded.events,
+                page_views = page_views + excluded.page_views,
+                api_calls = api_calls + excluded.api_calls,
+                file_downloads = file_downloads + excluded.file_downloads
+        ''', [(hour,) + tuple(counts) for hour, counts in self.hourly.items()])
+
+        cursor.executemany('''
+            INSERT INTO activity_rollup_sessions (hour, session_id, user_id, first_seen, last_seen, events)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(hour, session_id) DO UPDATE SET
+                first_seen = MIN(first_seen, excluded.first_seen),
+                last_seen = MAX(last_seen, excluded.last_seen),
+                events = events + excluded.events
+        ''', [key + tuple(values) for key, values in self.sessions.items()])
+
+        cursor.executemany('''
+            INSERT INTO activity_rollup_pages (hour, page_url, action_type, events)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(hour, page_url, action_type) DO UPDATE SET
+                events = events + excluded.events
+        ''', [key + (events,) for key, events in self.pages.items()])
+
+
+def apply_rollups(cursor, activities):
+    """Fold activity dicts (as queued by ActivityTracker) into the rollups"""
+    accumulator = RollupAccumulator()
+    for activity in activities:
+        accumulator.add(activity['session_id'], activity['user_id'], activity['timestamp'],
+                        activity.get('page_url'), activity.get('action_type'))
+    accumulator.write(cursor)
+
+
+def backfill_rollups(cursor, start=None):
+    """
+    Rebuild rollups from user_activity_log in one pass, for all of it or from
+    the start of the given day. Existing rollups in that range are replaced.
+    Returns the number of log records read.
+    """
+    where = ''
+    params = ()
+    if start is not None:
+        first_hour = day_bounds(start)[0]
+        for table in ROLLUP_TABLES:
+            cursor.execute(f'DELETE FROM {table} WHERE hour >= ?', (first_hour,))
+        where = 'WHERE timestamp >= ?'
+        params = (first_hour[:10],)
+    else:
+        for table in ROLLUP_TABLES:
+            cursor.execute(f'DELETE FROM {table}')
+
+    accumulator = RollupAccumulator()
+    log = cursor.connection.execute(f'''
+        SELECT session_id, user_id, timestamp, page_url, action_type
+        FROM user_activity_log
+        {where}
+    ''', params)
+    while True:
+        rows = log.fetchmany(BACKFILL_FETCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            accumulator.add(*row)
+
+    accumulator.write(cursor)
+    return accumulator.records
+
+
+def prune_rollups(cursor, cutoff):
+    """Delete rollups for hours before cutoff (datetime or timestamp string)"""
+    if not _tables_exist(cursor):
+        return 0
+    cutoff_hour = hour_bucket(cutoff)
+    deleted = 0
+    for table in ROLLUP_TABLES:
+        deleted += cursor.execute(f'DELETE FROM {table} WHERE hour < ?', (cutoff_hour,)).rowcount
+    return deleted
+
+
+def summarize_day(cursor, day):
+    """
+    Daily summary metrics for a day from the rollups, or None if the day had no
+    activity. Keys match the activity_summary_daily columns; top_pages is a list
+    and user_distribution a dict.
+    """
+    first_hour, last_hour = day_bounds(day)
+
+    sessions = cursor.execute('''
+        SELECT
+            COUNT(DISTINCT user_id) as unique_users,
+            COUNT(DISTINCT session_id) as total_sessions
+        FROM activity_rollup_sessions
+        WHERE hour BETWEEN ? AND ?
+    ''', (first_hour, last_hour)).fetchone()
+    if not sessions or not sessions[0]:
+        return None
+
+    counts = cursor.execute('''
+        SELECT SUM(page_views), SUM(api_calls)
+        FROM activity_rollup_hourly
+        WHERE hour BETWEEN ? AND ?
+    ''', (first_hour, last_hour)).fetchone()
+
+    # Session duration from first to last activity of the day; sessions with a single hit are excluded
+    duration = cursor.execute('''
+        SELECT AVG(duration_seconds)
+        FROM (
+            SELECT (julianday(MAX(last_seen)) - julianday(MIN(first_seen))) * 86400 as duration_seconds
+            FROM activity_rollup_sessions
+            WHERE hour BETWEEN ? AND ?
+            GROUP BY session_id
+            HAVING duration_seconds > 0
+        )
+    ''', (first_hour, last_hour)).fetchone()
+
+    # Peak concurrency approximated by distinct users per hour; earliest hour wins ties
+    peak = cursor.execute('''
+        SELECT hour, COUNT(DISTINCT user_id) as users
+        FROM activity_rollup_sessions
+        WHERE hour BETWEEN ? AND ?
+        GROUP BY hour
+        ORDER BY users DESC, hour
+        LIMIT 1
+    ''', (first_hour, last_hour)).fetchone()
+
+    top_pages = cursor.execute('''
+        SELECT page_url, SUM(events) as views
+        FROM activity_rollup_pages
+        WHERE hour BETWEEN ? AND ? AND action_type = 'page_view'
+        GROUP BY page_url
+        ORDER BY views DESC, page_url
+        LIMIT ?
+    ''', (first_hour, last_hour, TOP_PAGES_LIMIT)).fetchall()
+
+    distribution = cursor.execute('''
+        SELECT u.role, COUNT(*) as users
+        FROM (
+            SELECT DISTINCT user_id FROM activity_rollup_sessions WHERE hour BETWEEN ? AND ?
+        ) active
+        JOIN users u ON u.id = active.user_id
+        GROUP BY u.role
+    ''', (first_hour, last_hour)).fetchall()
+
+    return {
+        'unique_users': sessions[0],
+        'total_sessions': sessions[1],
+        'total_page_views': counts[0] or 0,
+        'total_api_calls': counts[1] or 0,
+        'avg_session_duration_seconds': int(round(duration[0])) if duration and duration[0] else 0,
+        'peak_concurrent_users': peak[1] if peak else 0,
+        'peak_hour': int(peak[0][11:13]) if peak else None,
+        'top_pages': [{'page': row[0], 'count': row[1]} for row in top_pages],
+        'user_distribution': {row[0]: row[1] for row in distribution}
+    }
+
+
+def store_daily_summary(cursor, day, summary):
+    """Insert or replace a day's row in activity_summary_daily and refresh its trend rows"""
+    cursor.execute('''
+        INSERT OR REPLACE INTO activity_summary_daily (
+            date, unique_users, total_sessions, total_page_views,
+            total_api_calls, avg_session_duration_seconds,
+            peak_concurrent_users, peak_hour, top_pages, user_distribution
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        str(day)[:10],
+        summary['unique_users'],
+        summary['total_sessions'],
+        summary['total_page_views'],
+        summary['total_api_calls'],
+        summary['avg_session_duration_seconds'],
+        summary['peak_concurrent_users'],
+        summary['peak_hour'],
+        json.dumps(summary['top_pages']),
+        json.dumps(summary['user_distribution'])
+    ))
+    sync_trend_store(cursor, day)
+
+
+def write_daily_summary(cursor, day, replace=True):
+    """
+    Derive a day's summary from the rollups (creating and backfilling them if
+    needed) and store it. Existing summaries are kept when replace is False.
+    Returns the summary, or None if the day had no activity or was skipped.
+    The caller commits.
+    """
+    ensure_rollup_tables(cursor)
+    if not replace and cursor.execute('SELECT 1 FROM activity_summary_daily WHERE date = ?',
+                                      (str(day)[:10],)).fetchone():
+        return None
+    summary = summarize_day(cursor, day)
+    if summary is not None:
+        store_daily_summary(cursor, day, summary)
+    return summary
+
+
+def active_days(cursor, since):
+    """Days with rollup activity on or after the given date, ascending"""
+    return [row[0] for row in cursor.execute('''
+        SELECT DISTINCT substr(hour, 1, 10)
+        FROM activity_rollup_hourly
+        WHERE hour >= ?
+        ORDER BY 1
+    ''', (day_bounds(since)[0],))]
@@ -5,13 +5,15 @@ Provides real-time user activity monitoring with minimal performance impact
 
 import json
 import time
-import sqlite3
 import threading
 import queue
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from flask import g, request, session
 from functools import wraps
 import logging
+import db_pool
+from activity_rollups import ensure_rollup_tables, apply_rollups, prune_rollups, write_daily_summary
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -24,21 +26,46 @@ class ActivityTracker:
         """Initialize activity tracker with Flask app and database path"""
         self.app = app
         self.db_path = db_path
-        self.cache = {}  # In-memory cache for active sessions
+        self.cache = OrderedDict()  # Active sessions, least recently updated first
         self.cache_ttl = 30  # Cache TTL in seconds
         self.max_cache_size = 500  # Maximum cache entries
         self.cache_lock = threading.Lock()
+        self.cache_stats = {
+            'evictions': 0,
+            'expired': 0
+        }
         self.activity_queue = queue.Queue(maxsize=1000)
+        self.alert_queue = queue.Queue(maxsize=100)  # Written batches awaiting alert checks
         self.cleanup_lock = threading.Lock()
         self.is_running = True
         
+        # Writer flushes when a batch is full or its oldest record is this old
+        self.flush_batch_size = 100
+        self.flush_max_latency = 0.5  # seconds
+        self.idle_poll_interval = 1.0  # seconds between idle wakeups for expiry and shutdown
+        self.rollups_ready = False  # Hourly rollup tables known to exist
+        self.writer_stats_lock = threading.Lock()
+        self.writer_stats = {
+            'dropped': 0,
+            'alert_batches_dropped': 0,
+            'batches': 0,
+            'records': 0,
+            'failed_batches': 0,
+            'flushes_by_size': 0,
+            'flushes_by_deadline': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+        
         # Configuration cache
         self.config_cache = {}
         self.config_cache_time = 0
         self.config_cache_ttl = 300  # Refresh config every 5 minutes
         
-        # Start background worker thread
+        # Start background writer and alert threads
         self.worker_thread = None
+        self.alert_thread = None
         self.start_background_worker()
         
         # Start cleanup scheduler
@@ -61,7 +88,7 @@ class ActivityTracker:
         """Refresh configuration cache from database"""
         db = None
         try:
-            db = sqlite3.connect(self.db_path, timeout=10.0)  # Add timeout
+            db = db_pool.connect_readonly(self.db_path)
             cursor = db.cursor()
             
             cursor.execute("SELECT key, value FROM system_config WHERE key LIKE 'activity_%'")
@@ -169,11 +196,7 @@ class ActivityTracker:
         g.activity_start_time = time.time()
         
         # Queue for async processing
-        try:
-            self.activity_queue.put_nowait(activity_data)
-        except queue.Full:
-            # Log error but don't block request
-            logger.warning('Activity queue full, dropping activity record')
+        self.enqueue_activity(activity_data)
         
         # Update cache for real-time dashboard
         self.update_session_cache(session_id, activity_data)
@@ -205,27 +228,27 @@ class ActivityTracker:
                 'device_type': activity_data['device_type'],
                 'updated_at': time.time()
             }
+            self.cache.move_to_end(session_id)
             
-            # Clean up old cache entries
-            self._cleanup_cache()
+            # Evict least recently updated sessions over the size limit
+            while len(self.cache) > self.max_cache_size:
+                self.cache.popitem(last=False)
+                self.cache_stats['evictions'] += 1
     
-    def _cleanup_cache(self):
-        """Remove expired entries from cache and enforce size limits"""
-        now = time.time()
-        expired = [k for k, v in self.cache.items() 
-                  if now - v.get('updated_at', 0) > self.cache_ttl * 2]
-        
-        for key in expired:
-            del self.cache[key]
-        
-        # Enforce max cache size by removing oldest entries
-        if len(self.cache) > self.max_cache_size:
-            # Sort by updated_at and remove oldest
-            sorted_items = sorted(self.cache.items(), key=lambda x: x[1].get('updated_at', 0))
-            excess_count = len(self.cache) - self.max_cache_size
-            for key, _ in sorted_items[:excess_count]:
-                del self.cache[key]
-            logger.warning(f"Cache size limit exceeded, removed {excess_count} old entries")
+    def expire_session_cache(self):
+        """Remove expired entries from cache; runs on the background worker"""
+        cutoff = time.time() - self.cache_ttl * 2
+        expired = 0
+        with self.cache_lock:
+            # Entries are in update order, so expired ones are all at the front
+            while self.cache:
+                session_id, entry = next(iter(self.cache.items()))
+                if entry['updated_at'] > cutoff:
+                    break
+                self.cache.popitem(last=False)
+                expired += 1
+            self.cache_stats['expired'] += expired
+        return expired
     
     def get_active_sessions(self):
         """Get current active sessions from cache and database"""
@@ -235,43 +258,109 @@ class ActivityTracker:
         
         return cached_sessions
     
+    def enqueue_activity(self, activity_data):
+        """Queue an activity for the writer without blocking; returns False if dropped"""
+        try:
+            self.activity_queue.put_nowait(activity_data)
+            return True
+        except queue.Full:
+            # Log error but don't block request
+            with self.writer_stats_lock:
+                self.writer_stats['dropped'] += 1
+            logger.warning('Activity queue full, dropping activity record')
+            return False
+    
+    def get_writer_stats(self):
+        """Return writer queue depth, drop counts and flush latency"""
+        with self.writer_stats_lock:
+            stats = dict(self.writer_stats)
+        stats['queue_depth'] = self.activity_queue.qsize()
+        stats['alert_queue_depth'] = self.alert_queue.qsize()
+        stats['avg_flush_ms'] = round(stats['total_flush_ms'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['total_flush_ms'] = round(stats['total_flush_ms'], 2)
+        return stats
+    
     def start_background_worker(self):
-        """Start background thread to process activity queue"""
-        def worker():
-            """Background worker thread function"""
-            while self.is_running:
+        """Start the activity writer and alert threads"""
+        self.worker_thread = threading.Thread(target=self._writer_loop, daemon=True, name='ActivityWorker')
+        self.worker_thread.start()
+        self.alert_thread = threading.Thread(target=self._alert_loop, daemon=True, name='ActivityAlerts')
+        self.alert_thread.start()
+        logger.info("Activity background worker started")
+    
+    def _collect_batch(self):
+        """
+        Block until an activity arrives, then gather more until the batch is full
+        or flush_max_latency has passed since the first one. Returns (batch, full).
+        """
+        try:
+            batch = [self.activity_queue.get(timeout=self.idle_poll_interval)]
+        except queue.Empty:
+            return [], False
+        
+        deadline = time.monotonic() + self.flush_max_latency
+        while len(batch) < self.flush_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.activity_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch, len(batch) >= self.flush_batch_size
+    
+    def _writer_loop(self):
+        """Writer thread: flush batches on one long-lived connection"""
+        db = db_pool.connect(self.db_path)
+        try:
+            while self.is_running or not self.activity_queue.empty():
                 try:
-                    # Get batch of activities
-                    batch = []
-                    deadline = time.time() + 1  # Process for up to 1 second
-                    
-                    while time.time() < deadline and len(batch) < 100:
-                        try:
-                            activity = self.activity_queue.get(timeout=0.1)
-                            batch.append(activity)
-                        except queue.Empty:
-                            break
-                    
+                    batch, full = self._collect_batch()
                     if batch:
-                        self.process_activity_batch(batch)
+                        with self.writer_stats_lock:
+                            self.writer_stats['flushes_by_size' if full else 'flushes_by_deadline'] += 1
+                        if not self.process_activity_batch(batch, db):
+                            # Start over on a fresh connection in case this one went bad
+                            db.close()
+                            db = db_pool.connect(self.db_path)
+                    
+                    self.expire_session_cache()
                     
                 except Exception as e:
                     logger.error(f'Activity worker error: {e}')
-                
-                time.sleep(0.5)  # Brief pause between batches
-        
-        self.worker_thread = threading.Thread(target=worker, daemon=True, name='ActivityWorker')
-        self.worker_thread.start()
-        logger.info("Activity background worker started")
+        finally:
+            db.close()
     
-    def process_activity_batch(self, batch):
-        """Process a batch of activity records"""
-        db = None
+    def _alert_loop(self):
+        """Alert thread: evaluate alert rules for batches the writer has committed"""
+        db = db_pool.connect(self.db_path)
+        try:
+            while self.is_running:
+                try:
+                    batch = self.alert_queue.get(timeout=self.idle_poll_interval)
+                except queue.Empty:
+                    continue
+                self.check_activity_alerts(batch, db)
+        finally:
+            db.close()
+    
+    def process_activity_batch(self, batch, db=None):
+        """
+        Write a batch of activity records and coalesced session updates in one
+        transaction, then hand the batch to the alert stage. Uses the given
+        connection or a pooled one. Returns True if the batch was committed.
+        """
+        own_connection = db is None
+        start = time.perf_counter()
         try:
-            db = sqlite3.connect(self.db_path, timeout=10.0)  # Add timeout
-            db.execute('PRAGMA journal_mode=WAL')  # Enable WAL mode for better concurrency
+            if own_connection:
+                db = db_pool.connect(self.db_path)
             cursor = db.cursor()
             
+            # Rollups are created and backfilled before this batch's rows are written
+            if not self.rollups_ready:
+                ensure_rollup_tables(cursor)
+            
             # Prepare batch data for insertion
             activity_records = []
             session_updates = {}
@@ -287,18 +376,24 @@ class ActivityTracker:
                     activity['action_type'],
                     activity.get('duration_ms'),
                     activity.get('referrer'),
-                    activity['ip_address'],
-                    activity['user_agent'],
+                    activity.get('ip_address'),
+                    activity.get('user_agent'),
                     json.dumps(activity.get('metadata', {})) if activity.get('metadata') else None
                 ))
                 
-                # Track session updates (keep latest for each session)
-                session_updates[activity['session_id']] = {
-                    'timestamp': activity['timestamp'],
-                    'page_url': activity['page_url'],
-                    'api_endpoint': activity['page_url'] if activity['action_type'] == 'api_call' else None,
-                    'device_type': activity['device_type']
-                }
+                # Coalesce to one update per session: latest page, latest API call, count
+                update = session_updates.setdefault(activity['session_id'], {
+                    'page_url': None,
+                    'api_endpoint': None,
+                    'count': 0
+                })
+                update['timestamp'] = activity['timestamp']
+                update['device_type'] = activity.get('device_type', 'unknown')
+                update['count'] += 1
+                if activity['action_type'] == 'api_call':
+                    update['api_endpoint'] = activity['page_url']
+                else:
+                    update['page_url'] = activity['page_url']
             
             # Insert activity records
             if activity_records:
@@ -308,42 +403,51 @@ class ActivityTracker:
                      duration_ms, referrer, ip_address, user_agent, metadata)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', activity_records)
+                apply_rollups(cursor, batch)
             
             # Update sessions
-            for session_id, updates in session_updates.items():
-                if updates['api_endpoint']:
-                    cursor.execute('''
-                        UPDATE sessions 
-                        SET last_activity = ?, 
-                            last_api_endpoint = ?,
-                            activity_count = activity_count + 1,
-                            device_type = ?
-                        WHERE id = ?
-                    ''', (updates['timestamp'], updates['api_endpoint'], 
-                         updates['device_type'], session_id))
-                else:
-                    cursor.execute('''
-                        UPDATE sessions 
-                        SET last_activity = ?, 
-                            last_page = ?,
-                            activity_count = activity_count + 1,
-                            device_type = ?
-                        WHERE id = ?
-                    ''', (updates['timestamp'], updates['page_url'], 
-                         updates['device_type'], session_id))
+            cursor.executemany('''
+                UPDATE sessions 
+                SET last_activity = ?, 
+                    last_page = COALESCE(?, last_page),
+                    last_api_endpoint = COALESCE(?, last_api_endpoint),
+                    activity_count = activity_count + ?,
+                    device_type = ?
+                WHERE id = ?
+            ''', [(update['timestamp'], update['page_url'], update['api_endpoint'],
+                   update['count'], update['device_type'], session_id)
+                  for session_id, update in session_updates.items()])
             
             db.commit()
-            
-            # Check for alerts after processing
-            self.check_activity_alerts(batch, db)
+            self.rollups_ready = True
             
         except Exception as e:
             if db:
                 db.rollback()
+            with self.writer_stats_lock:
+                self.writer_stats['failed_batches'] += 1
             logger.error(f'Failed to process activity batch: {e}')
+            return False
         finally:
-            if db:
+            if own_connection and db:
                 db.close()
+        
+        flush_ms = (time.perf_counter() - start) * 1000
+        with self.writer_stats_lock:
+            self.writer_stats['batches'] += 1
+            self.writer_stats['records'] += len(batch)
+            self.writer_stats['last_flush_ms'] = round(flush_ms, 2)
+            self.writer_stats['max_flush_ms'] = round(max(self.writer_stats['max_flush_ms'], flush_ms), 2)
+            self.writer_stats['total_flush_ms'] += flush_ms
+        
+        # Check for alerts on the alert thread
+        try:
+            self.alert_queue.put_nowait(batch)
+        except queue.Full:
+            with self.writer_stats_lock:
+                self.writer_stats['alert_batches_dropped'] += 1
+            logger.warning('Activity alert queue full, skipping alert checks for batch')
+        return True
     
     def check_activity_alerts(self, activities, db):
         """Check activities for alert conditions"""
@@ -457,8 +561,7 @@ class ActivityTracker:
         """Remove activity data older than retention period"""
         db = None
         try:
-            db = sqlite3.connect(self.db_path, timeout=30.0)  # Longer timeout for cleanup
-            db.execute('PRAGMA journal_mode=WAL')
+            db = db_pool.connect(self.db_path, timeout=30.0)  # Longer timeout for cleanup
             cursor = db.cursor()
             
             # Get retention settings
@@ -497,6 +600,9 @@ class ActivityTracker:
                 WHERE created_at < ? AND status IN ('resolved', 'dismissed')
             ''', (cutoff_date,))
             
+            # Hourly rollups share the activity log's retention
+            prune_rollups(cursor, cutoff_date)
+            
             db.commit()
             
         except Exception as e:
@@ -511,8 +617,7 @@ class ActivityTracker:
         """Clean up expired sessions"""
         db = None
         try:
-            db = sqlite3.connect(self.db_path, timeout=10.0)
-            db.execute('PRAGMA journal_mode=WAL')
+            db = db_pool.connect(self.db_path)
             cursor = db.cursor()
             
             # Delete expired sessions
@@ -535,75 +640,19 @@ class ActivityTracker:
                 db.close()
     
     def generate_daily_summary(self):
-        """Generate daily activity summary if needed"""
+        """Generate yesterday's activity summary from the hourly rollups if needed"""
         db = None
         try:
-            db = sqlite3.connect(self.db_path, timeout=10.0)
-            db.execute('PRAGMA journal_mode=WAL')
+            db = db_pool.connect(self.db_path)
             cursor = db.cursor()
             
-            # Generate summary for yesterday
-            today = datetime.now().date()
-            yesterday = today - timedelta(days=1)
-            
-            # Check if yesterday's summary already exists
-            cursor.execute('''
-                SELECT id FROM activity_summary_daily 
-                WHERE date = ?
-            ''', (yesterday,))
-            
-            if cursor.fetchone():
-                return  # Summary already exists
-            
-            # Get metrics
-            cursor.execute('''
-                SELECT 
-                    COUNT(DISTINCT user_id) as unique_users,
-                    COUNT(DISTINCT session_id) as total_sessions,
-                    SUM(CASE WHEN action_type = 'page_view' THEN 1 ELSE 0 END) as page_views,
-                    SUM(CASE WHEN action_type = 'api_call' THEN 1 ELSE 0 END) as api_calls
-                FROM user_activity_log
-                WHERE date(timestamp) = ?
-            ''', (yesterday,))
-            
-            metrics = cursor.fetchone()
-            
-            if metrics and metrics[0] > 0:  # Only create summary if there was activity
-                # Get top pages
-                cursor.execute('''
-                    SELECT page_url, COUNT(*) as count
-                    FROM user_activity_log
-                    WHERE date(timestamp) = ? AND action_type = 'page_view'
-                    GROUP BY page_url
-                    ORDER BY count DESC
-                    LIMIT 10
-                ''', (yesterday,))
-                
-                top_pages = [{'url': row[0], 'count': row[1]} for row in cursor.fetchall()]
-                
-                # Get user distribution by role
-                cursor.execute('''
-                    SELECT u.role, COUNT(DISTINCT l.user_id) as count
-                    FROM user_activity_log l
-                    JOIN users u ON l.user_id = u.id
-                    WHERE date(l.timestamp) = ?
-                    GROUP BY u.role
-                ''', (yesterday,))
-                
-                user_dist = {row[0]: row[1] for row in cursor.fetchall()}
-                
-                # Insert summary
-                cursor.execute('''
-                    INSERT INTO activity_summary_daily 
-                    (date, unique_users, total_sessions, total_page_views, 
-                     total_api_calls, top_pages, user_distribution)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (yesterday, metrics[0], metrics[1], metrics[2] or 0, 
-                     metrics[3] or 0, json.dumps(top_pages), json.dumps(user_dist)))
-                
-                db.commit()
+            # Generate summary for yesterday, keeping one that already exists
+            yesterday = datetime.now().date() - timedelta(days=1)
+            if write_daily_summary(cursor, yesterday, replace=False):
                 logger.info(f'Generated daily summary for {yesterday}')
             
+            db.commit()
+            
         except Exception as e:
             logger.error(f'Failed to generate daily summary: {e}')
             if db:
@@ -620,6 +669,8 @@ class ActivityTracker:
         # Wait for threads to finish
         if self.worker_thread:
             self.worker_thread.join(timeout=5)
+        if self.alert_thread:
+            self.alert_thread.join(timeout=5)
         if self.cleanup_thread:
             self.cleanup_thread.join(timeout=5)
         
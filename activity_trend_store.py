@@ -0,0 +1,220 @@
+"""
+Activity Trend Store
+Moving averages and regression prefix sums materialized per activity_summary_daily row.
+
+One row per summary date in activity_trend_daily holding, for each metric:
+    {metric}          the summary value the row was computed from
+    {metric}_avg7     7-day moving average ending on that date
+    {metric}_avg30    30-day moving average ending on that date
+    {metric}_cum_y    running sums over all earlier rows of y, x*y and y*y,
+    {metric}_cum_xy   where x is the row's ordinal in date order
+    {metric}_cum_yy
+
+Averages run over the preceding summary rows regardless of the range being
+read, so a trend read is a single range scan. The prefix sums give the linear
+regression of any contiguous range from its first and last rows. Rows are
+recomputed from the earliest changed date forward when a summary is written;
+readers detect rows whose stored value no longer matches the summary and
+resync them. The date column is declared DATE like activity_summary_daily.date
+so the two share an affinity and the join can use the primary key.
+"""
+
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TREND_METRICS = (
+    'unique_users', 'total_sessions', 'total_page_views',
+    'total_api_calls', 'avg_session_duration_seconds', 'peak_concurrent_users'
+)
+
+# Moving average windows materialized for every metric, in days (rows)
+TREND_WINDOWS = (7, 30)
+
+_CUM_SUFFIXES = ('cum_y', 'cum_xy', 'cum_yy')
+
+
+def _store_columns():
+    """Per-metric column names in table order"""
+    columns = []
+    for metric in TREND_METRICS:
+        columns.append(metric)
+        columns.extend(f'{metric}_avg{window}' for window in TREND_WINDOWS)
+        columns.extend(f'{metric}_{suffix}' for suffix in _CUM_SUFFIXES)
+    return columns
+
+
+STORE_COLUMNS = _store_columns()
+
+TREND_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS activity_trend_daily (date DATE PRIMARY KEY, ordinal INTEGER NOT NULL, '
+    + ', '.join(f'{column} REAL NOT NULL DEFAULT 0' for column in STORE_COLUMNS)
+    + ')'
+)
+
+_SUMMARY_VALUES = ', '.join(f'COALESCE({metric}, 0)' for metric in TREND_METRICS)
+
+
+def ensure_trend_store(cursor):
+    """Create activity_trend_daily if needed"""
+    cursor.execute(TREND_SCHEMA)
+
+
+def trend_store_exists(cursor):
+    """True once activity_trend_daily has been created"""
+    return cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activity_trend_daily'"
+    ).fetchone() is not None
+
+
+def moving_average(values, window):
+    """
+    Trailing mean over up to `window` values ending at each position (NumPy).
+    The first window-1 positions average the values available so far.
+    """
+    values = np.asarray(values, dtype=float)
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def stale_condition(summary_alias='s', store_alias='t'):
+    """SQL predicate true when a summary row has no matching materialized row"""
+    checks = [f'{store_alias}.date IS NULL']
+    checks.extend(f'{store_alias}.{metric} IS NOT COALESCE({summary_alias}.{metric}, 0)' for metric in TREND_METRICS)
+    return '(' + ' OR '.join(checks) + ')'
+
+
+def first_stale_date(cursor):
+    """Earliest summary date missing from or out of date in the store, or None"""
+    row = cursor.execute(f'''
+        SELECT MIN(s.date)
+        FROM activity_summary_daily s
+        LEFT JOIN activity_trend_daily t ON t.date = s.date
+        WHERE {stale_condition()}
+    ''').fetchone()
+    return row[0] if row else None
+
+
+def prune_trend_store(cursor, cutoff):
+    """Delete materialized rows before cutoff; returns rows removed"""
+    if not trend_store_exists(cursor):
+        return 0
+    return cursor.execute('DELETE FROM activity_trend_daily WHERE date < ?', (str(cutoff)[:10],)).rowcount
+
+
+def sync_trend_store(cursor, since=None):
+    """
+    Recompute materialized rows from `since` (a date) forward. With no date,
+    rows for deleted summaries are dropped and the earliest missing or changed
+    date is found first. Returns the number of rows written. The caller commits.
+    """
+    ensure_trend_store(cursor)
+
+    if since is None:
+        orphan = cursor.execute('''
+            SELECT MIN(date) FROM activity_trend_daily
+            WHERE date NOT IN (SELECT date FROM activity_summary_daily)
+        ''').fetchone()[0]
+        if orphan is not None:
+            cursor.execute('DELETE FROM activity_trend_daily WHERE date NOT IN (SELECT date FROM activity_summary_daily)')
+        candidates = [day for day in (first_stale_date(cursor), orphan) if day is not None]
+        if not candidates:
+            return 0
+        since = min(candidates)
+    since = str(since)[:10]
+
+    longest = max(TREND_WINDOWS)
+    context = cursor.execute(f'''
+        SELECT date, {_SUMMARY_VALUES} FROM activity_summary_daily
+        WHERE date < ? ORDER BY date DESC LIMIT ?
+    ''', (since, longest - 1)).fetchall()[::-1]
+    previous = cursor.execute(f'''
+        SELECT date, ordinal, {', '.join(f'{metric}_{suffix}' for metric in TREND_METRICS for suffix in _CUM_SUFFIXES)}
+        FROM activity_trend_daily WHERE date < ? ORDER BY date DESC LIMIT 1
+    ''', (since,)).fetchone()
+
+    if context and (previous is None or previous[0] != context[-1][0]):
+        # Earlier rows were never materialized; rebuild the whole series
+        return sync_trend_store(cursor, cursor.execute('SELECT MIN(date) FROM activity_summary_daily').fetchone()[0])
+    if context:
+        previous = tuple(previous)
+    else:
+        # Nothing precedes since; any earlier rows belong to deleted summaries
+        cursor.execute('DELETE FROM activity_trend_daily WHERE date < ?', (since,))
+        previous = None
+
+    rows = cursor.execute(f'''
+        SELECT date, {_SUMMARY_VALUES} FROM activity_summary_daily
+        WHERE date >= ? ORDER BY date
+    ''', (since,)).fetchall()
+    cursor.execute('DELETE FROM activity_trend_daily WHERE date >= ?', (since,))
+    if not rows:
+        return 0
+
+    offset = len(context)
+    values = np.array([tuple(row)[1:] for row in list(context) + list(rows)], dtype=float)
+    first_ordinal = previous[1] + 1 if previous else 0
+    x = first_ordinal + np.arange(len(rows), dtype=float)
+
+    columns = [[row[0] for row in rows], (first_ordinal + np.arange(len(rows))).tolist()]
+    for index, metric in enumerate(TREND_METRICS):
+        series = values[:, index]
+        y = series[offset:]
+        columns.append(y.tolist())
+        for window in TREND_WINDOWS:
+            columns.append(moving_average(series, window)[offset:].tolist())
+        base = previous[2 + index * 3: 5 + index * 3] if previous else (0.0, 0.0, 0.0)
+        columns.append((base[0] + np.cumsum(y)).tolist())
+        columns.append((base[1] + np.cumsum(x * y)).tolist())
+        columns.append((base[2] + np.cumsum(y * y)).tolist())
+
+    placeholders = ', '.join('?' * (len(STORE_COLUMNS) + 2))
+    cursor.executemany(
+        f"INSERT INTO activity_trend_daily (date, ordinal, {', '.join(STORE_COLUMNS)}) VALUES ({placeholders})",
+        zip(*columns)
+    )
+    return len(rows)
+
+
+def range_regression(first, last, metric):
+    """
+    Least-squares fit of a metric over a contiguous range of materialized rows,
+    with x counted from 0 at the first row, from the range's first and last rows
+    (mappings with ordinal, the metric value and its prefix sums).
+    Returns None if the range has fewer than two rows.
+    """
+    n = last['ordinal'] - first['ordinal'] + 1
+    if n < 2:
+        return None
+
+    y0 = first[metric]
+    x0 = first['ordinal']
+    sum_y = last[f'{metric}_cum_y'] - first[f'{metric}_cum_y'] + y0
+    sum_xy = last[f'{metric}_cum_xy'] - first[f'{metric}_cum_xy'] + x0 * y0 - x0 * sum_y
+    sum_yy = last[f'{metric}_cum_yy'] - first[f'{metric}_cum_yy'] + y0 * y0
+    sum_x = n * (n - 1) / 2
+    sum_xx = (n - 1) * n * (2 * n - 1) / 6
+
+    cov_xx = sum_xx - sum_x * sum_x / n
+    cov_xy = sum_xy - sum_x * sum_y / n
+    cov_yy = max(sum_yy - sum_y * sum_y / n, 0.0)
+
+    slope = cov_xy / cov_xx
+    intercept = (sum_y - slope * sum_x) / n
+    # Rounding in the prefix sums can leave a tiny residual for a flat series
+    r_value = cov_xy / math.sqrt(cov_xx * cov_yy) if cov_yy > 1e-9 * max(sum_yy, 1.0) else 0.0
+    r_value = max(-1.0, min(1.0, r_value))
+
+    return {
+        'n': n,
+        'mean': sum_y / n,
+        'slope': slope,
+        'intercept': intercept,
+        'r_value': r_value,
+        'r_squared': r_value * r_value
+    }
@@ -319,6 +319,40 @@ def ensure_initialized():
     return True
 
 
+def build_trends_response(start_date: date, end_date: date, metrics: list) -> dict:
+    """
+    Build the cached trends payload: daily data, summary and trend analysis
+    
+    Args:
+        start_date: Start date
+        end_date: End date
+        metrics: Metrics to include
+    
+    Returns:
+        Response data dictionary
+    """
+    trends_data, regression = trends_service.get_trends_with_regression(start_date, end_date, metrics)
+    summary = trends_service.calculate_summary(trends_data, regression)
+    
+    trend_analyzer = TrendAnalyzer()
+    for metric in metrics:
+        if metric in trends_data and trends_data[metric]:
+            trend_analysis = trend_analyzer.calculate_trend(trends_data[metric], regression=regression.get(metric))
+            if metric in summary:
+                summary[metric]['trend_analysis'] = trend_analysis
+    
+    return {
+        'period': {
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'days': (end_date - start_date).days + 1
+        },
+        'metrics': trends_data,
+        'summary': summary,
+        'generated_at': datetime.now().isoformat()
+    }
+
+
 @activity_trends_bp.route('/api/admin/activity/trends', methods=['GET'])
 def get_activity_trends():
     """
@@ -393,57 +427,36 @@ def get_activity_trends():
             params['metrics']
         )
         
-        # Step 4: Check cache unless bypass requested
-        if not params.get('cache_bypass', False):
-            cached_data = trends_cache.get(cache_key)
-            if cached_data:
-                # Record cache hit performance
-                if performance_monitor:
-                    elapsed_ms = (time.time() - start_time) * 1000
-                    performance_monitor.record_metric('trends_api', elapsed_ms)
-                    performance_monitor.record_metric('cache_hit', elapsed_ms)
-                
-                return jsonify({
-                    'success': True,
-                    'data': cached_data,
-                    'cached': True,
-                    'cache_ttl': trends_cache.get_ttl(cache_key)
-                }), 200
-        
-        # Step 5: Query database for trend data
-        trends_data = trends_service.get_trends(
-            params['start_date'],
-            params['end_date'],
-            params['metrics']
-        )
-        
-        # Step 6: Calculate summary statistics
-        summary = trends_service.calculate_summary(trends_data)
-        
-        # Step 7: Add trend analysis
-        trend_analyzer = TrendAnalyzer()
-        for metric in params['metrics']:
-            if metric in trends_data and trends_data[metric]:
-                trend_analysis = trend_analyzer.calculate_trend(trends_data[metric])
-                if metric in summary:
-                    summary[metric]['trend_analysis'] = trend_analysis
-        
-        # Step 8: Format response
-        response_data = {
-            'period': {
-                'start': params['start_date'].isoformat(),
-                'end': params['end_date'].isoformat(),
-                'days': (params['end_date'] - params['start_date']).days + 1
-            },
-            'metrics': trends_data,
-            'summary': summary,
-            'generated_at': datetime.now().isoformat()
-        }
+        # Step 4: Serve from cache; concurrent misses for the same key share one load
+        def load_response():
+            return build_trends_response(
+                params['start_date'],
+                params['end_date'],
+                params['metrics']
+            )
         
-        # Step 9: Update cache
-        trends_cache.set(cache_key, response_data)
+        if params.get('cache_bypass', False):
+            response_data = load_response()
+            trends_cache.set(cache_key, response_data)
+            source = 'loaded'
+        else:
+            response_data, source = trends_cache.get_or_load(cache_key, load_response)
+        
+        if source != 'loaded':
+            # Record cache hit performance
+            if performance_monitor:
+                elapsed_ms = (time.time() - start_time) * 1000
+                performance_monitor.record_metric('trends_api', elapsed_ms)
+                performance_monitor.record_metric('cache_hit', elapsed_ms)
+            
+            return jsonify({
+                'success': True,
+                'data': response_data,
+                'cached': True,
+                'cache_ttl': trends_cache.get_ttl(cache_key)
+            }), 200
         
-        # Step 10: Log activity
+        # Step 5: Log activity
         log_audit_event(
             g.user['id'],
             'VIEW_ACTIVITY_TRENDS',
@@ -786,7 +799,7 @@ def init_trends_module(app, database_path: str):
         logger.info(f"Processed {processed} missing daily summaries")
     
     # Warm cache on startup
-    cache_warmer = CacheWarmer(trends_cache, trends_service)
+    cache_warmer = CacheWarmer(trends_cache, trends_service, loader=build_trends_response)
     
     # Run cache warming in background to not block startup
     import threading
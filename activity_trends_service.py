@@ -12,9 +12,18 @@ import numpy as np
 from scipy import stats
 from collections import defaultdict
 import logging
+import db_pool
+from activity_rollups import ensure_rollup_tables, active_days, write_daily_summary
+from activity_trend_store import (
+    TREND_METRICS, moving_average, range_regression, stale_condition,
+    sync_trend_store, trend_store_exists
+)
 
 logger = logging.getLogger(__name__)
 
+# Metrics whose 30-day average is included in trend responses
+LONG_AVG_METRICS = ('unique_users', 'total_sessions')
+
 
 class ActivityTrendsService:
     """
@@ -25,77 +34,154 @@ class ActivityTrendsService:
         self.db_path = db_path
     
     def _get_connection(self) -> sqlite3.Connection:
-        """Get a database connection - always create new for thread safety"""
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        """Get a read-only connection from the calling thread's pool"""
+        conn = db_pool.connect_readonly(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
     
     def _return_connection(self, conn: sqlite3.Connection):
-        """Close connection - no pooling for SQLite due to thread safety"""
+        """Return connection to the pool"""
         conn.close()
     
-    def get_trends(self, start_date: date, end_date: date, metrics: List[str]) -> Dict[str, List[Dict]]:
+    def _metric_columns(self, metrics: List[str]) -> List[str]:
+        """Requested metrics that are summary columns, or the default set"""
+        metric_columns = [metric for metric in metrics if metric in TREND_METRICS]
+        return metric_columns or ['unique_users', 'total_sessions', 'total_page_views']
+    
+    def _sync_trend_store(self):
+        """Materialize missing or changed trend rows through the writer pool"""
+        conn = db_pool.connect(self.db_path)
+        try:
+            written = sync_trend_store(conn.cursor())
+            conn.commit()
+            if written:
+                logger.info(f"Materialized {written} trend rows")
+        except sqlite3.Error as e:
+            logger.warning(f"Could not refresh trend store: {e}")
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _store_rows_current(rows: List[sqlite3.Row]) -> bool:
+        """True if every row is materialized and up to date with consecutive ordinals"""
+        if any(row['stale'] for row in rows):
+            return False
+        return not rows or rows[-1]['ordinal'] - rows[0]['ordinal'] + 1 == len(rows)
+    
+    def get_trends(self, start_date: date, end_date: date, metrics: List[str],
+                   windows: Optional[List[int]] = None) -> Dict[str, List[Dict]]:
         """
-        Optimized query for trend data retrieval with moving averages
+        Trend data with moving averages read from the materialized trend store
         
         Args:
             start_date: Start date for trend data
             end_date: End date for trend data
             metrics: List of metrics to retrieve
+            windows: Extra moving average windows (days) computed with NumPy
         
         Returns:
             Dictionary with metric names as keys and trend data as values
         """
-        # Build dynamic column selection based on requested metrics
-        metric_columns = []
-        for metric in metrics:
-            if metric in ['unique_users', 'total_sessions', 'total_page_views', 
-                         'total_api_calls', 'avg_session_duration_seconds', 'peak_concurrent_users']:
-                metric_columns.append(metric)
+        return self.get_trends_with_regression(start_date, end_date, metrics, windows)[0]
+    
+    def get_trends_with_regression(self, start_date: date, end_date: date, metrics: List[str],
+                                   windows: Optional[List[int]] = None) -> Tuple[Dict[str, List[Dict]], Dict[str, Dict]]:
+        """
+        Trend data plus each metric's linear regression over the range
         
-        if not metric_columns:
-            metric_columns = ['unique_users', 'total_sessions', 'total_page_views']
+        The 7-day and 30-day averages and the regression prefix sums are
+        precomputed per day, so this is a single indexed range read. Rows
+        missing from the store or out of date with their summary are
+        materialized first.
         
-        columns_str = ', '.join(metric_columns)
+        Args:
+            start_date: Start date for trend data
+            end_date: End date for trend data
+            metrics: List of metrics to retrieve
+            windows: Extra moving average windows (days) computed with NumPy
+        
+        Returns:
+            Tuple of (trend data, regression by metric)
+        """
+        metric_columns = self._metric_columns(metrics)
+        
+        select = ['s.date', 't.ordinal', f"{stale_condition()} as stale"]
+        for metric in metric_columns:
+            select.append(f's.{metric}')
+            select.append(f't.{metric}_avg7 as {metric}_7day_avg')
+            if metric in LONG_AVG_METRICS:
+                select.append(f't.{metric}_avg30 as {metric}_30day_avg')
+            select.extend(f't.{metric}_{suffix}' for suffix in ('cum_y', 'cum_xy', 'cum_yy'))
         
         query = f"""
-        WITH date_range AS (
-            SELECT 
-                date,
-                {columns_str}
-            FROM activity_summary_daily
-            WHERE date BETWEEN ? AND ?
-            ORDER BY date ASC
-        ),
-        moving_averages AS (
-            SELECT 
-                date,
-                {', '.join(metric_columns)},
-                -- 7-day moving averages for trend calculation
-                {', '.join([f'''AVG({metric}) OVER (
-                    ORDER BY date 
-                    ROWS BETWEEN 6 PRECEDING AND CURRENT ROW
-                ) as {metric}_7day_avg''' for metric in metric_columns])},
-                -- 30-day moving averages for long-term trends
-                {', '.join([f'''AVG({metric}) OVER (
-                    ORDER BY date 
-                    ROWS BETWEEN 29 PRECEDING AND CURRENT ROW
-                ) as {metric}_30day_avg''' for metric in metric_columns if metric in ['unique_users', 'total_sessions']])}
-            FROM date_range
-        )
-        SELECT * FROM moving_averages
+        SELECT {', '.join(select)}
+        FROM activity_summary_daily s
+        LEFT JOIN activity_trend_daily t ON t.date = s.date
+        WHERE s.date BETWEEN ? AND ?
+        ORDER BY s.date ASC
         """
         
+        rows = []
+        for attempt in range(2):
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                if trend_store_exists(cursor):
+                    rows = cursor.execute(query, (start_date.isoformat(), end_date.isoformat())).fetchall()
+                    if self._store_rows_current(rows):
+                        break
+            finally:
+                self._return_connection(conn)
+            
+            if attempt == 0:
+                self._sync_trend_store()
+        
+        trends = self._format_trend_data(rows, metrics)
+        
+        regression = {}
+        if rows and self._store_rows_current(rows):
+            for metric in metric_columns:
+                fit = range_regression(rows[0], rows[-1], metric)
+                if fit:
+                    regression[metric] = fit
+        
+        for window in windows or []:
+            self._add_window_average(trends, start_date, end_date, metric_columns, window)
+        
+        return trends, regression
+    
+    def _add_window_average(self, trends: Dict[str, List[Dict]], start_date: date, end_date: date,
+                            metric_columns: List[str], window: int):
+        """
+        Add a '{window}day_avg' to each data point, computed with NumPy over the
+        range plus the window-1 summary rows preceding it
+        """
+        columns_str = ', '.join(f'COALESCE({metric}, 0)' for metric in metric_columns)
         conn = self._get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute(query, (start_date.isoformat(), end_date.isoformat()))
-            
-            rows = cursor.fetchall()
-            return self._format_trend_data(rows, metrics)
-            
+            preceding = cursor.execute(f"""
+                SELECT date, {columns_str} FROM activity_summary_daily
+                WHERE date < ? ORDER BY date DESC LIMIT ?
+            """, (start_date.isoformat(), max(window - 1, 0))).fetchall()
+            in_range = cursor.execute(f"""
+                SELECT date, {columns_str} FROM activity_summary_daily
+                WHERE date BETWEEN ? AND ? ORDER BY date ASC
+            """, (start_date.isoformat(), end_date.isoformat())).fetchall()
         finally:
             self._return_connection(conn)
+        
+        if not in_range:
+            return
+        
+        rows = list(reversed(preceding)) + in_range
+        values = np.array([tuple(row)[1:] for row in rows], dtype=float)
+        for index, metric in enumerate(metric_columns):
+            if metric not in trends:
+                continue
+            averages = moving_average(values[:, index], window)[len(preceding):]
+            for data_point, average in zip(trends[metric], averages):
+                data_point[f'{window}day_avg'] = round(float(average), 2)
     
     def get_trends_raw(self, start_date: date, end_date: date, metrics: List[str]) -> Dict[str, Dict]:
         """
@@ -109,15 +195,7 @@ class ActivityTrendsService:
         Returns:
             Dictionary with dates as keys and metric values as nested dict
         """
-        metric_columns = []
-        for metric in metrics:
-            if metric in ['unique_users', 'total_sessions', 'total_page_views', 
-                         'total_api_calls', 'avg_session_duration_seconds', 'peak_concurrent_users']:
-                metric_columns.append(metric)
-        
-        if not metric_columns:
-            metric_columns = ['unique_users', 'total_sessions', 'total_page_views']
-        
+        metric_columns = self._metric_columns(metrics)
         columns_str = ', '.join(metric_columns)
         
         query = f"""
@@ -156,63 +234,80 @@ class ActivityTrendsService:
             Formatted trend data
         """
         result = {metric: [] for metric in metrics}
+        if not rows:
+            return result
+        
+        # Resolve which columns are present once rather than per row
+        columns = set(rows[0].keys())
+        present = [
+            (metric,
+             f'{metric}_7day_avg' if f'{metric}_7day_avg' in columns else None,
+             f'{metric}_30day_avg' if f'{metric}_30day_avg' in columns else None)
+            for metric in metrics if metric in columns
+        ]
         
         for row in rows:
             date_str = row['date']
-            for metric in metrics:
-                if metric in dict(row):
-                    data_point = {
-                        'date': date_str,
-                        'value': row[metric] or 0
-                    }
-                    
-                    # Add moving averages if available
-                    if f'{metric}_7day_avg' in dict(row):
-                        data_point['7day_avg'] = round(row[f'{metric}_7day_avg'] or 0, 2)
-                    if f'{metric}_30day_avg' in dict(row):
-                        data_point['30day_avg'] = round(row[f'{metric}_30day_avg'] or 0, 2)
-                    
-                    result[metric].append(data_point)
+            for metric, avg_7day, avg_30day in present:
+                data_point = {
+                    'date': date_str,
+                    'value': row[metric] or 0
+                }
+                
+                # Add moving averages if available
+                if avg_7day:
+                    data_point['7day_avg'] = round(row[avg_7day] or 0, 2)
+                if avg_30day:
+                    data_point['30day_avg'] = round(row[avg_30day] or 0, 2)
+                
+                result[metric].append(data_point)
         
         return result
     
-    def calculate_summary(self, trends_data: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+    def calculate_summary(self, trends_data: Dict[str, List[Dict]],
+                          regression: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
         """
         Calculate summary statistics and trend indicators
         
         Args:
             trends_data: Trend data from get_trends
+            regression: Precomputed fits by metric from get_trends_with_regression;
+                metrics without one are fitted here
         
         Returns:
             Summary statistics for each metric
         """
         summary = {}
+        regression = regression or {}
         
         for metric, data_points in trends_data.items():
             if not data_points:
                 continue
             
-            values = [p['value'] for p in data_points]
-            dates = [p['date'] for p in data_points]
+            values = np.fromiter((p['value'] for p in data_points), dtype=float, count=len(data_points))
+            peak_index = int(np.argmax(values))
             
             # Basic statistics
             summary[metric] = {
-                'average': round(np.mean(values), 2),
-                'median': round(np.median(values), 2),
-                'std_dev': round(np.std(values), 2),
-                'min': min(values),
-                'max': max(values),
-                'peak_date': dates[values.index(max(values))],
-                'total': sum(values)
+                'average': round(float(values.mean()), 2),
+                'median': round(float(np.median(values)), 2),
+                'std_dev': round(float(values.std()), 2),
+                'min': data_points[int(np.argmin(values))]['value'],
+                'max': data_points[peak_index]['value'],
+                'peak_date': data_points[peak_index]['date'],
+                'total': sum(p['value'] for p in data_points)
             }
             
             # Trend calculation using linear regression
             if len(values) >= 7:
-                x = np.arange(len(values))
-                slope, intercept, r_value, p_value, std_err = stats.linregress(x, values)
+                fit = regression.get(metric)
+                if fit and fit['n'] == len(values):
+                    slope, r_value = fit['slope'], fit['r_value']
+                else:
+                    slope, intercept, r_value, p_value, std_err = stats.linregress(np.arange(len(values)), values)
                 
                 # Determine trend direction
-                mean_val = np.mean(values)
+                mean_val = values.mean()
                 if mean_val > 0:
                     relative_slope = abs(slope) / mean_val
                 else:
@@ -233,9 +328,9 @@ class ActivityTrendsService:
                 
                 summary[metric].update({
                     'trend': trend,
-                    'trend_slope': round(slope, 3),
-                    'trend_confidence': round(abs(r_value), 3),  # R-squared value
-                    'percentage_change': round(pct_change, 2)
+                    'trend_slope': round(float(slope), 3),
+                    'trend_confidence': round(abs(float(r_value)), 3),  # R-squared value
+                    'percentage_change': round(float(pct_change), 2)
                 })
         
         return summary
@@ -246,13 +341,15 @@ class TrendAnalyzer:
     Advanced trend analysis for activity data
     """
     
-    def calculate_trend(self, data_points: List[Dict], confidence_threshold: float = 0.7) -> Dict:
+    def calculate_trend(self, data_points: List[Dict], confidence_threshold: float = 0.7,
+                        regression: Optional[Dict] = None) -> Dict:
         """
         Calculate trend direction and strength with forecast
         
         Args:
             data_points: List of data points with 'value' key
             confidence_threshold: Minimum R-squared for confident trend
+            regression: Precomputed fit for these points (skips the fit)
         
         Returns:
             Trend analysis with direction, strength, confidence, and forecast
@@ -267,21 +364,22 @@ class TrendAnalyzer:
             }
         
         # Extract values and prepare for regression
-        values = np.array([p['value'] for p in data_points])
-        x = np.arange(len(values)).reshape(-1, 1)
+        values = np.fromiter((p['value'] for p in data_points), dtype=float, count=len(data_points))
         
-        # Simple linear regression (scikit-learn not available, using numpy)
-        # Calculate slope and intercept manually
-        x_flat = x.flatten()
-        slope, intercept = np.polyfit(x_flat, values, 1)
-        
-        # Calculate predictions
-        predictions = slope * x_flat + intercept
-        
-        # Calculate R-squared
-        ss_res = np.sum((values - predictions) ** 2)
-        ss_tot = np.sum((values - np.mean(values)) ** 2)
-        r_squared = 1 - (ss_res / ss_tot) if ss_tot > 0 else 0
+        if regression and regression['n'] == len(values):
+            slope, intercept, r_squared = regression['slope'], regression['intercept'], regression['r_squared']
+        else:
+            # Simple linear regression (scikit-learn not available, using numpy)
+            x_flat = np.arange(len(values))
+            slope, intercept = np.polyfit(x_flat, values, 1)
+            
+            # Calculate predictions
+            predictions = slope * x_flat + intercept
+            
+            # Calculate R-squared
+            ss_res = np.sum((values - predictions) ** 2)
+            ss_tot = np.sum((values - np.mean(values)) ** 2)
+            r_squared = 1 - (ss_res / ss_tot) if ss_tot > 0 else 0
         
         # Normalize slope relative to mean
         mean_value = np.mean(values)
@@ -334,37 +432,26 @@ class DailySummaryProcessor:
     
     def process_missing_days(self) -> int:
         """
-        Find and process any missing daily summaries
+        Find and process any missing daily summaries from the last 365 days
         
         Returns:
             Number of days processed
         """
-        query = """
-        WITH all_dates AS (
-            SELECT DISTINCT DATE(timestamp) as activity_date
-            FROM user_activity_log
-            WHERE timestamp >= date('now', '-365 days')
-        ),
-        existing_summaries AS (
-            SELECT date
-            FROM activity_summary_daily
-            WHERE date >= date('now', '-365 days')
-        )
-        SELECT activity_date
-        FROM all_dates
-        WHERE activity_date NOT IN (SELECT date FROM existing_summaries)
-        ORDER BY activity_date
-        """
-        
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        since = (date.today() - timedelta(days=365)).isoformat()
+        conn = db_pool.connect(self.db_path)
         processed_count = 0
         
         try:
             cursor = conn.cursor()
-            cursor.execute(query)
-            missing_dates = cursor.fetchall()
+            ensure_rollup_tables(cursor)
+            conn.commit()
             
-            for (date_val,) in missing_dates:
+            existing = {row[0] for row in cursor.execute(
+                "SELECT date FROM activity_summary_daily WHERE date >= ?", (since,)
+            )}
+            missing_dates = [day for day in active_days(cursor, since) if day not in existing]
+            
+            for date_val in missing_dates:
                 if self.generate_summary_for_date(date_val):
                     processed_count += 1
                     logger.info(f"Generated missing summary for {date_val}")
@@ -376,7 +463,7 @@ class DailySummaryProcessor:
     
     def generate_summary_for_date(self, target_date: str) -> bool:
         """
-        Generate summary for a specific date
+        Generate summary for a specific date from the hourly rollups
         
         Args:
             target_date: Date string in YYYY-MM-DD format
@@ -384,125 +471,11 @@ class DailySummaryProcessor:
         Returns:
             True if summary was generated, False otherwise
         """
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn = db_pool.connect(self.db_path)
         try:
-            cursor = conn.cursor()
-            
-            # Main metrics from user_activity_log
-            metrics_query = """
-            SELECT 
-                COUNT(DISTINCT user_id) as unique_users,
-                COUNT(DISTINCT session_id) as total_sessions,
-                SUM(CASE WHEN page_url IS NOT NULL THEN 1 ELSE 0 END) as total_page_views,
-                SUM(CASE WHEN action_type = 'api_call' THEN 1 ELSE 0 END) as total_api_calls
-            FROM user_activity_log
-            WHERE DATE(timestamp) = ?
-            """
-            
-            cursor.execute(metrics_query, (target_date,))
-            metrics = cursor.fetchone()
-            
-            if not metrics or metrics[0] == 0:  # No activity for this date
-                return False
-            
-            # Session duration (approximate from activity timestamps)
-            duration_query = """
-            SELECT AVG(duration_seconds) as avg_duration
-            FROM (
-                SELECT 
-                    session_id,
-                    (julianday(MAX(timestamp)) - julianday(MIN(timestamp))) * 86400 as duration_seconds
-                FROM user_activity_log
-                WHERE DATE(timestamp) = ?
-                GROUP BY session_id
-                HAVING duration_seconds > 0
-            )
-            """
-            
-            cursor.execute(duration_query, (target_date,))
-            duration_result = cursor.fetchone()
-            avg_duration = int(duration_result[0]) if duration_result and duration_result[0] else 0
-            
-            # Peak concurrent users (approximate by hour)
-            concurrent_query = """
-            WITH time_slots AS (
-                SELECT 
-                    strftime('%H', timestamp) as hour_slot,
-                    COUNT(DISTINCT user_id) as concurrent_users
-                FROM user_activity_log
-                WHERE DATE(timestamp) = ?
-                GROUP BY hour_slot
-            )
-            SELECT 
-                MAX(concurrent_users) as peak_concurrent,
-                hour_slot as peak_hour
-            FROM time_slots
-            """
-            
-            cursor.execute(concurrent_query, (target_date,))
-            concurrent_result = cursor.fetchone()
-            
-            # Top pages
-            top_pages_query = """
-            SELECT json_group_array(
-                json_object('page', page_url, 'count', page_count)
-            ) as top_pages
-            FROM (
-                SELECT page_url, COUNT(*) as page_count
-                FROM user_activity_log
-                WHERE DATE(timestamp) = ? AND page_url IS NOT NULL
-                GROUP BY page_url
-                ORDER BY page_count DESC
-                LIMIT 10
-            )
-            """
-            
-            cursor.execute(top_pages_query, (target_date,))
-            top_pages_result = cursor.fetchone()
-            
-            # User distribution by role
-            distribution_query = """
-            SELECT json_object(
-                'admin', SUM(CASE WHEN role = 'admin' THEN 1 ELSE 0 END),
-                'manager', SUM(CASE WHEN role = 'manager' THEN 1 ELSE 0 END),
-                'driver', SUM(CASE WHEN role = 'driver' THEN 1 ELSE 0 END),
-                'viewer', SUM(CASE WHEN role = 'viewer' THEN 1 ELSE 0 END)
-            ) as user_distribution
-            FROM (
-                SELECT DISTINCT al.user_id, u.role
-                FROM user_activity_log al
-                JOIN users u ON al.user_id = u.id
-                WHERE DATE(al.timestamp) = ?
-            )
-            """
-            
-            cursor.execute(distribution_query, (target_date,))
-            distribution_result = cursor.fetchone()
-            
-            # Insert summary
-            insert_query = """
-            INSERT OR REPLACE INTO activity_summary_daily (
-                date, unique_users, total_sessions, total_page_views,
-                total_api_calls, avg_session_duration_seconds,
-                peak_concurrent_users, peak_hour, top_pages, user_distribution
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            
-            cursor.execute(insert_query, (
-                target_date,
-                metrics[0],  # unique_users
-                metrics[1],  # total_sessions
-                metrics[2],  # total_page_views
-                metrics[3],  # total_api_calls
-                avg_duration,
-                concurrent_result[0] if concurrent_result else 0,
-                int(concurrent_result[1]) if concurrent_result and concurrent_result[1] else None,
-                top_pages_result[0] if top_pages_result else '[]',
-                distribution_result[0] if distribution_result else '{}'
-            ))
-            
+            summary = write_daily_summary(conn.cursor(), target_date)
             conn.commit()
-            return True
+            return summary is not None
             
         except Exception as e:
             logger.error(f"Error generating summary for {target_date}: {e}")
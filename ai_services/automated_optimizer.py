@@ -4,7 +4,7 @@ Provides AI-driven recommendations considering multiple business objectives
 """
 
 import json
-import sqlite3
+import db_pool
 import numpy as np
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timedelta
@@ -61,7 +61,7 @@ class MultiObjectiveOptimizer:
     
     def _analyze_current_state(self, device_id: int, cabinet_index: int) -> Dict:
         """Analyze current planogram state across all objectives"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         planogram_key = f"{device_id}_{cabinet_index}"
@@ -151,7 +151,7 @@ class MultiObjectiveOptimizer:
     
     def _get_constraints(self, device_id: int, cabinet_index: int) -> Dict:
         """Get physical and business constraints"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         # Get cabinet configuration
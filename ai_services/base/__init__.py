@@ -1,6 +1,10 @@
 """Base AI services components"""
 
 from .client import AIClient
+from .dispatcher import RequestDispatcher, AnthropicTransport, PRIORITY_INTERACTIVE, PRIORITY_BATCH
 from .exceptions import AIServiceError, RateLimitError, TokenLimitError
 
-__all__ = ["AIClient", "AIServiceError", "RateLimitError", "TokenLimitError"]
\ No newline at end of file
+__all__ = [
+    "AIClient", "RequestDispatcher", "AnthropicTransport", "PRIORITY_INTERACTIVE", "PRIORITY_BATCH",
+    "AIServiceError", "RateLimitError", "TokenLimitError"
+]
\ No newline at end of file
@@ -12,6 +12,7 @@ import anthropic
 from anthropic import Anthropic, RateLimitError as AnthropicRateLimitError
 
 from .exceptions import AIServiceError, RateLimitError, TokenLimitError
+from .dispatcher import RequestDispatcher, PRIORITY_INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
@@ -55,16 +56,22 @@ class AIClient:
     DEFAULT_MODEL = "claude-3-haiku-20240307"  # Fast, cost-effective for real-time scoring
     ADVANCED_MODEL = "claude-3-opus-20240229"  # More capable for complex analysis
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, dispatcher: Optional[RequestDispatcher] = None):
         """
         Initialize the AI client
         
         Args:
             api_key: Optional API key (defaults to environment variable)
+            dispatcher: Optional shared dispatcher; completions then go through
+                its queue, concurrency limit and request coalescing
         """
         self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
+        self.dispatcher = dispatcher
         
-        if not self.api_key:
+        if dispatcher is not None:
+            self.client = None
+            self.fallback_mode = False
+        elif not self.api_key:
             logger.warning("No API key provided. AI features will use fallback mode.")
             self.client = None
             self.fallback_mode = True
@@ -102,7 +109,8 @@ class AIClient:
             model: Model to use (defaults to fast model)
             max_tokens: Maximum tokens in response
             temperature: Sampling temperature (0-1)
-            **kwargs: Additional parameters for the API
+            **kwargs: Additional parameters for the API; with a dispatcher,
+                priority and timeout are also accepted
         
         Returns:
             Dictionary with response and metadata
@@ -112,6 +120,24 @@ class AIClient:
         
         model = model or self.DEFAULT_MODEL
         
+        if self.dispatcher is not None:
+            priority = kwargs.pop("priority", PRIORITY_INTERACTIVE)
+            timeout = kwargs.pop("timeout", None)
+            result = self.dispatcher.complete(
+                prompt=prompt,
+                system=system_prompt,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                priority=priority,
+                timeout=timeout,
+                **kwargs
+            )
+            self.total_input_tokens += result["input_tokens"]
+            self.total_output_tokens += result["output_tokens"]
+            self.request_count += 1
+            return result
+        
         try:
             messages = [{"role": "user", "content": prompt}]
             
@@ -0,0 +1,336 @@
+"""
+Request dispatcher for Claude API calls
+
+Queues completion requests behind a fixed pool of worker threads so at most
+max_concurrency calls are in flight, serves interactive requests before batch
+work, and coalesces identical in-flight requests into one API call.
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import itertools
+from queue import PriorityQueue
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, Callable, List
+
+from .exceptions import AIServiceError, RateLimitError
+from .metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Lower values are dispatched first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+DEFAULT_MODEL = "claude-3-haiku-20240307"
+
+
+class AnthropicTransport:
+    """
+    Sends one request through the Anthropic SDK
+    
+    A base_url points the SDK at a local stand-in server for testing.
+    """
+    
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, client=None):
+        """
+        Args:
+            api_key: Anthropic API key
+            base_url: Optional API base URL override
+            client: Existing Anthropic client to reuse
+        """
+        if client is None:
+            import anthropic
+            options = {"api_key": api_key}
+            if base_url:
+                options["base_url"] = base_url
+            client = anthropic.Anthropic(**options)
+        self.client = client
+    
+    def __call__(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a request and normalize the response
+        
+        Args:
+            request: model, messages, max_tokens and optional system,
+                temperature and params
+        
+        Returns:
+            Dictionary with content, model, token counts and stop reason
+        """
+        import anthropic
+        
+        options = {
+            "model": request["model"],
+            "messages": request["messages"],
+            "max_tokens": request["max_tokens"],
+            **request.get("params", {})
+        }
+        if request.get("system"):
+            options["system"] = request["system"]
+        if request.get("temperature") is not None:
+            options["temperature"] = request["temperature"]
+        
+        try:
+            response = self.client.messages.create(**options)
+        except anthropic.RateLimitError as e:
+            raise RateLimitError(f"Rate limit exceeded: {str(e)}") from e
+        
+        return {
+            "content": response.content[0].text,
+            "model": request["model"],
+            "input_tokens": response.usage.input_tokens,
+            "output_tokens": response.usage.output_tokens,
+            "total_tokens": response.usage.input_tokens + response.usage.output_tokens,
+            "stop_reason": response.stop_reason
+        }
+
+
+class _Job:
+    """One queued API call and the future its callers wait on"""
+    
+    __slots__ = ("key", "request", "future", "priority", "enqueued_at", "started", "waiters")
+    
+    def __init__(self, key: str, request: Dict[str, Any], priority: int):
+        self.key = key
+        self.request = request
+        self.future: Future = Future()
+        self.priority = priority
+        self.enqueued_at = time.perf_counter()
+        self.started = False
+        self.waiters = 1
+
+
+class _ModelMetrics:
+    """Counters and latency histograms for one model"""
+    
+    def __init__(self):
+        self.requests = 0
+        self.api_calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latency = LatencyHistogram(LatencyHistogram.API_BUCKETS_MS)
+        self.queue_wait = LatencyHistogram(LatencyHistogram.API_BUCKETS_MS)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus latency and queue wait histograms"""
+        return {
+            "requests": self.requests,
+            "api_calls": self.api_calls,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.input_tokens + self.output_tokens,
+            "latency": self.latency.snapshot(),
+            "queue_wait": self.queue_wait.snapshot()
+        }
+
+
+class RequestDispatcher:
+    """
+    Concurrency-limited, coalescing dispatcher for completion requests
+    
+    submit() returns a concurrent.futures.Future; complete() waits on it and
+    acomplete() awaits it from asyncio code. Requests with the same model,
+    messages, system prompt and parameters share the call already queued or
+    in flight. Calls are not retried here; callers decide on retries.
+    """
+    
+    def __init__(
+        self,
+        transport: Callable[[Dict[str, Any]], Dict[str, Any]],
+        max_concurrency: int = 4,
+        default_model: str = DEFAULT_MODEL
+    ):
+        """
+        Args:
+            transport: Callable that sends one request dict and returns the
+                normalized response (AnthropicTransport or a test double)
+            max_concurrency: Most API calls in flight at once
+            default_model: Model used when a request names none
+        """
+        self.transport = transport
+        self.max_concurrency = max_concurrency
+        self.default_model = default_model
+        
+        self.queue: PriorityQueue = PriorityQueue()
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, _Job] = {}
+        self.active = 0
+        self.workers: List[threading.Thread] = []
+        self.is_running = False
+        self.metrics: Dict[str, _ModelMetrics] = {}
+    
+    def start(self):
+        """Start the worker threads"""
+        with self.lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            self.workers = [
+                threading.Thread(target=self._run, daemon=True, name=f"AIDispatcher-{index}")
+                for index in range(self.max_concurrency)
+            ]
+        for worker in self.workers:
+            worker.start()
+        logger.info(f"AI request dispatcher started with {self.max_concurrency} workers")
+    
+    def stop(self, timeout: float = 5):
+        """Stop the workers after the calls in progress finish"""
+        with self.lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+        for _ in self.workers:
+            self.queue.put((float("inf"), next(self.sequence), None))
+        for worker in self.workers:
+            worker.join(timeout=timeout)
+        self.workers = []
+    
+    def request_key(self, request: Dict[str, Any]) -> str:
+        """Coalescing key over model, prompt and parameters"""
+        encoded = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.blake2b(encoded.encode(), digest_size=16).hexdigest()
+    
+    def build_request(
+        self,
+        prompt: Optional[str] = None,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        system: Optional[str] = None,
+        model: Optional[str] = None,
+        max_tokens: int = 1000,
+        temperature: Optional[float] = None,
+        **params
+    ) -> Dict[str, Any]:
+        """Normalize call arguments into a transport request"""
+        if messages is None:
+            if prompt is None:
+                raise AIServiceError("A prompt or messages are required")
+            messages = [{"role": "user", "content": prompt}]
+        return {
+            "model": model or self.default_model,
+            "messages": messages,
+            "system": system,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "params": params
+        }
+    
+    def submit(self, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """
+        Queue a completion request
+        
+        Args:
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH (lower runs first)
+            **kwargs: prompt or messages, system, model, max_tokens,
+                temperature and extra API parameters
+        
+        Returns:
+            Future resolving to the response dictionary
+        """
+        if not self.is_running:
+            self.start()
+        
+        request = self.build_request(**kwargs)
+        key = self.request_key(request)
+        
+        with self.lock:
+            metrics = self._metrics(request["model"])
+            metrics.requests += 1
+            job = self.in_flight.get(key)
+            if job is not None:
+                job.waiters += 1
+                metrics.coalesced += 1
+                if priority < job.priority and not job.started:
+                    # Requeue at the better priority; the stale entry is skipped
+                    job.priority = priority
+                    self.queue.put((priority, next(self.sequence), job))
+                return job.future
+            
+            job = _Job(key, request, priority)
+            self.in_flight[key] = job
+            self.queue.put((priority, next(self.sequence), job))
+            return job.future
+    
+    def complete(self, timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Submit a request and wait for the response
+        
+        Args:
+            timeout: Seconds to wait before raising TimeoutError
+            **kwargs: Arguments for submit()
+        
+        Returns:
+            A copy of the response dictionary
+        """
+        return dict(self.submit(**kwargs).result(timeout=timeout))
+    
+    async def acomplete(self, **kwargs) -> Dict[str, Any]:
+        """Submit a request and await the response from asyncio code"""
+        return dict(await asyncio.wrap_future(self.submit(**kwargs)))
+    
+    def _metrics(self, model: str) -> _ModelMetrics:
+        """Metrics for a model, created on first use (lock held)"""
+        metrics = self.metrics.get(model)
+        if metrics is None:
+            metrics = self.metrics[model] = _ModelMetrics()
+        return metrics
+    
+    def _run(self):
+        """Worker loop: take the most urgent job and send it"""
+        while True:
+            _, _, job = self.queue.get()
+            if job is None:
+                break
+            
+            with self.lock:
+                if job.started:
+                    continue
+                job.started = True
+                self.active += 1
+                metrics = self._metrics(job.request["model"])
+                metrics.queue_wait.observe(time.perf_counter() - job.enqueued_at)
+            
+            started = time.perf_counter()
+            try:
+                response = self.transport(job.request)
+            except Exception as e:
+                with self.lock:
+                    self.active -= 1
+                    metrics.api_calls += 1
+                    metrics.errors += 1
+                    metrics.latency.observe(time.perf_counter() - started)
+                    del self.in_flight[job.key]
+                logger.error(f"AI request failed: {e}")
+                if not isinstance(e, AIServiceError):
+                    e = AIServiceError(f"Failed to generate completion: {str(e)}")
+                job.future.set_exception(e)
+                continue
+            
+            with self.lock:
+                self.active -= 1
+                metrics.api_calls += 1
+                metrics.input_tokens += response.get("input_tokens", 0)
+                metrics.output_tokens += response.get("output_tokens", 0)
+                metrics.latency.observe(time.perf_counter() - started)
+                del self.in_flight[job.key]
+            job.future.set_result(response)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue state and per-model token and latency metrics"""
+        with self.lock:
+            return {
+                "running": self.is_running,
+                "max_concurrency": self.max_concurrency,
+                "active": self.active,
+                "queued": sum(1 for job in self.in_flight.values() if not job.started),
+                "models": {model: metrics.snapshot() for model, metrics in self.metrics.items()}
+            }
@@ -0,0 +1,56 @@
+"""
+Lightweight metrics shared by AI service components
+"""
+
+from bisect import bisect_left
+from typing import Any, Dict, Optional, Tuple
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram in milliseconds"""
+    
+    BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+    
+    # Bucket bounds for remote API calls
+    API_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+    
+    def __init__(self, buckets_ms: Optional[Tuple[float, ...]] = None):
+        """
+        Args:
+            buckets_ms: Ascending bucket upper bounds (defaults to BUCKETS_MS)
+        """
+        self.buckets_ms = tuple(buckets_ms or self.BUCKETS_MS)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+    
+    def observe(self, seconds: float):
+        """Record one duration"""
+        ms = seconds * 1000
+        self.counts[bisect_left(self.buckets_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+    
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given fraction of samples"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets_ms[index] if index < len(self.buckets_ms) else float("inf")
+        return float("inf")
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Counts per bucket plus summary figures"""
+        labels = [f"<={bound}ms" for bound in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 4) if self.count else 0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets": dict(zip(labels, self.counts))
+        }
@@ -4,7 +4,7 @@ Provides location-specific, time-aware, and demographic-based recommendations
 """
 
 import json
-import sqlite3
+import db_pool
 import requests
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
@@ -66,7 +66,7 @@ class ContextAwareRecommender:
     
     def _get_location_context(self, device_id: int) -> Dict:
         """Get location-specific context"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         query = """
@@ -266,7 +266,7 @@ class ContextAwareRecommender:
     
     def _get_competitive_context(self, device_id: int) -> Dict:
         """Analyze competitive landscape"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         # Get devices at same location
@@ -5,10 +5,15 @@ Provides instant feedback on planogram placement quality
 """
 
 import json
+import time
 import logging
-from typing import Dict, List, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 
+import numpy as np
+
 from ..base.client import AIClient
 from ..base.exceptions import AIServiceError, ValidationError
 from ..pipelines.cache import CacheManager, cached
@@ -35,6 +40,10 @@ class PlanogramScorer:
         "floor_level": 0.5     # 0-24 inches
     }
     
+    # Memoized score grids per scorer instance
+    GRID_CACHE_SIZE = 64
+    GRID_CACHE_TTL = 300  # 5 minutes
+    
     def __init__(
         self,
         ai_client: Optional[AIClient] = None,
@@ -49,6 +58,11 @@ class PlanogramScorer:
         """
         self.ai_client = ai_client or AIClient()
         self.cache_manager = cache_manager or CacheManager()
+        
+        # (planogram hash, product ID) -> (expires_at, grid)
+        self._grid_cache: "OrderedDict[Tuple[str, int], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._grid_lock = threading.Lock()
+        self.grid_stats = {"hits": 0, "misses": 0, "evictions": 0}
     
     @cached(cache_manager=None, ttl=300)  # 5 minute cache
     def score_placement(
@@ -124,6 +138,174 @@ class PlanogramScorer:
             logger.error(f"Scoring error: {e}")
             return self._fallback_score()
     
+    def score_grid(self, planogram_data: Dict[str, Any], product_id: int) -> Dict[str, Any]:
+        """
+        Score one product at every slot of a planogram
+        
+        Builds a positional index of the planogram once and computes zone,
+        affinity and category scores for the whole grid in array operations,
+        so the editor can shade every slot while a product is dragged. The
+        AI component is left out; per-slot scores match score_placement
+        without an AI score. Results are memoized per scorer instance on a
+        hash of the planogram content and the product ID.
+        
+        Args:
+            planogram_data: Complete planogram configuration
+            product_id: Product being placed
+        
+        Returns:
+            Score matrix indexed [row][column] (None where there is no slot),
+            component scores, and the empty slots ranked by score
+        """
+        if not planogram_data:
+            raise ValidationError("Planogram data is required")
+        if not isinstance(product_id, int) or product_id <= 0:
+            raise ValidationError("Valid product ID is required")
+        
+        key = (self._planogram_hash(planogram_data), product_id)
+        now = time.time()
+        with self._grid_lock:
+            entry = self._grid_cache.get(key)
+            if entry and entry[0] > now:
+                self._grid_cache.move_to_end(key)
+                self.grid_stats["hits"] += 1
+                return entry[1]
+            self.grid_stats["misses"] += 1
+        
+        grid = self._compute_score_grid(planogram_data, product_id)
+        grid["planogram_hash"] = key[0]
+        
+        with self._grid_lock:
+            self._grid_cache[key] = (now + self.GRID_CACHE_TTL, grid)
+            self._grid_cache.move_to_end(key)
+            while len(self._grid_cache) > self.GRID_CACHE_SIZE:
+                self._grid_cache.popitem(last=False)
+                self.grid_stats["evictions"] += 1
+        
+        return grid
+    
+    def _compute_score_grid(self, planogram_data: Dict, product_id: int) -> Dict[str, Any]:
+        """Vectorized zone, affinity and category scores over the slot grid"""
+        index = self._build_position_index(planogram_data)
+        positions = [
+            (row, col) for row, col in index["positions"]
+            if isinstance(row, int) and isinstance(col, int) and row >= 0 and col >= 0
+        ]
+        if not positions:
+            raise ValidationError("Planogram has no slots with row and column")
+        
+        rows = max(row for row, _ in positions) + 1
+        cols = max(col for _, col in positions) + 1
+        
+        has_slot = np.zeros((rows, cols), dtype=bool)
+        for row, col in positions:
+            has_slot[row, col] = True
+        
+        # Products per position, and how many share the dragged product's category
+        placed = np.zeros((rows, cols), dtype=float)
+        same = np.zeros((rows, cols), dtype=float)
+        occupied = np.zeros((rows, cols), dtype=bool)
+        for (row, col), products in index["products"].items():
+            if not (isinstance(row, int) and isinstance(col, int) and 0 <= row < rows and 0 <= col < cols):
+                continue
+            placed[row, col] = len(products)
+            same[row, col] = sum(1 for p in products if self._same_category(product_id, p))
+            occupied[row, col] = True
+        
+        neighbours = self._neighbour_sum(placed)
+        neighbours_same = self._neighbour_sum(same)
+        affinity = np.where(
+            neighbours > 0,
+            np.minimum((80 * neighbours_same + 40 * (neighbours - neighbours_same)) / np.maximum(neighbours, 1), 100),
+            50
+        )
+        
+        # Zone and category scores depend only on the row
+        zone_by_row = np.array([self._calculate_zone_score({"row": row}) for row in range(rows)], dtype=float)
+        category_by_row = np.array([
+            self._calculate_category_score(planogram_data, product_id, {"row": row}) for row in range(rows)
+        ], dtype=float)
+        zone = np.broadcast_to(zone_by_row[:, None], (rows, cols))
+        category = np.broadcast_to(category_by_row[:, None], (rows, cols))
+        
+        # Same combination as _combine_scores with no AI score
+        raw = np.minimum((zone * 0.3 + affinity * 0.25 + category * 0.2) * 1.33, 100)
+        # Python's round per cell, so values agree with score_placement exactly
+        scores = [[round(value, 1) for value in row] for row in raw.tolist()]
+        
+        empty_slots = [
+            {"row": int(row), "column": int(col), "score": scores[row][col]}
+            for row, col in zip(*np.nonzero(has_slot & ~occupied))
+        ]
+        empty_slots.sort(key=lambda s: (-s["score"], s["row"], s["column"]))
+        
+        return {
+            "product_id": product_id,
+            "rows": rows,
+            "columns": cols,
+            "scores": [
+                [scores[row][col] if has_slot[row, col] else None for col in range(cols)]
+                for row in range(rows)
+            ],
+            "components": {
+                "zone_score": zone_by_row.tolist(),
+                "category_score": category_by_row.tolist(),
+                "affinity_score": affinity.tolist()
+            },
+            "empty_slots": empty_slots,
+            "best_slot": empty_slots[0] if empty_slots else None,
+            "confidence": self._calculate_confidence(False),
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    @staticmethod
+    def _neighbour_sum(grid: np.ndarray) -> np.ndarray:
+        """Sum of the 8 surrounding cells for every cell"""
+        rows, cols = grid.shape
+        padded = np.pad(grid, 1)
+        total = np.zeros_like(grid)
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                if dr == 0 and dc == 0:
+                    continue
+                total += padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+        return total
+    
+    def _planogram_hash(self, planogram_data: Dict) -> str:
+        """Content hash of a planogram for memoization"""
+        return self.cache_manager.digest(planogram_data)
+    
+    def _build_position_index(self, planogram_data: Dict) -> Dict[str, Any]:
+        """
+        Index slots by position in one pass
+        
+        Returns:
+            Dictionary with the set of slot positions and the product IDs
+            placed at each (row, column)
+        """
+        positions = set()
+        products: Dict[Tuple[int, int], List[int]] = {}
+        for slot in planogram_data.get("slots", []):
+            row = slot.get("row")
+            col = slot.get("column")
+            if row is None or col is None:
+                continue
+            positions.add((row, col))
+            product = slot.get("product_id")
+            if product:
+                products.setdefault((row, col), []).append(product)
+        return {"positions": positions, "products": products}
+    
+    def get_grid_cache_stats(self) -> Dict[str, Any]:
+        """Score grid memoization counters"""
+        with self._grid_lock:
+            total = self.grid_stats["hits"] + self.grid_stats["misses"]
+            return {
+                **self.grid_stats,
+                "size": len(self._grid_cache),
+                "hit_rate": round(self.grid_stats["hits"] / total * 100, 1) if total else 0
+            }
+    
     def _validate_inputs(
         self,
         planogram_data: Dict,
@@ -317,20 +499,14 @@ class PlanogramScorer:
         adjacent = []
         row = slot_position.get("row")
         col = slot_position.get("column")
+        products = self._build_position_index(planogram_data)["products"]
         
         # Check surrounding positions
         for dr in [-1, 0, 1]:
             for dc in [-1, 0, 1]:
                 if dr == 0 and dc == 0:
                     continue
-                
-                # Find product at adjacent position
-                for slot in planogram_data.get("slots", []):
-                    if (slot.get("row") == row + dr and 
-                        slot.get("column") == col + dc):
-                        product = slot.get("product_id")
-                        if product:
-                            adjacent.append(product)
+                adjacent.extend(products.get((row + dr, col + dc), []))
         
         return adjacent
     
@@ -4,9 +4,11 @@ Production-ready prompt templates and integration patterns
 """
 
 import os
+import re
 import json
 import time
 import asyncio
+import threading
 from typing import Dict, List, Optional, Tuple, Any, AsyncGenerator
 from dataclasses import dataclass, asdict
 from enum import Enum
@@ -14,10 +16,20 @@ import hashlib
 from datetime import datetime, timedelta
 import anthropic
 from anthropic import AsyncAnthropic
-import tiktoken
 import sqlite3
+import logging
 from functools import lru_cache
 
+import numpy as np
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
 # =============================================================================
 # MODEL CONFIGURATION & TOKEN MANAGEMENT
 # =============================================================================
@@ -673,39 +685,163 @@ class StreamingHandler:
 # BATCH PROCESSING PATTERNS
 # =============================================================================
 
+class TokenBucket:
+    """Async token bucket refilled continuously at a per-minute rate"""
+    
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waited_seconds = 0.0
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self, amount: float = 1):
+        """Wait until amount tokens are available and take them"""
+        # Requests larger than the bucket would never fit; let them drain it
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            delay = (amount - self.tokens) / self.rate
+            self.waited_seconds += delay
+            await asyncio.sleep(delay)
+
 class BatchProcessor:
     """Efficient batch processing for multiple planograms"""
     
-    def __init__(self, client: anthropic.Anthropic, db_path: str):
+    def __init__(
+        self,
+        client: anthropic.Anthropic,
+        db_path: str,
+        batch_size: int = 10,
+        max_concurrency: int = 4,
+        requests_per_minute: int = 50,
+        input_tokens_per_minute: int = 40000,
+        model: ModelType = ModelType.ANALYSIS
+    ):
         self.client = client
         self.db_path = db_path
-        self.batch_size = 10  # Process 10 planograms at a time
-        
+        self.batch_size = batch_size  # Process 10 planograms at a time
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.input_tokens_per_minute = input_tokens_per_minute
+        self.model = model
+        self.cost_monitor = None
+        self.last_report = None
+        self._init_db()
+    
+    def _init_db(self):
+        """Initialize batch result storage used to resume interrupted runs"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS batch_optimization_results (
+                run_id TEXT NOT NULL,
+                device_id INTEGER NOT NULL,
+                optimization_type TEXT,
+                status TEXT NOT NULL,
+                result TEXT,
+                input_tokens INTEGER DEFAULT 0,
+                output_tokens INTEGER DEFAULT 0,
+                cost_usd REAL DEFAULT 0,
+                completed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (run_id, device_id)
+            )
+        """)
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def make_run_id(device_ids: List[int], optimization_type: str) -> str:
+        """Run id for a device set, stable for the day so a restarted run resumes"""
+        digest = hashlib.sha256(json.dumps(sorted(set(device_ids))).encode()).hexdigest()[:12]
+        return f"{optimization_type}-{datetime.now().strftime('%Y%m%d')}-{digest}"
+    
     async def batch_optimize(
         self,
         device_ids: List[int],
-        optimization_type: str = 'revenue'
+        optimization_type: str = 'revenue',
+        run_id: Optional[str] = None
     ) -> List[Dict]:
-        """Process multiple planograms in batches"""
+        """
+        Process multiple planograms in concurrent, rate-limited batches
         
-        results = []
+        Results are stored per batch as it completes. Calling again with the
+        same devices (or run_id) skips devices that already succeeded, so an
+        interrupted run picks up where it stopped. Throughput and cost for the
+        call are left in last_report.
+        """
+        start_time = time.time()
+        run_id = run_id or self.make_run_id(device_ids, optimization_type)
         
-        # Process in batches to manage token limits
-        for i in range(0, len(device_ids), self.batch_size):
-            batch = device_ids[i:i + self.batch_size]
-            
-            # Prepare batch context
-            batch_context = self._prepare_batch_context(batch)
-            
-            # Create consolidated prompt
-            prompt = self._create_batch_prompt(batch_context, optimization_type)
+        completed = self._load_results(run_id)
+        pending = [d for d in dict.fromkeys(device_ids) if d not in completed]
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        
+        # Buckets are per call so their waits belong to this event loop
+        request_bucket = TokenBucket(self.requests_per_minute)
+        token_bucket = TokenBucket(self.input_tokens_per_minute)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        totals = {'input_tokens': 0, 'output_tokens': 0, 'cost_usd': 0.0, 'failed_batches': 0}
+        
+        async def run_batch(batch: List[int]) -> List[Dict]:
+            async with semaphore:
+                # Context queries run off the event loop, overlapping other batches' API calls
+                batch_context = await asyncio.to_thread(self._prepare_batch_context, batch)
+                prompt = self._create_batch_prompt(batch_context, optimization_type)
+                
+                await request_bucket.acquire(1)
+                await token_bucket.acquire(len(prompt) // 4)
+                
+                batch_results, usage = await self._process_batch(prompt, batch, optimization_type)
             
-            # Get recommendations for batch
-            batch_results = await self._process_batch(prompt)
-            results.extend(batch_results)
+            cost = UsageMetrics.calculate_cost(self.model, usage['input_tokens'], usage['output_tokens'])
+            totals['input_tokens'] += usage['input_tokens']
+            totals['output_tokens'] += usage['output_tokens']
+            totals['cost_usd'] += cost
+            if usage.get('error'):
+                totals['failed_batches'] += 1
             
-            # Rate limiting
-            await asyncio.sleep(1)
+            await asyncio.to_thread(self._save_results, run_id, optimization_type, batch_results, usage, cost)
+            return batch_results
+        
+        batch_outputs = await asyncio.gather(*(run_batch(batch) for batch in batches))
+        fresh = {result['device_id']: result for output in batch_outputs for result in output}
+        
+        results = []
+        for device_id in dict.fromkeys(device_ids):
+            result = completed.get(device_id) or fresh.get(device_id)
+            if result:
+                results.append(result)
+        
+        elapsed = time.time() - start_time
+        processed = sum(1 for result in fresh.values() if result['success'])
+        self.last_report = {
+            'run_id': run_id,
+            'devices_requested': len(results),
+            'devices_resumed': len(completed),
+            'devices_processed': processed,
+            'devices_failed': len(fresh) - processed,
+            'batches': len(batches),
+            'failed_batches': totals['failed_batches'],
+            'elapsed_seconds': round(elapsed, 2),
+            'devices_per_minute': round(processed / elapsed * 60, 1) if elapsed > 0 else 0.0,
+            'input_tokens': totals['input_tokens'],
+            'output_tokens': totals['output_tokens'],
+            'cost_usd': round(totals['cost_usd'], 6),
+            'rate_limit_wait_seconds': round(request_bucket.waited_seconds + token_bucket.waited_seconds, 2)
+        }
+        logger.info(
+            f"Batch run {run_id}: {processed} devices in {elapsed:.1f}s "
+            f"({self.last_report['devices_per_minute']} devices/min, ${self.last_report['cost_usd']:.4f}), "
+            f"{len(completed)} resumed, {self.last_report['devices_failed']} failed"
+        )
         
         return results
     
@@ -719,10 +855,13 @@ class BatchProcessor:
         
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        devices = self._get_device_contexts(cursor, device_ids)
+        conn.close()
         
         for device_id in device_ids:
-            # Get device data
-            device_data = self._get_device_context(cursor, device_id)
+            device_data = devices.get(device_id)
+            if device_data is None:
+                continue
             context['devices'][device_id] = device_data
             
             # Track patterns
@@ -731,7 +870,6 @@ class BatchProcessor:
                 context['venue_types'][venue_type] = []
             context['venue_types'][venue_type].append(device_id)
         
-        conn.close()
         return context
     
     def _create_batch_prompt(self, context: Dict, optimization_type: str) -> str:
@@ -773,69 +911,417 @@ Focus on {optimization_type} optimization.
 </output_format>
 </batch_optimization>"""
     
-    async def _process_batch(self, prompt: str) -> List[Dict]:
-        """Process batch and parse results"""
-        # Implementation would call Claude API and parse response
-        pass
+    async def _process_batch(
+        self,
+        prompt: str,
+        device_ids: List[int],
+        optimization_type: str
+    ) -> Tuple[List[Dict], Dict]:
+        """Process batch and parse results into one entry per device"""
+        start_time = time.time()
+        usage = {'input_tokens': 0, 'output_tokens': 0, 'latency_ms': 0.0}
+        
+        try:
+            # The client is synchronous; a worker thread keeps batches concurrent
+            response = await asyncio.to_thread(
+                self.client.messages.create,
+                model=self.model.value,
+                max_tokens=TokenLimits.BATCH,
+                temperature=0.3,
+                messages=[{"role": "user", "content": prompt}]
+            )
+            usage['input_tokens'] = response.usage.input_tokens
+            usage['output_tokens'] = response.usage.output_tokens
+            usage['latency_ms'] = (time.time() - start_time) * 1000
+            
+            text = response.content[0].text
+            parsed = json.loads(text[text.find('{'):text.rfind('}') + 1])
+        except Exception as e:
+            logger.error(f"Batch of {len(device_ids)} devices failed: {e}")
+            usage['error'] = str(e)
+            return [
+                {'device_id': device_id, 'optimization_type': optimization_type, 'success': False, 'error': str(e)}
+                for device_id in device_ids
+            ], usage
+        
+        recommendations = parsed.get('recommendations', {})
+        results = []
+        for device_id in device_ids:
+            recommendation = recommendations.get(str(device_id))
+            if recommendation is None:
+                results.append({
+                    'device_id': device_id,
+                    'optimization_type': optimization_type,
+                    'success': False,
+                    'error': 'No recommendation returned for device'
+                })
+            else:
+                results.append({
+                    'device_id': device_id,
+                    'optimization_type': optimization_type,
+                    'success': True,
+                    'recommendations': recommendation
+                })
+        
+        if self.cost_monitor:
+            metrics = UsageMetrics(
+                model=self.model.value,
+                input_tokens=usage['input_tokens'],
+                output_tokens=usage['output_tokens'],
+                latency_ms=usage['latency_ms'],
+                cost_usd=UsageMetrics.calculate_cost(self.model, usage['input_tokens'], usage['output_tokens'])
+            )
+            await asyncio.to_thread(self.cost_monitor.track_usage, metrics, 'batch')
+        
+        return results, usage
     
     def _get_device_context(self, cursor, device_id: int) -> Dict:
         """Get device context for batch processing"""
-        # Implementation would fetch device data from database
-        pass
+        return self._get_device_contexts(cursor, [device_id]).get(device_id)
+    
+    def _get_device_contexts(self, cursor, device_ids: List[int]) -> Dict[int, Dict]:
+        """Fetch context for a whole batch with one query per table"""
+        if not device_ids:
+            return {}
+        placeholders = ','.join('?' * len(device_ids))
+        
+        cursor.execute(f"""
+            SELECT d.id, d.asset, d.model, dt.name, l.name
+            FROM devices d
+            LEFT JOIN device_types dt ON d.device_type_id = dt.id
+            LEFT JOIN locations l ON d.location_id = l.id
+            WHERE d.id IN ({placeholders}) AND d.deleted_at IS NULL
+        """, device_ids)
+        contexts = {
+            row[0]: {
+                'asset': row[1],
+                'model': row[2],
+                'device_type': row[3],
+                'location': row[4],
+                # No venue classification is stored; device type is the closest grouping
+                'venue_type': row[3],
+                'slots': {'total': 0, 'empty': 0, 'fill_percent': 0.0},
+                'planogram_products': [],
+                'sales_30d': {'units': 0, 'revenue': 0.0, 'top_products': []}
+            }
+            for row in cursor.fetchall()
+        }
+        if not contexts:
+            return {}
+        
+        cursor.execute(f"""
+            SELECT cc.device_id,
+                   COUNT(ps.id),
+                   SUM(CASE WHEN ps.product_id IS NULL THEN 1 ELSE 0 END),
+                   SUM(ps.quantity),
+                   SUM(ps.capacity),
+                   GROUP_CONCAT(DISTINCT ps.product_name)
+            FROM cabinet_configurations cc
+            JOIN planograms p ON p.cabinet_id = cc.id
+            JOIN planogram_slots ps ON ps.planogram_id = p.id
+            WHERE cc.device_id IN ({placeholders})
+            GROUP BY cc.device_id
+        """, device_ids)
+        for device_id, total, empty, quantity, capacity, products in cursor.fetchall():
+            if device_id not in contexts:
+                continue
+            contexts[device_id]['slots'] = {
+                'total': total,
+                'empty': empty or 0,
+                'fill_percent': round((quantity or 0) / capacity * 100, 1) if capacity else 0.0
+            }
+            contexts[device_id]['planogram_products'] = sorted(products.split(',')) if products else []
+        
+        cursor.execute(f"""
+            SELECT s.device_id, pr.name, SUM(s.sale_units), SUM(s.sale_cash)
+            FROM sales s
+            JOIN products pr ON s.product_id = pr.id
+            WHERE s.device_id IN ({placeholders})
+              AND s.created_at >= datetime('now', '-30 days')
+            GROUP BY s.device_id, s.product_id
+            ORDER BY s.device_id, SUM(s.sale_cash) DESC
+        """, device_ids)
+        for device_id, product_name, units, revenue in cursor.fetchall():
+            if device_id not in contexts:
+                continue
+            sales = contexts[device_id]['sales_30d']
+            sales['units'] += units
+            sales['revenue'] = round(sales['revenue'] + revenue, 2)
+            if len(sales['top_products']) < 5:
+                sales['top_products'].append({'name': product_name, 'units': units, 'revenue': round(revenue, 2)})
+        
+        return contexts
+    
+    def _load_results(self, run_id: str) -> Dict[int, Dict]:
+        """Results already stored for a run, keyed by device id"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT device_id, result FROM batch_optimization_results
+            WHERE run_id = ? AND status = 'success'
+        """, (run_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return {device_id: json.loads(result) for device_id, result in rows}
+    
+    def _save_results(self, run_id: str, optimization_type: str, results: List[Dict], usage: Dict, cost: float):
+        """Store one batch's results in a single transaction"""
+        share = max(len(results), 1)
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany("""
+            INSERT OR REPLACE INTO batch_optimization_results
+            (run_id, device_id, optimization_type, status, result, input_tokens, output_tokens, cost_usd)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (
+                run_id, result['device_id'], optimization_type,
+                'success' if result['success'] else 'failed',
+                json.dumps(result),
+                usage['input_tokens'] // share, usage['output_tokens'] // share, cost / share
+            )
+            for result in results
+        ])
+        conn.commit()
+        conn.close()
+    
+    def get_last_report(self) -> Optional[Dict]:
+        """Throughput and cost summary of the last batch_optimize call"""
+        return self.last_report
 
 # =============================================================================
 # SEMANTIC CACHING
 # =============================================================================
 
 class SemanticCache:
-    """Cache LLM responses based on semantic similarity"""
+    """
+    Cache LLM responses in one indexed SQLite store
+    
+    Exact lookups hash the full prompt and model. With near_duplicates on,
+    prompts are also normalized (timestamps, dates and whitespace removed);
+    a miss then tries the normalized prompt's hash, and after that the most
+    similar cached prompt for the same model whose MinHash-estimated Jaccard
+    similarity over word shingles reaches similarity_threshold. Expiry uses
+    an index on expires_at.
+    """
+    
+    NUM_PERM = 128
+    LSH_BANDS = 32
+    SHINGLE_SIZE = 3
+    _MERSENNE_PRIME = (1 << 31) - 1
     
-    def __init__(self, cache_dir: str = "/tmp/llm_cache", ttl_hours: int = 24):
+    # Volatile values that should not make otherwise equal prompts differ
+    _VOLATILE_PATTERNS = [
+        re.compile(r'\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?)?'),
+        re.compile(r'\b\d{1,2}/\d{1,2}/\d{2,4}\b'),
+        re.compile(r'\b\d{1,2}:\d{2}(?::\d{2})?(?:\s?[ap]m)?\b'),
+        re.compile(r'\b1\d{9}(?:\.\d+)?\b')
+    ]
+    
+    def __init__(
+        self,
+        cache_dir: str = "/tmp/llm_cache",
+        ttl_hours: int = 24,
+        near_duplicates: bool = False,
+        similarity_threshold: float = 0.98
+    ):
         self.cache_dir = cache_dir
         self.ttl = timedelta(hours=ttl_hours)
+        self.near_duplicates = near_duplicates
+        self.similarity_threshold = similarity_threshold
+        self.stats = {'exact_hits': 0, 'normalized_hits': 0, 'similar_hits': 0, 'misses': 0}
         os.makedirs(cache_dir, exist_ok=True)
         
+        # Fixed seed so signatures stay comparable across processes
+        rng = np.random.RandomState(1)
+        self._perm_a = rng.randint(1, self._MERSENNE_PRIME, self.NUM_PERM).astype(np.uint64)
+        self._perm_b = rng.randint(0, self._MERSENNE_PRIME, self.NUM_PERM).astype(np.uint64)
+        
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "semantic_cache.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt TEXT,
+                normalized_key TEXT,
+                response TEXT NOT NULL,
+                signature BLOB,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at);
+            CREATE INDEX IF NOT EXISTS idx_llm_cache_normalized ON llm_cache(normalized_key);
+            CREATE TABLE IF NOT EXISTS llm_cache_bands (
+                band_key TEXT NOT NULL,
+                cache_key TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_cache_bands_band ON llm_cache_bands(band_key);
+            CREATE INDEX IF NOT EXISTS idx_llm_cache_bands_key ON llm_cache_bands(cache_key);
+        """)
+        self.conn.commit()
+    
     def _get_cache_key(self, prompt: str, model: str) -> str:
-        """Generate cache key from prompt"""
-        # Use first 1000 chars + model for key
-        content = f"{prompt[:1000]}_{model}"
-        return hashlib.sha256(content.encode()).hexdigest()
+        """Generate cache key from the full prompt and model"""
+        return hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+    
+    def _normalize(self, prompt: str) -> str:
+        """Lowercase, drop timestamps and collapse whitespace"""
+        text = prompt.lower()
+        for pattern in self._VOLATILE_PATTERNS:
+            text = pattern.sub(' ', text)
+        return ' '.join(text.split())
+    
+    def _signature(self, prompt: str) -> np.ndarray:
+        """MinHash signature over word shingles of the normalized prompt"""
+        words = self._normalize(prompt).split()
+        size = self.SHINGLE_SIZE
+        shingles = {' '.join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), 'little') % self._MERSENNE_PRIME
+             for s in shingles],
+            dtype=np.uint64
+        )
+        # Values stay below 2**62, so the products cannot overflow
+        permuted = (np.outer(hashes, self._perm_a) + self._perm_b) % self._MERSENNE_PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+    
+    def _band_keys(self, signature: np.ndarray, model: str) -> List[str]:
+        """LSH band keys; prompts sharing any band become candidates"""
+        rows = self.NUM_PERM // self.LSH_BANDS
+        return [
+            f"{model}:{band}:{hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()}"
+            for band in range(self.LSH_BANDS)
+        ]
     
     def get(self, prompt: str, model: str) -> Optional[Dict]:
         """Retrieve cached response if available"""
         cache_key = self._get_cache_key(prompt, model)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        now = time.time()
+        
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT prompt, response, created_at FROM llm_cache WHERE cache_key = ? AND expires_at > ?",
+                (cache_key, now)
+            ).fetchone()
+        if row:
+            self.stats['exact_hits'] += 1
+            return self._entry(row, model, 'exact', 1.0)
         
-        if os.path.exists(cache_file):
-            # Check TTL
-            file_time = datetime.fromtimestamp(os.path.getmtime(cache_file))
-            if datetime.now() - file_time < self.ttl:
-                with open(cache_file, 'r') as f:
-                    return json.load(f)
+        if self.near_duplicates:
+            normalized_key = self._get_cache_key(self._normalize(prompt), model)
+            with self.lock:
+                row = self.conn.execute("""
+                    SELECT prompt, response, created_at FROM llm_cache
+                    WHERE normalized_key = ? AND expires_at > ?
+                    ORDER BY created_at DESC LIMIT 1
+                """, (normalized_key, now)).fetchone()
+            if row:
+                self.stats['normalized_hits'] += 1
+                return self._entry(row, model, 'normalized', 1.0)
+            
+            similar = self._get_similar(prompt, model, now)
+            if similar:
+                self.stats['similar_hits'] += 1
+                return similar
         
+        self.stats['misses'] += 1
         return None
     
+    def _get_similar(self, prompt: str, model: str, now: float) -> Optional[Dict]:
+        """Most similar unexpired entry for the model at or above the threshold"""
+        signature = self._signature(prompt)
+        band_keys = self._band_keys(signature, model)
+        placeholders = ','.join('?' * len(band_keys))
+        
+        with self.lock:
+            rows = self.conn.execute(f"""
+                SELECT prompt, response, created_at, signature FROM llm_cache
+                WHERE cache_key IN (SELECT cache_key FROM llm_cache_bands WHERE band_key IN ({placeholders}))
+                  AND expires_at > ? AND signature IS NOT NULL
+            """, (*band_keys, now)).fetchall()
+        
+        best, best_similarity = None, self.similarity_threshold
+        for row in rows:
+            similarity = float(np.mean(np.frombuffer(row[3], dtype=np.uint32) == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = row, similarity
+        if best is None:
+            return None
+        return self._entry(best[:3], model, 'similar', round(best_similarity, 3))
+    
+    @staticmethod
+    def _entry(row, model: str, match: str, similarity: float) -> Dict:
+        """Cached entry in the shape callers read"""
+        prompt, response, created_at = row
+        return {
+            'prompt': prompt,
+            'model': model,
+            'response': json.loads(response),
+            'timestamp': datetime.fromtimestamp(created_at).isoformat(),
+            'match': match,
+            'similarity': similarity
+        }
+    
     def set(self, prompt: str, model: str, response: Dict):
         """Cache response"""
         cache_key = self._get_cache_key(prompt, model)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
-        
-        with open(cache_file, 'w') as f:
-            json.dump({
-                'prompt': prompt[:500],  # Store truncated prompt for debugging
-                'model': model,
-                'response': response,
-                'timestamp': datetime.now().isoformat()
-            }, f)
+        now = time.time()
+        signature = self._signature(prompt) if self.near_duplicates else None
+        normalized_key = self._get_cache_key(self._normalize(prompt), model) if self.near_duplicates else None
+        
+        with self.lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO llm_cache
+                (cache_key, model, prompt, normalized_key, response, signature, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                cache_key, model,
+                prompt[:500],  # Store truncated prompt for debugging
+                normalized_key,
+                json.dumps(response),
+                signature.tobytes() if signature is not None else None,
+                now, now + self.ttl.total_seconds()
+            ))
+            self.conn.execute("DELETE FROM llm_cache_bands WHERE cache_key = ?", (cache_key,))
+            if signature is not None:
+                self.conn.executemany(
+                    "INSERT INTO llm_cache_bands (band_key, cache_key) VALUES (?, ?)",
+                    [(band_key, cache_key) for band_key in self._band_keys(signature, model)]
+                )
+            self.conn.commit()
     
-    def clear_expired(self):
+    def clear_expired(self) -> int:
         """Remove expired cache entries"""
-        now = datetime.now()
-        for filename in os.listdir(self.cache_dir):
-            filepath = os.path.join(self.cache_dir, filename)
-            file_time = datetime.fromtimestamp(os.path.getmtime(filepath))
-            if now - file_time > self.ttl:
-                os.remove(filepath)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("""
+                DELETE FROM llm_cache_bands
+                WHERE cache_key IN (SELECT cache_key FROM llm_cache WHERE expires_at <= ?)
+            """, (now,))
+            removed = self.conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+            self.conn.commit()
+        return removed
+    
+    def get_stats(self) -> Dict:
+        """Entry count, store size and hit rates"""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        lookups = sum(self.stats.values())
+        hits = lookups - self.stats['misses']
+        return {
+            'entries': entries,
+            'size_bytes': page_count * page_size,
+            **self.stats,
+            'hit_rate': hits / lookups if lookups else 0.0
+        }
+    
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.conn.close()
 
 # =============================================================================
 # COST MONITORING & MANAGEMENT
@@ -1071,6 +1557,7 @@ class LLMIntegrationPipeline:
         if cost_monitoring:
             self.cost_monitor = CostMonitor(db_path)
             self.error_handler.cost_monitor = self.cost_monitor
+            self.batch.cost_monitor = self.cost_monitor
         else:
             self.cost_monitor = None
     
@@ -2,9 +2,10 @@
 Multi-tier caching system for AI services
 
 Implements three-tier caching:
-- L1: In-memory cache (5 minute TTL)
-- L2: Redis cache (1 hour TTL) 
-- L3: SQLite cache (24 hour TTL)
+- L1: In-memory cache (5 minute TTL), LRU bounded by entry count and bytes
+- L2: Redis cache (1 hour TTL)
+- L3: SQLite cache (24 hour TTL) on one persistent connection, with hit
+  counts buffered and written in batches
 """
 
 import json
@@ -12,11 +13,15 @@ import time
 import hashlib
 import logging
 import sqlite3
-from typing import Optional, Any, Dict, Callable
+import threading
+from collections import Counter, OrderedDict
+from typing import Optional, Any, Dict, Callable, Iterable, List
 from datetime import datetime, timedelta
 from functools import wraps
 import pickle
 
+from ..base.metrics import LatencyHistogram
+
 try:
     import redis
     REDIS_AVAILABLE = True
@@ -26,6 +31,16 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Key digests are BLAKE2b truncated to this many bytes (32 hex characters)
+KEY_DIGEST_SIZE = 16
+
+# Immutable arguments at least this long have their digests memoized
+DIGEST_MEMO_MIN_LENGTH = 256
+DIGEST_MEMO_SIZE = 1024
+
+# Keys per SQL statement in batch lookups
+BATCH_CHUNK_SIZE = 500
+
 
 class CacheManager:
     """
@@ -37,13 +52,23 @@ class CacheManager:
     L2_TTL = 3600  # 1 hour
     L3_TTL = 86400  # 24 hours
     
+    # L1 bounds
+    L1_MAX_ENTRIES = 1000
+    L1_MAX_BYTES = 64 * 1024 * 1024
+    
+    # Buffered L3 hit counts are written once this many are pending or this many seconds pass
+    HIT_FLUSH_BATCH = 100
+    HIT_FLUSH_INTERVAL = 30
+    
     def __init__(
         self,
         redis_url: Optional[str] = None,
         sqlite_path: str = "ai_cache.db",
         enable_l1: bool = True,
         enable_l2: bool = True,
-        enable_l3: bool = True
+        enable_l3: bool = True,
+        l1_max_entries: int = L1_MAX_ENTRIES,
+        l1_max_bytes: int = L1_MAX_BYTES
     ):
         """
         Initialize cache manager
@@ -54,10 +79,16 @@ class CacheManager:
             enable_l1: Enable memory cache
             enable_l2: Enable Redis cache
             enable_l3: Enable SQLite cache
+            l1_max_entries: Most entries kept in the memory cache
+            l1_max_bytes: Memory cache budget (serialized size of values)
         """
-        # L1: Memory cache
+        # L1: Memory cache, least recently used first
         self.enable_l1 = enable_l1
-        self.memory_cache: Dict[str, Dict[str, Any]] = {}
+        self.memory_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.l1_max_entries = l1_max_entries
+        self.l1_max_bytes = l1_max_bytes
+        self.memory_bytes = 0
+        self.lock = threading.RLock()
         
         # L2: Redis cache
         self.enable_l2 = enable_l2 and REDIS_AVAILABLE
@@ -74,20 +105,30 @@ class CacheManager:
         # L3: SQLite cache
         self.enable_l3 = enable_l3
         self.sqlite_path = sqlite_path
+        self.sqlite_conn = None
+        self.sqlite_lock = threading.Lock()
+        self.pending_hits: Counter = Counter()
+        self.last_hit_flush = time.time()
         if self.enable_l3:
             self._init_sqlite()
         
+        # Key digests of long immutable arguments
+        self._digest_memo: "OrderedDict[Any, bytes]" = OrderedDict()
+        
         # Statistics
         self.hits = {"L1": 0, "L2": 0, "L3": 0}
         self.misses = 0
         self.writes = {"L1": 0, "L2": 0, "L3": 0}
+        self.evictions = 0
+        self.latency = {tier: LatencyHistogram() for tier in ("L1", "L2", "L3")}
     
     def _init_sqlite(self):
-        """Initialize SQLite cache database"""
+        """Open the persistent SQLite cache connection and create the table"""
         try:
-            conn = sqlite3.connect(self.sqlite_path)
-            cursor = conn.cursor()
-            cursor.execute("""
+            conn = sqlite3.connect(self.sqlite_path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
                 CREATE TABLE IF NOT EXISTS ai_cache (
                     cache_key TEXT PRIMARY KEY,
                     value TEXT,
@@ -96,11 +137,11 @@ class CacheManager:
                     hit_count INTEGER DEFAULT 0
                 )
             """)
-            cursor.execute("""
+            conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_expires_at ON ai_cache(expires_at)
             """)
             conn.commit()
-            conn.close()
+            self.sqlite_conn = conn
             logger.info("SQLite cache initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize SQLite cache: {e}")
@@ -110,15 +151,72 @@ class CacheManager:
         """
         Generate cache key from function arguments
         
+        Each argument is digested separately over a canonical encoding and
+        the key is a BLAKE2b digest of those digests, so a long immutable
+        argument such as a prompt string is only hashed once.
+        
         Returns:
-            MD5 hash of arguments
+            Hex digest of arguments
         """
-        key_data = {
-            "args": args,
-            "kwargs": kwargs
-        }
-        key_str = json.dumps(key_data, sort_keys=True)
-        return hashlib.md5(key_str.encode()).hexdigest()
+        hasher = hashlib.blake2b(digest_size=KEY_DIGEST_SIZE)
+        for arg in args:
+            hasher.update(self._digest(arg))
+        for name in sorted(kwargs):
+            hasher.update(self._digest(name))
+            hasher.update(self._digest(kwargs[name]))
+        return hasher.hexdigest()
+    
+    def digest(self, obj: Any) -> str:
+        """Hex content digest of a JSON-like object, e.g. a planogram"""
+        return self._digest(obj).hex()
+    
+    def _digest(self, obj: Any) -> bytes:
+        """
+        BLAKE2b digest of an object's canonical encoding
+        
+        Mutable containers are encoded on every call since they may change
+        between calls; strings, bytes and tuples long enough to matter are
+        memoized by value.
+        """
+        memoize = (
+            isinstance(obj, (str, bytes, tuple)) and len(obj) >= DIGEST_MEMO_MIN_LENGTH
+        )
+        if memoize:
+            with self.lock:
+                try:
+                    digest = self._digest_memo.get((type(obj), obj))
+                except TypeError:
+                    # Tuple holding unhashable items
+                    memoize = False
+                    digest = None
+                if digest is not None:
+                    self._digest_memo.move_to_end((type(obj), obj))
+                    return digest
+        
+        if isinstance(obj, bytes):
+            encoded = b"b" + obj
+        elif isinstance(obj, str):
+            encoded = b"s" + obj.encode()
+        else:
+            encoded = b"j" + json.dumps(
+                obj, sort_keys=True, separators=(",", ":"), default=str
+            ).encode()
+        digest = hashlib.blake2b(encoded, digest_size=KEY_DIGEST_SIZE).digest()
+        
+        if memoize:
+            with self.lock:
+                self._digest_memo[(type(obj), obj)] = digest
+                while len(self._digest_memo) > DIGEST_MEMO_SIZE:
+                    self._digest_memo.popitem(last=False)
+        return digest
+    
+    @staticmethod
+    def _estimate_size(value: Any) -> int:
+        """Approximate value size as its serialized JSON length"""
+        try:
+            return len(json.dumps(value, default=str))
+        except (TypeError, ValueError):
+            return len(repr(value))
     
     def get(self, key: str) -> Optional[Any]:
         """
@@ -132,17 +230,17 @@ class CacheManager:
         """
         # Check L1 (Memory)
         if self.enable_l1:
-            if key in self.memory_cache:
-                entry = self.memory_cache[key]
-                if time.time() < entry["expires_at"]:
-                    self.hits["L1"] += 1
-                    logger.debug(f"L1 cache hit for key: {key}")
-                    return entry["value"]
-                else:
-                    del self.memory_cache[key]
+            started = time.perf_counter()
+            value = self._get_l1(key)
+            self.latency["L1"].observe(time.perf_counter() - started)
+            if value is not None:
+                self.hits["L1"] += 1
+                logger.debug(f"L1 cache hit for key: {key}")
+                return value
         
         # Check L2 (Redis)
         if self.enable_l2 and self.redis_client:
+            started = time.perf_counter()
             try:
                 cached = self.redis_client.get(f"ai_cache:{key}")
                 if cached:
@@ -152,51 +250,115 @@ class CacheManager:
                     
                     # Promote to L1
                     if self.enable_l1:
-                        self._set_l1(key, value)
+                        self._set_l1(key, value, size=len(cached))
                     
                     return value
             except Exception as e:
                 logger.warning(f"Redis get error: {e}")
+            finally:
+                self.latency["L2"].observe(time.perf_counter() - started)
         
         # Check L3 (SQLite)
         if self.enable_l3:
-            try:
-                conn = sqlite3.connect(self.sqlite_path)
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT value FROM ai_cache
-                    WHERE cache_key = ? AND expires_at > ?
-                """, (key, datetime.now()))
-                
-                result = cursor.fetchone()
-                if result:
-                    value = json.loads(result[0])
-                    self.hits["L3"] += 1
-                    logger.debug(f"L3 cache hit for key: {key}")
-                    
-                    # Update hit count
-                    cursor.execute("""
-                        UPDATE ai_cache SET hit_count = hit_count + 1
-                        WHERE cache_key = ?
-                    """, (key,))
-                    conn.commit()
-                    
-                    # Promote to L1 and L2
-                    if self.enable_l1:
-                        self._set_l1(key, value)
-                    if self.enable_l2:
-                        self._set_l2(key, value)
-                    
-                    conn.close()
-                    return value
-                
-                conn.close()
-            except Exception as e:
-                logger.warning(f"SQLite get error: {e}")
+            found = self._get_l3([key])
+            if key in found:
+                return found[key]
         
         self.misses += 1
         return None
     
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Get several values, checking each tier once for all remaining keys
+        
+        Args:
+            keys: Cache keys
+        
+        Returns:
+            Dictionary of the keys found and their values
+        """
+        remaining = list(dict.fromkeys(keys))
+        found: Dict[str, Any] = {}
+        
+        if self.enable_l1 and remaining:
+            started = time.perf_counter()
+            for key in remaining:
+                value = self._get_l1(key)
+                if value is not None:
+                    found[key] = value
+                    self.hits["L1"] += 1
+            self.latency["L1"].observe(time.perf_counter() - started)
+            remaining = [key for key in remaining if key not in found]
+        
+        if self.enable_l2 and self.redis_client and remaining:
+            started = time.perf_counter()
+            try:
+                cached_values = self.redis_client.mget([f"ai_cache:{key}" for key in remaining])
+                for key, cached in zip(remaining, cached_values):
+                    if cached:
+                        value = pickle.loads(cached)
+                        found[key] = value
+                        self.hits["L2"] += 1
+                        if self.enable_l1:
+                            self._set_l1(key, value, size=len(cached))
+            except Exception as e:
+                logger.warning(f"Redis mget error: {e}")
+            finally:
+                self.latency["L2"].observe(time.perf_counter() - started)
+            remaining = [key for key in remaining if key not in found]
+        
+        if self.enable_l3 and remaining:
+            found.update(self._get_l3(remaining))
+            remaining = [key for key in remaining if key not in found]
+        
+        self.misses += len(remaining)
+        return found
+    
+    def _get_l1(self, key: str) -> Optional[Any]:
+        """Look up a live L1 entry and mark it recently used"""
+        with self.lock:
+            entry = self.memory_cache.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry["expires_at"]:
+                self._remove_l1(key)
+                return None
+            self.memory_cache.move_to_end(key)
+            return entry["value"]
+    
+    def _get_l3(self, keys: List[str]) -> Dict[str, Any]:
+        """Look up live L3 rows for keys on the persistent connection"""
+        found: Dict[str, Any] = {}
+        started = time.perf_counter()
+        now = datetime.now().isoformat(" ")
+        try:
+            with self.sqlite_lock:
+                for offset in range(0, len(keys), BATCH_CHUNK_SIZE):
+                    chunk = keys[offset:offset + BATCH_CHUNK_SIZE]
+                    placeholders = ", ".join("?" * len(chunk))
+                    rows = self.sqlite_conn.execute(f"""
+                        SELECT cache_key, value FROM ai_cache
+                        WHERE cache_key IN ({placeholders}) AND expires_at > ?
+                    """, (*chunk, now)).fetchall()
+                    for key, raw in rows:
+                        value = json.loads(raw)
+                        found[key] = value
+                        self.hits["L3"] += 1
+                        self.pending_hits[key] += 1
+                        logger.debug(f"L3 cache hit for key: {key}")
+                        
+                        # Promote to L1 and L2
+                        if self.enable_l1:
+                            self._set_l1(key, value, size=len(raw))
+                        if self.enable_l2:
+                            self._set_l2(key, value)
+                self._maybe_flush_hits()
+        except Exception as e:
+            logger.warning(f"SQLite get error: {e}")
+        finally:
+            self.latency["L3"].observe(time.perf_counter() - started)
+        return found
+    
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
         """
         Set value in all cache tiers
@@ -206,23 +368,80 @@ class CacheManager:
             value: Value to cache
             ttl: Optional TTL override
         """
-        if self.enable_l1:
-            self._set_l1(key, value, ttl)
+        self.set_many({key: value}, ttl)
+    
+    def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None):
+        """
+        Set several values in all cache tiers, one round trip per tier
         
-        if self.enable_l2:
-            self._set_l2(key, value, ttl)
+        Args:
+            items: Cache keys and values
+            ttl: Optional TTL override
+        """
+        if not items:
+            return
         
+        encoded = {}
         if self.enable_l3:
-            self._set_l3(key, value, ttl)
+            for key, value in items.items():
+                try:
+                    encoded[key] = json.dumps(value)
+                except (TypeError, ValueError) as e:
+                    logger.warning(f"SQLite set error: {e}")
+        
+        if self.enable_l1:
+            for key, value in items.items():
+                size = len(encoded[key]) if key in encoded else None
+                self._set_l1(key, value, ttl, size=size)
+        
+        if self.enable_l2 and self.redis_client:
+            if len(items) == 1:
+                key, value = next(iter(items.items()))
+                self._set_l2(key, value, ttl)
+            else:
+                try:
+                    pipeline = self.redis_client.pipeline()
+                    for key, value in items.items():
+                        pipeline.setex(f"ai_cache:{key}", ttl or self.L2_TTL, pickle.dumps(value))
+                    pipeline.execute()
+                    self.writes["L2"] += len(items)
+                except Exception as e:
+                    logger.warning(f"Redis set error: {e}")
+        
+        if self.enable_l3 and encoded:
+            self._set_l3(encoded, ttl)
     
-    def _set_l1(self, key: str, value: Any, ttl: Optional[int] = None):
-        """Set value in L1 (memory) cache"""
+    def _set_l1(self, key: str, value: Any, ttl: Optional[int] = None, size: Optional[int] = None):
+        """Set value in L1 (memory) cache, evicting least recently used entries"""
         ttl = ttl or self.L1_TTL
-        self.memory_cache[key] = {
-            "value": value,
-            "expires_at": time.time() + ttl
-        }
-        self.writes["L1"] += 1
+        if size is None:
+            size = self._estimate_size(value)
+        
+        with self.lock:
+            if key in self.memory_cache:
+                self._remove_l1(key)
+            if size > self.l1_max_bytes:
+                return
+            
+            self.memory_cache[key] = {
+                "value": value,
+                "expires_at": time.time() + ttl,
+                "size": size
+            }
+            self.memory_bytes += size
+            self.writes["L1"] += 1
+            
+            while (len(self.memory_cache) > self.l1_max_entries or
+                   self.memory_bytes > self.l1_max_bytes):
+                oldest = next(iter(self.memory_cache))
+                self._remove_l1(oldest)
+                self.evictions += 1
+    
+    def _remove_l1(self, key: str):
+        """Drop an L1 entry and its byte count"""
+        entry = self.memory_cache.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= entry["size"]
     
     def _set_l2(self, key: str, value: Any, ttl: Optional[int] = None):
         """Set value in L2 (Redis) cache"""
@@ -240,25 +459,63 @@ class CacheManager:
         except Exception as e:
             logger.warning(f"Redis set error: {e}")
     
-    def _set_l3(self, key: str, value: Any, ttl: Optional[int] = None):
-        """Set value in L3 (SQLite) cache"""
+    def _set_l3(self, encoded: Dict[str, str], ttl: Optional[int] = None):
+        """Set JSON-encoded values in L3 (SQLite) cache"""
         ttl = ttl or self.L3_TTL
+        now = datetime.now()
+        created_at = now.isoformat(" ")
+        expires_at = (now + timedelta(seconds=ttl)).isoformat(" ")
         try:
-            conn = sqlite3.connect(self.sqlite_path)
-            cursor = conn.cursor()
-            
-            expires_at = datetime.now() + timedelta(seconds=ttl)
-            cursor.execute("""
-                INSERT OR REPLACE INTO ai_cache (cache_key, value, created_at, expires_at, hit_count)
-                VALUES (?, ?, ?, ?, 0)
-            """, (key, json.dumps(value), datetime.now(), expires_at))
-            
-            conn.commit()
-            conn.close()
-            self.writes["L3"] += 1
+            with self.sqlite_lock:
+                self.sqlite_conn.executemany("""
+                    INSERT OR REPLACE INTO ai_cache (cache_key, value, created_at, expires_at, hit_count)
+                    VALUES (?, ?, ?, ?, 0)
+                """, [(key, raw, created_at, expires_at) for key, raw in encoded.items()])
+                for key in encoded:
+                    self.pending_hits.pop(key, None)
+                self.sqlite_conn.commit()
+            self.writes["L3"] += len(encoded)
         except Exception as e:
             logger.warning(f"SQLite set error: {e}")
     
+    def _maybe_flush_hits(self):
+        """Write buffered hit counts once enough are pending (sqlite_lock held)"""
+        if (sum(self.pending_hits.values()) >= self.HIT_FLUSH_BATCH or
+                time.time() - self.last_hit_flush >= self.HIT_FLUSH_INTERVAL):
+            self._flush_hits()
+    
+    def _flush_hits(self):
+        """Write buffered hit counts in one statement batch (sqlite_lock held)"""
+        self.last_hit_flush = time.time()
+        if not self.pending_hits:
+            return
+        pending = list(self.pending_hits.items())
+        self.pending_hits.clear()
+        self.sqlite_conn.executemany("""
+            UPDATE ai_cache SET hit_count = hit_count + ?
+            WHERE cache_key = ?
+        """, [(count, key) for key, count in pending])
+        self.sqlite_conn.commit()
+    
+    def flush(self):
+        """Write buffered L3 hit counts now"""
+        if not self.enable_l3 or self.sqlite_conn is None:
+            return
+        try:
+            with self.sqlite_lock:
+                self._flush_hits()
+        except Exception as e:
+            logger.warning(f"SQLite hit count flush error: {e}")
+    
+    def close(self):
+        """Flush pending writes and close the L3 connection"""
+        self.flush()
+        with self.sqlite_lock:
+            if self.sqlite_conn is not None:
+                self.sqlite_conn.close()
+                self.sqlite_conn = None
+        self.enable_l3 = False
+    
     def invalidate(self, key: str):
         """
         Invalidate cache entry across all tiers
@@ -267,8 +524,8 @@ class CacheManager:
             key: Cache key to invalidate
         """
         # L1
-        if key in self.memory_cache:
-            del self.memory_cache[key]
+        with self.lock:
+            self._remove_l1(key)
         
         # L2
         if self.redis_client:
@@ -280,11 +537,10 @@ class CacheManager:
         # L3
         if self.enable_l3:
             try:
-                conn = sqlite3.connect(self.sqlite_path)
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM ai_cache WHERE cache_key = ?", (key,))
-                conn.commit()
-                conn.close()
+                with self.sqlite_lock:
+                    self.pending_hits.pop(key, None)
+                    self.sqlite_conn.execute("DELETE FROM ai_cache WHERE cache_key = ?", (key,))
+                    self.sqlite_conn.commit()
             except Exception as e:
                 logger.warning(f"SQLite delete error: {e}")
     
@@ -292,21 +548,23 @@ class CacheManager:
         """Clear expired entries from all cache tiers"""
         # L1
         now = time.time()
-        expired_keys = [
-            k for k, v in self.memory_cache.items()
-            if v["expires_at"] < now
-        ]
-        for key in expired_keys:
-            del self.memory_cache[key]
+        with self.lock:
+            expired_keys = [
+                k for k, v in self.memory_cache.items()
+                if v["expires_at"] < now
+            ]
+            for key in expired_keys:
+                self._remove_l1(key)
         
         # L3
         if self.enable_l3:
             try:
-                conn = sqlite3.connect(self.sqlite_path)
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM ai_cache WHERE expires_at < ?", (datetime.now(),))
-                conn.commit()
-                conn.close()
+                with self.sqlite_lock:
+                    self._flush_hits()
+                    self.sqlite_conn.execute(
+                        "DELETE FROM ai_cache WHERE expires_at < ?", (datetime.now().isoformat(" "),)
+                    )
+                    self.sqlite_conn.commit()
             except Exception as e:
                 logger.warning(f"SQLite cleanup error: {e}")
     
@@ -315,7 +573,7 @@ class CacheManager:
         Get cache statistics
         
         Returns:
-            Dictionary with cache stats
+            Dictionary with cache stats and per-tier lookup latency histograms
         """
         total_hits = sum(self.hits.values())
         total_requests = total_hits + self.misses
@@ -326,6 +584,10 @@ class CacheManager:
             "writes": self.writes,
             "hit_rate": (total_hits / total_requests * 100) if total_requests > 0 else 0,
             "memory_cache_size": len(self.memory_cache),
+            "memory_cache_bytes": self.memory_bytes,
+            "evictions": self.evictions,
+            "pending_hit_writes": sum(self.pending_hits.values()),
+            "latency": {tier: histogram.snapshot() for tier, histogram in self.latency.items()},
             "enabled_tiers": {
                 "L1": self.enable_l1,
                 "L2": self.enable_l2,
@@ -339,17 +601,26 @@ def cached(cache_manager: CacheManager, ttl: Optional[int] = None):
     Decorator for caching function results
     
     Args:
-        cache_manager: CacheManager instance
+        cache_manager: CacheManager instance, or None on a method to use
+            the instance's own cache_manager (self is left out of the key)
         ttl: Optional TTL override
     """
     def decorator(func: Callable):
         @wraps(func)
         def wrapper(*args, **kwargs):
+            manager = cache_manager
+            key_args = args
+            if manager is None:
+                manager = getattr(args[0], "cache_manager", None) if args else None
+                key_args = args[1:]
+            if manager is None:
+                return func(*args, **kwargs)
+            
             # Generate cache key
-            cache_key = cache_manager._generate_key(func.__name__, *args, **kwargs)
+            cache_key = manager._generate_key(func.__name__, *key_args, **kwargs)
             
             # Check cache
-            cached_result = cache_manager.get(cache_key)
+            cached_result = manager.get(cache_key)
             if cached_result is not None:
                 return cached_result
             
@@ -357,9 +628,9 @@ def cached(cache_manager: CacheManager, ttl: Optional[int] = None):
             result = func(*args, **kwargs)
             
             # Store in cache
-            cache_manager.set(cache_key, result, ttl)
+            manager.set(cache_key, result, ttl)
             
             return result
         
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
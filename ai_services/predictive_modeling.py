@@ -4,7 +4,7 @@ Uses AI to predict sales impact of proposed planogram modifications
 """
 
 import json
-import sqlite3
+import db_pool
 import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
@@ -47,7 +47,7 @@ class PredictiveModeler:
     
     def _get_baseline_performance(self, device_id: int, cabinet_index: int) -> Dict:
         """Get current planogram performance baseline"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         # Get last 30 days performance
@@ -115,7 +115,7 @@ class PredictiveModeler:
     
     def _analyze_historical_patterns(self, device_id: int) -> Dict:
         """Analyze historical patterns for prediction accuracy"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         # Get seasonal patterns
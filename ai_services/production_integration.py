@@ -450,16 +450,13 @@ def create_app():
             return jsonify({'error': 'Cache not available'}), 503
         
         try:
-            cache_dir = pipeline.cache.cache_dir
-            cache_files = os.listdir(cache_dir)
-            total_size = sum(
-                os.path.getsize(os.path.join(cache_dir, f))
-                for f in cache_files
-            ) / 1024 / 1024  # MB
+            stats = pipeline.cache.get_stats()
             
             return jsonify({
-                'entries': len(cache_files),
-                'size_mb': round(total_size, 2),
+                'entries': stats['entries'],
+                'size_mb': round(stats['size_bytes'] / 1024 / 1024, 2),
+                'hit_rate': round(stats['hit_rate'], 3),
+                'similar_hits': stats['similar_hits'],
                 'ttl_hours': pipeline.cache.ttl.total_seconds() / 3600
             })
             
@@ -474,8 +471,8 @@ def create_app():
             return jsonify({'error': 'Cache not available'}), 503
         
         try:
-            pipeline.cache.clear_expired()
-            return jsonify({'success': True, 'message': 'Expired cache cleared'})
+            removed = pipeline.cache.clear_expired()
+            return jsonify({'success': True, 'message': 'Expired cache cleared', 'removed': removed})
             
         except Exception as e:
             logger.error(f"Cache clear error: {e}")
@@ -10,6 +10,7 @@ import json
 from typing import Dict, Optional
 from ai_services.realtime_pipeline import RealtimePlanogramPipeline, StreamingAssistant
 import anthropic
+import db_pool
 
 def setup_realtime_routes(app, db_path='cvd.db'):
     """Setup real-time AI assistant routes"""
@@ -210,9 +211,7 @@ def validate_single_change(context: Dict, change: Dict) -> Dict:
 
 def find_similar_devices(device_id: int, limit: int = 5) -> list:
     """Find similar devices based on location type and performance"""
-    import sqlite3
-    
-    conn = sqlite3.connect('cvd.db')
+    conn = db_pool.connect_readonly('cvd.db')
     cursor = conn.cursor()
     
     # Get device characteristics
@@ -272,9 +271,7 @@ def analyze_patterns(context: Dict, similar_devices: list) -> list:
 
 def get_device_pattern(device_id: int) -> Dict:
     """Extract successful patterns from a device"""
-    import sqlite3
-    
-    conn = sqlite3.connect('cvd.db')
+    conn = db_pool.connect_readonly('cvd.db')
     cursor = conn.cursor()
     
     # Get top performing product positions
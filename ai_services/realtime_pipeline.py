@@ -5,6 +5,7 @@ Structures and optimizes data for LLM consumption
 
 import json
 import sqlite3
+import db_pool
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import hashlib
@@ -82,7 +83,7 @@ class RealtimePlanogramPipeline:
         if self._is_cache_valid(cache_key):
             return self.cache[cache_key]['data']
         
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -103,7 +104,7 @@ class RealtimePlanogramPipeline:
     
     def _get_cabinet_info(self, device_id: int, cabinet_index: int) -> Dict:
         """Get cabinet configuration"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -121,7 +122,7 @@ class RealtimePlanogramPipeline:
     
     def _get_planogram_state(self, device_id: int, cabinet_index: int) -> Dict:
         """Get current planogram state summary"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         planogram_key = f"{device_id}_{cabinet_index}"
@@ -177,7 +178,7 @@ class RealtimePlanogramPipeline:
     
     def _get_performance_metrics(self, device_id: int, days: int = 30) -> Dict:
         """Get performance metrics optimized for token usage"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         # Get revenue summary
@@ -4,7 +4,7 @@ Uses Claude's vision capabilities to analyze planogram layouts and generate heat
 """
 
 import json
-import sqlite3
+import db_pool
 import base64
 import io
 from PIL import Image, ImageDraw, ImageFont
@@ -53,7 +53,7 @@ class VisualPlanogramAnalyzer:
     
     def _generate_planogram_image(self, device_id: int, cabinet_index: int) -> bytes:
         """Generate visual representation of planogram"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         # Get cabinet configuration
@@ -201,7 +201,7 @@ class VisualPlanogramAnalyzer:
     
     def _get_sales_context(self, device_id: int) -> Dict:
         """Get sales context for visual analysis"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         # Get top/bottom performers
@@ -309,7 +309,7 @@ Format response as JSON with these sections:
     
     def _generate_heatmaps(self, device_id: int, cabinet_index: int) -> Dict:
         """Generate various heatmaps for the planogram"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         # Get cabinet dimensions
@@ -396,7 +396,7 @@ Format response as JSON with these sections:
     
     def _analyze_visibility_zones(self, device_id: int, cabinet_index: int) -> Dict:
         """Analyze visibility zones and their performance"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_pool.connect_readonly(self.db_path)
         cursor = conn.cursor()
         
         # Get cabinet dimensions
@@ -131,7 +131,29 @@ class CVDApi {
         const devices = await this.makeRequest('GET', '/devices');
         return devices;
     }
-    
+
+    /**
+     * Get one keyset-paginated page of devices
+     * @param {Object} options - Page options
+     * @param {number} options.limit - Page size (max 500)
+     * @param {string} options.after - pagination.nextCursor from the previous page
+     * @param {Array<string>} options.fields - Device fields to return
+     * @returns {Promise<Object>} { devices, pagination: { limit, hasMore, nextCursor } }
+     */
+    async getDevicesPage(options = {}) {
+        let endpoint = '/devices';
+        const params = new URLSearchParams();
+
+        params.append('limit', options.limit || 100);
+        if (options.after) params.append('after', options.after);
+        if (options.fields) params.append('fields', options.fields.join(','));
+
+        endpoint += `?${params.toString()}`;
+
+        const page = await this.makeRequest('GET', endpoint);
+        return page;
+    }
+
     /**
      * Check if an asset number already exists
      * @param {string} assetNumber - Asset number to check
@@ -524,7 +546,28 @@ class CVDApi {
         
         return responseData;
     }
-    
+
+    async parseDexBatch(files) {
+        // Accepts an array of File objects (.txt DEX files and/or .zip archives)
+        const formData = new FormData();
+        for (const file of files) {
+            formData.append('files', file);
+        }
+
+        const response = await fetch(`${this.baseUrl}/dex/parse-batch`, {
+            method: 'POST',
+            body: formData,
+            credentials: 'include'
+        });
+
+        const responseData = await response.json();
+        if (!response.ok) {
+            throw new Error(responseData.error?.message || `API error: ${response.status} ${response.statusText}`);
+        }
+
+        return responseData;
+    }
+
     async getDexPARecords(readId) {
         return await this.makeRequest('GET', `/dex/pa-records/${readId}`);
     }
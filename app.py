@@ -13,9 +13,14 @@ from datetime import datetime, timedelta
 import json
 import os
 import secrets
+import tempfile
+import zipfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import closing
 from werkzeug.security import generate_password_hash, check_password_hash
-from dex_parser import DEXParser
+from dex_parser import DEXParser, parse_dex_upload, open_dex_source
+from dex_content_store import stream_content_hash, decode_raw_content, RawContentWriter
 from planogram_optimizer import PlanogramOptimizer
 from auth import AuthManager, log_audit_event
 import requests
@@ -23,6 +28,12 @@ import time
 from activity_tracker import ActivityTracker
 from security_monitor import SecurityMonitor
 from activity_trends_api import init_trends_module
+from order_preview_service import OrderPreviewEngine
+import db_pool
+from slot_metrics_service import (
+    SlotMetricsWorker, record_sales, mark_dirty, load_active_slots,
+    refresh_slot_metrics_for_pairs, reconcile_slot_metrics
+)
 
 app = Flask(__name__)
 
@@ -72,6 +83,10 @@ auth_manager = AuthManager(app, DATABASE)
 # Initialize activity tracker and security monitor
 activity_tracker = None  # Will be initialized after database setup
 security_monitor = None  # Will be initialized after database setup
+slot_metrics_worker = None  # Will be initialized after database setup
+
+# Per-process order preview engine with memoized cabinet product aggregates
+order_preview_engine = OrderPreviewEngine()
 
 def get_db():
     """Get database connection for current request context"""
@@ -84,13 +99,13 @@ def get_db():
             app.logger.error(f"Current working directory: {os.getcwd()}")
             app.logger.error(f"Directory contents: {os.listdir('.')}")
             raise FileNotFoundError(f"Database not found: {db_path}")
-        db = g._database = sqlite3.connect(db_path)
+        db = g._database = db_pool.connect(db_path)
         db.row_factory = sqlite3.Row
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    """Close database connection at end of request"""
+    """Return database connection to the pool at end of request"""
     db = getattr(g, '_database', None)
     if db is not None:
         db.close()
@@ -419,6 +434,61 @@ def init_db():
             )
         ''')
         
+        # Rolling per-day sales counters used for incremental slot_metrics refreshes
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS sales_daily_counters (
+                device_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                sale_date DATE NOT NULL,
+                units INTEGER NOT NULL DEFAULT 0,
+                first_sale_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (device_id, product_id, sale_date)
+            )
+        ''')
+        
+        # (device_id, product_id) pairs whose slot_metrics need recalculating
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS slot_metrics_dirty (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                marked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(device_id, product_id)
+            )
+        ''')
+        
+        # Per-cabinet change counters used to key memoized order previews.
+        # planogram_version is bumped by the triggers below; metrics_version by upsert_slot_metrics
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS cabinet_versions (
+                cabinet_id INTEGER PRIMARY KEY,
+                planogram_version INTEGER NOT NULL DEFAULT 0,
+                metrics_version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_planogram_slots_{event.lower()}_version
+                AFTER {event} ON planogram_slots
+                BEGIN
+                    INSERT INTO cabinet_versions (cabinet_id, planogram_version)
+                    SELECT cabinet_id, 1 FROM planograms WHERE id = {row}.planogram_id
+                    ON CONFLICT(cabinet_id) DO UPDATE SET planogram_version = planogram_version + 1;
+                END
+            ''')
+        
+        for event, row in (('INSERT', 'NEW'), ('DELETE', 'OLD')):
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_planograms_{event.lower()}_version
+                AFTER {event} ON planograms
+                BEGIN
+                    INSERT INTO cabinet_versions (cabinet_id, planogram_version)
+                    VALUES ({row}.cabinet_id, 1)
+                    ON CONFLICT(cabinet_id) DO UPDATE SET planogram_version = planogram_version + 1;
+                END
+            ''')
+        
         # Create device_routes table for many-to-many relationship
         db.execute('''
             CREATE TABLE IF NOT EXISTS device_routes (
@@ -444,7 +514,9 @@ def init_db():
                 parsed_successfully BOOLEAN DEFAULT FALSE,
                 error_message TEXT,
                 error_line INTEGER,
-                error_field INTEGER
+                error_field INTEGER,
+                content_hash VARCHAR(64),
+                content_encoding VARCHAR(10) DEFAULT 'text'
             )
         ''')
         
@@ -482,6 +554,8 @@ def init_db():
                 discount_sales_cents INTEGER,
                 line_number INTEGER NOT NULL,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                row VARCHAR(10),
+                "column" VARCHAR(10),
                 FOREIGN KEY (dex_read_id) REFERENCES dex_reads(id) ON DELETE CASCADE
             )
         ''')
@@ -799,6 +873,30 @@ def migrate_database_schema():
         if 'previous_product_id' not in columns:
             cursor.execute("ALTER TABLE planogram_slots ADD COLUMN previous_product_id INTEGER")
         
+        # Check dex_pa_records table for grid position columns
+        table_info = cursor.execute("PRAGMA table_info(dex_pa_records)").fetchall()
+        columns = {col[1] for col in table_info}
+        
+        if table_info and 'row' not in columns:
+            cursor.execute("ALTER TABLE dex_pa_records ADD COLUMN row VARCHAR(10)")
+        
+        if table_info and 'column' not in columns:
+            cursor.execute('ALTER TABLE dex_pa_records ADD COLUMN "column" VARCHAR(10)')
+        
+        # Check dex_reads table for content hash deduplication columns
+        table_info = cursor.execute("PRAGMA table_info(dex_reads)").fetchall()
+        columns = {col[1] for col in table_info}
+        
+        if table_info:
+            if 'content_hash' not in columns:
+                cursor.execute("ALTER TABLE dex_reads ADD COLUMN content_hash VARCHAR(64)")
+            
+            if 'content_encoding' not in columns:
+                cursor.execute("ALTER TABLE dex_reads ADD COLUMN content_encoding VARCHAR(10) DEFAULT 'text'")
+            
+            # NULL hashes (reads stored before hashing) are allowed to repeat
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_dex_reads_content_hash ON dex_reads(content_hash)')
+        
         # Initialize route planning config if not exists
         cursor.execute("SELECT COUNT(*) FROM route_planning_config")
         if cursor.fetchone()[0] == 0:
@@ -1109,46 +1207,7 @@ class RouteMetricsService:
     @staticmethod
     def calculate_device_metrics(device_id):
         """Calculate and cache all metrics for a device"""
-        db = get_db()
-        cursor = db.cursor()
-        
-        try:
-            # Calculate individual metrics
-            sold_out_count = RouteMetricsService.calculate_sold_out_count(device_id)
-            units_to_par = RouteMetricsService.calculate_units_to_par(device_id)
-            product_level = RouteMetricsService.calculate_product_level(device_id)
-            dri = RouteMetricsService.calculate_days_remaining_inventory(device_id)
-            data_collection_rate = 100.0  # Placeholder - would check device connectivity
-            
-            # Cache the results
-            cursor.execute('''
-                INSERT INTO device_metrics 
-                (device_id, sold_out_count, days_remaining_inventory, 
-                 data_collection_rate, product_level_percent, units_to_par, last_calculated)
-                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ON CONFLICT(device_id) DO UPDATE SET
-                    sold_out_count = excluded.sold_out_count,
-                    days_remaining_inventory = excluded.days_remaining_inventory,
-                    data_collection_rate = excluded.data_collection_rate,
-                    product_level_percent = excluded.product_level_percent,
-                    units_to_par = excluded.units_to_par,
-                    last_calculated = CURRENT_TIMESTAMP
-            ''', (device_id, sold_out_count, dri, data_collection_rate, product_level, units_to_par))
-            
-            db.commit()
-            
-            return {
-                'soldOutCount': sold_out_count,
-                'daysRemainingInventory': dri,
-                'dataCollectionRate': data_collection_rate,
-                'productLevelPercent': product_level,
-                'unitsToPar': units_to_par
-            }
-            
-        except Exception as e:
-            print(f"Error calculating metrics for device {device_id}: {e}")
-            db.rollback()
-            return None
+        return RouteMetricsService.calculate_batch_device_metrics([device_id]).get(device_id)
     
     @staticmethod
     def calculate_sold_out_count(device_id):
@@ -1276,10 +1335,274 @@ class RouteMetricsService:
         
         return round(result['days'], 1) if result else None
 
+    # Keep IN (...) lists well under SQLite's default 999 bound-variable limit
+    BATCH_CHUNK_SIZE = 500
+
+    @staticmethod
+    def _chunks(ids):
+        """Yield de-duplicated device ID lists sized for an IN (...) clause"""
+        unique_ids = list(dict.fromkeys(ids))
+        size = RouteMetricsService.BATCH_CHUNK_SIZE
+        for start in range(0, len(unique_ids), size):
+            yield unique_ids[start:start + size]
+
+    @staticmethod
+    def calculate_batch_device_metrics(device_ids):
+        """
+        Calculate and cache metrics for a set of devices in grouped passes.
+
+        Slot aggregates, per-product inventory and 30-day sales velocity are
+        each fetched with one GROUP BY query per chunk of devices, joined in
+        memory, and written back to device_metrics with a single executemany.
+        Returns {device_id: metrics} using the same keys and defaults as
+        calculate_device_metrics.
+        """
+        db = get_db()
+        cursor = db.cursor()
+        results = {}
+
+        try:
+            for chunk in RouteMetricsService._chunks(device_ids):
+                placeholders = ','.join('?' * len(chunk))
+
+                # Pass 1: sold out count, units to par and fill level per device
+                slot_totals = {}
+                for row in cursor.execute(f'''
+                    SELECT
+                        cc.device_id,
+                        SUM(CASE WHEN ps.quantity = 0 THEN 1 ELSE 0 END) as sold_out_count,
+                        SUM(CASE WHEN ps.par_level > ps.quantity
+                            THEN ps.par_level - ps.quantity ELSE 0 END) as units_to_par,
+                        AVG(CASE
+                            WHEN ps.capacity > 0 THEN (ps.quantity * 1.0 / ps.capacity) * 100
+                            ELSE 0
+                        END) as avg_fill
+                    FROM planogram_slots ps
+                    JOIN planograms p ON ps.planogram_id = p.id
+                    JOIN cabinet_configurations cc ON p.cabinet_id = cc.id
+                    WHERE cc.device_id IN ({placeholders})
+                    AND ps.product_id != 1  -- Exclude empty slot sentinel
+                    GROUP BY cc.device_id
+                ''', chunk):
+                    slot_totals[row['device_id']] = row
+
+                # Pass 2: current inventory per device and product
+                inventory = {}
+                for row in cursor.execute(f'''
+                    SELECT
+                        cc.device_id,
+                        ps.product_id,
+                        SUM(ps.quantity) as total_quantity
+                    FROM planogram_slots ps
+                    JOIN planograms p ON ps.planogram_id = p.id
+                    JOIN cabinet_configurations cc ON p.cabinet_id = cc.id
+                    WHERE cc.device_id IN ({placeholders})
+                    AND ps.product_id != 1  -- Exclude empty slot sentinel
+                    GROUP BY cc.device_id, ps.product_id
+                ''', chunk):
+                    inventory.setdefault(row['device_id'], []).append(
+                        (row['product_id'], row['total_quantity'])
+                    )
+
+                # Pass 3: daily consumption rate per device and product (last 30 days)
+                consumption_rates = {}
+                for row in cursor.execute(f'''
+                    SELECT
+                        s.device_id,
+                        s.product_id,
+                        SUM(s.sale_units) as total_units,
+                        COUNT(DISTINCT DATE(s.created_at)) as days_with_sales
+                    FROM sales s
+                    WHERE s.device_id IN ({placeholders})
+                    AND s.created_at >= datetime('now', '-30 days')
+                    GROUP BY s.device_id, s.product_id
+                ''', chunk):
+                    if row['days_with_sales'] > 0:
+                        consumption_rates[(row['device_id'], row['product_id'])] = \
+                            row['total_units'] / row['days_with_sales']
+
+                # In-memory join
+                for device_id in chunk:
+                    totals = slot_totals.get(device_id)
+
+                    min_days = 999.0
+                    for product_id, quantity in inventory.get(device_id, []):
+                        rate = consumption_rates.get((device_id, product_id), 0)
+                        if rate > 0:
+                            min_days = min(min_days, quantity / rate)
+
+                    results[device_id] = {
+                        'soldOutCount': (totals['sold_out_count'] or 0) if totals else 0,
+                        'daysRemainingInventory': round(min_days, 1),
+                        'dataCollectionRate': 100.0,  # Placeholder - would check device connectivity
+                        'productLevelPercent': round((totals['avg_fill'] or 0.0) if totals else 0.0, 1),
+                        'unitsToPar': (totals['units_to_par'] or 0) if totals else 0
+                    }
+
+            # Cache all results in one statement
+            cursor.executemany('''
+                INSERT INTO device_metrics
+                (device_id, sold_out_count, days_remaining_inventory,
+                 data_collection_rate, product_level_percent, units_to_par, last_calculated)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(device_id) DO UPDATE SET
+                    sold_out_count = excluded.sold_out_count,
+                    days_remaining_inventory = excluded.days_remaining_inventory,
+                    data_collection_rate = excluded.data_collection_rate,
+                    product_level_percent = excluded.product_level_percent,
+                    units_to_par = excluded.units_to_par,
+                    last_calculated = CURRENT_TIMESTAMP
+            ''', [
+                (device_id, m['soldOutCount'], m['daysRemainingInventory'],
+                 m['dataCollectionRate'], m['productLevelPercent'], m['unitsToPar'])
+                for device_id, m in results.items()
+            ])
+
+            db.commit()
+            return results
+
+        except Exception as e:
+            print(f"Error calculating batch metrics for {len(device_ids)} devices: {e}")
+            db.rollback()
+            return {}
+
+    @staticmethod
+    def get_cached_device_metrics(device_ids, include_stale=False):
+        """
+        Return {device_id: metrics} for devices with metrics fresher than 15 minutes.
+        With include_stale, older rows are returned too and every entry carries
+        a 'stale' flag.
+        """
+        db = get_db()
+        cursor = db.cursor()
+        cached = {}
+
+        for chunk in RouteMetricsService._chunks(device_ids):
+            placeholders = ','.join('?' * len(chunk))
+            for row in cursor.execute(f'''
+                SELECT device_id, sold_out_count, days_remaining_inventory, data_collection_rate,
+                       product_level_percent, units_to_par, last_calculated,
+                       datetime(last_calculated) > datetime('now', '-15 minutes') as is_fresh
+                FROM device_metrics
+                WHERE device_id IN ({placeholders})
+            ''', chunk):
+                if not row['is_fresh'] and not include_stale:
+                    continue
+                metrics = {
+                    'soldOutCount': row['sold_out_count'],
+                    'daysRemainingInventory': row['days_remaining_inventory'],
+                    'dataCollectionRate': row['data_collection_rate'],
+                    'productLevelPercent': row['product_level_percent'],
+                    'unitsToPar': row['units_to_par'],
+                    'lastCalculated': row['last_calculated']
+                }
+                if include_stale:
+                    metrics['stale'] = not row['is_fresh']
+                cached[row['device_id']] = metrics
+
+        return cached
+
+    @staticmethod
+    def get_batch_days_since_service(device_ids):
+        """Get days since last service visit for a set of devices"""
+        db = get_db()
+        cursor = db.cursor()
+        days_since = {}
+
+        for chunk in RouteMetricsService._chunks(device_ids):
+            placeholders = ','.join('?' * len(chunk))
+            for row in cursor.execute(f'''
+                SELECT device_id, julianday('now') - julianday(MAX(service_date)) as days
+                FROM service_visits
+                WHERE device_id IN ({placeholders})
+                GROUP BY device_id
+            ''', chunk):
+                if row['days'] is not None:
+                    days_since[row['device_id']] = round(row['days'], 1)
+
+        return days_since
+
 
 class ServiceOrderService:
     """Service for creating and managing cabinet-centric service orders"""
     
+    # Selections per VALUES chunk: three bound variables each, under SQLite's 999 default
+    SELECTION_CHUNK_SIZE = 300
+    
+    @staticmethod
+    def load_cabinet_needs(cursor, cabinet_selections):
+        """
+        Resolve cabinet selections and the products each cabinet needs with one
+        VALUES-joined query per chunk of selections.
+        Returns (cabinet_ids, needs): cabinet_ids maps (deviceId, cabinetIndex) to the
+        cabinet configuration id; needs lists rows with cabinet_config_id, product_id,
+        product_name, category and quantity_needed in selection order.
+        """
+        # Repeated selections name the same cabinet; keep the first occurrence
+        selections = list(dict.fromkeys(
+            (selection['deviceId'], selection['cabinetIndex']) for selection in cabinet_selections
+        ))
+        
+        cabinet_ids = {}
+        needs = []
+        chunk_size = ServiceOrderService.SELECTION_CHUNK_SIZE
+        for start in range(0, len(selections), chunk_size):
+            chunk = selections[start:start + chunk_size]
+            values_sql = ','.join('(?, ?, ?)' for _ in chunk)
+            params = [value for position, (device_id, cabinet_index) in enumerate(chunk, start)
+                      for value in (position, device_id, cabinet_index)]
+            
+            rows = cursor.execute(f'''
+                WITH selections(position, device_id, cabinet_index) AS (VALUES {values_sql})
+                SELECT 
+                    s.device_id,
+                    s.cabinet_index,
+                    cc.id as cabinet_config_id,
+                    ps.product_id,
+                    ps.product_name,
+                    pr.category,
+                    SUM(ps.par_level - ps.quantity) as quantity_needed
+                FROM selections s
+                JOIN cabinet_configurations cc
+                    ON cc.device_id = s.device_id AND cc.cabinet_index = s.cabinet_index
+                LEFT JOIN planograms p ON p.cabinet_id = cc.id
+                LEFT JOIN planogram_slots ps ON ps.planogram_id = p.id
+                    AND ps.product_id != 1
+                    AND ps.par_level > ps.quantity
+                LEFT JOIN products pr ON ps.product_id = pr.id
+                GROUP BY s.position, cc.id, ps.product_id, ps.product_name
+                ORDER BY s.position, ps.product_id, ps.product_name
+            ''', params).fetchall()
+            
+            for row in rows:
+                cabinet_ids.setdefault((row['device_id'], row['cabinet_index']), row['cabinet_config_id'])
+                if row['product_id'] is not None:
+                    needs.append(row)
+        
+        return cabinet_ids, needs
+    
+    @staticmethod
+    def build_pick_list(needs):
+        """Aggregate per-cabinet product needs into a pick list sorted by category, then name"""
+        product_totals = {}
+        for product in needs:
+            key = product['product_id']
+            if key in product_totals:
+                product_totals[key]['quantity'] += product['quantity_needed']
+            else:
+                product_totals[key] = {
+                    'productId': product['product_id'],
+                    'productName': product['product_name'],
+                    'category': product['category'],
+                    'quantity': product['quantity_needed']
+                }
+        
+        # Convert to list and sort by category, then name
+        pick_list = list(product_totals.values())
+        pick_list.sort(key=lambda x: (x['category'] or '', x['productName']))
+        
+        return pick_list
+    
     @staticmethod
     def create_service_order(route_id, cabinet_selections, created_by=None):
         """
@@ -1297,8 +1620,14 @@ class ServiceOrderService:
             
             driver_id = route_info['driver_id'] if route_info else None
             
-            # Calculate pick list from cabinet selections
-            pick_list = ServiceOrderService.calculate_pick_list(cabinet_selections)
+            # Resolve every selection and its product needs once; reused for items and pick list
+            cabinet_ids, needs = ServiceOrderService.load_cabinet_needs(cursor, cabinet_selections)
+            
+            for selection in cabinet_selections:
+                if (selection['deviceId'], selection['cabinetIndex']) not in cabinet_ids:
+                    raise ValueError(f"Cabinet configuration not found for device {selection['deviceId']}, cabinet {selection['cabinetIndex']}")
+            
+            pick_list = ServiceOrderService.build_pick_list(needs)
             
             # Calculate total units and estimated time
             total_units = sum(item['quantity'] for item in pick_list)
@@ -1314,48 +1643,30 @@ class ServiceOrderService:
             order_id = cursor.lastrowid
             
             # Create service order cabinet entries
-            for selection in cabinet_selections:
-                device_id = selection['deviceId']
-                cabinet_index = selection['cabinetIndex']
-                
-                # Get cabinet configuration ID
-                cabinet_config = cursor.execute('''
-                    SELECT id FROM cabinet_configurations
-                    WHERE device_id = ? AND cabinet_index = ?
-                ''', (device_id, cabinet_index)).fetchone()
-                
-                if not cabinet_config:
-                    raise ValueError(f"Cabinet configuration not found for device {device_id}, cabinet {cabinet_index}")
-                
-                # Create service order cabinet entry
-                cursor.execute('''
-                    INSERT INTO service_order_cabinets
-                    (service_order_id, cabinet_configuration_id)
-                    VALUES (?, ?)
-                ''', (order_id, cabinet_config['id']))
-                
-                service_order_cabinet_id = cursor.lastrowid
-                
-                # Get products needed for this cabinet
-                products_needed = cursor.execute('''
-                    SELECT 
-                        ps.product_id,
-                        SUM(ps.par_level - ps.quantity) as quantity_needed
-                    FROM planogram_slots ps
-                    JOIN planograms p ON ps.planogram_id = p.id
-                    WHERE p.cabinet_id = ?
-                    AND ps.product_id != 1
-                    AND ps.par_level > ps.quantity
-                    GROUP BY ps.product_id
-                ''', (cabinet_config['id'],)).fetchall()
-                
-                # Create service order cabinet items
-                for product in products_needed:
-                    cursor.execute('''
-                        INSERT INTO service_order_cabinet_items
-                        (service_order_cabinet_id, product_id, quantity_needed)
-                        VALUES (?, ?, ?)
-                    ''', (service_order_cabinet_id, product['product_id'], product['quantity_needed']))
+            cursor.executemany('''
+                INSERT INTO service_order_cabinets
+                (service_order_id, cabinet_configuration_id)
+                VALUES (?, ?)
+            ''', [(order_id, cabinet_config_id) for cabinet_config_id in dict.fromkeys(cabinet_ids.values())])
+            
+            order_cabinet_ids = {
+                row['cabinet_configuration_id']: row['id'] for row in cursor.execute('''
+                    SELECT id, cabinet_configuration_id FROM service_order_cabinets
+                    WHERE service_order_id = ?
+                ''', (order_id,))
+            }
+            
+            # Create service order cabinet items, one per cabinet and product
+            cabinet_items = {}
+            for product in needs:
+                key = (order_cabinet_ids[product['cabinet_config_id']], product['product_id'])
+                cabinet_items[key] = cabinet_items.get(key, 0) + product['quantity_needed']
+            
+            cursor.executemany('''
+                INSERT INTO service_order_cabinet_items
+                (service_order_cabinet_id, product_id, quantity_needed)
+                VALUES (?, ?, ?)
+            ''', [key + (quantity,) for key, quantity in cabinet_items.items()])
             
             db.commit()
             
@@ -1374,56 +1685,8 @@ class ServiceOrderService:
     def calculate_pick_list(cabinet_selections):
         """Calculate aggregated pick list across all selected cabinets"""
         db = get_db()
-        cursor = db.cursor()
-        
-        # Build query to aggregate products needed
-        product_totals = {}
-        
-        for selection in cabinet_selections:
-            device_id = selection['deviceId']
-            cabinet_index = selection['cabinetIndex']
-            
-            # Get cabinet configuration ID
-            cabinet_config = cursor.execute('''
-                SELECT id FROM cabinet_configurations
-                WHERE device_id = ? AND cabinet_index = ?
-            ''', (device_id, cabinet_index)).fetchone()
-            
-            if not cabinet_config:
-                continue
-            
-            products = cursor.execute('''
-                SELECT 
-                    ps.product_id,
-                    ps.product_name,
-                    pr.category,
-                    SUM(ps.par_level - ps.quantity) as quantity_needed
-                FROM planogram_slots ps
-                JOIN planograms p ON ps.planogram_id = p.id
-                LEFT JOIN products pr ON ps.product_id = pr.id
-                WHERE p.cabinet_id = ?
-                AND ps.product_id != 1
-                AND ps.par_level > ps.quantity
-                GROUP BY ps.product_id, ps.product_name
-            ''', (cabinet_config['id'],)).fetchall()
-            
-            for product in products:
-                key = product['product_id']
-                if key in product_totals:
-                    product_totals[key]['quantity'] += product['quantity_needed']
-                else:
-                    product_totals[key] = {
-                        'productId': product['product_id'],
-                        'productName': product['product_name'],
-                        'category': product['category'],
-                        'quantity': product['quantity_needed']
-                    }
-        
-        # Convert to list and sort by category, then name
-        pick_list = list(product_totals.values())
-        pick_list.sort(key=lambda x: (x['category'] or '', x['productName']))
-        
-        return pick_list
+        _, needs = ServiceOrderService.load_cabinet_needs(db.cursor(), cabinet_selections)
+        return ServiceOrderService.build_pick_list(needs)
 
 # Authentication Endpoints
 
@@ -1544,6 +1807,7 @@ def logout():
         cursor = db.cursor()
         cursor.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
         db.commit()
+        auth_manager.invalidate_session(session_id)
         
         log_audit_event(g.user['id'], 'LOGOUT', 'user', g.user['id'], 'User logged out')
     
@@ -1644,6 +1908,7 @@ def update_profile():
     ''', (new_email, datetime.now(), g.user['id']))
     
     db.commit()
+    auth_manager.invalidate_user_sessions(g.user['id'])
     
     # Update g.user with new email
     g.user['email'] = new_email
@@ -1930,6 +2195,7 @@ def update_user(user_id):
         query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = ?"
         cursor.execute(query, params)
         db.commit()
+        auth_manager.invalidate_user_sessions(user_id)
         
         # Log changes
         changes = ', '.join([f"{k}={v}" for k, v in data.items() if k in allowed_fields])
@@ -1979,6 +2245,7 @@ def delete_user(user_id):
         cursor.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
         
         db.commit()
+        auth_manager.invalidate_user_sessions(user_id)
         
         log_audit_event(g.user['id'], 'USER_DELETE', 'user', user_id, 
                        f"Deactivated user {user['username']}")
@@ -2131,6 +2398,7 @@ def deactivate_user(user_id):
         cursor.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
         
         db.commit()
+        auth_manager.invalidate_user_sessions(user_id)
         
         # Log audit event
         log_user_lifecycle_event(
@@ -2261,6 +2529,7 @@ def soft_delete_user(user_id):
         cursor.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
         
         db.commit()
+        auth_manager.invalidate_user_sessions(user_id)
         
         # Log audit event
         log_user_lifecycle_event(
@@ -2335,8 +2604,20 @@ def batch_deactivate_users():
     
     db = get_db()
     results = []
+    deactivated_ids = []
     
     for user_id in user_ids:
+        # JSON ids may arrive as strings; session cache and self checks compare ints
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            results.append({
+                'user_id': user_id,
+                'status': 'failed',
+                'reason': 'Invalid user ID'
+            })
+            continue
+        
         # Check constraints for each user
         if check_user_service_orders(user_id, db):
             results.append({
@@ -2397,6 +2678,7 @@ def batch_deactivate_users():
             
             # Invalidate sessions
             cursor.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+            deactivated_ids.append(user_id)
             
             results.append({
                 'user_id': user_id,
@@ -2418,6 +2700,10 @@ def batch_deactivate_users():
         db.rollback()
         return jsonify({'error': f'Batch operation failed: {str(e)}'}), 500
     
+    # Drop cached sessions only once the deactivations are committed
+    for user_id in deactivated_ids:
+        auth_manager.invalidate_user_sessions(user_id)
+    
     return jsonify({'results': results})
 
 @app.route('/api/metrics/user-lifecycle', methods=['GET'])
@@ -2584,6 +2870,9 @@ def unblock_ip(ip_address):
     
     db.commit()
     
+    if security_monitor:
+        security_monitor.unblock_ip(ip_address)
+    
     log_audit_event(g.user['id'], 'unblock_ip', 'ip_block', None, 
                    f'Manually unblocked IP: {ip_address}', db)
     
@@ -2727,17 +3016,20 @@ def track_activity():
     data['user_id'] = g.user['id']
     data['timestamp'] = data.get('timestamp', datetime.utcnow().isoformat())
     
-    # Queue for processing if tracker is available
+    # Queue for processing if tracker is available; a full queue doesn't fail the request
     if activity_tracker:
-        try:
-            activity_tracker.activity_queue.put_nowait(data)
-            return jsonify({'success': True, 'activity_id': None}), 201
-        except:
-            # Queue full, but don't fail the request
-            pass
+        activity_tracker.enqueue_activity(data)
     
     return jsonify({'success': True, 'activity_id': None}), 201
 
+@app.route('/api/admin/activity/writer-stats', methods=['GET'])
+@auth_manager.require_role(['admin'])
+def get_activity_writer_stats():
+    """Activity writer queue depth, drop counts and flush latency (admin-only)"""
+    if not activity_tracker:
+        return jsonify({'error': 'Activity tracking is not enabled'}), 503
+    return jsonify(activity_tracker.get_writer_stats())
+
 @app.route('/api/admin/activity/history/<int:user_id>', methods=['GET'])
 @auth_manager.require_role(['admin'])
 def get_user_activity_history(user_id):
@@ -3103,6 +3395,7 @@ def terminate_session(session_id):
     # Delete the session
     cursor.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
     db.commit()
+    auth_manager.invalidate_session(session_id)
     
     # Log the action
     log_audit_event(g.user['id'], 'TERMINATE_SESSION', 'session', None,
@@ -3113,16 +3406,59 @@ def terminate_session(session_id):
         'message': f'Session terminated for user {session_info["username"]}'
     })
 
+@app.route('/api/admin/auth/session-cache', methods=['GET'])
+@auth_manager.require_role(['admin'])
+def get_session_cache_stats():
+    """Session validation cache counters for this worker process"""
+    return jsonify(auth_manager.get_session_cache_stats())
+
 # Device Management Endpoints
 
+# Fields GET /api/devices can project with ?fields=
+DEVICE_LIST_FIELDS = (
+    'id', 'asset', 'cooler', 'location_id', 'model', 'device_type_id',
+    'created_at', 'updated_at', 'location', 'cabinetConfiguration', 'deviceTypeDetails'
+)
+DEVICE_LIST_MAX_LIMIT = 500
+
 @app.route('/api/devices', methods=['GET'])
 def get_devices():
-    """Get all devices with their cabinet configurations"""
+    """
+    Get devices with their cabinet configurations.
+    
+    Cabinets for every returned device are loaded with a single query and
+    grouped by device_id.
+    
+    Query parameters:
+    - limit: page size (max 500). When given, the response is
+      {'devices': [...], 'pagination': {'limit', 'nextCursor', 'hasMore'}}
+      instead of a bare list
+    - after: keyset cursor '<created_at>,<id>' taken from pagination.nextCursor
+    - fields: comma-separated subset of DEVICE_LIST_FIELDS to return
+    """
     db = get_db()
     cursor = db.cursor()
     
-    # Get all devices with type information
-    devices = cursor.execute('''
+    fields = None
+    if request.args.get('fields'):
+        fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in DEVICE_LIST_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    try:
+        if limit is not None:
+            limit = min(max(int(limit), 1), DEVICE_LIST_MAX_LIMIT)
+        if after:
+            after_created_at, after_id = after.rsplit(',', 1)
+            after_id = int(after_id)
+    except ValueError:
+        return jsonify({'error': "limit must be an integer and after must be '<created_at>,<id>'"}), 400
+    
+    # Get devices with type information, newest first
+    query = '''
         SELECT 
             d.id, d.asset, d.cooler, d.location_id, d.model, 
             d.device_type_id, d.created_at, d.updated_at,
@@ -3134,40 +3470,58 @@ def get_devices():
         JOIN device_types dt ON d.device_type_id = dt.id
         LEFT JOIN locations l ON d.location_id = l.id
         WHERE d.deleted_at IS NULL
-        ORDER BY d.created_at DESC
-    ''').fetchall()
-    
-    result = []
-    for device in devices:
-        device_dict = dict_from_row(device)
-        
-        # Get cabinet configurations for this device
-        cabinets = cursor.execute('''
+    '''
+    params = []
+    if after:
+        query += ' AND (d.created_at < ? OR (d.created_at = ? AND d.id < ?))'
+        params.extend([after_created_at, after_created_at, after_id])
+    query += ' ORDER BY d.created_at DESC, d.id DESC'
+    if limit is not None:
+        # Fetch one extra row to know whether another page exists
+        query += ' LIMIT ?'
+        params.append(limit + 1)
+    
+    devices = cursor.execute(query, params).fetchall()
+    has_more = limit is not None and len(devices) > limit
+    if has_more:
+        devices = devices[:limit]
+    
+    # Load cabinet configurations for all returned devices in one query
+    cabinets_by_device = {}
+    if devices and (fields is None or 'cabinetConfiguration' in fields):
+        cabinet_query = '''
             SELECT 
-                cc.model_name, cc.is_parent, cc.cabinet_index, cc.rows, cc.columns,
-                ct.name as cabinet_type, ct.description, ct.icon
+                cc.device_id, cc.model_name, cc.is_parent, cc.cabinet_index, cc.rows, cc.columns,
+                ct.name as cabinet_type
             FROM cabinet_configurations cc
             JOIN cabinet_types ct ON cc.cabinet_type_id = ct.id
-            WHERE cc.device_id = ?
-            ORDER BY cc.is_parent DESC, cc.cabinet_index
-        ''', (device['id'],)).fetchall()
-        
-        # Convert to camelCase for frontend consistency
-        cabinet_configs = []
-        for cab in cabinets:
-            cab_dict = dict_from_row(cab)
-            # Convert snake_case to camelCase
-            cabinet_configs.append({
-                'cabinetType': cab_dict['cabinet_type'],
-                'modelName': cab_dict['model_name'],
-                'isParent': bool(cab_dict['is_parent']),
-                'cabinetIndex': cab_dict['cabinet_index'],
-                'rows': cab_dict['rows'],
-                'columns': cab_dict['columns']
+        '''
+        if limit is None:
+            cabinet_query += ' JOIN devices d ON cc.device_id = d.id WHERE d.deleted_at IS NULL'
+            cabinet_params = []
+        else:
+            # A page is at most DEVICE_LIST_MAX_LIMIT ids, within SQLite's variable limit
+            cabinet_query += f" WHERE cc.device_id IN ({','.join('?' * len(devices))})"
+            cabinet_params = [device['id'] for device in devices]
+        cabinet_query += ' ORDER BY cc.device_id, cc.is_parent DESC, cc.cabinet_index'
+        
+        for cab in cursor.execute(cabinet_query, cabinet_params):
+            # Convert snake_case to camelCase for frontend consistency
+            cabinets_by_device.setdefault(cab['device_id'], []).append({
+                'cabinetType': cab['cabinet_type'],
+                'modelName': cab['model_name'],
+                'isParent': bool(cab['is_parent']),
+                'cabinetIndex': cab['cabinet_index'],
+                'rows': cab['rows'],
+                'columns': cab['columns']
             })
+    
+    result = []
+    for device in devices:
+        device_dict = dict_from_row(device)
         
         # Add cabinet configuration
-        device_dict['cabinetConfiguration'] = cabinet_configs
+        device_dict['cabinetConfiguration'] = cabinets_by_device.get(device['id'], [])
         
         # Add enhanced device type details
         device_dict['deviceTypeDetails'] = {
@@ -3182,9 +3536,23 @@ def get_devices():
         del device_dict['device_type_description']
         del device_dict['allows_additional_cabinets']
         
+        if fields is not None:
+            device_dict = {field: device_dict[field] for field in fields}
+        
         result.append(device_dict)
     
-    return jsonify(result)
+    if limit is None:
+        return jsonify(result)
+    
+    last = devices[-1] if devices else None
+    return jsonify({
+        'devices': result,
+        'pagination': {
+            'limit': limit,
+            'hasMore': has_more,
+            'nextCursor': f"{last['created_at']},{last['id']}" if has_more else None
+        }
+    })
 
 @app.route('/api/devices', methods=['POST'])
 def create_device():
@@ -3501,37 +3869,32 @@ def get_batch_device_metrics():
     if not isinstance(device_ids, list):
         return jsonify({'error': 'deviceIds must be an array'}), 400
     
-    db = get_db()
-    cursor = db.cursor()
-    results = {}
+    # Batch results are keyed by SQLite's integer ids, so "12" must become 12
+    try:
+        if any(isinstance(device_id, (bool, float)) for device_id in device_ids):
+            raise ValueError
+        device_ids = list(dict.fromkeys(int(device_id) for device_id in device_ids))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'deviceIds must contain integer device IDs'}), 400
+    
+    # Serve fresh cached rows, then recalculate everything stale in one batch
+    cached = RouteMetricsService.get_cached_device_metrics(device_ids)
+    stale_ids = [device_id for device_id in device_ids if device_id not in cached]
+    calculated = RouteMetricsService.calculate_batch_device_metrics(stale_ids) if stale_ids else {}
+    days_since = RouteMetricsService.get_batch_days_since_service(stale_ids) if calculated else {}
     
+    results = {}
     for device_id in device_ids:
-        # Check cache first
-        cached = cursor.execute('''
-            SELECT sold_out_count, days_remaining_inventory, data_collection_rate,
-                   product_level_percent, units_to_par, last_calculated
-            FROM device_metrics
-            WHERE device_id = ? 
-            AND datetime(last_calculated) > datetime('now', '-15 minutes')
-        ''', (device_id,)).fetchone()
-        
-        if cached:
-            results[device_id] = {
-                'soldOutCount': cached['sold_out_count'],
-                'daysRemainingInventory': cached['days_remaining_inventory'],
-                'dataCollectionRate': cached['data_collection_rate'],
-                'productLevelPercent': cached['product_level_percent'],
-                'unitsToPar': cached['units_to_par'],
-                'cached': True
-            }
-        else:
-            # Calculate fresh
-            metrics = RouteMetricsService.calculate_device_metrics(device_id)
-            if metrics:
-                days_since = RouteMetricsService.get_days_since_service(device_id)
-                metrics['daysSinceService'] = days_since
-                metrics['cached'] = False
-                results[device_id] = metrics
+        if device_id in cached:
+            metrics = dict(cached[device_id])
+            del metrics['lastCalculated']
+            metrics['cached'] = True
+            results[device_id] = metrics
+        elif device_id in calculated:
+            metrics = dict(calculated[device_id])
+            metrics['daysSinceService'] = days_since.get(device_id)
+            metrics['cached'] = False
+            results[device_id] = metrics
     
     return jsonify(results)
 
@@ -4287,166 +4650,15 @@ def preview_service_order():
 
 def generate_order_preview(route_id, service_date, cabinet_selections, days_until_service):
     """Generate the order preview data structure"""
-    response = {
-        'routeId': route_id,
-        'serviceDate': service_date.isoformat(),
-        'daysUntilService': days_until_service,
-        'totalUnits': 0,
-        'totalProducts': 0,
-        'devices': []
-    }
-    
-    # Group selections by device
-    device_cabinets = {}
-    for selection in cabinet_selections:
-        device_id = selection.get('deviceId')
-        cabinet_index = selection.get('cabinetIndex')
-        
-        if device_id is None or cabinet_index is None:
-            continue
-            
-        if device_id not in device_cabinets:
-            device_cabinets[device_id] = []
-        device_cabinets[device_id].append(cabinet_index)
-    
-    # Process each device
-    db = get_db()
-    cursor = db.cursor()
-    
-    for device_id, cabinet_indices in device_cabinets.items():
-        try:
-            device_data = process_device_order(cursor, device_id, cabinet_indices, days_until_service)
-            if device_data and device_data['totalUnits'] > 0:
-                response['devices'].append(device_data)
-                response['totalUnits'] += device_data['totalUnits']
-        except Exception as e:
-            print(f"Error processing device {device_id}: {str(e)}")
-            continue
-    
-    # Count unique products across all devices
-    unique_products = set()
-    for device in response['devices']:
-        for cabinet in device['cabinets']:
-            for product in cabinet['products']:
-                unique_products.add(product['productId'])
-    
-    response['totalProducts'] = len(unique_products)
-    
-    return response
-
-def process_device_order(cursor, device_id, cabinet_indices, days_until_service):
-    """Calculate order for specific device cabinets"""
-    print(f"[DEBUG] Processing device {device_id} with cabinet indices: {cabinet_indices}")
-    
-    # Get device info
-    cursor.execute('''
-        SELECT d.id, d.asset, COALESCE(l.name, 'Unknown') as location
-        FROM devices d
-        LEFT JOIN locations l ON d.location_id = l.id
-        WHERE d.id = ? AND (d.deleted_at IS NULL OR d.deleted_at = '')
-    ''', (device_id,))
-    
-    device_info = cursor.fetchone()
-    if not device_info:
-        raise ValueError(f"Device {device_id} not found or deleted")
-    
-    device_data = {
-        'deviceId': device_info['id'],
-        'asset': device_info['asset'],
-        'location': device_info['location'],
-        'totalUnits': 0,
-        'cabinets': []
-    }
-    
-    # Process each cabinet
-    for cabinet_index in cabinet_indices:
-        try:
-            cabinet_order = calculate_cabinet_order(cursor, device_id, cabinet_index, days_until_service)
-            if cabinet_order and cabinet_order['totalUnits'] > 0:
-                device_data['cabinets'].append(cabinet_order)
-                device_data['totalUnits'] += cabinet_order['totalUnits']
-        except Exception as e:
-            print(f"Error processing cabinet {cabinet_index} for device {device_id}: {str(e)}")
-            continue
-    
-    return device_data
-
-def calculate_cabinet_order(cursor, device_id, cabinet_index, days_until_service):
-    """Calculate aggregated order for a cabinet"""
-    print(f"[DEBUG] Calculating order for device {device_id}, cabinet index {cabinet_index}")
-    
-    # Get cabinet info
-    cursor.execute('''
-        SELECT model_name, rows, columns
-        FROM cabinet_configurations
-        WHERE device_id = ? AND cabinet_index = ?
-    ''', (device_id, cabinet_index))
-    
-    cabinet_info = cursor.fetchone()
-    if not cabinet_info:
-        print(f"[DEBUG] Cabinet not found in database for device_id={device_id}, cabinet_index={cabinet_index}")
-        raise ValueError(f"Cabinet not found: device {device_id}, index {cabinet_index}")
-    
-    # Get aggregated product data with comprehensive LEFT JOINs
-    cursor.execute('''
-        SELECT 
-            ps.product_id,
-            COALESCE(p.name, 'Unknown Product') as product_name,
-            SUM(COALESCE(ps.quantity, 0)) as total_quantity,
-            SUM(COALESCE(ps.par_level, 0)) as total_par_level,
-            SUM(COALESCE(sm.daily_velocity, 0)) as total_daily_velocity
-        FROM planogram_slots ps
-        JOIN planograms pl ON ps.planogram_id = pl.id
-        JOIN cabinet_configurations cc ON pl.cabinet_id = cc.id
-        LEFT JOIN products p ON ps.product_id = p.id
-        LEFT JOIN slot_metrics sm ON ps.id = sm.planogram_slot_id
-        WHERE cc.device_id = ? 
-            AND cc.cabinet_index = ?
-            AND ps.product_id <> 1
-        GROUP BY ps.product_id, p.name
-        HAVING SUM(COALESCE(ps.par_level, 0)) > 0
-    ''', (device_id, cabinet_index))
-    
-    products = cursor.fetchall()
-    print(f"[DEBUG] Found {len(products)} products for cabinet")
-    
-    cabinet_data = {
-        'cabinetIndex': cabinet_index,
-        'cabinetType': cabinet_info['model_name'],
-        'totalUnits': 0,
-        'products': []
-    }
-    
-    for product in products:
-        quantity = product['total_quantity'] or 0
-        par_level = product['total_par_level'] or 0
-        daily_velocity = product['total_daily_velocity'] or 0
-        
-        # Calculate order quantity using business rules
-        if daily_velocity > 0:
-            order_quantity = round((par_level - quantity) + (daily_velocity * days_until_service))
-        else:
-            order_quantity = round(par_level - quantity)
-        
-        # Only include if order needed
-        if order_quantity > 0:
-            cabinet_data['products'].append({
-                'productId': product['product_id'],
-                'productName': product['product_name'],
-                'orderQuantity': order_quantity,
-                'currentQuantity': quantity,
-                'parLevel': par_level,
-                'dailyVelocity': daily_velocity
-            })
-            cabinet_data['totalUnits'] += order_quantity
-    
-    return cabinet_data
-
-# Planogram Management Endpoints
-
-@app.route('/api/planograms/<planogram_key>', methods=['GET'])
-def get_planogram(planogram_key):
-    """Get planogram data by key"""
+    db = get_db()
+    return order_preview_engine.generate(db.cursor(), route_id, service_date,
+                                         cabinet_selections, days_until_service)
+
+# Planogram Management Endpoints
+
+@app.route('/api/planograms/<planogram_key>', methods=['GET'])
+def get_planogram(planogram_key):
+    """Get planogram data by key"""
     db = get_db()
     cursor = db.cursor()
     
@@ -4487,7 +4699,7 @@ def save_planogram():
     data = request.json
     
     # Use direct connection instead of Flask's g context
-    conn = sqlite3.connect(DATABASE)
+    conn = db_pool.connect(DATABASE)
     conn.row_factory = sqlite3.Row
     conn.execute('PRAGMA foreign_keys = ON')
     cursor = conn.cursor()
@@ -4758,13 +4970,24 @@ def check_ai_available():
 
 # New AI-Powered Endpoints
 
+_planogram_scorer = None
+_planogram_scorer_lock = threading.Lock()
+
+def get_planogram_scorer():
+    """Return the shared planogram scorer so its memoized grids survive between requests"""
+    global _planogram_scorer
+    with _planogram_scorer_lock:
+        if _planogram_scorer is None:
+            from ai_services import PlanogramScorer, AIClient
+            dispatcher = get_ai_dispatcher()
+            _planogram_scorer = PlanogramScorer(ai_client=AIClient(dispatcher=dispatcher) if dispatcher else None)
+        return _planogram_scorer
+
 @app.route('/api/planograms/realtime/score', methods=['POST'])
 @auth_manager.require_auth
 def realtime_planogram_score():
     """Real-time scoring for planogram placement"""
     try:
-        from ai_services import PlanogramScorer
-        
         data = request.json
         planogram_data = data.get('planogram', {})
         product_id = data.get('product_id')
@@ -4774,7 +4997,7 @@ def realtime_planogram_score():
         if not product_id or not slot_position:
             return jsonify({'error': 'Product ID and position required'}), 400
         
-        scorer = PlanogramScorer()
+        scorer = get_planogram_scorer()
         result = scorer.score_placement(
             planogram_data=planogram_data,
             product_id=int(product_id),
@@ -4790,6 +5013,36 @@ def realtime_planogram_score():
         logger.error(f"Scoring error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/planograms/realtime/score-grid', methods=['POST'])
+@auth_manager.require_auth
+def realtime_planogram_score_grid():
+    """Score a product at every slot of a planogram while it is dragged"""
+    try:
+        from ai_services.base.exceptions import ValidationError as AIValidationError
+        
+        data = request.json
+        planogram_data = data.get('planogram', {})
+        product_id = data.get('product_id')
+        
+        if not product_id or not planogram_data:
+            return jsonify({'error': 'Product ID and planogram required'}), 400
+        
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Product ID must be an integer'}), 400
+        
+        result = get_planogram_scorer().score_grid(planogram_data, product_id)
+        return jsonify(result)
+        
+    except ImportError:
+        return jsonify({'error': 'AI services not available'}), 503
+    except AIValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Grid scoring error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/planograms/predict/revenue', methods=['POST'])
 @auth_manager.require_role(['manager', 'admin'])
 def predict_planogram_revenue():
@@ -5894,11 +6147,129 @@ def delete_route(route_id):
         db.rollback()
         return jsonify({'error': str(e)}), 500
 
+def summarize_cabinet_slot_metrics(slot_rows):
+    """
+    Roll slot-level metrics rows for one device up to cabinet and device level.
+    slot_rows must be ordered by cabinet_index.
+    Returns (cabinets, device_level_metrics) for the route devices response.
+    """
+    device_cabinets = []
+    device_level_metrics = {
+        'soldOutCount': 0,
+        'daysRemainingInventory': 999,
+        'dailyConsumptionRate': 0.0,
+        'productLevelPercent': 0.0,
+        'unitsToPick': 0,
+        'totalSlots': 0
+    }
+    
+    # Group metrics by cabinet
+    cabinet_data = {}
+    for row_dict in slot_rows:
+        cabinet_id = row_dict['cabinet_id']
+        
+        if cabinet_id not in cabinet_data:
+            cabinet_data[cabinet_id] = {
+                'cabinetId': cabinet_id,
+                'cabinetIndex': row_dict['cabinet_index'],
+                'isParent': bool(row_dict['is_parent']),
+                'cabinetType': row_dict['cabinet_type'],
+                'modelName': row_dict['model_name'],
+                'slots': []
+            }
+        
+        # Add slot data if it exists
+        if row_dict['is_sold_out'] is not None:
+            cabinet_data[cabinet_id]['slots'].append({
+                'is_sold_out': row_dict['is_sold_out'],
+                'days_remaining_inventory': row_dict['days_remaining_inventory'],
+                'product_level_percent': row_dict['product_level_percent'],
+                'daily_velocity': row_dict['daily_velocity'],
+                'capacity': row_dict['capacity'],
+                'quantity': row_dict['quantity']
+            })
+    
+    # Calculate metrics for each cabinet
+    for cabinet_id, cabinet in cabinet_data.items():
+        slots = cabinet['slots']
+        
+        if slots:
+            # Calculate cabinet-level metrics
+            sold_out_count = sum(1 for slot in slots if slot['is_sold_out'])
+            # DRI: MIN of all slots, excluding zero velocity slots AND sold out slots
+            dri_values = [slot['days_remaining_inventory'] for slot in slots 
+                         if slot['daily_velocity'] > 0 and slot['days_remaining_inventory'] > 0]
+            min_dri = min(dri_values, default=999)
+            # DCR: SUM of all daily_velocity values in cabinet
+            sum_daily_velocity = sum(slot['daily_velocity'] for slot in slots)
+            avg_product_level = sum(slot['product_level_percent'] for slot in slots) / len(slots)
+            
+            # Calculate units to reach capacity
+            units_to_capacity = 0
+            for slot in slots:
+                if slot['capacity'] > 0:
+                    current_fill_rate = slot['product_level_percent'] / 100.0
+                    current_quantity = int(slot['capacity'] * current_fill_rate)
+                    units_to_capacity += max(0, slot['capacity'] - current_quantity)
+            
+            cabinet['metrics'] = {
+                'soldOutCount': sold_out_count,
+                'daysRemainingInventory': min_dri,
+                'dailyConsumptionRate': round(sum_daily_velocity, 2),
+                'productLevelPercent': round(avg_product_level, 1),
+                'unitsToPick': units_to_capacity,
+                'totalSlots': len(slots)
+            }
+            
+            # Aggregate to device level
+            device_level_metrics['soldOutCount'] += sold_out_count
+            device_level_metrics['dailyConsumptionRate'] += sum_daily_velocity
+            device_level_metrics['productLevelPercent'] += avg_product_level
+            device_level_metrics['unitsToPick'] += units_to_capacity
+            device_level_metrics['totalSlots'] += len(slots)
+            
+            if min_dri < device_level_metrics['daysRemainingInventory']:
+                device_level_metrics['daysRemainingInventory'] = min_dri
+                
+        else:
+            # No slots for this cabinet
+            cabinet['metrics'] = {
+                'soldOutCount': 0,
+                'daysRemainingInventory': 999,
+                'dailyConsumptionRate': 0.0,
+                'productLevelPercent': 0.0,
+                'unitsToPick': 0,
+                'totalSlots': 0
+            }
+        
+        # Remove raw slots data
+        del cabinet['slots']
+        device_cabinets.append(cabinet)
+    
+    # Finalize device-level metrics
+    cabinet_count = len(device_cabinets)
+    if cabinet_count > 0 and device_level_metrics['totalSlots'] > 0:
+        # DCR should be sum of all cabinet DCRs, not averaged
+        device_level_metrics['dailyConsumptionRate'] = round(device_level_metrics['dailyConsumptionRate'], 2)
+        device_level_metrics['productLevelPercent'] = round(device_level_metrics['productLevelPercent'] / cabinet_count, 1)
+    
+    return device_cabinets, device_level_metrics
+
 @app.route('/api/routes/<int:route_id>/devices', methods=['GET'])
 def get_route_devices(route_id):
-    """Get all devices assigned to a specific route with their configurations and metrics"""
+    """
+    Get all devices assigned to a specific route with their configurations and metrics.
+    
+    Cabinets, device metrics, last service dates and slot metrics are each loaded
+    with one route-wide query and grouped by device in Python.
+    
+    Query parameters:
+    - recalculate: 'false' returns cached device metrics as-is with a 'stale' flag
+      instead of recalculating expired ones before responding (default 'true')
+    """
     db = get_db()
     cursor = db.cursor()
+    recalculate = request.args.get('recalculate', 'true').lower() != 'false'
     
     # First check if route exists
     route = cursor.execute('SELECT name FROM routes WHERE id = ?', (route_id,)).fetchone()
@@ -5924,216 +6295,101 @@ def get_route_devices(route_id):
         WHERE d.route_id = ? AND d.deleted_at IS NULL
         ORDER BY l.name, d.asset
     ''', (route_id,)).fetchall()
+    device_ids = [device['id'] for device in devices]
+    
+    # Cabinet configurations for every device on the route
+    cabinets_by_device = {}
+    for cab in cursor.execute('''
+        SELECT 
+            cc.id, cc.device_id, cc.model_name, cc.is_parent, cc.cabinet_index, cc.rows, cc.columns,
+            ct.name as cabinet_type
+        FROM cabinet_configurations cc
+        JOIN cabinet_types ct ON cc.cabinet_type_id = ct.id
+        JOIN devices d ON cc.device_id = d.id
+        WHERE d.route_id = ? AND d.deleted_at IS NULL
+        ORDER BY cc.device_id, cc.is_parent DESC, cc.cabinet_index
+    ''', (route_id,)):
+        # Convert to camelCase for frontend consistency
+        cabinets_by_device.setdefault(cab['device_id'], []).append({
+            'id': cab['id'],
+            'cabinetType': cab['cabinet_type'],
+            'modelName': cab['model_name'],
+            'isParent': bool(cab['is_parent']),
+            'cabinetIndex': cab['cabinet_index'],
+            'rows': cab['rows'],
+            'columns': cab['columns']
+        })
+    
+    # Device metrics: fresh cache rows, then either a batch recalculation or stale rows
+    route_metrics = RouteMetricsService.get_cached_device_metrics(
+        device_ids, include_stale=not recalculate
+    )
+    if recalculate:
+        stale_ids = [device_id for device_id in device_ids if device_id not in route_metrics]
+        if stale_ids:
+            route_metrics.update(RouteMetricsService.calculate_batch_device_metrics(stale_ids))
+    
+    days_since_service = RouteMetricsService.get_batch_days_since_service(device_ids)
+    
+    # Cabinet-level slot metrics for accordion view
+    slot_rows_by_device = {}
+    for row in cursor.execute('''
+        SELECT 
+            cc.device_id,
+            cc.id as cabinet_id,
+            cc.cabinet_index,
+            cc.is_parent,
+            ct.name as cabinet_type,
+            cc.model_name,
+            sm.is_sold_out,
+            sm.days_remaining_inventory,
+            sm.product_level_percent,
+            sm.daily_velocity,
+            ps.capacity,
+            ps.quantity
+        FROM cabinet_configurations cc
+        JOIN devices d ON cc.device_id = d.id
+        JOIN cabinet_types ct ON cc.cabinet_type_id = ct.id
+        LEFT JOIN planograms p ON cc.id = p.cabinet_id
+        LEFT JOIN planogram_slots ps ON p.id = ps.planogram_id
+        LEFT JOIN slot_metrics sm ON ps.id = sm.planogram_slot_id
+        WHERE d.route_id = ? AND d.deleted_at IS NULL
+        AND (ps.product_id != 1 OR ps.product_id IS NULL)  -- Exclude empty slot sentinel
+        ORDER BY cc.device_id, cc.cabinet_index
+    ''', (route_id,)):
+        slot_rows_by_device.setdefault(row['device_id'], []).append(dict_from_row(row))
     
     result = []
     for device in devices:
         device_dict = dict_from_row(device)
+        device_id = device['id']
         
-        # Get cabinet configurations for this device
-        cabinets = cursor.execute('''
-            SELECT 
-                cc.id, cc.model_name, cc.is_parent, cc.cabinet_index, cc.rows, cc.columns,
-                ct.name as cabinet_type, ct.description, ct.icon
-            FROM cabinet_configurations cc
-            JOIN cabinet_types ct ON cc.cabinet_type_id = ct.id
-            WHERE cc.device_id = ?
-            ORDER BY cc.is_parent DESC, cc.cabinet_index
-        ''', (device['id'],)).fetchall()
-        
-        # Convert to camelCase for frontend consistency
-        cabinet_configs = []
-        for cab in cabinets:
-            cab_dict = dict_from_row(cab)
-            cabinet_configs.append({
-                'id': cab_dict['id'],
-                'cabinetType': cab_dict['cabinet_type'],
-                'modelName': cab_dict['model_name'],
-                'isParent': bool(cab_dict['is_parent']),
-                'cabinetIndex': cab_dict['cabinet_index'],
-                'rows': cab_dict['rows'],
-                'columns': cab_dict['columns']
-            })
-        
-        # Get device metrics (check if cached and recent)
-        metrics = cursor.execute('''
-            SELECT sold_out_count, days_remaining_inventory, data_collection_rate,
-                   product_level_percent, units_to_par, last_calculated
-            FROM device_metrics
-            WHERE device_id = ? 
-            AND datetime(last_calculated) > datetime('now', '-15 minutes')
-        ''', (device['id'],)).fetchone()
-        
-        # If no recent metrics, calculate them
-        if not metrics:
-            calculated_metrics = RouteMetricsService.calculate_device_metrics(device['id'])
-            if calculated_metrics:
-                metrics_dict = calculated_metrics
-            else:
-                # Fallback to placeholder values if calculation fails
-                metrics_dict = {
-                    'soldOutCount': 0,
-                    'daysRemainingInventory': 999,
-                    'dataCollectionRate': 100.0,
-                    'productLevelPercent': 100.0,
-                    'unitsToPar': 0
-                }
+        metrics_dict = route_metrics.get(device_id)
+        if metrics_dict:
+            metrics_dict = {key: value for key, value in metrics_dict.items() if key != 'lastCalculated'}
         else:
+            # Fallback to placeholder values if calculation fails or nothing is cached yet
             metrics_dict = {
-                'soldOutCount': metrics['sold_out_count'],
-                'daysRemainingInventory': metrics['days_remaining_inventory'],
-                'dataCollectionRate': metrics['data_collection_rate'],
-                'productLevelPercent': metrics['product_level_percent'],
-                'unitsToPar': metrics['units_to_par']
+                'soldOutCount': 0,
+                'daysRemainingInventory': 999,
+                'dataCollectionRate': 100.0,
+                'productLevelPercent': 100.0,
+                'unitsToPar': 0
             }
+            if not recalculate:
+                metrics_dict['stale'] = True
+        metrics_dict['daysSinceService'] = days_since_service.get(device_id)
         
-        # Get days since last service
-        last_service = cursor.execute('''
-            SELECT service_date FROM service_visits
-            WHERE device_id = ?
-            ORDER BY service_date DESC
-            LIMIT 1
-        ''', (device['id'],)).fetchone()
-        
-        if last_service:
-            days_since_service = cursor.execute('''
-                SELECT julianday('now') - julianday(?)
-            ''', (last_service['service_date'],)).fetchone()[0]
-            metrics_dict['daysSinceService'] = round(days_since_service, 1)
-        else:
-            metrics_dict['daysSinceService'] = None
-        
-        # Get cabinet-level slot metrics for accordion view
-        cabinet_metrics = cursor.execute('''
-            SELECT 
-                cc.id as cabinet_id,
-                cc.cabinet_index,
-                cc.is_parent,
-                ct.name as cabinet_type,
-                cc.model_name,
-                sm.is_sold_out,
-                sm.days_remaining_inventory,
-                sm.product_level_percent,
-                sm.daily_velocity,
-                ps.capacity,
-                ps.quantity
-            FROM cabinet_configurations cc
-            JOIN cabinet_types ct ON cc.cabinet_type_id = ct.id
-            LEFT JOIN planograms p ON cc.id = p.cabinet_id
-            LEFT JOIN planogram_slots ps ON p.id = ps.planogram_id
-            LEFT JOIN slot_metrics sm ON ps.id = sm.planogram_slot_id
-            WHERE cc.device_id = ?
-            AND (ps.product_id != 1 OR ps.product_id IS NULL)  -- Exclude empty slot sentinel
-            ORDER BY cc.cabinet_index
-        ''', (device['id'],)).fetchall()
-        
-        # Process cabinet metrics
-        device_cabinets = []
-        device_level_metrics = {
-            'soldOutCount': 0,
-            'daysRemainingInventory': 999,
-            'dailyConsumptionRate': 0.0,
-            'productLevelPercent': 0.0,
-            'unitsToPick': 0,
-            'totalSlots': 0
-        }
-        
-        # Group metrics by cabinet
-        cabinet_data = {}
-        for row in cabinet_metrics:
-            row_dict = dict_from_row(row)
-            cabinet_id = row_dict['cabinet_id']
-            
-            if cabinet_id not in cabinet_data:
-                cabinet_data[cabinet_id] = {
-                    'cabinetId': cabinet_id,
-                    'cabinetIndex': row_dict['cabinet_index'],
-                    'isParent': bool(row_dict['is_parent']),
-                    'cabinetType': row_dict['cabinet_type'],
-                    'modelName': row_dict['model_name'],
-                    'slots': []
-                }
-            
-            # Add slot data if it exists
-            if row_dict['is_sold_out'] is not None:
-                cabinet_data[cabinet_id]['slots'].append({
-                    'is_sold_out': row_dict['is_sold_out'],
-                    'days_remaining_inventory': row_dict['days_remaining_inventory'],
-                    'product_level_percent': row_dict['product_level_percent'],
-                    'daily_velocity': row_dict['daily_velocity'],
-                    'capacity': row_dict['capacity'],
-                    'quantity': row_dict['quantity']
-                })
-        
-        # Calculate metrics for each cabinet
-        for cabinet_id, cabinet in cabinet_data.items():
-            slots = cabinet['slots']
-            
-            if slots:
-                # Calculate cabinet-level metrics
-                sold_out_count = sum(1 for slot in slots if slot['is_sold_out'])
-                # DRI: MIN of all slots, excluding zero velocity slots AND sold out slots
-                dri_values = [slot['days_remaining_inventory'] for slot in slots 
-                             if slot['daily_velocity'] > 0 and slot['days_remaining_inventory'] > 0]
-                min_dri = min(dri_values, default=999)
-                # DCR: SUM of all daily_velocity values in cabinet
-                sum_daily_velocity = sum(slot['daily_velocity'] for slot in slots)
-                avg_product_level = sum(slot['product_level_percent'] for slot in slots) / len(slots)
-                
-                # Calculate units to reach capacity
-                units_to_capacity = 0
-                for slot in slots:
-                    if slot['capacity'] > 0:
-                        current_fill_rate = slot['product_level_percent'] / 100.0
-                        current_quantity = int(slot['capacity'] * current_fill_rate)
-                        units_to_capacity += max(0, slot['capacity'] - current_quantity)
-                
-                cabinet['metrics'] = {
-                    'soldOutCount': sold_out_count,
-                    'daysRemainingInventory': min_dri,
-                    'dailyConsumptionRate': round(sum_daily_velocity, 2),
-                    'productLevelPercent': round(avg_product_level, 1),
-                    'unitsToPick': units_to_capacity,
-                    'totalSlots': len(slots)
-                }
-                
-                # Aggregate to device level
-                device_level_metrics['soldOutCount'] += sold_out_count
-                device_level_metrics['dailyConsumptionRate'] += sum_daily_velocity
-                device_level_metrics['productLevelPercent'] += avg_product_level
-                device_level_metrics['unitsToPick'] += units_to_capacity
-                device_level_metrics['totalSlots'] += len(slots)
-                
-                if min_dri < device_level_metrics['daysRemainingInventory']:
-                    device_level_metrics['daysRemainingInventory'] = min_dri
-                    
-            else:
-                # No slots for this cabinet
-                cabinet['metrics'] = {
-                    'soldOutCount': 0,
-                    'daysRemainingInventory': 999,
-                    'dailyConsumptionRate': 0.0,
-                    'productLevelPercent': 0.0,
-                    'unitsToPick': 0,
-                    'totalSlots': 0
-                }
-            
-            # Remove raw slots data
-            del cabinet['slots']
-            device_cabinets.append(cabinet)
-        
-        # Finalize device-level metrics
-        cabinet_count = len(device_cabinets)
-        if cabinet_count > 0 and device_level_metrics['totalSlots'] > 0:
-            # DCR should be sum of all cabinet DCRs, not averaged
-            device_level_metrics['dailyConsumptionRate'] = round(device_level_metrics['dailyConsumptionRate'], 2)
-            device_level_metrics['productLevelPercent'] = round(device_level_metrics['productLevelPercent'] / cabinet_count, 1)
+        device_cabinets, device_level_metrics = summarize_cabinet_slot_metrics(
+            slot_rows_by_device.get(device_id, [])
+        )
         
         # Add both cabinet and device level metrics to response
         device_dict['cabinets'] = device_cabinets
         device_dict['slotMetrics'] = device_level_metrics
         
         # Build device response
-        device_dict['cabinetConfiguration'] = cabinet_configs
+        device_dict['cabinetConfiguration'] = cabinets_by_device.get(device_id, [])
         device_dict['metrics'] = metrics_dict
         device_dict['deviceTypeDetails'] = {
             'id': device_dict['device_type_id'],
@@ -6141,21 +6397,15 @@ def get_route_devices(route_id):
             'description': device_dict['device_type_description'],
             'allowsAdditionalCabinets': bool(device_dict['allows_additional_cabinets'])
         }
-        device_dict['locationAddress'] = device_dict.get('location_address')
-        device_dict['locationLatitude'] = device_dict.get('location_latitude')
-        device_dict['locationLongitude'] = device_dict.get('location_longitude')
+        device_dict['locationAddress'] = device_dict.pop('location_address', None)
+        device_dict['locationLatitude'] = device_dict.pop('location_latitude', None)
+        device_dict['locationLongitude'] = device_dict.pop('location_longitude', None)
         
         # Remove raw fields
         del device_dict['device_type_name']
         del device_dict['device_type_description']
         del device_dict['allows_additional_cabinets']
         del device_dict['route_id']
-        if 'location_address' in device_dict:
-            del device_dict['location_address']
-        if 'location_latitude' in device_dict:
-            del device_dict['location_latitude']
-        if 'location_longitude' in device_dict:
-            del device_dict['location_longitude']
         
         result.append(device_dict)
     
@@ -6598,7 +6848,9 @@ def create_sale():
         ))
         
         sale_id = cursor.lastrowid
+        record_sales(cursor, [(data['deviceId'], data['productId'], data['saleUnits'], None)])
         db.commit()
+        refresh_slot_metrics_after_sales(db, [(data['deviceId'], data['productId'])])
         
         # Fetch the created sale
         sale = cursor.execute('''
@@ -6934,13 +7186,20 @@ def generate_demo_sales_data():
     if not products:
         return jsonify({'error': 'No products found'}), 400
     
+    # Slots whose metrics this request changes
+    touched_pairs = []
+    
     # Clear existing sales data if requested
     if data.get('clearExisting', False):
         cursor.execute('DELETE FROM sales')
+        cursor.execute('DELETE FROM sales_daily_counters')
+        # Every stocked slot loses its sales history, not just the ones regenerated below
+        touched_pairs = [(slot['device_id'], slot['product_id']) for slot in load_active_slots(cursor)]
+        mark_dirty(cursor, touched_pairs)
         db.commit()
     
     # Generate sales for the specified date range
-    total_sales_created = 0
+    sales_rows = []
     
     for day_offset in range(days):
         current_date = start_date + timedelta(days=day_offset)
@@ -6972,17 +7231,19 @@ def generate_demo_sales_data():
                 hour = random.randint(6, 22)  # 6 AM to 10 PM
                 minute = random.randint(0, 59)
                 created_at = current_date.replace(hour=hour, minute=minute, second=0)
+                created_at = created_at.strftime('%Y-%m-%d %H:%M:%S')
                 
-                cursor.execute('''
-                    INSERT INTO sales (device_id, product_id, sale_units, sale_cash, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (device_id, product_id, sale_units, sale_cash, 
-                     created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                     created_at.strftime('%Y-%m-%d %H:%M:%S')))
-                
-                total_sales_created += 1
+                sales_rows.append((device_id, product_id, sale_units, sale_cash, created_at, created_at))
+    
+    cursor.executemany('''
+        INSERT INTO sales (device_id, product_id, sale_units, sale_cash, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', sales_rows)
+    record_sales(cursor, [(row[0], row[1], row[2], row[4]) for row in sales_rows])
+    total_sales_created = len(sales_rows)
     
     db.commit()
+    refresh_slot_metrics_after_sales(db, touched_pairs + [(row[0], row[1]) for row in sales_rows])
     
     return jsonify({
         'success': True,
@@ -6997,45 +7258,42 @@ def generate_demo_sales_data():
 
 # Slot Metrics Endpoints
 
+def refresh_slot_metrics_after_sales(db, pairs):
+    """
+    Hand dirty slots to the background worker, or, when it isn't running in this
+    process, refresh only the (device_id, product_id) pairs this request marked
+    """
+    if slot_metrics_worker:
+        slot_metrics_worker.notify()
+        return
+    try:
+        refresh_slot_metrics_for_pairs(db.cursor(), pairs)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        app.logger.error(f"Inline slot metrics refresh failed: {e}")
+
 @app.route('/api/metrics/calculate', methods=['POST'])
 def calculate_all_metrics():
-    """Manually trigger metrics calculation for all devices"""
+    """
+    Manually trigger a full metrics reconciliation for all devices.
+    Rebuilds the sales counters and recalculates every slot from the sales history;
+    routine updates after sales go through the incremental dirty-set refresh.
+    """
     db = get_db()
     cursor = db.cursor()
     
     try:
-        # Get all active planogram slots with required relationships
-        slots = cursor.execute('''
-            SELECT 
-                ps.id as slot_id,
-                ps.quantity,
-                ps.capacity,
-                ps.product_id,
-                cc.device_id
-            FROM planogram_slots ps
-            JOIN planograms p ON ps.planogram_id = p.id
-            JOIN cabinet_configurations cc ON p.cabinet_id = cc.id
-            JOIN devices d ON cc.device_id = d.id
-            WHERE d.deleted_at IS NULL
-            AND ps.product_id IS NOT NULL
-            ORDER BY cc.device_id, ps.id
-        ''').fetchall()
-        
-        processed = 0
-        for slot in slots:
-            calculate_slot_metrics(
-                slot['slot_id'],
-                slot['quantity'],
-                slot['capacity'],
-                slot['device_id'],
-                slot['product_id']
-            )
-            processed += 1
-        
+        started = time.perf_counter()
+        processed = reconcile_slot_metrics(cursor)
         db.commit()
+        elapsed = time.perf_counter() - started
+        
         return jsonify({
             'success': True,
             'processed': processed,
+            'elapsedSeconds': round(elapsed, 3),
+            'rowsPerSecond': round(processed / elapsed, 1) if elapsed > 0 else None,
             'timestamp': datetime.utcnow().isoformat()
         })
         
@@ -7043,78 +7301,6 @@ def calculate_all_metrics():
         db.rollback()
         return jsonify({'error': str(e)}), 500
 
-def calculate_slot_metrics(slot_id, quantity, capacity, device_id, product_id):
-    """Calculate metrics for a single slot"""
-    db = get_db()
-    cursor = db.cursor()
-    
-    # Calculate SO (Sold Out)
-    is_sold_out = 1 if quantity == 0 else 0
-    
-    # Calculate PL (Product Level)
-    product_level_percent = round((quantity * 100.0) / capacity) if capacity > 0 else 0
-    
-    # Calculate UTP (Units to Par)
-    units_to_par = capacity - quantity
-    
-    # Calculate DRI (Days Remaining Inventory)
-    # Get 28-day sales
-    sales_28 = cursor.execute('''
-        SELECT COALESCE(SUM(sale_units), 0) as total
-        FROM sales
-        WHERE device_id = ? 
-        AND product_id = ?
-        AND datetime(created_at) >= datetime('now', '-28 days')
-    ''', (device_id, product_id)).fetchone()['total']
-    
-    if sales_28 > 0:
-        daily_velocity = sales_28 / 28.0
-    else:
-        # Get historical average
-        historical = cursor.execute('''
-            SELECT 
-                COALESCE(SUM(sale_units), 0) as total_sales,
-                julianday('now') - julianday(MIN(created_at)) as days_active
-            FROM sales
-            WHERE device_id = ? AND product_id = ?
-        ''', (device_id, product_id)).fetchone()
-        
-        if historical['total_sales'] and historical['total_sales'] > 0 and historical['days_active'] and historical['days_active'] > 0:
-            daily_velocity = historical['total_sales'] / historical['days_active']
-        else:
-            daily_velocity = 0.1  # Default minimum
-    
-    # Calculate DRI
-    if daily_velocity > 0 and quantity > 0:
-        dri = int(quantity / daily_velocity)
-    else:
-        dri = 0 if quantity == 0 else 999
-    
-    dri = min(dri, 999)  # Cap at 999
-    
-    # Get all-time sales for additional stats
-    all_time_stats = cursor.execute('''
-        SELECT 
-            COALESCE(SUM(sale_units), 0) as total_sales,
-            COUNT(DISTINCT date(created_at)) as days_with_sales
-        FROM sales
-        WHERE device_id = ? AND product_id = ?
-    ''', (device_id, product_id)).fetchone()
-    
-    # Upsert metrics
-    cursor.execute('''
-        INSERT OR REPLACE INTO slot_metrics (
-            planogram_slot_id, is_sold_out, days_remaining_inventory, 
-            product_level_percent, units_to_par,
-            sales_28_day, sales_all_time, days_with_sales, daily_velocity, 
-            last_calculated
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (
-        slot_id, is_sold_out, dri, product_level_percent, units_to_par,
-        sales_28, all_time_stats['total_sales'], all_time_stats['days_with_sales'], 
-        daily_velocity
-    ))
-
 # Dashboard Metrics API Endpoints
 
 @app.route('/api/metrics/weekly', methods=['GET'])
@@ -7408,6 +7594,27 @@ def get_top_performers():
     except Exception as e:
         return jsonify({'error': 'Failed to retrieve top performers: ' + str(e)}), 500
 
+# Concurrent Claude API calls shared by chat, scoring and other AI endpoints
+AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', '4'))
+
+# Seconds a chat request waits on the API before falling back
+CHAT_TIMEOUT_SECONDS = 20
+
+_ai_dispatcher = None
+_ai_dispatcher_lock = threading.Lock()
+
+def get_ai_dispatcher():
+    """Return the shared AI request dispatcher, or None without an API key"""
+    global _ai_dispatcher
+    with _ai_dispatcher_lock:
+        if _ai_dispatcher is None:
+            api_key = os.getenv('ANTHROPIC_API_KEY')
+            if not api_key:
+                return None
+            from ai_services.base.dispatcher import RequestDispatcher, AnthropicTransport
+            _ai_dispatcher = RequestDispatcher(AnthropicTransport(api_key=api_key), max_concurrency=AI_MAX_CONCURRENCY)
+        return _ai_dispatcher
+
 @app.route('/api/chat', methods=['POST'])
 def chat_with_ai():
     """AI chat endpoint for business insights and system guidance"""
@@ -7531,15 +7738,12 @@ Current Context:
 This is a small business vending machine operation. You can help with both business insights from their data AND system guidance for using the CVD application.
 """
         
-        # Use real Anthropic API
+        # Use real Anthropic API through the shared dispatcher
         try:
-            import anthropic
-            
-            client = anthropic.Anthropic(api_key=api_key)
-            
-            response = client.messages.create(
+            response = get_ai_dispatcher().complete(
                 model="claude-opus-4-20250514",
                 max_tokens=150,
+                timeout=CHAT_TIMEOUT_SECONDS,
                 messages=[
                     {
                         "role": "user",
@@ -7558,7 +7762,7 @@ Respond in 1-3 sentences. Be helpful and specific."""
                 ]
             )
             
-            ai_response = response.content[0].text
+            ai_response = response['content']
             return jsonify({'response': ai_response})
             
         except Exception as api_error:
@@ -7667,9 +7871,9 @@ def generate_business_response(user_message, context):
 def get_knowledge_base_articles():
     """Get all knowledge base articles with metadata"""
     try:
-        from services.knowledge_base_service import KnowledgeBaseService
+        from services.knowledge_base_service import get_knowledge_base_service
         
-        kb_service = KnowledgeBaseService()
+        kb_service = get_knowledge_base_service(watch=True)
         articles = kb_service.scan_articles()
         categories = kb_service.get_categories()
         
@@ -7697,9 +7901,9 @@ def get_knowledge_base_articles():
 def get_knowledge_base_article(article_id):
     """Get specific knowledge base article with content"""
     try:
-        from services.knowledge_base_service import KnowledgeBaseService
+        from services.knowledge_base_service import get_knowledge_base_service
         
-        kb_service = KnowledgeBaseService()
+        kb_service = get_knowledge_base_service(watch=True)
         article = kb_service.get_article_by_id(article_id)
         
         if not article:
@@ -7754,11 +7958,11 @@ def search_knowledge_base():
                 'error': 'Query must be at least 2 characters'
             }), 400
             
-        from services.knowledge_base_service import KnowledgeBaseService
+        from services.knowledge_base_service import get_knowledge_base_service
         import time
         
         start_time = time.time()
-        kb_service = KnowledgeBaseService()
+        kb_service = get_knowledge_base_service(watch=True)
         results = kb_service.search_articles(query, category, difficulty)
         search_time = (time.time() - start_time) * 1000  # Convert to milliseconds
         
@@ -7785,9 +7989,9 @@ def search_knowledge_base():
 def get_knowledge_base_categories():
     """Get all knowledge base categories with metadata"""
     try:
-        from services.knowledge_base_service import KnowledgeBaseService
+        from services.knowledge_base_service import get_knowledge_base_service
         
-        kb_service = KnowledgeBaseService()
+        kb_service = get_knowledge_base_service(watch=True)
         categories = kb_service.get_categories()
         
         return jsonify({
@@ -7806,9 +8010,9 @@ def get_knowledge_base_categories():
 def get_knowledge_base_stats():
     """Get knowledge base statistics"""
     try:
-        from services.knowledge_base_service import KnowledgeBaseService
+        from services.knowledge_base_service import get_knowledge_base_service
         
-        kb_service = KnowledgeBaseService()
+        kb_service = get_knowledge_base_service(watch=True)
         stats = kb_service.get_article_stats()
         
         return jsonify({
@@ -7824,6 +8028,231 @@ def get_knowledge_base_stats():
 
 # DEX Parser Engine - moved to dex_parser.py
 
+# Records per executemany batch when storing parsed DEX files
+DEX_RECORD_CHUNK_SIZE = 500
+
+# raw_content storage for new DEX reads: 'text', 'zlib' or 'blob' (see dex_content_store)
+DEX_CONTENT_STORAGE = os.environ.get('DEX_CONTENT_STORAGE', 'text')
+DEX_BLOB_DIR = os.environ.get('DEX_BLOB_DIR', 'dex_blobs')
+
+def find_dex_reads_by_hash(db, hashes):
+    """Return {content_hash: existing dex_reads row summary} for already stored uploads"""
+    hashes = list(dict.fromkeys(hashes))
+    found = {}
+    for chunk in RouteMetricsService._chunks(hashes):
+        placeholders = ','.join('?' * len(chunk))
+        for row in db.execute(f'''
+            SELECT r.id, r.content_hash, r.machine_serial, r.manufacturer, r.dex_version,
+                   r.total_records,
+                   (SELECT COUNT(*) FROM dex_pa_records pa WHERE pa.dex_read_id = r.id) as pa_records_count
+            FROM dex_reads r
+            WHERE r.content_hash IN ({placeholders})
+        ''', chunk):
+            found[row['content_hash']] = row
+    return found
+
+def duplicate_dex_read_response(existing):
+    """Upload result fields for a file that is already stored"""
+    return {
+        'dex_read_id': existing['id'],
+        'machine_info': {
+            'machine_serial': existing['machine_serial'],
+            'manufacturer': existing['manufacturer'],
+            'version': existing['dex_version']
+        },
+        'total_records': existing['total_records'],
+        'pa_records_count': existing['pa_records_count'],
+        'duplicate': True
+    }
+
+def load_dex_raw_content(read_row):
+    """Original DEX text for a dex_reads row regardless of its content_encoding"""
+    return decode_raw_content(read_row['raw_content'], read_row['content_encoding'],
+                              read_row['content_hash'], DEX_BLOB_DIR)
+
+def insert_dex_records(cursor, dex_read_id, records):
+    """Store a chunk of non-PA DEX records with a single executemany"""
+    cursor.executemany('''
+        INSERT INTO dex_records (
+            dex_read_id, record_type, record_subtype, line_number,
+            raw_record, parsed_data
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(
+        dex_read_id,
+        record['record_type'],
+        record['record_subtype'],
+        record['line_number'],
+        record['raw_record'],
+        json.dumps(record['parsed_data'])
+    ) for record in records])
+
+def insert_dex_pa_records(cursor, dex_read_id, pa_records):
+    """Store consolidated PA records with a single executemany"""
+    cursor.executemany('''
+        INSERT INTO dex_pa_records (
+            dex_read_id, record_subtype, selection_number,
+            price_cents, capacity, units_sold, revenue_cents,
+            test_vends, free_vends, cash_sales, cash_sales_cents,
+            cashless_sales, cashless_sales_cents, discount_sales,
+            discount_sales_cents, line_number, row, "column"
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(
+        dex_read_id,
+        'CONSOLIDATED',  # New record_subtype to indicate consolidated record
+        pa_record['data']['selection_number'],
+        pa_record['data']['price_cents'],
+        pa_record['data']['capacity'],
+        pa_record['data']['units_sold'],
+        pa_record['data']['revenue_cents'],
+        pa_record['data']['test_vends'],
+        pa_record['data']['free_vends'],
+        pa_record['data']['cash_sales'],
+        pa_record['data']['cash_sales_cents'],
+        pa_record['data']['cashless_sales'],
+        pa_record['data']['cashless_sales_cents'],
+        pa_record['data']['discount_sales'],
+        pa_record['data']['discount_sales_cents'],
+        pa_record['line_number'],
+        pa_record['data'].get('row'),
+        pa_record['data'].get('column')
+    ) for pa_record in pa_records])
+
+def stage_dex_records(cursor, records):
+    """Hold a chunk of streamed DEX records until their dex_reads row exists"""
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS dex_records_staging (
+            record_type TEXT, record_subtype TEXT, line_number INTEGER,
+            raw_record TEXT, parsed_data TEXT
+        )
+    ''')
+    cursor.executemany('''
+        INSERT INTO temp.dex_records_staging (
+            record_type, record_subtype, line_number, raw_record, parsed_data
+        ) VALUES (?, ?, ?, ?, ?)
+    ''', [(
+        record['record_type'],
+        record['record_subtype'],
+        record['line_number'],
+        record['raw_record'],
+        json.dumps(record['parsed_data'])
+    ) for record in records])
+
+def store_dex_read(cursor, filename, stored, result, staged=False):
+    """
+    Store a parsed DEX file (read row, records and PA records); returns dex_read_id.
+    stored is (content_hash, raw_content, content_encoding) from RawContentWriter.
+    With staged=True the non-PA records are moved from dex_records_staging.
+    """
+    digest, raw_content, content_encoding = stored
+    cursor.execute('''
+        INSERT INTO dex_reads (
+            filename, machine_serial, manufacturer, dex_version,
+            raw_content, total_records, parsed_successfully, error_message,
+            content_hash, content_encoding
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        filename,
+        result['machine_info'].get('machine_serial', ''),
+        result['machine_info'].get('manufacturer', ''),
+        result['machine_info'].get('version', ''),
+        raw_content,
+        result['total_records'],
+        result['parsed_successfully'],
+        result.get('error_message'),
+        digest,
+        content_encoding
+    ))
+    dex_read_id = cursor.lastrowid
+    
+    if staged:
+        cursor.execute('''
+            INSERT INTO dex_records (
+                dex_read_id, record_type, record_subtype, line_number,
+                raw_record, parsed_data
+            )
+            SELECT ?, record_type, record_subtype, line_number, raw_record, parsed_data
+            FROM temp.dex_records_staging ORDER BY rowid
+        ''', (dex_read_id,))
+        cursor.execute('DELETE FROM temp.dex_records_staging')
+    else:
+        records = result['parsed_records']
+        for start in range(0, len(records), DEX_RECORD_CHUNK_SIZE):
+            insert_dex_records(cursor, dex_read_id, records[start:start + DEX_RECORD_CHUNK_SIZE])
+    insert_dex_pa_records(cursor, dex_read_id, result['pa_records'])
+    return dex_read_id
+
+# Upper bounds for one /api/dex/parse-batch request, checked before any file is read
+DEX_BATCH_MAX_FILES = 200
+DEX_MAX_FILE_BYTES = 10 * 1024 * 1024
+DEX_BATCH_MAX_BYTES = 100 * 1024 * 1024
+
+class DEXBatchLimitError(ValueError):
+    """Raised by collect_dex_uploads when a batch exceeds its file or byte limits"""
+
+_dex_process_pool = None
+_dex_process_pool_lock = threading.Lock()
+
+def get_dex_process_pool():
+    """Return the shared DEX parsing process pool, creating it on first use"""
+    global _dex_process_pool
+    with _dex_process_pool_lock:
+        if _dex_process_pool is None:
+            _dex_process_pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        return _dex_process_pool
+
+def collect_dex_uploads(uploaded_files, workdir):
+    """
+    Save uploaded files to workdir and list their DEX sources as
+    (filename, path, zip member or None). Zip archives contribute every .txt
+    member, sized from the archive directory without extracting; other files
+    must be .txt. Returns (uploads, rejected); raises DEXBatchLimitError once
+    the batch passes DEX_BATCH_MAX_FILES or DEX_BATCH_MAX_BYTES.
+    """
+    uploads = []
+    rejected = []
+    total_bytes = 0
+    
+    def add(filename, path, member, size):
+        nonlocal total_bytes
+        if size > DEX_MAX_FILE_BYTES:
+            rejected.append({'filename': filename,
+                             'message': f'File exceeds {DEX_MAX_FILE_BYTES // (1024 * 1024)} MB'})
+            return
+        if len(uploads) >= DEX_BATCH_MAX_FILES:
+            raise DEXBatchLimitError(f'Too many files (max {DEX_BATCH_MAX_FILES})')
+        total_bytes += size
+        if total_bytes > DEX_BATCH_MAX_BYTES:
+            raise DEXBatchLimitError(f'Batch exceeds {DEX_BATCH_MAX_BYTES // (1024 * 1024)} MB')
+        uploads.append((os.path.basename(filename), path, member))
+    
+    for index, file in enumerate(uploaded_files):
+        if not file.filename:
+            continue
+        extension = os.path.splitext(file.filename)[1].lower()
+        if extension not in ('.zip', '.txt'):
+            rejected.append({'filename': file.filename, 'message': 'File must be a .txt file'})
+            continue
+        
+        path = os.path.join(workdir, f'upload-{index}{extension}')
+        file.save(path)
+        if extension == '.txt':
+            add(file.filename, path, None, os.path.getsize(path))
+            continue
+        
+        try:
+            with zipfile.ZipFile(path) as archive:
+                members = [member for member in archive.infolist() if not member.is_dir()]
+                if len(uploads) + len(members) > DEX_BATCH_MAX_FILES:
+                    raise DEXBatchLimitError(f'Too many files (max {DEX_BATCH_MAX_FILES})')
+                for member in members:
+                    if member.filename.lower().endswith('.txt'):
+                        add(member.filename, path, member.filename, member.file_size)
+                    else:
+                        rejected.append({'filename': member.filename, 'message': 'File must be a .txt file'})
+        except zipfile.BadZipFile:
+            rejected.append({'filename': file.filename, 'message': 'Invalid zip archive'})
+    return uploads, rejected
+
 # DEX API Endpoints
 @app.route('/api/dex/parse', methods=['POST'])
 def parse_dex_file():
@@ -7842,112 +8271,226 @@ def parse_dex_file():
                 'error': {'message': 'No file selected', 'line': 0, 'field': 0}
             }), 400
         
-        if not file.filename.endswith('.txt'):
+        if not file.filename.lower().endswith('.txt'):
             return jsonify({
                 'success': False,
                 'error': {'message': 'File must be a .txt file', 'line': 0, 'field': 0}
             }), 400
         
-        # Read file content
-        content = file.read().decode('utf-8', errors='ignore')
-        
-        # Parse DEX file
-        parser = DEXParser()
-        result = parser.parse_file(content, file.filename)
-        
-        if not result['success']:
-            return jsonify(result), 400
-        
-        # Store in database using transaction
+        # One chunked pass hashes the upload and builds its stored raw_content;
+        # identical re-uploads resolve to the stored read without re-parsing
         db = get_db()
+        writer = RawContentWriter(DEX_CONTENT_STORAGE, DEX_BLOB_DIR)
+        stored = writer.consume(file.stream)
+        digest = stored[0]
+        existing = find_dex_reads_by_hash(db, [digest]).get(digest)
+        if existing:
+            writer.discard()
+            response = duplicate_dex_read_response(existing)
+            response.update({'success': True, 'message': 'DEX file already uploaded'})
+            return jsonify(response)
+        
+        # Store in database using transaction; records are staged in chunks while
+        # parsing and the read row is inserted once the parse result is known
         db.execute('BEGIN TRANSACTION')
         
         try:
-            # Insert main DEX read record
             cursor = db.cursor()
-            cursor.execute('''
-                INSERT INTO dex_reads (
-                    filename, machine_serial, manufacturer, dex_version,
-                    raw_content, total_records, parsed_successfully, error_message
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                file.filename,
-                result['machine_info'].get('machine_serial', ''),
-                result['machine_info'].get('manufacturer', ''),
-                result['machine_info'].get('version', ''),
-                content,
-                result['total_records'],
-                result['parsed_successfully'],
-                result.get('error_message')
-            ))
             
-            dex_read_id = cursor.lastrowid
+            # Parse DEX file line by line from the upload stream
+            parser = DEXParser()
+            result = parser.parse_stream(
+                file.stream, file.filename,
+                record_sink=lambda records: stage_dex_records(cursor, records),
+                chunk_size=DEX_RECORD_CHUNK_SIZE
+            )
             
-            # Insert all DEX records
-            for record in result['parsed_records']:
-                cursor.execute('''
-                    INSERT INTO dex_records (
-                        dex_read_id, record_type, record_subtype, line_number,
-                        raw_record, parsed_data
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    dex_read_id,
-                    record['record_type'],
-                    record['record_subtype'],
-                    record['line_number'],
-                    record['raw_record'],
-                    json.dumps(record['parsed_data'])
-                ))
+            if not result['success']:
+                db.execute('ROLLBACK')
+                writer.discard()
+                return jsonify(result), 400
             
-            # Insert consolidated PA records
-            for pa_record in result['pa_records']:
-                data = pa_record['data']
-                cursor.execute('''
-                    INSERT INTO dex_pa_records (
-                        dex_read_id, record_subtype, selection_number,
-                        price_cents, capacity, units_sold, revenue_cents,
-                        test_vends, free_vends, cash_sales, cash_sales_cents,
-                        cashless_sales, cashless_sales_cents, discount_sales,
-                        discount_sales_cents, line_number, row, "column"
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    dex_read_id,
-                    'CONSOLIDATED',  # New record_subtype to indicate consolidated record
-                    data['selection_number'],
-                    data['price_cents'],
-                    data['capacity'],
-                    data['units_sold'],
-                    data['revenue_cents'],
-                    data['test_vends'],
-                    data['free_vends'],
-                    data['cash_sales'],
-                    data['cash_sales_cents'],
-                    data['cashless_sales'],
-                    data['cashless_sales_cents'],
-                    data['discount_sales'],
-                    data['discount_sales_cents'],
-                    pa_record['line_number'],
-                    data.get('row'),
-                    data.get('column')
-                ))
+            dex_read_id = store_dex_read(cursor, file.filename, stored, result, staged=True)
             
             db.execute('COMMIT')
             
+        except sqlite3.IntegrityError as e:
+            db.execute('ROLLBACK')
+            writer.discard()
+            # A concurrent upload of the same file was stored after the duplicate check
+            existing = find_dex_reads_by_hash(db, [digest]).get(digest)
+            if existing:
+                response = duplicate_dex_read_response(existing)
+                response.update({'success': True, 'message': 'DEX file already uploaded'})
+                return jsonify(response)
             return jsonify({
-                'success': True,
-                'dex_read_id': dex_read_id,
-                'machine_info': result['machine_info'],
-                'total_records': result['total_records'],
-                'pa_records_count': len(result['pa_records']),
-                'message': 'DEX file parsed and stored successfully'
-            })
+                'success': False,
+                'error': {'message': f'Database error: {str(e)}', 'line': 0, 'field': 0}
+            }), 500
             
         except Exception as e:
             db.execute('ROLLBACK')
+            writer.discard()
             return jsonify({
                 'success': False,
                 'error': {'message': f'Database error: {str(e)}', 'line': 0, 'field': 0}
             }), 500
+        
+        # Blobs are only published once their row is committed
+        writer.publish()
+        
+        return jsonify({
+            'success': True,
+            'dex_read_id': dex_read_id,
+            'machine_info': result['machine_info'],
+            'total_records': result['total_records'],
+            'pa_records_count': len(result['pa_records']),
+            'message': 'DEX file parsed and stored successfully'
+        })
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': {'message': f'Server error: {str(e)}', 'line': 0, 'field': 0}
+        }), 500
+
+@app.route('/api/dex/parse-batch', methods=['POST'])
+def parse_dex_batch():
+    """Parse many DEX files (multiple uploads and/or zip archives) and store them in one transaction"""
+    try:
+        # Uploads are spooled to a work directory; zip members are streamed from the archive
+        with tempfile.TemporaryDirectory(prefix='dex-batch-') as workdir:
+            try:
+                uploads, rejected = collect_dex_uploads(
+                    request.files.getlist('files') + request.files.getlist('file'), workdir)
+            except DEXBatchLimitError as e:
+                return jsonify({
+                    'success': False,
+                    'error': {'message': str(e), 'line': 0, 'field': 0}
+                }), 400
+            
+            if not uploads:
+                return jsonify({
+                    'success': False,
+                    'error': {'message': 'No DEX files uploaded', 'line': 0, 'field': 0},
+                    'rejected': rejected
+                }), 400
+            
+            start_time = time.perf_counter()
+            
+            # Skip parsing for files already stored or repeated within this batch
+            db = get_db()
+            digests = []
+            for _, path, member in uploads:
+                with open_dex_source(path, member) as stream:
+                    digests.append(stream_content_hash(stream))
+            existing = find_dex_reads_by_hash(db, digests)
+            to_parse = {}
+            for index, digest in enumerate(digests):
+                if digest not in existing and digest not in to_parse:
+                    to_parse[digest] = index
+            
+            # Parsing and grid analysis are CPU bound; fan out to worker processes
+            parse_indexes = list(to_parse.values())
+            if len(parse_indexes) <= 1:
+                parsed = [parse_dex_upload(*uploads[index]) for index in parse_indexes]
+            else:
+                pool = get_dex_process_pool()
+                parsed = list(pool.map(parse_dex_upload, *zip(*[uploads[index] for index in parse_indexes])))
+            results = dict(zip(parse_indexes, parsed))
+            
+            db.execute('BEGIN TRANSACTION')
+            
+            try:
+                cursor = db.cursor()
+                files = []
+                stored_ids = {}
+                writers = []
+                total_records = 0
+                for index, ((filename, path, member), digest) in enumerate(zip(uploads, digests)):
+                    if digest in existing:
+                        files.append(dict(duplicate_dex_read_response(existing[digest]),
+                                          filename=filename, success=True))
+                        continue
+                    
+                    result = results.get(index)
+                    if result is None:
+                        # Same content as an earlier file in this batch
+                        first = files[to_parse[digest]]
+                        duplicate = {key: value for key, value in first.items() if key != 'filename'}
+                        files.append(dict(duplicate, filename=filename, duplicate=True))
+                        continue
+                    
+                    if not result['success']:
+                        files.append({'filename': filename, 'success': False, 'error': result['error']})
+                        continue
+                    
+                    writer = RawContentWriter(DEX_CONTENT_STORAGE, DEX_BLOB_DIR)
+                    writers.append(writer)
+                    with open_dex_source(path, member) as stream:
+                        stored_content = writer.consume(stream)
+                    
+                    # Undo only this file if a concurrent upload stored it after the duplicate check
+                    cursor.execute('SAVEPOINT dex_batch_file')
+                    try:
+                        dex_read_id = store_dex_read(cursor, filename, stored_content, result)
+                    except sqlite3.IntegrityError:
+                        cursor.execute('ROLLBACK TO dex_batch_file')
+                        cursor.execute('RELEASE dex_batch_file')
+                        concurrent = find_dex_reads_by_hash(db, [digest]).get(digest)
+                        if concurrent is None:
+                            raise
+                        writer.discard()
+                        files.append(dict(duplicate_dex_read_response(concurrent),
+                                          filename=filename, success=True))
+                        continue
+                    cursor.execute('RELEASE dex_batch_file')
+                    stored_ids[digest] = dex_read_id
+                    total_records += result['total_records']
+                    files.append({
+                        'filename': filename,
+                        'success': True,
+                        'dex_read_id': dex_read_id,
+                        'machine_info': result['machine_info'],
+                        'total_records': result['total_records'],
+                        'pa_records_count': len(result['pa_records'])
+                    })
+                
+                db.execute('COMMIT')
+                
+            except Exception as e:
+                db.execute('ROLLBACK')
+                for writer in writers:
+                    writer.discard()
+                return jsonify({
+                    'success': False,
+                    'error': {'message': f'Database error: {str(e)}', 'line': 0, 'field': 0}
+                }), 500
+            
+            # Blobs are only published once their rows are committed
+            for writer in writers:
+                writer.publish()
+            
+            elapsed = time.perf_counter() - start_time
+            stored = len(stored_ids)
+            duplicates = sum(1 for f in files if f.get('duplicate'))
+            failed = sum(1 for f in files if not f['success'])
+            
+            return jsonify({
+                'success': failed < len(files),
+                'files': files,
+                'rejected': rejected,
+                'stats': {
+                    'files': len(uploads),
+                    'stored': stored,
+                    'duplicates': duplicates,
+                    'failed': failed,
+                    'records': total_records,
+                    'elapsedSeconds': round(elapsed, 3),
+                    'filesPerSecond': round(len(uploads) / elapsed, 1) if elapsed > 0 else None,
+                    'recordsPerSecond': round(total_records / elapsed, 1) if elapsed > 0 else None
+                }
+            })
             
     except Exception as e:
         return jsonify({
@@ -8024,9 +8567,12 @@ def get_dex_read_details(read_id):
             ORDER BY line_number
         ''', (read_id,)).fetchall()
         
+        read_data = dict_from_row(read_info)
+        read_data['raw_content'] = load_dex_raw_content(read_info)
+        
         return jsonify({
             'success': True,
-            'read_info': dict_from_row(read_info),
+            'read_info': read_data,
             'records': [dict_from_row(row) for row in records],
             'pa_records': [dict_from_row(row) for row in pa_records]
         })
@@ -8240,6 +8786,11 @@ if __name__ == '__main__':
     print("Initializing security monitor...")
     security_monitor = SecurityMonitor(DATABASE, activity_tracker)
     
+    # Initialize incremental slot metrics worker
+    print("Initializing slot metrics worker...")
+    slot_metrics_worker = SlotMetricsWorker(DATABASE)
+    slot_metrics_worker.start()
+    
     # Initialize activity trends module
     print("Initializing activity trends module...")
     try:
@@ -8277,4 +8828,9 @@ if __name__ == '__main__':
     finally:
         # Cleanup activity tracker on shutdown
         if activity_tracker:
-            activity_tracker.shutdown()
\ No newline at end of file
+            activity_tracker.shutdown()
+        if slot_metrics_worker:
+            slot_metrics_worker.stop()
+        if _dex_process_pool:
+            _dex_process_pool.shutdown(wait=False)
+        db_pool.close_all()
@@ -8,13 +8,31 @@ from flask import session, jsonify, request, g
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import os
+import db_pool
 
 class AuthManager:
+    # Session validation cache: seconds a validated session is trusted without
+    # re-querying, and the number of sessions kept (least recently used evicted).
+    # Invalidation is per process, so the TTL bounds staleness across workers.
+    SESSION_CACHE_TTL = 30
+    SESSION_CACHE_MAX_SIZE = 10000
+    
     def __init__(self, app, db_path):
         self.app = app
         self.db_path = db_path
+        self._session_cache = OrderedDict()  # {session_id: (cached_at, expires_at, user)}
+        self._session_cache_lock = threading.Lock()
+        self.session_cache_stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
         self.setup_session_config()
     
     def get_client_ip(self):
@@ -80,35 +98,91 @@ class AuthManager:
             return 'desktop'
     
     def validate_session(self, session_id):
-        """Validate and return user info for session"""
+        """Validate and return user info for session, served from the session cache when fresh"""
         from flask import current_app
         
+        now = datetime.now()
+        with self._session_cache_lock:
+            cached = self._session_cache.get(session_id)
+            if cached and time.monotonic() - cached[0] < self.SESSION_CACHE_TTL and cached[1] > now:
+                self._session_cache.move_to_end(session_id)
+                self.session_cache_stats['hits'] += 1
+                return cached[2]
+            self.session_cache_stats['misses'] += 1
+        
         # Get db from Flask context
         get_db = current_app.config.get('get_db')
         if get_db:
             db = get_db()
         else:
-            db = sqlite3.connect(self.db_path)
+            db = db_pool.connect_readonly(self.db_path)
             db.row_factory = sqlite3.Row
         
         cursor = db.cursor()
         
-        user = cursor.execute('''
-            SELECT u.id, u.username, u.email, u.role, u.is_active, u.is_deleted
+        row = cursor.execute('''
+            SELECT u.id, u.username, u.email, u.role, u.is_active, u.is_deleted, s.expires_at
             FROM users u
             JOIN sessions s ON s.user_id = u.id
             WHERE s.id = ? AND s.expires_at > ? AND u.is_active = 1 AND u.is_deleted = 0
-        ''', (session_id, datetime.now())).fetchone()
+        ''', (session_id, now)).fetchone()
         
         # Don't close if using Flask's db
         if not get_db:
             db.close()
         
+        if not row:
+            return None
+        
+        user = {key: row[key] for key in ('id', 'username', 'email', 'role', 'is_active', 'is_deleted')}
+        expires_at = row['expires_at']
+        if isinstance(expires_at, str):
+            try:
+                expires_at = datetime.fromisoformat(expires_at)
+            except ValueError:
+                expires_at = datetime.max  # Unparseable; rely on the TTL alone
+        
+        with self._session_cache_lock:
+            self._session_cache[session_id] = (time.monotonic(), expires_at, user)
+            self._session_cache.move_to_end(session_id)
+            while len(self._session_cache) > self.SESSION_CACHE_MAX_SIZE:
+                self._session_cache.popitem(last=False)
+                self.session_cache_stats['evictions'] += 1
+        
         return user
     
+    def invalidate_session(self, session_id):
+        """Drop a session from the validation cache (logout, termination)"""
+        with self._session_cache_lock:
+            if self._session_cache.pop(session_id, None) is not None:
+                self.session_cache_stats['invalidations'] += 1
+    
+    def invalidate_user_sessions(self, user_id):
+        """Drop every cached session of a user (deactivation, deletion, role or profile change)"""
+        with self._session_cache_lock:
+            stale = [sid for sid, (_, _, user) in self._session_cache.items() if user['id'] == user_id]
+            for sid in stale:
+                del self._session_cache[sid]
+            self.session_cache_stats['invalidations'] += len(stale)
+    
+    def clear_session_cache(self):
+        """Drop all cached sessions"""
+        with self._session_cache_lock:
+            self.session_cache_stats['invalidations'] += len(self._session_cache)
+            self._session_cache.clear()
+    
+    def get_session_cache_stats(self):
+        """Return session cache counters, size and hit rate"""
+        with self._session_cache_lock:
+            stats = dict(self.session_cache_stats, size=len(self._session_cache),
+                         ttl_seconds=self.SESSION_CACHE_TTL, max_size=self.SESSION_CACHE_MAX_SIZE)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+    
     def cleanup_expired_sessions(self):
         """Remove expired sessions from database"""
-        db = sqlite3.connect(self.db_path)
+        db = db_pool.connect(self.db_path)
         cursor = db.cursor()
         
         deleted = cursor.execute('''
@@ -238,7 +312,7 @@ def check_user_service_orders(user_id, db=None):
     
     if db is None:
         db_path = current_app.config.get('DATABASE', 'cvd.db')
-        db = sqlite3.connect(db_path)
+        db = db_pool.connect_readonly(db_path)
         db.row_factory = sqlite3.Row
         should_close = True
     else:
@@ -267,7 +341,7 @@ def get_user_service_order_details(user_id, db=None):
     
     if db is None:
         db_path = current_app.config.get('DATABASE', 'cvd.db')
-        db = sqlite3.connect(db_path)
+        db = db_pool.connect_readonly(db_path)
         db.row_factory = sqlite3.Row
         should_close = True
     else:
@@ -349,7 +423,7 @@ def log_audit_event(user_id, action, resource_type=None, resource_id=None, detai
         return request.remote_addr
     
     db_path = current_app.config.get('DATABASE', 'cvd.db')
-    db = sqlite3.connect(db_path)
+    db = db_pool.connect(db_path)
     cursor = db.cursor()
     
     # Handle case where dictionary is passed as third parameter (details in resource_type position)
@@ -60,7 +60,7 @@ class BackgroundTaskManager:
     
     def warm_cache(self):
         """
-        Warm the cache with common date ranges
+        Warm the cache with the most requested date ranges
         Runs every hour
         """
         if not self.cache or not self.service:
@@ -69,7 +69,9 @@ class BackgroundTaskManager:
         
         try:
             logger.info("Starting cache warming...")
-            warmer = CacheWarmer(self.cache, self.service)
+            # Warm with the same payload the trends endpoint caches
+            from activity_trends_api import build_trends_response
+            warmer = CacheWarmer(self.cache, self.service, loader=build_trends_response)
             warmer.warm_cache()
             logger.info("Cache warming complete")
             
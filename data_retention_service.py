@@ -3,12 +3,13 @@ Data Retention Service for Activity Monitoring
 Handles automatic cleanup of old activity data and session management
 """
 
-import sqlite3
 import threading
 import time
 import logging
 from datetime import datetime, timedelta
-import json
+import db_pool
+from activity_rollups import prune_rollups, write_daily_summary
+from activity_trend_store import prune_trend_store
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +34,7 @@ class DataRetentionService:
     def get_config(self, key, default=None):
         """Get configuration value from database"""
         try:
-            db = sqlite3.connect(self.db_path)
+            db = db_pool.connect_readonly(self.db_path)
             cursor = db.cursor()
             
             result = cursor.execute(
@@ -96,7 +97,7 @@ class DataRetentionService:
     def cleanup_old_activity_data(self):
         """Remove activity data older than retention period"""
         try:
-            db = sqlite3.connect(self.db_path)
+            db = db_pool.connect(self.db_path)
             cursor = db.cursor()
             
             # Get retention settings
@@ -114,6 +115,9 @@ class DataRetentionService:
             if deleted > 0:
                 logger.info(f"Deleted {deleted} old activity log records")
             
+            # Hourly rollups share the activity log's retention
+            prune_rollups(cursor, cutoff_date)
+            
             # Clean up old daily summaries (keep longer than detailed logs)
             summary_retention_days = int(self.get_config('activity_summary_retention_days', '730'))
             summary_cutoff = datetime.now() - timedelta(days=summary_retention_days)
@@ -125,6 +129,7 @@ class DataRetentionService:
             
             if deleted_summaries > 0:
                 logger.info(f"Deleted {deleted_summaries} old summary records")
+            prune_trend_store(cursor, summary_cutoff.date())
             
             db.commit()
             db.close()
@@ -137,7 +142,7 @@ class DataRetentionService:
     def cleanup_expired_sessions(self):
         """Clean up expired sessions"""
         try:
-            db = sqlite3.connect(self.db_path)
+            db = db_pool.connect(self.db_path)
             cursor = db.cursor()
             
             # Delete sessions that have expired
@@ -173,7 +178,7 @@ class DataRetentionService:
     def cleanup_old_alerts(self):
         """Clean up old resolved/dismissed alerts"""
         try:
-            db = sqlite3.connect(self.db_path)
+            db = db_pool.connect(self.db_path)
             cursor = db.cursor()
             
             # Keep resolved/dismissed alerts for 30 days
@@ -216,7 +221,7 @@ class DataRetentionService:
     def optimize_database(self):
         """Optimize database by running VACUUM and ANALYZE"""
         try:
-            db = sqlite3.connect(self.db_path)
+            db = db_pool.connect(self.db_path)
             cursor = db.cursor()
             
             # Get database size before optimization
@@ -288,9 +293,10 @@ class DataRetentionService:
         logger.info("Daily summary generator started")
     
     def generate_daily_summary(self, date=None):
-        """Generate activity summary for a specific date"""
+        """Generate activity summary for a specific date from the hourly rollups"""
+        db = None
         try:
-            db = sqlite3.connect(self.db_path)
+            db = db_pool.connect(self.db_path)
             cursor = db.cursor()
             
             # Default to yesterday if no date specified
@@ -299,123 +305,14 @@ class DataRetentionService:
             
             logger.info(f"Generating summary for {date}")
             
-            # Check if summary already exists
-            existing = cursor.execute('''
-                SELECT id FROM activity_summary_daily 
-                WHERE date = ?
-            ''', (date,)).fetchone()
+            # Existing summaries are kept
+            summary = write_daily_summary(cursor, date, replace=False)
+            db.commit()
             
-            if existing:
-                logger.info(f"Summary already exists for {date}")
-                db.close()
-                return
-            
-            # Calculate date range
-            start_datetime = datetime.combine(date, datetime.min.time())
-            end_datetime = start_datetime + timedelta(days=1)
-            
-            # Get metrics
-            metrics = cursor.execute('''
-                SELECT 
-                    COUNT(DISTINCT user_id) as unique_users,
-                    COUNT(DISTINCT session_id) as total_sessions,
-                    SUM(CASE WHEN action_type = 'page_view' THEN 1 ELSE 0 END) as page_views,
-                    SUM(CASE WHEN action_type = 'api_call' THEN 1 ELSE 0 END) as api_calls,
-                    AVG(duration_ms) / 1000 as avg_duration_seconds
-                FROM user_activity_log
-                WHERE timestamp >= ? AND timestamp < ?
-            ''', (start_datetime, end_datetime)).fetchone()
-            
-            if not metrics or metrics['unique_users'] == 0:
-                logger.info(f"No activity data for {date}")
-                db.close()
-                return
-            
-            # Get peak concurrent users by hour
-            hourly_users = cursor.execute('''
-                SELECT 
-                    strftime('%H', timestamp) as hour,
-                    COUNT(DISTINCT user_id) as user_count
-                FROM user_activity_log
-                WHERE timestamp >= ? AND timestamp < ?
-                GROUP BY hour
-                ORDER BY user_count DESC
-                LIMIT 1
-            ''', (start_datetime, end_datetime)).fetchone()
-            
-            peak_hour = int(hourly_users['hour']) if hourly_users else None
-            peak_users = hourly_users['user_count'] if hourly_users else 0
-            
-            # Get top pages
-            top_pages = cursor.execute('''
-                SELECT page_url, COUNT(*) as count
-                FROM user_activity_log
-                WHERE timestamp >= ? AND timestamp < ? 
-                AND action_type = 'page_view'
-                GROUP BY page_url
-                ORDER BY count DESC
-                LIMIT 10
-            ''', (start_datetime, end_datetime)).fetchall()
-            
-            top_pages_json = json.dumps([
-                {'url': row[0], 'count': row[1]} for row in top_pages
-            ])
-            
-            # Get user distribution by role
-            user_dist = cursor.execute('''
-                SELECT u.role, COUNT(DISTINCT l.user_id) as count
-                FROM user_activity_log l
-                JOIN users u ON l.user_id = u.id
-                WHERE l.timestamp >= ? AND l.timestamp < ?
-                GROUP BY u.role
-            ''', (start_datetime, end_datetime)).fetchall()
-            
-            user_dist_json = json.dumps({
-                row[0]: row[1] for row in user_dist
-            })
-            
-            # Calculate average session duration
-            session_durations = cursor.execute('''
-                SELECT 
-                    session_id,
-                    MIN(timestamp) as start_time,
-                    MAX(timestamp) as end_time
-                FROM user_activity_log
-                WHERE timestamp >= ? AND timestamp < ?
-                GROUP BY session_id
-            ''', (start_datetime, end_datetime)).fetchall()
-            
-            if session_durations:
-                total_duration = sum(
-                    (datetime.fromisoformat(row[2]) - datetime.fromisoformat(row[1])).total_seconds()
-                    for row in session_durations
-                )
-                avg_session_duration = int(total_duration / len(session_durations))
+            if summary:
+                logger.info(f"Generated summary for {date}: {summary['unique_users']} users, {summary['total_sessions']} sessions")
             else:
-                avg_session_duration = 0
-            
-            # Insert summary
-            cursor.execute('''
-                INSERT INTO activity_summary_daily 
-                (date, unique_users, total_sessions, total_page_views, 
-                 total_api_calls, avg_session_duration_seconds,
-                 peak_concurrent_users, peak_hour, top_pages, user_distribution)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                date,
-                metrics['unique_users'],
-                metrics['total_sessions'],
-                metrics['page_views'] or 0,
-                metrics['api_calls'] or 0,
-                avg_session_duration,
-                peak_users,
-                peak_hour,
-                top_pages_json,
-                user_dist_json
-            ))
-            
-            db.commit()
-            logger.info(f"Generated summary for {date}: {metrics['unique_users']} users, {metrics['total_sessions']} sessions")
+                logger.info(f"No new summary for {date} (already exists or no activity)")
             db.close()
             
         except Exception as e:
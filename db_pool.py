@@ -0,0 +1,227 @@
+"""
+Database Connection Pool
+Per-thread reusable SQLite connections with uniform pragmas for the app and its
+background services.
+
+connect() hands out a read-write connection and connect_readonly() a query-only
+connection from a separate pool. Connections are drop-in sqlite3 connections:
+close() returns them to the calling thread's idle list (rolling back anything
+uncommitted and resetting row_factory and foreign_keys) instead of closing, so
+existing open/close call sites get reuse without restructuring. Every
+connection is opened once with WAL, synchronous=NORMAL, busy_timeout,
+cache_size, mmap_size and temp_store applied.
+
+An idle connection is only reused while its database file is the same file it
+was opened on, so replacing or restoring cvd.db never serves a stale handle.
+In-memory and URI paths are not pooled.
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds a connection waits on a locked database before raising
+BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '10'))
+
+# Page cache per connection in KiB (negative cache_size is KiB in SQLite)
+CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '16384'))
+
+# Bytes of the database file memory-mapped for reads
+MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+# Idle connections kept per thread and database before extras are closed
+MAX_IDLE_PER_THREAD = 4
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() returns it to the pool it came from"""
+
+    def close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is None:
+            super().close()
+        else:
+            pool.release(self)
+
+    def discard(self):
+        """Close the underlying connection for good"""
+        self._pool = None
+        super().close()
+
+
+def _file_identity(db_path):
+    """(device, inode) of the database file, or None when it does not exist"""
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+class ConnectionPool:
+    """Per-thread pool of reusable SQLite connections"""
+
+    def __init__(self, read_only=False, max_idle_per_thread=MAX_IDLE_PER_THREAD):
+        """
+        Args:
+            read_only: Open connections with mode=ro and query_only
+            max_idle_per_thread: Idle connections kept per thread and database
+        """
+        self.read_only = read_only
+        self.max_idle_per_thread = max_idle_per_thread
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self.stats = {
+            'created': 0,
+            'reused': 0,
+            'released': 0,
+            'discarded': 0
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _idle(self, db_path):
+        """Idle connections for db_path owned by the calling thread"""
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = {}
+        return idle.setdefault(db_path, [])
+
+    def _open(self, db_path, timeout):
+        """Open a new pooled connection with the standard pragmas"""
+        if self.read_only:
+            conn = sqlite3.connect(f'file:{os.path.abspath(db_path)}?mode=ro', uri=True,
+                                   timeout=timeout, factory=PooledConnection,
+                                   check_same_thread=False)
+        else:
+            conn = sqlite3.connect(db_path, timeout=timeout, factory=PooledConnection,
+                                   check_same_thread=False)
+
+        # journal_mode is persistent in the file but must be set from a writer
+        if not self.read_only:
+            conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        if self.read_only:
+            conn.execute('PRAGMA query_only = ON')
+
+        conn._pool = self
+        conn._db_path = db_path
+        conn._identity = _file_identity(db_path)
+        conn._timeout = timeout
+        conn._idle = False
+        self._connections.add(conn)
+        self._count('created')
+        return conn
+
+    def acquire(self, db_path, timeout=None):
+        """Return an idle connection for db_path from this thread, or open one"""
+        db_path = os.fspath(db_path)
+        timeout = BUSY_TIMEOUT if timeout is None else timeout
+
+        if db_path == ':memory:' or db_path.startswith('file:'):
+            return sqlite3.connect(db_path, timeout=timeout, uri=db_path.startswith('file:'))
+
+        idle = self._idle(db_path)
+        identity = _file_identity(db_path)
+        while idle:
+            conn = idle.pop()
+            if getattr(conn, '_pool', None) is not self:
+                continue  # closed by close_all()
+            if conn._identity != identity:
+                conn.discard()
+                self._count('discarded')
+                continue
+            if conn._timeout != timeout:
+                conn.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+                conn._timeout = timeout
+            conn._idle = False
+            self._count('reused')
+            return conn
+
+        return self._open(db_path, timeout)
+
+    def release(self, conn):
+        """Reset a connection and keep it idle for the calling thread"""
+        if conn._idle:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if not self.read_only:
+                conn.execute('PRAGMA foreign_keys = OFF')
+            conn.row_factory = None
+            conn.text_factory = str
+        except sqlite3.Error as e:
+            logger.warning(f"Discarding pooled connection to {conn._db_path}: {e}")
+            conn.discard()
+            self._count('discarded')
+            return
+
+        idle = self._idle(conn._db_path)
+        if len(idle) >= self.max_idle_per_thread:
+            conn.discard()
+            self._count('discarded')
+            return
+
+        conn._idle = True
+        idle.append(conn)
+        self._count('released')
+
+    def close_all(self):
+        """Close every idle connection in every thread"""
+        closed = 0
+        for conn in list(self._connections):
+            if conn._idle and getattr(conn, '_pool', None) is self:
+                conn.discard()
+                closed += 1
+        with self._lock:
+            self.stats['discarded'] += closed
+        return closed
+
+    def get_stats(self):
+        """Return pool counters and open connection count"""
+        connections = list(self._connections)
+        with self._lock:
+            stats = dict(self.stats)
+        stats['open'] = sum(1 for conn in connections if getattr(conn, '_pool', None) is self)
+        stats['idle'] = sum(1 for conn in connections
+                            if conn._idle and getattr(conn, '_pool', None) is self)
+        return stats
+
+
+write_pool = ConnectionPool()
+read_pool = ConnectionPool(read_only=True)
+
+
+def connect(db_path, timeout=None):
+    """Read-write connection for db_path; close() returns it to the pool"""
+    return write_pool.acquire(db_path, timeout)
+
+
+def connect_readonly(db_path, timeout=None):
+    """Query-only connection for db_path from the read-only pool"""
+    return read_pool.acquire(db_path, timeout)
+
+
+def close_all():
+    """Close all idle pooled connections, e.g. at shutdown"""
+    return write_pool.close_all() + read_pool.close_all()
+
+
+def get_pool_stats():
+    """Counters for both pools"""
+    return {
+        'write': write_pool.get_stats(),
+        'read': read_pool.get_stats()
+    }
@@ -0,0 +1,148 @@
+"""
+DEX Content Store
+Content hashing and raw_content storage for dex_reads.
+
+Every upload is identified by the SHA-256 of its bytes (dex_reads.content_hash),
+so re-uploads of the same file resolve to the existing read without re-parsing.
+The decoded text is stored according to the storage mode:
+
+    text  - plain text in dex_reads.raw_content (default, original behaviour)
+    zlib  - zlib-compressed BLOB in dex_reads.raw_content
+    blob  - zlib-compressed file in a content-addressed directory
+            (<blob_dir>/<hash[:2]>/<hash>.zlib); raw_content is left empty
+
+dex_reads.content_encoding records the mode used for each row, so the mode can
+change without migrating existing rows.
+"""
+
+import codecs
+import hashlib
+import os
+import tempfile
+import zlib
+
+STORAGE_MODES = ('text', 'zlib', 'blob')
+
+# Bytes read per chunk when consuming a stream
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(raw: bytes) -> str:
+    """SHA-256 hex digest of raw upload bytes"""
+    return hashlib.sha256(raw).hexdigest()
+
+
+def stream_content_hash(stream) -> str:
+    """SHA-256 hex digest of a binary stream read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_path(blob_dir: str, digest: str) -> str:
+    """Content-addressed path for a hash"""
+    return os.path.join(blob_dir, digest[:2], f'{digest}.zlib')
+
+
+class RawContentWriter:
+    """
+    Hash upload bytes and build their raw_content value chunk by chunk, so a
+    file is never held whole as bytes and then again as text.
+
+    finish() returns (content_hash, raw_content value, content_encoding). In
+    blob mode the compressed stream goes to a temporary file in blob_dir;
+    publish() renames it to the content-addressed path after the row is
+    committed and discard() removes it when the row is not stored.
+    """
+
+    def __init__(self, mode: str = 'text', blob_dir: str = None):
+        if mode not in STORAGE_MODES:
+            raise ValueError(f'Unknown DEX content storage mode: {mode}')
+        if mode == 'blob' and not blob_dir:
+            raise ValueError('blob storage requires a blob directory')
+        self.mode = mode
+        self.blob_dir = blob_dir
+        self._hash = hashlib.sha256()
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self._parts = []
+        self._compressor = None if mode == 'text' else zlib.compressobj()
+        self._tmp = None
+        self._digest = None
+        if mode == 'blob':
+            os.makedirs(blob_dir, exist_ok=True)
+            self._tmp = tempfile.NamedTemporaryFile(dir=blob_dir, suffix='.tmp', delete=False)
+
+    def update(self, chunk: bytes):
+        """Add the next chunk of upload bytes"""
+        self._hash.update(chunk)
+        self._add_text(self._decoder.decode(chunk))
+
+    def consume(self, stream) -> tuple:
+        """Read a binary stream to the end in chunks, rewind it and finish"""
+        for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b''):
+            self.update(chunk)
+        stream.seek(0)
+        return self.finish()
+
+    def _add_text(self, text: str):
+        if self._compressor is None:
+            self._parts.append(text)
+            return
+        compressed = self._compressor.compress(text.encode('utf-8'))
+        if self._tmp is not None:
+            self._tmp.write(compressed)
+        else:
+            self._parts.append(compressed)
+
+    def finish(self) -> tuple:
+        """Return (content_hash, raw_content value, content_encoding)"""
+        digest = self._hash.hexdigest()
+        self._add_text(self._decoder.decode(b'', final=True))
+        if self.mode == 'text':
+            return digest, ''.join(self._parts), 'text'
+
+        tail = self._compressor.flush()
+        if self.mode == 'zlib':
+            return digest, b''.join(self._parts) + tail, 'zlib'
+
+        self._tmp.write(tail)
+        self._tmp.close()
+        self._digest = digest
+        return digest, '', 'blob'
+
+    def publish(self):
+        """Move a finished blob to its content-addressed path; call once its row is committed"""
+        if self._tmp is None:
+            return
+        path = blob_path(self.blob_dir, self._digest)
+        if os.path.exists(path):
+            self.discard()
+            return
+        # Rename so readers never see a partial blob
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self._tmp.name, path)
+        self._tmp = None
+
+    def discard(self):
+        """Drop any temporary blob file"""
+        if self._tmp is not None:
+            self._tmp.close()
+            if os.path.exists(self._tmp.name):
+                os.remove(self._tmp.name)
+            self._tmp = None
+
+
+def decode_raw_content(value, encoding: str, digest: str = None, blob_dir: str = None) -> str:
+    """Return the original text for a stored raw_content value"""
+    if encoding in (None, 'text'):
+        return value
+
+    if encoding == 'zlib':
+        return zlib.decompress(value).decode('utf-8')
+
+    if encoding == 'blob':
+        with open(blob_path(blob_dir, digest), 'rb') as f:
+            return zlib.decompress(f.read()).decode('utf-8')
+
+    raise ValueError(f'Unknown DEX content encoding: {encoding}')
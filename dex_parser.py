@@ -22,10 +22,129 @@ Usage:
     else:
         print(f"Parse failed: {result['error']['message']}")
 
+    # Large uploads: parse line by line and hand non-PA records to a sink in chunks
+    with open(path, 'rb') as stream:
+        result = parser.parse_stream(stream, filename, record_sink=store_records)
+
 Author: CVD System
-Version: 2.0 (with PA consolidation)
+Version: 2.1 (streaming parse)
 """
 
+import io
+import zipfile
+
+
+class DEXParseError(Exception):
+    """Raised by DEXParser.iter_records; error holds the line/record/message/field dict"""
+    
+    def __init__(self, error: dict):
+        super().__init__(error.get('message'))
+        self.error = error
+
+
+class PAConsolidator:
+    """Groups PA records by selection_number as they stream in"""
+    
+    def __init__(self, parser):
+        self.parser = parser
+        self.pa_groups = {}  # {selection_number: {PA1: record, PA2: record, ...}}
+        self.errors = []
+        self.current_selection = None
+    
+    def add(self, record: dict):
+        """Add one PA record to its selection group"""
+        pa_groups = self.pa_groups
+        errors = self.errors
+        pa_type = record['record_type']
+        
+        # PA1 contains selection_number, subsequent PA records belong to same selection
+        if pa_type == 'PA1':
+            # PA1 starts a new selection group
+            self.current_selection = record['parsed_data'].get('selection_number', '')
+            current_selection = self.current_selection
+            if not current_selection:
+                return  # Skip PA1 without selection number
+            
+            if current_selection not in pa_groups:
+                pa_groups[current_selection] = {}
+            
+            # Check for duplicate PA1 for same selection
+            if pa_type in pa_groups[current_selection]:
+                error_msg = f"Duplicate selections found: {current_selection}"
+                if error_msg not in errors:
+                    errors.append(error_msg)
+            
+            pa_groups[current_selection][pa_type] = record
+        
+        elif pa_type == 'PA7':
+            # PA7 records have their own selection_number in the data
+            pa7_selection = record['parsed_data'].get('selection_number', '')
+            if pa7_selection:
+                if pa7_selection not in pa_groups:
+                    pa_groups[pa7_selection] = {}
+                
+                # PA7 records can have multiple entries per selection (different payment types)
+                # Store them in a list
+                if pa_type not in pa_groups[pa7_selection]:
+                    pa_groups[pa7_selection][pa_type] = []
+                pa_groups[pa7_selection][pa_type].append(record)
+        
+        elif self.current_selection and pa_type.startswith('PA'):
+            current_selection = self.current_selection
+            # PA2, PA3, PA4, PA5, PA8 belong to current selection
+            if current_selection not in pa_groups:
+                pa_groups[current_selection] = {}
+            
+            # Check for duplicate PA types within same selection (except PA7 which can have multiples)
+            if pa_type in pa_groups[current_selection] and pa_type != 'PA7':
+                error_msg = f"Duplicate selections found: {current_selection}"
+                if error_msg not in errors:
+                    errors.append(error_msg)
+            
+            pa_groups[current_selection][pa_type] = record
+    
+    def finish(self) -> tuple:
+        """Validate and merge every group; returns (consolidated, errors)"""
+        consolidated = []
+        for selection_number, pa_group in self.pa_groups.items():
+            # Validate PA1 exists (required)
+            if 'PA1' not in pa_group:
+                self.errors.append(f"Selection {selection_number} missing PA1")
+                continue
+            
+            # Consolidate data from all PA records
+            consolidated_data = self.parser._merge_pa_data(pa_group)
+            
+            # Validate revenue consistency
+            if not self.parser._validate_pa_revenue(pa_group):
+                self.errors.append("PA sales data mismatch")
+            
+            consolidated.append({
+                'selection_number': selection_number,
+                'data': consolidated_data,
+                'line_number': pa_group['PA1']['line_number']  # Use PA1 line for reference
+            })
+        
+        return consolidated, self.errors
+
+
+def open_dex_source(path: str, member: str = None):
+    """Binary stream for an upload saved at path, or for a member of the zip archive at path"""
+    if member is None:
+        return open(path, 'rb')
+    # The member stream keeps the archive file open until it is closed
+    return zipfile.ZipFile(path).open(member)
+
+
+def parse_dex_upload(filename: str, path: str, member: str = None) -> dict:
+    """
+    Parse one uploaded DEX file line by line, including grid pattern analysis.
+    Module-level so it can run in a ProcessPoolExecutor worker.
+    """
+    with open_dex_source(path, member) as stream:
+        return DEXParser().parse_stream(stream, filename)
+
+
 class DEXParser:
     """DEX file parser with comprehensive error handling and validation"""
     
@@ -94,63 +213,44 @@ class DEXParser:
     
     def parse_file(self, content: str, filename: str) -> dict:
         """Parse DEX file content with comprehensive error handling and PA record consolidation"""
+        return self.parse_stream(io.StringIO(content), filename)
+    
+    def parse_stream(self, stream, filename: str, record_sink=None, chunk_size: int = 500) -> dict:
+        """
+        Parse a DEX file from a text or binary stream without loading it whole.
+        
+        PA records are consolidated as they arrive. Other records are returned in
+        'parsed_records', or, when record_sink is given, passed to it in lists of
+        up to chunk_size records and left out of the result.
+        """
         try:
-            lines = content.strip().split('\n')
-            lines = [line.strip() for line in lines if line.strip()]
-            
-            if not lines:
-                return {
-                    'success': False,
-                    'error': {
-                        'line': 0,
-                        'message': 'Empty file or no valid content found',
-                        'field': 0
-                    }
-                }
-            
-            # Validate file structure
-            structure_result = self._validate_structure(lines)
-            if not structure_result['success']:
-                return structure_result
-            
-            # Parse records
-            parsed_records = []
-            pa_records = []
+            consolidator = PAConsolidator(self)
             non_pa_records = []
             machine_info = {}
+            total_records = 0
             
-            for line_num, line in enumerate(lines, 1):
-                try:
-                    record_result = self._parse_record(line, line_num)
-                    if not record_result['success']:
-                        return record_result
-                    
-                    record = record_result['record']
-                    parsed_records.append(record)
-                    
-                    # Extract machine info from DXS
-                    if record['record_type'] == 'DXS':
-                        machine_info = record['parsed_data']
-                    
-                    # Separate PA and non-PA records
-                    if record['record_type'].startswith('PA'):
-                        pa_records.append(record)
-                    else:
-                        non_pa_records.append(record)
+            for record in self.iter_records(stream):
+                total_records += 1
                 
-                except Exception as e:
-                    return {
-                        'success': False,
-                        'error': {
-                            'line': line_num,
-                            'record': line,
-                            'message': f'Unexpected error parsing record: {str(e)}',
-                            'field': 0
-                        }
-                    }
+                # Extract machine info from DXS
+                if record['record_type'] == 'DXS':
+                    machine_info = record['parsed_data']
+                
+                # Separate PA and non-PA records
+                if record['record_type'].startswith('PA'):
+                    consolidator.add(record)
+                else:
+                    non_pa_records.append(record)
+                    if record_sink and len(non_pa_records) >= chunk_size:
+                        record_sink(non_pa_records)
+                        non_pa_records = []
+            
+            if record_sink and non_pa_records:
+                record_sink(non_pa_records)
+                non_pa_records = []
             
             # Consolidate PA records by selection_number
-            consolidated_pa, pa_errors = self._consolidate_pa_records(pa_records)
+            consolidated_pa, pa_errors = consolidator.finish()
             
             # NEW: Add grid pattern analysis
             grid_result = self._analyze_grid_patterns(consolidated_pa)
@@ -166,7 +266,7 @@ class DEXParser:
             return {
                 'success': has_only_non_critical,
                 'machine_info': machine_info,
-                'total_records': len(parsed_records),
+                'total_records': total_records,
                 'parsed_records': non_pa_records,  # Only non-PA records
                 'pa_records': consolidated_pa,
                 'grid_analysis': grid_result,
@@ -175,6 +275,11 @@ class DEXParser:
                 'error_message': self._format_error_messages(pa_errors) if pa_errors else None
             }
             
+        except DEXParseError as e:
+            return {
+                'success': False,
+                'error': e.error
+            }
         except Exception as e:
             return {
                 'success': False,
@@ -185,38 +290,67 @@ class DEXParser:
                 }
             }
     
-    def _validate_structure(self, lines: list) -> dict:
-        """Validate DEX file structure"""
-        if len(lines) < 2:
-            return {
-                'success': False,
-                'error': {
-                    'line': 0,
-                    'message': 'File too short - must contain at least DXS and DXE records',
+    def iter_records(self, stream):
+        """
+        Yield parsed records one non-empty line at a time from a text or binary stream.
+        Raises DEXParseError for structure or record errors; the DXE trailer is
+        checked after the last record has been yielded.
+        """
+        line_num = 0
+        last_line = None
+        
+        for raw_line in stream:
+            if isinstance(raw_line, bytes):
+                raw_line = raw_line.decode('utf-8', errors='ignore')
+            line = raw_line.strip()
+            if not line:
+                continue
+            
+            line_num += 1
+            if line_num == 1 and not line.startswith('DXS*'):
+                raise DEXParseError({
+                    'line': 1,
+                    'record': line,
+                    'message': 'File must start with DXS record',
                     'field': 0
-                }
-            }
+                })
+            
+            record_result = self._parse_record(line, line_num)
+            if not record_result['success']:
+                raise DEXParseError(record_result['error'])
+            
+            last_line = line
+            yield record_result['record']
         
-        # Check for DXS header
-        first_line = lines[0]
-        if not first_line.startswith('DXS*'):
+        if line_num == 0:
+            raise DEXParseError({
+                'line': 0,
+                'message': 'Empty file or no valid content found',
+                'field': 0
+            })
+        
+        structure_result = self._validate_trailer(line_num, last_line)
+        if not structure_result['success']:
+            raise DEXParseError(structure_result['error'])
+    
+    def _validate_trailer(self, line_count: int, last_line: str) -> dict:
+        """Validate DEX file length and DXE trailer"""
+        if line_count < 2:
             return {
                 'success': False,
                 'error': {
-                    'line': 1,
-                    'record': first_line,
-                    'message': 'File must start with DXS record',
+                    'line': 0,
+                    'message': 'File too short - must contain at least DXS and DXE records',
                     'field': 0
                 }
             }
         
         # Check for DXE trailer
-        last_line = lines[-1]
         if not last_line.startswith('DXE*'):
             return {
                 'success': False,
                 'error': {
-                    'line': len(lines),
+                    'line': line_count,
                     'record': last_line,
                     'message': 'File must end with DXE record',
                     'field': 0
@@ -227,80 +361,10 @@ class DEXParser:
     
     def _consolidate_pa_records(self, pa_records: list) -> tuple:
         """Consolidate PA records by selection_number with validation"""
-        pa_groups = {}  # {selection_number: {PA1: record, PA2: record, ...}}
-        errors = []
-        current_selection = None
-        
-        # Group PA records by selection_number
-        # PA1 contains selection_number, subsequent PA records belong to same selection
+        consolidator = PAConsolidator(self)
         for record in pa_records:
-            pa_type = record['record_type']
-            
-            if pa_type == 'PA1':
-                # PA1 starts a new selection group
-                current_selection = record['parsed_data'].get('selection_number', '')
-                if not current_selection:
-                    continue  # Skip PA1 without selection number
-                
-                if current_selection not in pa_groups:
-                    pa_groups[current_selection] = {}
-                
-                # Check for duplicate PA1 for same selection
-                if pa_type in pa_groups[current_selection]:
-                    error_msg = f"Duplicate selections found: {current_selection}"
-                    if error_msg not in errors:
-                        errors.append(error_msg)
-                
-                pa_groups[current_selection][pa_type] = record
-            
-            elif pa_type == 'PA7':
-                # PA7 records have their own selection_number in the data
-                pa7_selection = record['parsed_data'].get('selection_number', '')
-                if pa7_selection:
-                    if pa7_selection not in pa_groups:
-                        pa_groups[pa7_selection] = {}
-                    
-                    # PA7 records can have multiple entries per selection (different payment types)
-                    # Store them in a list
-                    if pa_type not in pa_groups[pa7_selection]:
-                        pa_groups[pa7_selection][pa_type] = []
-                    pa_groups[pa7_selection][pa_type].append(record)
-            
-            elif current_selection and pa_type.startswith('PA'):
-                # PA2, PA3, PA4, PA5, PA8 belong to current selection
-                if current_selection not in pa_groups:
-                    pa_groups[current_selection] = {}
-                
-                # Check for duplicate PA types within same selection (except PA7 which can have multiples)
-                if pa_type in pa_groups[current_selection] and pa_type != 'PA7':
-                    error_msg = f"Duplicate selections found: {current_selection}"
-                    if error_msg not in errors:
-                        errors.append(error_msg)
-                
-                pa_groups[current_selection][pa_type] = record
-        
-        # Validate and consolidate each group
-        consolidated = []
-        for selection_number, pa_group in pa_groups.items():
-            # Validate PA1 exists (required)
-            if 'PA1' not in pa_group:
-                errors.append(f"Selection {selection_number} missing PA1")
-                continue
-            
-            # Consolidate data from all PA records
-            consolidated_data = self._merge_pa_data(pa_group)
-            
-            # Validate revenue consistency
-            if not self._validate_pa_revenue(pa_group):
-                errors.append("PA sales data mismatch")
-            
-            consolidated.append({
-                'selection_number': selection_number,
-                'data': consolidated_data,
-                'line_number': pa_group['PA1']['line_number']  # Use PA1 line for reference
-            })
-        
-        return consolidated, errors
+            consolidator.add(record)
+        return consolidator.finish()
     
     def _analyze_grid_patterns(self, consolidated_pa: list) -> dict:
         """Analyze PA records for grid patterns and add row/column assignments"""
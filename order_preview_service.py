@@ -0,0 +1,254 @@
+"""
+Order Preview Service
+Batched order preview engine for POST /api/service-orders/preview.
+
+All selected cabinets are resolved with one VALUES-joined query, their product
+aggregates (quantity, par level, slot-metric velocity) are loaded with one grouped
+query and order quantities are computed for every product in a single vectorized
+pass. Product aggregates are memoized per cabinet and keyed on the cabinet's
+planogram and slot-metric versions (cabinet_versions), so re-running a preview
+only queries cabinets whose planogram or metrics changed since the last run.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Selections per VALUES chunk: three bound variables each, under SQLite's 999 default
+SELECTION_CHUNK_SIZE = 300
+
+# Cabinet ids per IN clause
+CABINET_CHUNK_SIZE = 500
+
+
+def compute_order_quantities(quantity, par_level, daily_velocity, days_until_service):
+    """
+    Order quantity per product: units to par, plus expected sales until the service
+    date when the product has velocity. Returns an int array.
+    """
+    quantity = np.asarray(quantity, dtype=float)
+    par_level = np.asarray(par_level, dtype=float)
+    daily_velocity = np.asarray(daily_velocity, dtype=float)
+
+    units_to_par = par_level - quantity
+    with_velocity = units_to_par + daily_velocity * days_until_service
+    return np.round(np.where(daily_velocity > 0, with_velocity, units_to_par)).astype(int)
+
+
+class OrderPreviewEngine:
+    """Computes service order previews with per-cabinet memoized product aggregates"""
+
+    def __init__(self, max_cached_cabinets=2048):
+        """
+        Args:
+            max_cached_cabinets: Cabinets kept in the memo before least recently used are evicted
+        """
+        self.max_cached_cabinets = max_cached_cabinets
+        self._memo = OrderedDict()  # {cabinet_id: (version, product rows)}
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+    def get_stats(self):
+        """Return memo counters and size"""
+        with self._lock:
+            return dict(self.stats, size=len(self._memo))
+
+    def clear(self):
+        """Drop all memoized cabinets"""
+        with self._lock:
+            self._memo.clear()
+
+    def load_cabinets(self, cursor, cabinet_selections):
+        """
+        Resolve selections to active cabinets with device info and versions,
+        in selection order. Unknown cabinets and deleted devices are dropped.
+        """
+        selections = list(dict.fromkeys(
+            (selection.get('deviceId'), selection.get('cabinetIndex'))
+            for selection in cabinet_selections
+            if selection.get('deviceId') is not None and selection.get('cabinetIndex') is not None
+        ))
+
+        cabinets = {}
+        for start in range(0, len(selections), SELECTION_CHUNK_SIZE):
+            chunk = selections[start:start + SELECTION_CHUNK_SIZE]
+            values_sql = ','.join('(?, ?, ?)' for _ in chunk)
+            params = [value for position, (device_id, cabinet_index) in enumerate(chunk, start)
+                      for value in (position, device_id, cabinet_index)]
+
+            for row in cursor.execute(f'''
+                WITH selections(position, device_id, cabinet_index) AS (VALUES {values_sql})
+                SELECT
+                    s.position,
+                    cc.device_id,
+                    cc.cabinet_index,
+                    cc.id as cabinet_id,
+                    cc.model_name,
+                    d.asset,
+                    COALESCE(l.name, 'Unknown') as location,
+                    COALESCE(cv.planogram_version, 0) as planogram_version,
+                    COALESCE(cv.metrics_version, 0) as metrics_version
+                FROM selections s
+                JOIN cabinet_configurations cc
+                    ON cc.device_id = s.device_id AND cc.cabinet_index = s.cabinet_index
+                JOIN devices d ON cc.device_id = d.id
+                LEFT JOIN locations l ON d.location_id = l.id
+                LEFT JOIN cabinet_versions cv ON cv.cabinet_id = cc.id
+                WHERE d.deleted_at IS NULL OR d.deleted_at = ''
+                ORDER BY s.position, cc.id
+            ''', params):
+                cabinets.setdefault((row['device_id'], row['cabinet_index']), row)
+
+        if len(cabinets) < len(selections):
+            logger.debug("Order preview skipped %d unknown cabinets or deleted devices",
+                         len(selections) - len(cabinets))
+
+        return list(cabinets.values())
+
+    def load_cabinet_products(self, cursor, cabinets):
+        """
+        Return {cabinet_id: product rows} for the given cabinets, querying only
+        those whose versions are not memoized.
+        """
+        products = {}
+        missing = {}
+        with self._lock:
+            for cabinet in cabinets:
+                version = (cabinet['planogram_version'], cabinet['metrics_version'])
+                cached = self._memo.get(cabinet['cabinet_id'])
+                if cached and cached[0] == version:
+                    self._memo.move_to_end(cabinet['cabinet_id'])
+                    products[cabinet['cabinet_id']] = cached[1]
+                    self.stats['hits'] += 1
+                else:
+                    missing[cabinet['cabinet_id']] = version
+                    self.stats['misses'] += 1
+
+        if not missing:
+            return products
+
+        loaded = {cabinet_id: [] for cabinet_id in missing}
+        cabinet_ids = list(missing)
+        for start in range(0, len(cabinet_ids), CABINET_CHUNK_SIZE):
+            chunk = cabinet_ids[start:start + CABINET_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            for row in cursor.execute(f'''
+                SELECT
+                    pl.cabinet_id,
+                    ps.product_id,
+                    COALESCE(p.name, 'Unknown Product') as product_name,
+                    SUM(COALESCE(ps.quantity, 0)) as total_quantity,
+                    SUM(COALESCE(ps.par_level, 0)) as total_par_level,
+                    SUM(COALESCE(sm.daily_velocity, 0)) as total_daily_velocity
+                FROM planogram_slots ps
+                JOIN planograms pl ON ps.planogram_id = pl.id
+                LEFT JOIN products p ON ps.product_id = p.id
+                LEFT JOIN slot_metrics sm ON ps.id = sm.planogram_slot_id
+                WHERE pl.cabinet_id IN ({placeholders})
+                    AND ps.product_id <> 1
+                GROUP BY pl.cabinet_id, ps.product_id, p.name
+                HAVING SUM(COALESCE(ps.par_level, 0)) > 0
+                ORDER BY pl.cabinet_id, ps.product_id, p.name
+            ''', chunk):
+                loaded[row['cabinet_id']].append((
+                    row['product_id'],
+                    row['product_name'],
+                    row['total_quantity'] or 0,
+                    row['total_par_level'] or 0,
+                    row['total_daily_velocity'] or 0
+                ))
+
+        with self._lock:
+            for cabinet_id, rows in loaded.items():
+                self._memo[cabinet_id] = (missing[cabinet_id], rows)
+                self._memo.move_to_end(cabinet_id)
+            while len(self._memo) > self.max_cached_cabinets:
+                self._memo.popitem(last=False)
+                self.stats['evictions'] += 1
+
+        products.update(loaded)
+        return products
+
+    def generate(self, cursor, route_id, service_date, cabinet_selections, days_until_service):
+        """Generate the order preview data structure"""
+        response = {
+            'routeId': route_id,
+            'serviceDate': service_date.isoformat(),
+            'daysUntilService': days_until_service,
+            'totalUnits': 0,
+            'totalProducts': 0,
+            'devices': []
+        }
+
+        cabinets = self.load_cabinets(cursor, cabinet_selections)
+        products = self.load_cabinet_products(cursor, cabinets)
+        logger.debug("Order preview for route %s: %d cabinets, memo %s",
+                     route_id, len(cabinets), self.get_stats())
+
+        # One vectorized pass over every product row of every cabinet
+        rows = [row for cabinet in cabinets for row in products[cabinet['cabinet_id']]]
+        if not rows:
+            return response
+        _, _, quantity, par_level, daily_velocity = zip(*rows)
+        order_quantities = compute_order_quantities(quantity, par_level, daily_velocity,
+                                                    days_until_service).tolist()
+
+        devices = {}
+        unique_products = set()
+        offset = 0
+        for cabinet in cabinets:
+            cabinet_rows = products[cabinet['cabinet_id']]
+            cabinet_orders = order_quantities[offset:offset + len(cabinet_rows)]
+            offset += len(cabinet_rows)
+
+            cabinet_data = {
+                'cabinetIndex': cabinet['cabinet_index'],
+                'cabinetType': cabinet['model_name'],
+                'totalUnits': 0,
+                'products': []
+            }
+            for (product_id, product_name, qty, par, velocity), order_quantity in zip(cabinet_rows, cabinet_orders):
+                # Only include if order needed
+                if order_quantity > 0:
+                    cabinet_data['products'].append({
+                        'productId': product_id,
+                        'productName': product_name,
+                        'orderQuantity': order_quantity,
+                        'currentQuantity': qty,
+                        'parLevel': par,
+                        'dailyVelocity': velocity
+                    })
+                    cabinet_data['totalUnits'] += order_quantity
+                    unique_products.add(product_id)
+
+            if cabinet_data['totalUnits'] <= 0:
+                continue
+
+            device_data = devices.get(cabinet['device_id'])
+            if device_data is None:
+                device_data = devices[cabinet['device_id']] = {
+                    'deviceId': cabinet['device_id'],
+                    'asset': cabinet['asset'],
+                    'location': cabinet['location'],
+                    'totalUnits': 0,
+                    'cabinets': []
+                }
+            device_data['cabinets'].append(cabinet_data)
+            device_data['totalUnits'] += cabinet_data['totalUnits']
+
+        # Devices in order of their first selection
+        device_order = {}
+        for selection in cabinet_selections:
+            device_order.setdefault(selection.get('deviceId'), len(device_order))
+        response['devices'] = sorted(devices.values(), key=lambda device: device_order[device['deviceId']])
+        response['totalUnits'] = sum(device['totalUnits'] for device in response['devices'])
+        response['totalProducts'] = len(unique_products)
+
+        return response
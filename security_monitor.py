@@ -3,17 +3,135 @@ Enhanced Security Monitoring Module for CVD Application
 Provides advanced threat detection and alerting capabilities
 """
 
-import sqlite3
 import json
 import time
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from collections import defaultdict
 import hashlib
 import re
+import threading
+import db_pool
 
 logger = logging.getLogger(__name__)
 
+# Login tracking state is partitioned by IP hash so concurrent failures from
+# many addresses take different locks
+SHARD_COUNT = 16
+
+# Sliding windows are kept as this many fixed-width bucket counters
+WINDOW_BUCKETS = 60
+
+# Distinct targeted users remembered per IP for alert details
+MAX_TRACKED_TARGETS = 20
+
+
+def sqlite_utc(timestamp):
+    """Epoch seconds as UTC text in SQLite's datetime('now') format"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class SlidingWindowCounter:
+    """
+    Event count over a trailing time window kept as a ring of bucket counters.
+    add() and count() are O(1) amortized: buckets are cleared as time advances
+    past them and a running total is adjusted, so nothing is rescanned.
+    Resolution is window_seconds / buckets.
+    """
+    
+    def __init__(self, window_seconds, buckets=WINDOW_BUCKETS):
+        self.bucket_seconds = window_seconds / buckets
+        self.buckets = buckets
+        self.counts = [0] * buckets
+        self.epochs = [-1] * buckets
+        self.total = 0
+        self.current_epoch = None
+    
+    def _advance(self, now):
+        """Expire buckets that fell out of the window; returns the current epoch"""
+        epoch = int(now // self.bucket_seconds)
+        if self.current_epoch is None:
+            self.current_epoch = epoch
+        elif epoch > self.current_epoch:
+            # Each bucket is cleared at most once per pass around the ring
+            for stale in range(max(self.current_epoch + 1, epoch - self.buckets + 1), epoch + 1):
+                index = stale % self.buckets
+                self.total -= self.counts[index]
+                self.counts[index] = 0
+                self.epochs[index] = stale
+            if epoch - self.current_epoch >= self.buckets:
+                self.total = 0
+            self.current_epoch = epoch
+        return epoch
+    
+    def add(self, now, amount=1):
+        """Record events at time now"""
+        epoch = self._advance(now)
+        index = epoch % self.buckets
+        self.epochs[index] = epoch
+        self.counts[index] += amount
+        self.total += amount
+    
+    def count(self, now):
+        """Events within the window ending at now"""
+        self._advance(now)
+        return self.total
+    
+    def subtract(self, other, now):
+        """Remove another counter's events (same window and buckets) from this one"""
+        self._advance(now)
+        other._advance(now)
+        for index in range(self.buckets):
+            if other.counts[index] and other.epochs[index] == self.epochs[index]:
+                removed = min(other.counts[index], self.counts[index])
+                self.counts[index] -= removed
+                self.total -= removed
+
+
+class _LoginShard:
+    """Failed-login windows and active blocks for the IPs hashed to one shard"""
+    
+    def __init__(self, window_seconds):
+        self.lock = threading.Lock()
+        self.window_seconds = window_seconds
+        self.attempts = {}                                  # IP -> SlidingWindowCounter
+        self.targets = {}                                   # IP -> {user_id: last attempt time}
+        self.failed = SlidingWindowCounter(window_seconds)  # all failures in this shard
+        self.blocks = {}                                    # IP -> (block expiry, time blocked)
+    
+    def record_failure(self, ip_address, user_id, now):
+        """Count a failure; returns (attempts from this IP, users it targeted)"""
+        counter = self.attempts.get(ip_address)
+        if counter is None:
+            counter = self.attempts[ip_address] = SlidingWindowCounter(self.window_seconds)
+        counter.add(now)
+        self.failed.add(now)
+        
+        targets = self.targets.setdefault(ip_address, {})
+        if user_id:
+            targets.pop(user_id, None)
+            targets[user_id] = now
+            if len(targets) > MAX_TRACKED_TARGETS:
+                del targets[next(iter(targets))]
+        cutoff = now - self.window_seconds
+        return counter.count(now), [user for user, seen in targets.items() if seen > cutoff]
+    
+    def clear(self, ip_address, now):
+        """Forget an IP's failures after a successful login"""
+        counter = self.attempts.pop(ip_address, None)
+        self.targets.pop(ip_address, None)
+        if counter is not None:
+            self.failed.subtract(counter, now)
+    
+    def sweep(self, now):
+        """Drop IPs with no failures left in the window and expired blocks"""
+        for ip_address in [ip for ip, counter in self.attempts.items() if counter.count(now) == 0]:
+            del self.attempts[ip_address]
+            self.targets.pop(ip_address, None)
+        for ip_address in [ip for ip, (expires, _) in self.blocks.items() if expires <= now]:
+            del self.blocks[ip_address]
+
+
 class SecurityMonitor:
     """Advanced security monitoring and threat detection"""
     
@@ -81,41 +199,52 @@ class SecurityMonitor:
         }
         
         # In-memory caches for performance
-        self.failed_login_cache = defaultdict(list)  # IP -> [(timestamp, user_id)]
+        window_seconds = self.brute_force_config['time_window_minutes'] * 60
+        self.login_shards = [_LoginShard(window_seconds) for _ in range(SHARD_COUNT)]
         self.export_cache = defaultdict(list)        # user_id -> [(timestamp, rows)]
         self.location_cache = {}                     # user_id -> last_location
         self.cache_cleanup_interval = 300            # 5 minutes
         self.last_cleanup = time.time()
+        
+        # Blocks written by other worker processes are picked up on this interval
+        self.block_refresh_interval = 30
+        self.last_block_refresh = 0
+        self.block_refresh_lock = threading.Lock()
+        self._ensure_block_table()
+        self._load_ip_blocks()
+    
+    def _shard(self, ip_address):
+        """Shard holding an IP's login state"""
+        return self.login_shards[hash(ip_address) % SHARD_COUNT]
+    
+    def _total_failed(self, now):
+        """Failed logins across all IPs within the window"""
+        total = 0
+        for shard in self.login_shards:
+            with shard.lock:
+                total += shard.failed.count(now)
+        return total
     
     def check_brute_force(self, ip_address, user_id=None, success=False):
         """
         Monitor for brute force attacks
         Returns: (is_blocked, should_alert, alert_details)
         """
-        now = datetime.now()
-        window_start = now - timedelta(minutes=self.brute_force_config['time_window_minutes'])
+        now = time.time()
+        shard = self._shard(ip_address)
         
         # Clean up old entries from cache
         self._cleanup_cache()
         
         if success:
             # Clear failed attempts on successful login
-            if ip_address in self.failed_login_cache:
-                del self.failed_login_cache[ip_address]
+            with shard.lock:
+                shard.clear(ip_address, now)
             return False, False, None
         
-        # Add failed attempt to cache
-        self.failed_login_cache[ip_address].append((now, user_id))
-        
-        # Filter attempts within time window
-        recent_attempts = [
-            attempt for attempt in self.failed_login_cache[ip_address]
-            if attempt[0] > window_start
-        ]
-        self.failed_login_cache[ip_address] = recent_attempts
-        
-        # Check thresholds
-        attempt_count = len(recent_attempts)
+        with shard.lock:
+            attempt_count, user_targets = shard.record_failure(ip_address, user_id, now)
+            already_blocked = shard.blocks.get(ip_address, (0, 0))[0] > now
         
         # Check if IP should be blocked
         is_blocked = attempt_count >= self.brute_force_config['max_failed_attempts']
@@ -126,9 +255,7 @@ class SecurityMonitor:
         alert_details = None
         if should_alert:
             # Check for distributed attack pattern
-            total_failed = sum(
-                len(attempts) for attempts in self.failed_login_cache.values()
-            )
+            total_failed = self._total_failed(now)
             
             severity = 'critical' if is_blocked else 'warning'
             if total_failed >= self.brute_force_config['distributed_threshold']:
@@ -139,14 +266,14 @@ class SecurityMonitor:
                 'severity': severity,
                 'ip_address': ip_address,
                 'attempt_count': attempt_count,
-                'user_targets': list(set(a[1] for a in recent_attempts if a[1])),
+                'user_targets': user_targets,
                 'is_distributed': total_failed >= self.brute_force_config['distributed_threshold'],
                 'total_failed_attempts': total_failed,
                 'description': f'Brute force attack detected from {ip_address}: {attempt_count} failed attempts'
             }
         
-        # Store block in database if needed
-        if is_blocked:
+        # Store block in memory and the database once per block
+        if is_blocked and not already_blocked:
             self._store_ip_block(ip_address, now)
         
         return is_blocked, should_alert, alert_details
@@ -348,19 +475,15 @@ class SecurityMonitor:
         if time.time() - self.last_cleanup < self.cache_cleanup_interval:
             return
         
-        now = datetime.now()
-        window = timedelta(minutes=self.brute_force_config['time_window_minutes'])
+        self.last_cleanup = time.time()
         
-        # Clean failed login cache
-        for ip in list(self.failed_login_cache.keys()):
-            self.failed_login_cache[ip] = [
-                attempt for attempt in self.failed_login_cache[ip]
-                if attempt[0] > now - window
-            ]
-            if not self.failed_login_cache[ip]:
-                del self.failed_login_cache[ip]
+        # Clean failed login windows and expired blocks, one shard at a time
+        for shard in self.login_shards:
+            with shard.lock:
+                shard.sweep(self.last_cleanup)
         
         # Clean export cache
+        now = datetime.now()
         hour_ago = now - timedelta(hours=1)
         for user_id in list(self.export_cache.keys()):
             self.export_cache[user_id] = [
@@ -369,17 +492,12 @@ class SecurityMonitor:
             ]
             if not self.export_cache[user_id]:
                 del self.export_cache[user_id]
-        
-        self.last_cleanup = time.time()
     
-    def _store_ip_block(self, ip_address, timestamp):
-        """Store IP block in database"""
+    def _ensure_block_table(self):
+        """Create the ip_blocks table if it does not exist"""
         try:
-            db = sqlite3.connect(self.db_path)
-            cursor = db.cursor()
-            
-            # Create table if not exists
-            cursor.execute('''
+            db = db_pool.connect(self.db_path)
+            db.execute('''
                 CREATE TABLE IF NOT EXISTS ip_blocks (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     ip_address TEXT NOT NULL,
@@ -389,24 +507,74 @@ class SecurityMonitor:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-            
-            expires_at = timestamp + timedelta(
-                minutes=self.brute_force_config['lockout_duration_minutes']
-            )
+            db.commit()
+            db.close()
+        except Exception as e:
+            logger.error(f'Failed to create ip_blocks table: {e}')
+    
+    def _load_ip_blocks(self):
+        """Replace the in-memory block set with the active blocks in ip_blocks"""
+        started = time.time()
+        try:
+            db = db_pool.connect_readonly(self.db_path)
+            rows = db.execute('''
+                SELECT ip_address, MAX(expires_at) FROM ip_blocks
+                WHERE expires_at > datetime('now')
+                GROUP BY ip_address
+            ''').fetchall()
+            db.close()
+        except Exception as e:
+            logger.error(f'Failed to load IP blocks: {e}')
+            return
+        
+        blocks = [[] for _ in range(SHARD_COUNT)]
+        for ip_address, expires_at in rows:
+            try:
+                expires = datetime.fromisoformat(str(expires_at)).replace(tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                continue
+            blocks[hash(ip_address) % SHARD_COUNT].append((ip_address, (expires, started)))
+        
+        for shard, shard_blocks in zip(self.login_shards, blocks):
+            with shard.lock:
+                # Keep blocks made while the query ran; their rows may not have been visible
+                recent = {ip: block for ip, block in shard.blocks.items() if block[1] >= started}
+                shard.blocks = dict(shard_blocks)
+                shard.blocks.update(recent)
+        self.last_block_refresh = started
+    
+    def _store_ip_block(self, ip_address, blocked_at):
+        """Store IP block (blocked_at in epoch seconds) in memory and in the database"""
+        expires_at = blocked_at + self.brute_force_config['lockout_duration_minutes'] * 60
+        
+        shard = self._shard(ip_address)
+        with shard.lock:
+            shard.blocks[ip_address] = (expires_at, time.time())
+        
+        try:
+            db = db_pool.connect(self.db_path)
+            cursor = db.cursor()
             
             cursor.execute('''
                 INSERT INTO ip_blocks (ip_address, blocked_at, expires_at, reason)
                 VALUES (?, ?, ?, ?)
-            ''', (ip_address, timestamp, expires_at, 'Brute force attack'))
+            ''', (ip_address, sqlite_utc(blocked_at), sqlite_utc(expires_at), 'Brute force attack'))
             
             db.commit()
             db.close()
             
-            logger.info(f'Blocked IP {ip_address} until {expires_at}')
+            logger.info(f'Blocked IP {ip_address} until {sqlite_utc(expires_at)} UTC')
             
         except Exception as e:
             logger.error(f'Failed to store IP block: {e}')
     
+    def unblock_ip(self, ip_address):
+        """Drop an IP's in-memory block (after it was lifted in ip_blocks)"""
+        shard = self._shard(ip_address)
+        with shard.lock:
+            shard.blocks.pop(ip_address, None)
+            shard.clear(ip_address, time.time())
+    
     def _get_ip_location(self, ip_address):
         """
         Get geographic location from IP address
@@ -446,33 +614,29 @@ class SecurityMonitor:
         return R * c
     
     def is_ip_blocked(self, ip_address):
-        """Check if an IP address is currently blocked"""
-        try:
-            db = sqlite3.connect(self.db_path)
-            cursor = db.cursor()
-            
-            # Check for active blocks
-            cursor.execute('''
-                SELECT id FROM ip_blocks
-                WHERE ip_address = ? 
-                AND expires_at > datetime('now')
-                ORDER BY expires_at DESC
-                LIMIT 1
-            ''', (ip_address,))
-            
-            result = cursor.fetchone()
-            db.close()
-            
-            return result is not None
-            
-        except Exception as e:
-            logger.error(f'Failed to check IP block: {e}')
-            return False
+        """Check if an IP address is currently blocked (in-memory block set)"""
+        now = time.time()
+        if now - self.last_block_refresh > self.block_refresh_interval and \
+                self.block_refresh_lock.acquire(blocking=False):
+            try:
+                self._load_ip_blocks()
+            finally:
+                self.block_refresh_lock.release()
+        
+        shard = self._shard(ip_address)
+        with shard.lock:
+            block = shard.blocks.get(ip_address)
+            if block is None:
+                return False
+            if block[0] <= now:
+                del shard.blocks[ip_address]
+                return False
+            return True
     
     def create_security_alert(self, alert_details):
         """Create a security alert in the database"""
         try:
-            db = sqlite3.connect(self.db_path)
+            db = db_pool.connect(self.db_path)
             cursor = db.cursor()
             
             # Store in activity_alerts table with enhanced metadata
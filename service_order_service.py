@@ -11,6 +11,83 @@ def get_db():
 class ServiceOrderService:
     """Service for creating and managing cabinet-centric service orders"""
     
+    # Selections per VALUES chunk: three bound variables each, under SQLite's 999 default
+    SELECTION_CHUNK_SIZE = 300
+    
+    @staticmethod
+    def load_cabinet_needs(cursor, cabinet_selections):
+        """
+        Resolve cabinet selections and the products each cabinet needs with one
+        VALUES-joined query per chunk of selections.
+        Returns (cabinet_ids, needs): cabinet_ids maps (deviceId, cabinetIndex) to the
+        cabinet configuration id; needs lists rows with cabinet_config_id, product_id,
+        product_name, category and quantity_needed in selection order.
+        """
+        # Repeated selections name the same cabinet; keep the first occurrence
+        selections = list(dict.fromkeys(
+            (selection['deviceId'], selection['cabinetIndex']) for selection in cabinet_selections
+        ))
+        
+        cabinet_ids = {}
+        needs = []
+        chunk_size = ServiceOrderService.SELECTION_CHUNK_SIZE
+        for start in range(0, len(selections), chunk_size):
+            chunk = selections[start:start + chunk_size]
+            values_sql = ','.join('(?, ?, ?)' for _ in chunk)
+            params = [value for position, (device_id, cabinet_index) in enumerate(chunk, start)
+                      for value in (position, device_id, cabinet_index)]
+            
+            rows = cursor.execute(f'''
+                WITH selections(position, device_id, cabinet_index) AS (VALUES {values_sql})
+                SELECT 
+                    s.device_id,
+                    s.cabinet_index,
+                    cc.id as cabinet_config_id,
+                    ps.product_id,
+                    ps.product_name,
+                    pr.category,
+                    SUM(ps.par_level - ps.quantity) as quantity_needed
+                FROM selections s
+                JOIN cabinet_configurations cc
+                    ON cc.device_id = s.device_id AND cc.cabinet_index = s.cabinet_index
+                LEFT JOIN planograms p ON p.cabinet_id = cc.id
+                LEFT JOIN planogram_slots ps ON ps.planogram_id = p.id
+                    AND ps.product_id != 1
+                    AND ps.par_level > ps.quantity
+                LEFT JOIN products pr ON ps.product_id = pr.id
+                GROUP BY s.position, cc.id, ps.product_id, ps.product_name
+                ORDER BY s.position, ps.product_id, ps.product_name
+            ''', params).fetchall()
+            
+            for row in rows:
+                cabinet_ids.setdefault((row['device_id'], row['cabinet_index']), row['cabinet_config_id'])
+                if row['product_id'] is not None:
+                    needs.append(row)
+        
+        return cabinet_ids, needs
+    
+    @staticmethod
+    def build_pick_list(needs):
+        """Aggregate per-cabinet product needs into a pick list sorted by category, then name"""
+        product_totals = {}
+        for product in needs:
+            key = product['product_id']
+            if key in product_totals:
+                product_totals[key]['quantity'] += product['quantity_needed']
+            else:
+                product_totals[key] = {
+                    'productId': product['product_id'],
+                    'productName': product['product_name'],
+                    'category': product['category'],
+                    'quantity': product['quantity_needed']
+                }
+        
+        # Convert to list and sort by category, then name
+        pick_list = list(product_totals.values())
+        pick_list.sort(key=lambda x: (x['category'] or '', x['productName']))
+        
+        return pick_list
+    
     @staticmethod
     def create_service_order(route_id, cabinet_selections, created_by=None):
         """
@@ -28,8 +105,14 @@ class ServiceOrderService:
             
             driver_id = route_info['driver_id'] if route_info else None
             
-            # Calculate pick list from cabinet selections
-            pick_list = ServiceOrderService.calculate_pick_list(cabinet_selections)
+            # Resolve every selection and its product needs once; reused for items and pick list
+            cabinet_ids, needs = ServiceOrderService.load_cabinet_needs(cursor, cabinet_selections)
+            
+            for selection in cabinet_selections:
+                if (selection['deviceId'], selection['cabinetIndex']) not in cabinet_ids:
+                    raise ValueError(f"Cabinet configuration not found for device {selection['deviceId']}, cabinet {selection['cabinetIndex']}")
+            
+            pick_list = ServiceOrderService.build_pick_list(needs)
             
             # Calculate total units and estimated time
             total_units = sum(item['quantity'] for item in pick_list)
@@ -45,48 +128,30 @@ class ServiceOrderService:
             order_id = cursor.lastrowid
             
             # Create service order cabinet entries
-            for selection in cabinet_selections:
-                device_id = selection['deviceId']
-                cabinet_index = selection['cabinetIndex']
-                
-                # Get cabinet configuration ID
-                cabinet_config = cursor.execute('''
-                    SELECT id FROM cabinet_configurations
-                    WHERE device_id = ? AND cabinet_index = ?
-                ''', (device_id, cabinet_index)).fetchone()
-                
-                if not cabinet_config:
-                    raise ValueError(f"Cabinet configuration not found for device {device_id}, cabinet {cabinet_index}")
-                
-                # Create service order cabinet entry
-                cursor.execute('''
-                    INSERT INTO service_order_cabinets
-                    (service_order_id, cabinet_configuration_id)
-                    VALUES (?, ?)
-                ''', (order_id, cabinet_config['id']))
-                
-                service_order_cabinet_id = cursor.lastrowid
-                
-                # Get products needed for this cabinet
-                products_needed = cursor.execute('''
-                    SELECT 
-                        ps.product_id,
-                        SUM(ps.par_level - ps.quantity) as quantity_needed
-                    FROM planogram_slots ps
-                    JOIN planograms p ON ps.planogram_id = p.id
-                    WHERE p.cabinet_id = ?
-                    AND ps.product_id != 1
-                    AND ps.par_level > ps.quantity
-                    GROUP BY ps.product_id
-                ''', (cabinet_config['id'],)).fetchall()
-                
-                # Create service order cabinet items
-                for product in products_needed:
-                    cursor.execute('''
-                        INSERT INTO service_order_cabinet_items
-                        (service_order_cabinet_id, product_id, quantity_needed)
-                        VALUES (?, ?, ?)
-                    ''', (service_order_cabinet_id, product['product_id'], product['quantity_needed']))
+            cursor.executemany('''
+                INSERT INTO service_order_cabinets
+                (service_order_id, cabinet_configuration_id)
+                VALUES (?, ?)
+            ''', [(order_id, cabinet_config_id) for cabinet_config_id in dict.fromkeys(cabinet_ids.values())])
+            
+            order_cabinet_ids = {
+                row['cabinet_configuration_id']: row['id'] for row in cursor.execute('''
+                    SELECT id, cabinet_configuration_id FROM service_order_cabinets
+                    WHERE service_order_id = ?
+                ''', (order_id,))
+            }
+            
+            # Create service order cabinet items, one per cabinet and product
+            cabinet_items = {}
+            for product in needs:
+                key = (order_cabinet_ids[product['cabinet_config_id']], product['product_id'])
+                cabinet_items[key] = cabinet_items.get(key, 0) + product['quantity_needed']
+            
+            cursor.executemany('''
+                INSERT INTO service_order_cabinet_items
+                (service_order_cabinet_id, product_id, quantity_needed)
+                VALUES (?, ?, ?)
+            ''', [key + (quantity,) for key, quantity in cabinet_items.items()])
             
             db.commit()
             
@@ -105,56 +170,8 @@ class ServiceOrderService:
     def calculate_pick_list(cabinet_selections):
         """Calculate aggregated pick list across all selected cabinets"""
         db = get_db()
-        cursor = db.cursor()
-        
-        # Build query to aggregate products needed
-        product_totals = {}
-        
-        for selection in cabinet_selections:
-            device_id = selection['deviceId']
-            cabinet_index = selection['cabinetIndex']
-            
-            # Get cabinet configuration ID
-            cabinet_config = cursor.execute('''
-                SELECT id FROM cabinet_configurations
-                WHERE device_id = ? AND cabinet_index = ?
-            ''', (device_id, cabinet_index)).fetchone()
-            
-            if not cabinet_config:
-                continue
-            
-            products = cursor.execute('''
-                SELECT 
-                    ps.product_id,
-                    ps.product_name,
-                    pr.category,
-                    SUM(ps.par_level - ps.quantity) as quantity_needed
-                FROM planogram_slots ps
-                JOIN planograms p ON ps.planogram_id = p.id
-                LEFT JOIN products pr ON ps.product_id = pr.id
-                WHERE p.cabinet_id = ?
-                AND ps.product_id != 1
-                AND ps.par_level > ps.quantity
-                GROUP BY ps.product_id, ps.product_name
-            ''', (cabinet_config['id'],)).fetchall()
-            
-            for product in products:
-                key = product['product_id']
-                if key in product_totals:
-                    product_totals[key]['quantity'] += product['quantity_needed']
-                else:
-                    product_totals[key] = {
-                        'productId': product['product_id'],
-                        'productName': product['product_name'],
-                        'category': product['category'],
-                        'quantity': product['quantity_needed']
-                    }
-        
-        # Convert to list and sort by category, then name
-        pick_list = list(product_totals.values())
-        pick_list.sort(key=lambda x: (x['category'] or '', x['productName']))
-        
-        return pick_list
+        _, needs = ServiceOrderService.load_cabinet_needs(db.cursor(), cabinet_selections)
+        return ServiceOrderService.build_pick_list(needs)
     
     @staticmethod
     def get_service_order_preview(cabinet_selections):
@@ -0,0 +1,304 @@
+"""
+Knowledge Base Search Index for CVD Vending Machine Management System
+In-memory inverted index with BM25 ranking over knowledge base articles
+"""
+
+import math
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Any, Tuple
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Indexed fields and their BM25F weights, in match_type order
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'description': 1.5,
+    'tags': 2.0,
+    'content': 1.0,
+    'category': 1.0
+}
+FIELDS = tuple(FIELD_WEIGHTS)
+CONTENT_FIELD = FIELDS.index('content')
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Vocabulary terms a trailing query prefix may expand to
+MAX_PREFIX_EXPANSIONS = 50
+
+SNIPPET_CONTEXT = 100
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """Lowercased word tokens with their start and end offsets in text"""
+    return [(match.group().lower(), match.start(), match.end()) for match in TOKEN_PATTERN.finditer(text)]
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct query terms in order, ignoring single characters"""
+    terms = []
+    for term, _, _ in tokenize(query):
+        if len(term) > 1 and term not in terms:
+            terms.append(term)
+    return terms
+
+
+class _IndexedArticle:
+    """Per-article index entry"""
+
+    __slots__ = ('article', 'content_hash', 'modified', 'lengths', 'terms', 'offsets')
+
+    def __init__(self, article, lengths, terms, offsets):
+        self.article = article
+        self.content_hash = article.get('content_hash')
+        self.modified = article.get('file_modified_time')
+        self.lengths = lengths
+        self.terms = terms
+        # term -> sorted (start, end) spans in article['search_content']
+        self.offsets = offsets
+
+
+class KnowledgeBaseIndex:
+    """
+    Token index over article fields. Postings map each term to the per-field
+    term frequencies of every article containing it; content postings also
+    keep character spans so snippets are cut without rescanning the text.
+    Articles are reindexed only when their content hash or mtime changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.postings = {}
+        self.documents = {}
+        self.field_totals = [0] * len(FIELDS)
+        self._vocabulary = None
+        self.stats = {
+            'indexed': 0,
+            'removed': 0,
+            'unchanged': 0,
+            'queries': 0
+        }
+
+    def sync(self, articles: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Bring the index in line with a scanned article list
+
+        Args:
+            articles: Article dictionaries from KnowledgeBaseService.scan_articles
+
+        Returns:
+            Counts of articles indexed, removed and unchanged by this call
+        """
+        counts = {'indexed': 0, 'removed': 0, 'unchanged': 0}
+
+        with self.lock:
+            seen = set()
+            for article in articles:
+                article_id = article['id']
+                seen.add(article_id)
+                entry = self.documents.get(article_id)
+                if (entry is not None and entry.content_hash == article.get('content_hash')
+                        and entry.modified == article.get('file_modified_time')):
+                    # Keep the entry but point it at the freshly scanned dict
+                    entry.article = article
+                    counts['unchanged'] += 1
+                    continue
+                if entry is not None:
+                    self._remove(article_id)
+                self._add(article)
+                counts['indexed'] += 1
+
+            for article_id in [a for a in self.documents if a not in seen]:
+                self._remove(article_id)
+                counts['removed'] += 1
+
+            if counts['indexed'] or counts['removed']:
+                self._vocabulary = None
+            for key, value in counts.items():
+                self.stats[key] += value
+
+        return counts
+
+    def _field_texts(self, article: Dict[str, Any]) -> List[str]:
+        """Text of each indexed field in FIELDS order"""
+        tags = article.get('tags') or []
+        if isinstance(tags, str):
+            tags = [tags]
+        return [
+            str(article.get('title') or ''),
+            str(article.get('description') or ''),
+            ' '.join(str(tag) for tag in tags),
+            str(article.get('search_content') or ''),
+            str(article.get('category') or '')
+        ]
+
+    def _add(self, article: Dict[str, Any]) -> None:
+        """Index one article"""
+        article_id = article['id']
+        lengths = [0] * len(FIELDS)
+        frequencies = {}
+        offsets = {}
+
+        for field_index, text in enumerate(self._field_texts(article)):
+            tokens = tokenize(text)
+            lengths[field_index] = len(tokens)
+            for term, start, end in tokens:
+                counts = frequencies.get(term)
+                if counts is None:
+                    counts = frequencies[term] = [0] * len(FIELDS)
+                counts[field_index] += 1
+                if field_index == CONTENT_FIELD:
+                    offsets.setdefault(term, []).append((start, end))
+
+        for term, counts in frequencies.items():
+            self.postings.setdefault(term, {})[article_id] = tuple(counts)
+        for field_index, length in enumerate(lengths):
+            self.field_totals[field_index] += length
+
+        self.documents[article_id] = _IndexedArticle(article, lengths, tuple(frequencies), offsets)
+
+    def _remove(self, article_id: str) -> None:
+        """Drop one article's postings"""
+        entry = self.documents.pop(article_id)
+        for term in entry.terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(article_id, None)
+            if not postings:
+                del self.postings[term]
+        for field_index, length in enumerate(entry.lengths):
+            self.field_totals[field_index] -= length
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        """Vocabulary terms starting with prefix"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        start = bisect_left(self._vocabulary, prefix)
+        end = bisect_right(self._vocabulary, prefix + '\U0010ffff')
+        return self._vocabulary[start:min(end, start + MAX_PREFIX_EXPANSIONS)]
+
+    def search(self, query: str, category: str = None, difficulty: str = None) -> List[Dict[str, Any]]:
+        """
+        Rank articles against a multi-term query with BM25F
+
+        Every query term contributes its best field-weighted BM25 score; the
+        last term also matches longer vocabulary terms it prefixes, so partial
+        words typed into the search box still find articles.
+
+        Args:
+            query: Search query string
+            category: Optional category filter
+            difficulty: Optional difficulty filter
+
+        Returns:
+            Search results sorted by score, highest first
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        with self.lock:
+            self.stats['queries'] += 1
+            total = len(self.documents)
+            if not total:
+                return []
+            average_lengths = [max(field_total / total, 1.0) for field_total in self.field_totals]
+
+            scores = {}
+            matched_fields = {}
+            matched_terms = {}
+            for position, term in enumerate(terms):
+                variants = [term]
+                if position == len(terms) - 1:
+                    variants.extend(t for t in self._expand_prefix(term) if t != term)
+
+                best = {}
+                for variant in variants:
+                    postings = self.postings.get(variant)
+                    if not postings:
+                        continue
+                    idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for article_id, counts in postings.items():
+                        entry = self.documents[article_id]
+                        article = entry.article
+                        if category and article['category'] != category:
+                            continue
+                        if difficulty and article['difficulty'] != difficulty:
+                            continue
+                        weighted = 0.0
+                        for field_index, count in enumerate(counts):
+                            if count:
+                                norm = 1 - BM25_B + BM25_B * entry.lengths[field_index] / average_lengths[field_index]
+                                weighted += FIELD_WEIGHTS[FIELDS[field_index]] * count / norm
+                                matched_fields.setdefault(article_id, set()).add(field_index)
+                        score = idf * weighted * (BM25_K1 + 1) / (weighted + BM25_K1)
+                        if score > best.get(article_id, 0.0):
+                            best[article_id] = score
+                        if counts[CONTENT_FIELD]:
+                            matched_terms.setdefault(article_id, []).append(variant)
+
+                for article_id, score in best.items():
+                    scores[article_id] = scores.get(article_id, 0.0) + score
+
+            results = []
+            for article_id, score in scores.items():
+                entry = self.documents[article_id]
+                article = entry.article
+                results.append({
+                    'id': article['id'],
+                    'title': article['title'],
+                    'category': article['category'],
+                    'difficulty': article['difficulty'],
+                    'description': article.get('description', ''),
+                    'snippet': self._snippet(entry, matched_terms.get(article_id, [])),
+                    'score': round(score, 4),
+                    'match_type': '_and_'.join(FIELDS[i] for i in sorted(matched_fields.get(article_id, ()))),
+                    'read_time_minutes': article['read_time_minutes']
+                })
+
+        results.sort(key=lambda x: (-x['score'], x['title']))
+        return results
+
+    def _snippet(self, entry: _IndexedArticle, terms: List[str]) -> str:
+        """Highlighted context around the first content match, from stored spans"""
+        article = entry.article
+        spans = [span for term in terms for span in entry.offsets.get(term, ())]
+        if not spans:
+            # Use description or preview if no content match
+            return article.get('description') or article.get('content_preview', '')
+
+        content = article.get('search_content', '')
+        first_start, first_end = min(spans)
+        start = max(0, first_start - SNIPPET_CONTEXT)
+        end = min(len(content), first_end + SNIPPET_CONTEXT)
+
+        pieces = []
+        cursor = start
+        for span_start, span_end in sorted(s for s in spans if s[0] >= start and s[1] <= end):
+            if span_start < cursor:
+                continue
+            pieces.append(content[cursor:span_start])
+            pieces.append(f'<mark>{content[span_start:span_end]}</mark>')
+            cursor = span_end
+        pieces.append(content[cursor:end])
+        snippet = ''.join(pieces).strip()
+
+        # Add ellipsis if we truncated
+        if start > 0:
+            snippet = '...' + snippet
+        if end < len(content):
+            snippet = snippet + '...'
+
+        return snippet
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Index size and maintenance counters"""
+        with self.lock:
+            return {
+                'documents': len(self.documents),
+                'terms': len(self.postings),
+                **self.stats
+            }
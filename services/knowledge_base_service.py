@@ -12,6 +12,26 @@ from pathlib import Path
 from typing import List, Dict, Optional, Any
 import hashlib
 import logging
+import threading
+import time
+
+from services.knowledge_base_index import KnowledgeBaseIndex
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+# Seconds a cached scan is served before a request triggers a rescan
+SCAN_CACHE_SECONDS = 300
+
+# Seconds between watcher rescans; with watchdog this is only a safety net
+WATCH_POLL_INTERVAL = 10
+
+# Seconds to let a burst of file events settle before rescanning
+WATCH_DEBOUNCE = 0.5
 
 class KnowledgeBaseService:
     def __init__(self, content_path: str = "knowledge-base", db_path: str = "cvd.db"):
@@ -20,8 +40,28 @@ class KnowledgeBaseService:
         self.db_path = db_path
         self.cache = {}
         self.last_scan = None
+        self.index = KnowledgeBaseIndex()
         self.logger = logging.getLogger(__name__)
         
+        # Per-file (mtime, size, hash, parsed article) from the last scan
+        self.file_state = {}
+        # Article id -> content_hash as stored in knowledge_base_articles
+        self._db_hashes = None
+        self.scan_lock = threading.Lock()
+        self.scan_stats = {
+            'scans': 0,
+            'files_reparsed': 0,
+            'files_unchanged': 0,
+            'files_removed': 0,
+            'db_upserts': 0,
+            'db_deletes': 0
+        }
+        
+        self.watcher_thread = None
+        self.watch_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.observer = None
+        
         # Ensure content directory exists
         self.content_path.mkdir(parents=True, exist_ok=True)
         
@@ -41,57 +81,112 @@ class KnowledgeBaseService:
         Returns:
             List of article metadata dictionaries
         """
-        # Check if we need to rescan (cache for 5 minutes)
-        if (not force_refresh and self.last_scan and 
-            (datetime.now() - self.last_scan).seconds < 300 and 
-            'articles' in self.cache):
-            return self.cache['articles']
+        # A running watcher keeps the cache current; otherwise rescan every 5 minutes
+        if not force_refresh and 'articles' in self.cache:
+            if self.is_watching():
+                return self.cache['articles']
+            if self.last_scan and (datetime.now() - self.last_scan).total_seconds() < SCAN_CACHE_SECONDS:
+                return self.cache['articles']
             
-        articles = []
+        with self.scan_lock:
+            try:
+                changed = self._rescan_files()
+                
+                if changed or 'articles' not in self.cache:
+                    articles = [state['article'] for state in self.file_state.values() if state['article']]
+                    
+                    # Sort articles by category and title
+                    articles.sort(key=lambda x: (x['category'], x['title']))
+                    
+                    # Cache results
+                    self.cache['articles'] = articles
+                    self.cache['categories'] = self._build_categories(articles)
+                    self.index.sync(articles)
+                    
+                    # Update database cache
+                    self._update_db_cache(articles)
+                    
+                self.last_scan = datetime.now()
+                self.scan_stats['scans'] += 1
+                
+            except Exception as e:
+                self.logger.error(f"Error scanning articles: {e}")
+                return []
+                
+            return self.cache['articles']
+    
+    def _rescan_files(self) -> bool:
+        """
+        Compare markdown files against the last scan and reparse changed ones
         
-        try:
-            # Scan all markdown files recursively
-            for md_file in self.content_path.rglob("*.md"):
-                try:
-                    article_data = self._parse_article(md_file)
-                    if article_data:
-                        articles.append(article_data)
-                except Exception as e:
-                    self.logger.error(f"Error processing {md_file}: {e}")
+        A file whose mtime and size are unchanged is skipped without reading;
+        a file that was touched but whose content hash matches keeps its
+        parsed article.
+        
+        Returns:
+            True if any article was added, changed or removed
+        """
+        changed = False
+        seen = set()
+        
+        # Scan all markdown files recursively
+        for md_file in self.content_path.rglob("*.md"):
+            key = str(md_file)
+            try:
+                file_stat = md_file.stat()
+                seen.add(key)
+                state = self.file_state.get(key)
+                if (state and state['mtime_ns'] == file_stat.st_mtime_ns
+                        and state['size'] == file_stat.st_size):
+                    self.scan_stats['files_unchanged'] += 1
+                    continue
                     
-            # Sort articles by category and title
-            articles.sort(key=lambda x: (x['category'], x['title']))
-            
-            # Cache results
-            self.cache['articles'] = articles
-            self.cache['categories'] = self._build_categories(articles)
-            self.last_scan = datetime.now()
-            
-            # Update database cache
-            self._update_db_cache(articles)
-            
-        except Exception as e:
-            self.logger.error(f"Error scanning articles: {e}")
-            articles = []
+                with open(md_file, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                content_hash = self._calculate_content_hash(content)
+                
+                if state and state['hash'] == content_hash:
+                    state['mtime_ns'] = file_stat.st_mtime_ns
+                    state['size'] = file_stat.st_size
+                    self.scan_stats['files_unchanged'] += 1
+                    continue
+                    
+                self.file_state[key] = {
+                    'mtime_ns': file_stat.st_mtime_ns,
+                    'size': file_stat.st_size,
+                    'hash': content_hash,
+                    'article': self._parse_article(md_file, content)
+                }
+                self.scan_stats['files_reparsed'] += 1
+                changed = True
+            except Exception as e:
+                self.logger.error(f"Error processing {md_file}: {e}")
+                
+        for key in [k for k in self.file_state if k not in seen]:
+            del self.file_state[key]
+            self.scan_stats['files_removed'] += 1
+            changed = True
             
-        return articles
+        return changed
     
-    def _parse_article(self, file_path: Path) -> Optional[Dict[str, Any]]:
+    def _parse_article(self, file_path: Path, content: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Parse markdown file with YAML frontmatter
         
         Args:
             file_path: Path to markdown file
+            content: File text if already read
             
         Returns:
             Article data dictionary or None if parsing fails
         """
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except Exception as e:
-            self.logger.error(f"Could not read file {file_path}: {e}")
-            return None
+        if content is None:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except Exception as e:
+                self.logger.error(f"Could not read file {file_path}: {e}")
+                return None
             
         # Split frontmatter and content
         if not content.startswith('---'):
@@ -313,104 +408,14 @@ class KnowledgeBaseService:
             difficulty: Optional difficulty filter
             
         Returns:
-            List of matching articles with relevance scores
+            List of matching articles with BM25 relevance scores
         """
         if not query or len(query.strip()) < 2:
             return []
             
-        articles = self.scan_articles()
-        query = query.lower().strip()
-        results = []
-        
-        for article in articles:
-            # Apply filters first
-            if category and article['category'] != category:
-                continue
-            if difficulty and article['difficulty'] != difficulty:
-                continue
-                
-            # Calculate relevance score
-            score = 0
-            match_types = []
-            
-            # Title match (highest weight)
-            if query in article['title'].lower():
-                score += 10
-                match_types.append('title')
-                
-            # Description match
-            if query in article.get('description', '').lower():
-                score += 5
-                match_types.append('description')
-                
-            # Tag match
-            for tag in article.get('tags', []):
-                if query in tag.lower():
-                    score += 3
-                    match_types.append('tags')
-                    break
-                    
-            # Content match (lower weight due to volume)
-            if query in article.get('search_content', '').lower():
-                score += 1
-                match_types.append('content')
-                
-            # Category match
-            if query in article['category'].lower():
-                score += 2
-                match_types.append('category')
-                
-            if score > 0:
-                # Create highlighted snippet
-                snippet = self._create_search_snippet(article, query)
-                
-                results.append({
-                    'id': article['id'],
-                    'title': article['title'],
-                    'category': article['category'],
-                    'difficulty': article['difficulty'],
-                    'description': article.get('description', ''),
-                    'snippet': snippet,
-                    'score': score,
-                    'match_type': '_and_'.join(match_types),
-                    'read_time_minutes': article['read_time_minutes']
-                })
-                
-        # Sort by relevance score (descending)
-        results.sort(key=lambda x: x['score'], reverse=True)
-        
-        return results
-    
-    def _create_search_snippet(self, article: Dict[str, Any], query: str) -> str:
-        """Create highlighted search snippet"""
-        content = article.get('search_content', '')
-        query_lower = query.lower()
-        
-        # Find first occurrence of query in content
-        content_lower = content.lower()
-        query_pos = content_lower.find(query_lower)
-        
-        if query_pos == -1:
-            # Use description or preview if no content match
-            return article.get('description') or article.get('content_preview', '')
-            
-        # Extract context around the match (±100 characters)
-        start = max(0, query_pos - 100)
-        end = min(len(content), query_pos + len(query) + 100)
-        
-        snippet = content[start:end].strip()
-        
-        # Add ellipsis if we truncated
-        if start > 0:
-            snippet = '...' + snippet
-        if end < len(content):
-            snippet = snippet + '...'
-            
-        # Highlight the query term (case-insensitive)
-        pattern = re.compile(re.escape(query), re.IGNORECASE)
-        snippet = pattern.sub(f'<mark>{query}</mark>', snippet)
-        
-        return snippet
+        # Scanning keeps the index in step with the article files
+        self.scan_articles()
+        return self.index.search(query, category, difficulty)
     
     def get_categories(self) -> List[Dict[str, Any]]:
         """Get all categories with article counts"""
@@ -424,21 +429,38 @@ class KnowledgeBaseService:
         return category_list
     
     def _update_db_cache(self, articles: List[Dict[str, Any]]) -> None:
-        """Update database cache with article metadata"""
+        """
+        Apply article changes to the database cache
+        
+        Only articles whose content hash differs from the stored row are
+        written, and only rows for articles that no longer exist are deleted.
+        The stored hashes are read once and tracked in memory afterwards.
+        """
         try:
             with self.get_db_connection() as conn:
-                # Clear existing cache
-                conn.execute('DELETE FROM knowledge_base_articles')
+                if self._db_hashes is None:
+                    self._db_hashes = {
+                        row['id']: row['content_hash']
+                        for row in conn.execute('SELECT id, content_hash FROM knowledge_base_articles')
+                    }
+                    
+                current = {article['id']: article for article in articles}
+                upserts = [a for a in current.values() if self._db_hashes.get(a['id']) != a['content_hash']]
+                deletes = [article_id for article_id in self._db_hashes if article_id not in current]
                 
-                # Insert new articles
-                for article in articles:
-                    conn.execute('''
-                        INSERT INTO knowledge_base_articles 
+                if deletes:
+                    conn.executemany('DELETE FROM knowledge_base_articles WHERE id = ?',
+                                     [(article_id,) for article_id in deletes])
+                    
+                if upserts:
+                    indexed_at = datetime.now().isoformat()
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO knowledge_base_articles 
                         (id, title, author, category, tags, difficulty, word_count, 
                          read_time_minutes, file_path, file_modified_time, 
                          content_preview, search_content, content_hash, last_indexed)
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
+                    ''', [(
                         article['id'],
                         article['title'],
                         article['author'],
@@ -452,14 +474,86 @@ class KnowledgeBaseService:
                         article['content_preview'],
                         article['search_content'],
                         article['content_hash'],
-                        datetime.now().isoformat()
-                    ))
+                        indexed_at
+                    ) for article in upserts])
                     
                 conn.commit()
                 
+            for article_id in deletes:
+                del self._db_hashes[article_id]
+            for article in upserts:
+                self._db_hashes[article['id']] = article['content_hash']
+            self.scan_stats['db_upserts'] += len(upserts)
+            self.scan_stats['db_deletes'] += len(deletes)
+                
         except Exception as e:
+            # Reload stored hashes next time rather than trust a partial write
+            self._db_hashes = None
             self.logger.error(f"Error updating database cache: {e}")
     
+    def start_watcher(self, poll_interval: float = WATCH_POLL_INTERVAL) -> None:
+        """
+        Start a background thread that rescans when article files change
+        
+        File events come from watchdog when it is installed; otherwise the
+        thread polls every poll_interval seconds. Rescans are incremental, so
+        a poll with no changes only stats the files.
+        
+        Args:
+            poll_interval: Seconds between rescans without a file event
+        """
+        if self.is_watching():
+            return
+            
+        self.stop_event.clear()
+        if WATCHDOG_AVAILABLE:
+            try:
+                self.observer = Observer()
+                self.observer.schedule(_ArticleEventHandler(self.watch_event), str(self.content_path), recursive=True)
+                self.observer.start()
+            except Exception as e:
+                self.logger.warning(f"File watching unavailable, polling instead: {e}")
+                self.observer = None
+                
+        # Bring the cache current before requests start relying on the watcher
+        self.scan_articles(force_refresh=True)
+        
+        self.watcher_thread = threading.Thread(
+            target=self._watch_loop, args=(poll_interval,), daemon=True, name='KnowledgeBaseWatcher'
+        )
+        self.watcher_thread.start()
+        self.logger.info(f"Knowledge base watcher started ({'events' if self.observer else 'polling'})")
+    
+    def stop_watcher(self) -> None:
+        """Stop the watcher thread and file observer"""
+        self.stop_event.set()
+        self.watch_event.set()
+        if self.observer:
+            self.observer.stop()
+            self.observer.join(timeout=5)
+            self.observer = None
+        if self.watcher_thread:
+            self.watcher_thread.join(timeout=5)
+            self.watcher_thread = None
+    
+    def is_watching(self) -> bool:
+        """True while the watcher thread is running"""
+        return self.watcher_thread is not None and self.watcher_thread.is_alive()
+    
+    def _watch_loop(self, poll_interval: float) -> None:
+        """Rescan on file events or every poll_interval seconds"""
+        while not self.stop_event.is_set():
+            if self.watch_event.wait(poll_interval):
+                # Let an editor's burst of writes settle
+                time.sleep(WATCH_DEBOUNCE)
+            self.watch_event.clear()
+            if self.stop_event.is_set():
+                break
+            try:
+                self.scan_articles(force_refresh=True)
+            except Exception as e:
+                self.logger.error(f"Knowledge base watcher scan failed: {e}")
+    
     def get_article_stats(self) -> Dict[str, Any]:
         """Get knowledge base statistics"""
         articles = self.scan_articles()
@@ -475,4 +569,46 @@ class KnowledgeBaseService:
             'average_words_per_article': total_words // total_articles if total_articles > 0 else 0,
             'categories': categories,
             'last_updated': self.last_scan.isoformat() if self.last_scan else None
-        }
\ No newline at end of file
+        }
+
+
+if WATCHDOG_AVAILABLE:
+    class _ArticleEventHandler(FileSystemEventHandler):
+        """Wake the watcher thread when a markdown file changes"""
+        
+        def __init__(self, watch_event: threading.Event):
+            super().__init__()
+            self.watch_event = watch_event
+        
+        def on_any_event(self, event):
+            paths = [getattr(event, 'src_path', ''), getattr(event, 'dest_path', '')]
+            if any(str(path).endswith('.md') for path in paths):
+                self.watch_event.set()
+
+
+_shared_services = {}
+_shared_services_lock = threading.Lock()
+
+
+def get_knowledge_base_service(content_path: str = "knowledge-base", db_path: str = "cvd.db",
+                               watch: bool = False) -> KnowledgeBaseService:
+    """
+    Get the process-wide service for a content directory
+    
+    Request handlers share one instance so the scan cache and search index
+    survive between requests instead of being rebuilt for each one.
+    
+    Args:
+        content_path: Knowledge base directory
+        db_path: Database holding the article cache
+        watch: Start the file watcher so requests never trigger a rescan
+    """
+    key = (str(content_path), db_path)
+    with _shared_services_lock:
+        service = _shared_services.get(key)
+        if service is None:
+            service = _shared_services[key] = KnowledgeBaseService(content_path, db_path)
+    if watch and not service.is_watching():
+        with _shared_services_lock:
+            service.start_watcher()
+    return service
@@ -0,0 +1,426 @@
+"""
+Slot Metrics Service
+Vectorized slot_metrics calculation with incremental maintenance driven by sales inserts.
+
+Sales writers call record_sales(), which adds the sale to rolling per-day counters
+(sales_daily_counters) and marks its (device_id, product_id) pair in the
+slot_metrics_dirty set. SlotMetricsWorker drains the dirty set in the background and
+recalculates only the affected slots from the counters; processes without the worker
+refresh just the pairs they marked with refresh_slot_metrics_for_pairs(). reconcile_slot_metrics()
+rebuilds the counters and recalculates every slot from the raw sales table.
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+import numpy as np
+import db_pool
+
+logger = logging.getLogger(__name__)
+
+# Pairs per VALUES chunk: two bound variables each, under SQLite's 999 default
+PAIR_CHUNK_SIZE = 400
+
+# Slot ids per IN clause when bumping cabinet metric versions
+SLOT_CHUNK_SIZE = 500
+
+
+def _pair_chunks(pairs):
+    """Yield (values_sql, params) for de-duplicated (device_id, product_id) pairs"""
+    unique_pairs = list(dict.fromkeys(pairs))
+    for start in range(0, len(unique_pairs), PAIR_CHUNK_SIZE):
+        chunk = unique_pairs[start:start + PAIR_CHUNK_SIZE]
+        values_sql = ','.join('(?, ?)' for _ in chunk)
+        yield values_sql, [value for pair in chunk for value in pair]
+
+
+def _grouped_stats(cursor, select, pairs):
+    """Run a per-pair stats SELECT over all rows or only the given pairs"""
+    if pairs is None:
+        queries = [(select + ' GROUP BY s.device_id, s.product_id', [])]
+    else:
+        queries = [
+            (f'''
+                WITH targets(device_id, product_id) AS (VALUES {values_sql})
+                {select}
+                JOIN targets t ON s.device_id = t.device_id AND s.product_id = t.product_id
+                GROUP BY s.device_id, s.product_id
+            ''', params)
+            for values_sql, params in _pair_chunks(pairs)
+        ]
+
+    stats = {}
+    for query, params in queries:
+        for row in cursor.execute(query, params):
+            stats[(row['device_id'], row['product_id'])] = (
+                row['sales_28'], row['total_sales'], row['days_active'] or 0.0, row['days_with_sales']
+            )
+    return stats
+
+
+def load_slot_sales_stats(cursor, pairs=None):
+    """
+    Aggregate sales per (device_id, product_id) for every slot metric window in one
+    grouped pass: 28-day units, all-time units, days since first sale and days with sales.
+    pairs limits the scan to the given (device_id, product_id) pairs.
+    """
+    return _grouped_stats(cursor, '''
+        SELECT
+            s.device_id,
+            s.product_id,
+            COALESCE(SUM(CASE WHEN datetime(s.created_at) >= datetime('now', '-28 days')
+                         THEN s.sale_units ELSE 0 END), 0) as sales_28,
+            COALESCE(SUM(s.sale_units), 0) as total_sales,
+            julianday('now') - julianday(MIN(s.created_at)) as days_active,
+            COUNT(DISTINCT date(s.created_at)) as days_with_sales
+        FROM sales s
+    ''', pairs)
+
+
+def load_counter_sales_stats(cursor, pairs=None):
+    """
+    Same windows as load_slot_sales_stats, read from the rolling daily counters
+    instead of the sales history. The 28-day window has day granularity.
+    """
+    return _grouped_stats(cursor, '''
+        SELECT
+            s.device_id,
+            s.product_id,
+            COALESCE(SUM(CASE WHEN s.sale_date >= date('now', '-28 days')
+                         THEN s.units ELSE 0 END), 0) as sales_28,
+            COALESCE(SUM(s.units), 0) as total_sales,
+            julianday('now') - julianday(MIN(s.first_sale_at)) as days_active,
+            COUNT(*) as days_with_sales
+        FROM sales_daily_counters s
+    ''', pairs)
+
+
+def compute_slot_metrics(slots, sales_stats):
+    """
+    Compute SO, PL, UTP, velocity and DRI for many slots at once.
+    slots: rows with slot_id, quantity, capacity, device_id, product_id.
+    Returns slot_metrics parameter tuples in upsert_slot_metrics column order.
+    """
+    if not slots:
+        return []
+
+    no_sales = (0, 0, 0.0, 0)
+    stats = [sales_stats.get((slot['device_id'], slot['product_id']), no_sales) for slot in slots]
+    quantity = np.array([slot['quantity'] or 0 for slot in slots], dtype=float)
+    capacity = np.array([slot['capacity'] or 0 for slot in slots], dtype=float)
+    sales_28, total_sales, days_active, days_with_sales = (
+        np.array(column, dtype=float) for column in zip(*stats)
+    )
+
+    # SO (Sold Out), PL (Product Level), UTP (Units to Par)
+    is_sold_out = (quantity == 0).astype(int)
+    product_level = np.round(np.divide(quantity * 100.0, capacity,
+                                       out=np.zeros_like(quantity), where=capacity > 0))
+    units_to_par = capacity - quantity
+
+    # Velocity: 28-day average, else historical average, else default minimum
+    historical = np.divide(total_sales, days_active,
+                           out=np.zeros_like(total_sales), where=days_active > 0)
+    has_history = (total_sales > 0) & (days_active > 0)
+    daily_velocity = np.where(sales_28 > 0, sales_28 / 28.0,
+                              np.where(has_history, historical, 0.1))
+
+    # DRI (Days Remaining Inventory), capped at 999
+    stocked = (quantity > 0) & (daily_velocity > 0)
+    days_left = np.floor(np.divide(quantity, daily_velocity,
+                                   out=np.zeros_like(quantity), where=stocked))
+    dri = np.minimum(np.where(stocked, days_left, np.where(quantity == 0, 0, 999)), 999)
+
+    return list(zip(
+        (slot['slot_id'] for slot in slots),
+        is_sold_out.tolist(),
+        dri.astype(int).tolist(),
+        product_level.astype(int).tolist(),
+        units_to_par.astype(int).tolist(),
+        sales_28.astype(int).tolist(),
+        total_sales.astype(int).tolist(),
+        days_with_sales.astype(int).tolist(),
+        daily_velocity.tolist()
+    ))
+
+
+def upsert_slot_metrics(cursor, rows):
+    """Write computed slot metric rows with a single executemany"""
+    cursor.executemany('''
+        INSERT INTO slot_metrics (
+            planogram_slot_id, is_sold_out, days_remaining_inventory,
+            product_level_percent, units_to_par,
+            sales_28_day, sales_all_time, days_with_sales, daily_velocity,
+            last_calculated
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(planogram_slot_id) DO UPDATE SET
+            is_sold_out = excluded.is_sold_out,
+            days_remaining_inventory = excluded.days_remaining_inventory,
+            product_level_percent = excluded.product_level_percent,
+            units_to_par = excluded.units_to_par,
+            sales_28_day = excluded.sales_28_day,
+            sales_all_time = excluded.sales_all_time,
+            days_with_sales = excluded.days_with_sales,
+            daily_velocity = excluded.daily_velocity,
+            last_calculated = CURRENT_TIMESTAMP
+    ''', rows)
+    bump_metrics_versions(cursor, [row[0] for row in rows])
+
+
+def bump_metrics_versions(cursor, slot_ids):
+    """Bump cabinet_versions.metrics_version once per cabinet owning the given slots"""
+    for start in range(0, len(slot_ids), SLOT_CHUNK_SIZE):
+        chunk = slot_ids[start:start + SLOT_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+            INSERT INTO cabinet_versions (cabinet_id, metrics_version)
+            SELECT DISTINCT p.cabinet_id, 1
+            FROM planogram_slots ps
+            JOIN planograms p ON ps.planogram_id = p.id
+            WHERE ps.id IN ({placeholders})
+            ON CONFLICT(cabinet_id) DO UPDATE SET metrics_version = metrics_version + 1
+        ''', chunk)
+
+
+def load_active_slots(cursor, pairs=None):
+    """Load active planogram slots, optionally only those stocking the given pairs"""
+    select = '''
+        SELECT
+            ps.id as slot_id,
+            ps.quantity,
+            ps.capacity,
+            ps.product_id,
+            cc.device_id
+        FROM planogram_slots ps
+        JOIN planograms p ON ps.planogram_id = p.id
+        JOIN cabinet_configurations cc ON p.cabinet_id = cc.id
+        JOIN devices d ON cc.device_id = d.id
+    '''
+    where = '''
+        WHERE d.deleted_at IS NULL
+        AND ps.product_id IS NOT NULL
+    '''
+    if pairs is None:
+        return cursor.execute(select + where + ' ORDER BY cc.device_id, ps.id').fetchall()
+
+    slots = []
+    for values_sql, params in _pair_chunks(pairs):
+        slots.extend(cursor.execute(f'''
+            WITH targets(device_id, product_id) AS (VALUES {values_sql})
+            {select}
+            JOIN targets t ON cc.device_id = t.device_id AND ps.product_id = t.product_id
+            {where}
+        ''', params).fetchall())
+    return slots
+
+
+def recalculate_slot_metrics(cursor, pairs=None):
+    """
+    Recalculate slot_metrics from the sales history for all active planogram slots,
+    or only the slots stocking the given (device_id, product_id) pairs.
+    Returns rows written.
+    """
+    rows = compute_slot_metrics(load_active_slots(cursor, pairs), load_slot_sales_stats(cursor, pairs))
+    upsert_slot_metrics(cursor, rows)
+    return len(rows)
+
+
+def record_sales(cursor, sales):
+    """
+    Add sales to the rolling daily counters and mark their slots dirty.
+    sales: iterable of (device_id, product_id, sale_units, created_at); a None
+    created_at means CURRENT_TIMESTAMP, matching the sales table default.
+    Call inside the transaction that inserts the sales rows.
+    """
+    sales = list(sales)
+    if not sales:
+        return
+
+    cursor.executemany('''
+        INSERT INTO sales_daily_counters (device_id, product_id, sale_date, units, first_sale_at)
+        VALUES (?, ?, date(COALESCE(?, CURRENT_TIMESTAMP)), ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ON CONFLICT(device_id, product_id, sale_date) DO UPDATE SET
+            units = units + excluded.units,
+            first_sale_at = MIN(first_sale_at, excluded.first_sale_at)
+    ''', [(device_id, product_id, created_at, units, created_at)
+          for device_id, product_id, units, created_at in sales])
+
+    mark_dirty(cursor, [(device_id, product_id) for device_id, product_id, _, _ in sales])
+
+
+def mark_dirty(cursor, pairs):
+    """
+    Add (device_id, product_id) pairs to the dirty set. REPLACE gives a re-marked
+    pair a new id, so a drain that started earlier will not discard it.
+    """
+    cursor.executemany('''
+        INSERT OR REPLACE INTO slot_metrics_dirty (device_id, product_id, marked_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+    ''', list(dict.fromkeys(pairs)))
+
+
+def refresh_dirty_slot_metrics(cursor):
+    """
+    Recalculate slots for every pair currently in the dirty set from the daily
+    counters, then remove those pairs. Returns (pairs_processed, rows_written).
+    """
+    high_water = cursor.execute('SELECT MAX(id) FROM slot_metrics_dirty').fetchone()[0]
+    if high_water is None:
+        return 0, 0
+
+    pairs = [(row['device_id'], row['product_id']) for row in cursor.execute(
+        'SELECT device_id, product_id FROM slot_metrics_dirty WHERE id <= ?', (high_water,)
+    )]
+    rows = compute_slot_metrics(load_active_slots(cursor, pairs), load_counter_sales_stats(cursor, pairs))
+    upsert_slot_metrics(cursor, rows)
+    cursor.execute('DELETE FROM slot_metrics_dirty WHERE id <= ?', (high_water,))
+    return len(pairs), len(rows)
+
+
+def refresh_slot_metrics_for_pairs(cursor, pairs):
+    """
+    Recalculate slots for the given pairs from the daily counters and clear their
+    dirty entries. A pair re-marked after the entries were read keeps its newer
+    entry. Returns rows written.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return 0
+
+    marked_ids = []
+    for values_sql, params in _pair_chunks(pairs):
+        marked_ids.extend(row[0] for row in cursor.execute(f'''
+            WITH targets(device_id, product_id) AS (VALUES {values_sql})
+            SELECT d.id FROM slot_metrics_dirty d
+            JOIN targets t ON d.device_id = t.device_id AND d.product_id = t.product_id
+        ''', params))
+    rows = compute_slot_metrics(load_active_slots(cursor, pairs), load_counter_sales_stats(cursor, pairs))
+    upsert_slot_metrics(cursor, rows)
+    cursor.executemany('DELETE FROM slot_metrics_dirty WHERE id = ?', [(marked_id,) for marked_id in marked_ids])
+    return len(rows)
+
+
+def rebuild_sales_counters(cursor):
+    """Rebuild the rolling daily counters from the sales table in one grouped pass"""
+    cursor.execute('DELETE FROM sales_daily_counters')
+    cursor.execute('''
+        INSERT INTO sales_daily_counters (device_id, product_id, sale_date, units, first_sale_at)
+        SELECT device_id, product_id, date(created_at), SUM(sale_units), MIN(created_at)
+        FROM sales
+        GROUP BY device_id, product_id, date(created_at)
+    ''')
+
+
+def reconcile_slot_metrics(cursor):
+    """
+    Full reconciliation: rebuild counters, clear the dirty set and recalculate
+    every slot from the sales history. Returns rows written.
+    """
+    rebuild_sales_counters(cursor)
+    cursor.execute('DELETE FROM slot_metrics_dirty')
+    return recalculate_slot_metrics(cursor)
+
+
+class SlotMetricsWorker:
+    """Background thread that keeps slot_metrics current from the dirty set"""
+
+    def __init__(self, db_path, poll_interval=5.0, reconcile_interval=24 * 3600):
+        """
+        Args:
+            db_path: Path to SQLite database
+            poll_interval: Seconds between dirty-set checks when not notified
+            reconcile_interval: Seconds between full reconciliations (None disables)
+        """
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.reconcile_interval = reconcile_interval
+        self.wake_event = threading.Event()
+        self.is_running = False
+        self.worker_thread = None
+        self.last_reconciled = time.time()
+        self.stats = {
+            'refreshes': 0,
+            'pairs_processed': 0,
+            'rows_written': 0,
+            'reconciliations': 0,
+            'errors': 0
+        }
+
+    def start(self):
+        """Start the worker thread"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.worker_thread = threading.Thread(target=self._run, daemon=True, name='SlotMetricsWorker')
+        self.worker_thread.start()
+        logger.info("Slot metrics worker started")
+
+    def stop(self):
+        """Stop the worker thread"""
+        self.is_running = False
+        self.wake_event.set()
+        if self.worker_thread:
+            self.worker_thread.join(timeout=5)
+        logger.info("Slot metrics worker stopped")
+
+    def notify(self):
+        """Wake the worker after new pairs were marked dirty"""
+        self.wake_event.set()
+
+    def request_reconciliation(self):
+        """Run a full reconciliation on the next cycle"""
+        self.last_reconciled = 0
+        self.wake_event.set()
+
+    def get_stats(self):
+        """Return worker counters"""
+        return dict(self.stats)
+
+    def _run(self):
+        """Worker loop: drain dirty pairs on notify or poll, reconcile periodically"""
+        db = db_pool.connect(self.db_path)
+        db.row_factory = sqlite3.Row
+        try:
+            self._bootstrap_counters(db)
+            while self.is_running:
+                self.wake_event.wait(self.poll_interval)
+                self.wake_event.clear()
+                if not self.is_running:
+                    break
+                try:
+                    self.run_once(db)
+                except Exception as e:
+                    db.rollback()
+                    self.stats['errors'] += 1
+                    logger.error(f"Slot metrics worker error: {e}")
+        finally:
+            db.close()
+
+    def run_once(self, db):
+        """Run one refresh (or reconciliation when due) on the given connection"""
+        cursor = db.cursor()
+        if self.reconcile_interval is not None and time.time() - self.last_reconciled >= self.reconcile_interval:
+            rows = reconcile_slot_metrics(cursor)
+            db.commit()
+            self.last_reconciled = time.time()
+            self.stats['reconciliations'] += 1
+            self.stats['rows_written'] += rows
+            return
+
+        pairs, rows = refresh_dirty_slot_metrics(cursor)
+        db.commit()
+        if pairs:
+            self.stats['refreshes'] += 1
+            self.stats['pairs_processed'] += pairs
+            self.stats['rows_written'] += rows
+
+    def _bootstrap_counters(self, db):
+        """Build counters once for databases that have sales but predate them"""
+        cursor = db.cursor()
+        has_counters = cursor.execute('SELECT 1 FROM sales_daily_counters LIMIT 1').fetchone()
+        has_sales = cursor.execute('SELECT 1 FROM sales LIMIT 1').fetchone()
+        if has_sales and not has_counters:
+            logger.info("Building sales daily counters from sales history")
+            rebuild_sales_counters(cursor)
+            db.commit()
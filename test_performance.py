@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Performance test for Activity Trends API
-Verify sub-2 second response time for 365 days of data
+Verify sub-2 second response time for 365 days and multi-year ranges,
+alone and under concurrent clients
 """
 
 import time
@@ -17,12 +18,16 @@ DATABASE = 'cvd.db'
 
 def generate_365_days_data():
     """Generate 365 days of test data"""
+    generate_days_data(365)
+
+def generate_days_data(days):
+    """Generate the given number of days of test data, ending today"""
     conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
     
-    print("Generating 365 days of test data...")
+    print(f"Generating {days} days of test data...")
     
-    for i in range(365):
+    for i in range(days):
         date = (datetime.now().date() - timedelta(days=i)).isoformat()
         
         # Check if data already exists
@@ -52,7 +57,7 @@ def generate_365_days_data():
     
     conn.commit()
     conn.close()
-    print(f"✓ Generated 365 days of test data")
+    print(f"✓ Generated {days} days of test data")
 
 def test_performance_uncached():
     """Test performance without cache (cold query)"""
@@ -153,6 +158,96 @@ def test_performance_cached():
         print(f"\n✗ FAIL: Cache response time ({cache_time:.3f}s) exceeds 0.1 seconds")
         return False
 
+def test_performance_multi_year(years=3):
+    """Test a multi-year range served from the materialized trend store"""
+    print("\n" + "=" * 60)
+    print(f"Performance Test: {years} Years (Uncached)")
+    print("=" * 60)
+    
+    generate_days_data(365 * years)
+    service = ActivityTrendsService(DATABASE)
+    
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=365 * years)
+    metrics = ['unique_users', 'total_sessions', 'total_page_views', 
+               'total_api_calls', 'avg_session_duration_seconds']
+    
+    # First read materializes any rows missing from the trend store
+    start_time = time.time()
+    service.get_trends(start_date, end_date, metrics)
+    first_time = time.time() - start_time
+    
+    start_time = time.time()
+    trends_data, regression = service.get_trends_with_regression(start_date, end_date, metrics)
+    query_time = time.time() - start_time
+    
+    start_time = time.time()
+    service.calculate_summary(trends_data, regression)
+    summary_time = time.time() - start_time
+    
+    total_time = query_time + summary_time
+    total_points = sum(len(data) for data in trends_data.values())
+    
+    print("\nResults:")
+    print(f"  - First read (materializes store): {first_time:.3f} seconds")
+    print(f"  - Range read: {query_time:.3f} seconds")
+    print(f"  - Summary calculation: {summary_time:.3f} seconds")
+    print(f"  - Data points: {total_points}")
+    print(f"  - Precomputed regressions: {len(regression)}/{len(metrics)}")
+    
+    if total_time < 2.0:
+        print(f"\n✓ PASS: Response time ({total_time:.3f}s) is under 2 seconds")
+        return True
+    else:
+        print(f"\n✗ FAIL: Response time ({total_time:.3f}s) exceeds 2 seconds")
+        return False
+
+def test_concurrent_clients(clients=20, requests_per_client=10):
+    """Test trend reads from many concurrent clients without the cache"""
+    print("\n" + "=" * 60)
+    print(f"Performance Test: {clients} Concurrent Clients")
+    print("=" * 60)
+    
+    from concurrent.futures import ThreadPoolExecutor
+    
+    service = ActivityTrendsService(DATABASE)
+    end_date = datetime.now().date()
+    ranges = [7, 30, 90, 365, 730]
+    metrics = ['unique_users', 'total_sessions', 'total_page_views']
+    
+    def client(client_id):
+        latencies = []
+        for i in range(requests_per_client):
+            days = ranges[(client_id + i) % len(ranges)]
+            start_time = time.time()
+            trends_data, regression = service.get_trends_with_regression(
+                end_date - timedelta(days=days), end_date, metrics
+            )
+            service.calculate_summary(trends_data, regression)
+            latencies.append(time.time() - start_time)
+        return latencies
+    
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = sorted(l for result in executor.map(client, range(clients)) for l in result)
+    wall_time = time.time() - start_time
+    
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    
+    print("\nResults:")
+    print(f"  - Requests: {len(latencies)} in {wall_time:.3f} seconds ({len(latencies) / wall_time:.1f}/s)")
+    print(f"  - p50 latency: {p50 * 1000:.1f}ms")
+    print(f"  - p95 latency: {p95 * 1000:.1f}ms")
+    print(f"  - max latency: {latencies[-1] * 1000:.1f}ms")
+    
+    if p95 < 2.0:
+        print(f"\n✓ PASS: p95 latency ({p95:.3f}s) is under 2 seconds")
+        return True
+    else:
+        print(f"\n✗ FAIL: p95 latency ({p95:.3f}s) exceeds 2 seconds")
+        return False
+
 def test_query_optimization():
     """Test database query performance with EXPLAIN"""
     print("\n" + "=" * 60)
@@ -207,7 +302,7 @@ def main():
     
     # Run tests
     tests_passed = 0
-    tests_total = 3
+    tests_total = 5
     
     # Test 1: Uncached performance
     if test_performance_uncached():
@@ -217,7 +312,15 @@ def main():
     if test_performance_cached():
         tests_passed += 1
     
-    # Test 3: Query optimization
+    # Test 3: Multi-year range
+    if test_performance_multi_year():
+        tests_passed += 1
+    
+    # Test 4: Concurrent clients
+    if test_concurrent_clients():
+        tests_passed += 1
+    
+    # Test 5: Query optimization
     test_query_optimization()
     tests_passed += 1  # Information only, always passes
     
@@ -666,6 +666,68 @@ class TestActivityMonitoringPerformance(unittest.TestCase):
         print(f"  Memory increase: {memory_increase:.2f}MB")
         self.assertLess(memory_increase, 100, "Memory usage exceeds 100MB")
     
+    def test_session_cache_overhead_10k_sessions(self):
+        """Test request-path session cache updates stay constant-time at 10k sessions"""
+        print("\n[TEST] Measuring session cache overhead at 10k sessions...")
+        
+        session_count = 10000
+        updates = 50000
+        tracker = ActivityTracker(app.app, self.test_db_path)
+        results = {}
+        
+        try:
+            # Full cache (no evictions) and a cache at capacity evicting on every new session
+            for label, capacity in (('within_capacity', session_count), ('evicting', 500)):
+                tracker.max_cache_size = capacity
+                with tracker.cache_lock:
+                    tracker.cache.clear()
+                activities = [{
+                    'session_id': f'session-{i}',
+                    'user_id': i % 100,
+                    'timestamp': datetime.utcnow().isoformat(),
+                    'page_url': f'/page/{i % 50}',
+                    'device_type': 'desktop'
+                } for i in range(session_count)]
+                for activity in activities:
+                    tracker.update_session_cache(activity['session_id'], activity)
+                
+                order = [random.randrange(session_count) for _ in range(updates)]
+                start = time.perf_counter()
+                for i in order:
+                    tracker.update_session_cache(activities[i]['session_id'], activities[i])
+                single_us = (time.perf_counter() - start) / updates * 1e6
+                
+                # Same workload split across request threads contending for cache_lock
+                def run(chunk):
+                    for i in chunk:
+                        tracker.update_session_cache(activities[i]['session_id'], activities[i])
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    list(executor.map(run, [order[t::8] for t in range(8)]))
+                threaded_us = (time.perf_counter() - start) / updates * 1e6
+                
+                expire_start = time.perf_counter()
+                tracker.expire_session_cache()
+                expire_ms = (time.perf_counter() - expire_start) * 1000
+                
+                results[label] = {
+                    'single_thread_us_per_update': round(single_us, 2),
+                    'eight_threads_us_per_update': round(threaded_us, 2),
+                    'expiry_pass_ms': round(expire_ms, 2),
+                    'cached_sessions': len(tracker.cache)
+                }
+        finally:
+            tracker.shutdown()
+        
+        self.__class__.performance_results['session_cache_overhead'] = dict(
+            results, sessions=session_count, requirement='< 50us per update', evictions=tracker.cache_stats['evictions'])
+        
+        for label, metrics in results.items():
+            print(f"  {label}: {metrics['single_thread_us_per_update']}us/update "
+                  f"({metrics['eight_threads_us_per_update']}us with 8 threads)")
+            self.assertLess(metrics['single_thread_us_per_update'], 50,
+                            f"Session cache update ({label}) exceeds 50us")
+    
     def test_database_growth_rate(self):
         """Test database growth rate with activity data"""
         print("\n[TEST] Testing database growth rate...")
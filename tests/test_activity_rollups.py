@@ -0,0 +1,129 @@
+import unittest
+import sqlite3
+import json
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from unittest.mock import patch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from app import app
+from activity_tracker import ActivityTracker
+from activity_trends_service import DailySummaryProcessor
+from activity_rollups import ROLLUP_TABLES, backfill_rollups, prune_rollups
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+DAY_1 = (date.today() - timedelta(days=2)).isoformat()
+DAY_2 = (date.today() - timedelta(days=1)).isoformat()
+
+
+def make_activity(session_id, user_id, timestamp, page_url, action_type='page_view'):
+    """Activity record as queued by track_activity"""
+    return {
+        'session_id': session_id,
+        'user_id': user_id,
+        'timestamp': timestamp,
+        'page_url': page_url,
+        'action_type': action_type,
+        'device_type': 'desktop'
+    }
+
+
+class TestActivityRollups(unittest.TestCase):
+    """Hourly rollups maintained by the writer and daily summaries derived from them"""
+
+    def setUp(self):
+        """Create a database with activity logged before rollups existed"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.original_database = app_module.DATABASE
+        app_module.DATABASE = self.db_path
+        app_module.init_db()
+
+        db = sqlite3.connect(self.db_path)
+        with open(os.path.join(MIGRATIONS_DIR, '002_activity_monitoring.sql')) as f:
+            db.executescript(f.read())
+        db.executemany("INSERT INTO users (id, username, email, password_hash, role) VALUES (?, ?, ?, 'x', ?)",
+                       [(1, 'boss', 'boss@example.com', 'admin'), (2, 'driver1', 'd1@example.com', 'driver')])
+        db.executemany("INSERT INTO sessions (id, user_id, expires_at) VALUES (?, ?, '2999-01-01')",
+                       [('s1', 1), ('s2', 2), ('s3', 2)])
+        db.executemany("INSERT INTO user_activity_log (session_id, user_id, timestamp, page_url, action_type) VALUES (?, ?, ?, ?, ?)", [
+            ('s1', 1, f'{DAY_1}T09:00:00', '/home', 'page_view'),
+            ('s1', 1, f'{DAY_1}T09:10:00', '/api/devices', 'api_call'),
+            ('s2', 2, f'{DAY_1}T09:30:00', '/home', 'page_view'),
+        ])
+        db.commit()
+        db.close()
+
+        with patch.object(ActivityTracker, 'start_background_worker'):
+            self.tracker = ActivityTracker(app, self.db_path)
+
+    def tearDown(self):
+        """Stop the tracker and restore the database path"""
+        self.tracker.is_running = False
+        app_module.DATABASE = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def rollup_rows(self, db):
+        """Contents of every rollup table, ordered"""
+        return {table: db.execute(f'SELECT * FROM {table} ORDER BY 1, 2').fetchall() for table in ROLLUP_TABLES}
+
+    def write_batches(self):
+        """Write new activity for both days through the tracker"""
+        self.assertTrue(self.tracker.process_activity_batch([
+            make_activity('s1', 1, f'{DAY_1}T10:20:00', '/planogram'),
+            make_activity('s2', 2, f'{DAY_1}T10:00:00', '/home'),
+        ]))
+        self.assertTrue(self.tracker.process_activity_batch([
+            make_activity('s3', 2, f'{DAY_2}T14:00:00', '/routes'),
+            make_activity('s1', 1, f'{DAY_1}T10:30:00', '/api/routes', 'api_call'),
+        ]))
+
+    def test_writer_backfills_then_maintains_rollups(self):
+        """Incrementally maintained rollups match a full rebuild from the log"""
+        self.write_batches()
+
+        db = sqlite3.connect(self.db_path)
+        incremental = self.rollup_rows(db)
+        self.assertEqual(db.execute("SELECT events, page_views, api_calls FROM activity_rollup_hourly WHERE hour = ?",
+                                    (f'{DAY_1} 09',)).fetchone(), (3, 2, 1))
+        self.assertEqual(db.execute("SELECT first_seen, last_seen, events FROM activity_rollup_sessions WHERE hour = ? AND session_id = 's1'",
+                                    (f'{DAY_1} 10',)).fetchone(), (f'{DAY_1} 10:20:00', f'{DAY_1} 10:30:00', 2))
+
+        backfill_rollups(db.cursor())
+        self.assertEqual(self.rollup_rows(db), incremental)
+        db.close()
+
+    def test_daily_summaries_from_rollups(self):
+        """Missing summaries are derived from rollups with peak hour, durations and distribution"""
+        self.write_batches()
+        processor = DailySummaryProcessor(self.db_path)
+        self.assertEqual(processor.process_missing_days(), 2)
+        self.assertEqual(processor.process_missing_days(), 0)
+
+        db = sqlite3.connect(self.db_path)
+        db.row_factory = sqlite3.Row
+        summary = db.execute('SELECT * FROM activity_summary_daily WHERE date = ?', (DAY_1,)).fetchone()
+        db.close()
+
+        self.assertEqual((summary['unique_users'], summary['total_sessions']), (2, 2))
+        self.assertEqual((summary['total_page_views'], summary['total_api_calls']), (4, 2))
+        # s1 spans 09:00-10:30 and s2 09:30-10:00: (5400 + 1800) / 2
+        self.assertEqual(summary['avg_session_duration_seconds'], 3600)
+        self.assertEqual((summary['peak_concurrent_users'], summary['peak_hour']), (2, 9))
+        self.assertEqual(json.loads(summary['top_pages'])[0], {'page': '/home', 'count': 3})
+        self.assertEqual(json.loads(summary['user_distribution']), {'admin': 1, 'driver': 1})
+
+    def test_prune_follows_log_retention(self):
+        """Rollup hours before the cutoff are removed"""
+        self.write_batches()
+        db = sqlite3.connect(self.db_path)
+        prune_rollups(db.cursor(), f'{DAY_2}T00:00:00')
+        self.assertEqual([row[0] for row in db.execute('SELECT hour FROM activity_rollup_hourly')], [f'{DAY_2} 14'])
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import os
+import sys
+import time
+import tempfile
+from flask import Flask
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from activity_tracker import ActivityTracker
+
+
+def make_activity(session_id, page='/page'):
+    """Minimal activity record as built by track_activity"""
+    return {
+        'session_id': session_id,
+        'user_id': 1,
+        'timestamp': '2025-01-01T00:00:00',
+        'page_url': page,
+        'device_type': 'desktop'
+    }
+
+
+class TestActivitySessionCache(unittest.TestCase):
+    """LRU session cache on the request path with expiry on the background worker"""
+
+    def setUp(self):
+        """Create a tracker against an empty database file"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.tracker = ActivityTracker(Flask(__name__), self.db_path)
+        self.tracker.max_cache_size = 3
+
+    def tearDown(self):
+        """Stop the worker loop and remove the database file"""
+        self.tracker.is_running = False
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_touch_moves_to_end_and_evicts_least_recent(self):
+        """Updating a session refreshes it; the least recently updated is evicted first"""
+        for session_id in ('a', 'b', 'c'):
+            self.tracker.update_session_cache(session_id, make_activity(session_id))
+        self.tracker.update_session_cache('a', make_activity('a', '/again'))
+        self.tracker.update_session_cache('d', make_activity('d'))
+
+        self.assertEqual(list(self.tracker.cache), ['c', 'a', 'd'])
+        self.assertEqual(self.tracker.cache['a']['last_page'], '/again')
+        self.assertEqual(self.tracker.cache_stats['evictions'], 1)
+
+    def test_expiry_removes_only_stale_prefix(self):
+        """Expired sessions are dropped from the front until a fresh one is reached"""
+        for session_id in ('a', 'b', 'c'):
+            self.tracker.update_session_cache(session_id, make_activity(session_id))
+        stale = time.time() - self.tracker.cache_ttl * 3
+        with self.tracker.cache_lock:
+            self.tracker.cache['a']['updated_at'] = stale
+            self.tracker.cache['b']['updated_at'] = stale
+
+        self.tracker.expire_session_cache()
+        self.assertEqual(list(self.tracker.get_active_sessions()), ['c'])
+        self.assertEqual(self.tracker.cache_stats['expired'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import sqlite3
+import os
+import sys
+import time
+import queue
+import tempfile
+from unittest.mock import patch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from app import app
+from activity_tracker import ActivityTracker
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def make_activity(session_id, page_url, action_type='page_view'):
+    """Activity record as built by track_activity"""
+    return {
+        'session_id': session_id,
+        'user_id': 1,
+        'timestamp': '2025-01-01T12:00:00',
+        'page_url': page_url,
+        'action_type': action_type,
+        'ip_address': '127.0.0.1',
+        'user_agent': 'TestAgent',
+        'device_type': 'desktop'
+    }
+
+
+class TestActivityWriter(unittest.TestCase):
+    """Coalesced session updates, deadline flushes and writer metrics"""
+
+    def setUp(self):
+        """Create a database with two sessions and a tracker whose threads are not started"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.original_database = app_module.DATABASE
+        app_module.DATABASE = self.db_path
+        app_module.init_db()
+
+        db = sqlite3.connect(self.db_path)
+        with open(os.path.join(MIGRATIONS_DIR, '002_activity_monitoring.sql')) as f:
+            db.executescript(f.read())
+        db.execute("INSERT INTO users (id, username, email, password_hash, role) VALUES (1, 'u', 'u@example.com', 'x', 'admin')")
+        db.executemany("INSERT INTO sessions (id, user_id, expires_at, activity_count) VALUES (?, 1, '2999-01-01', 0)",
+                       [('s1',), ('s2',)])
+        db.commit()
+        db.close()
+
+        with patch.object(ActivityTracker, 'start_background_worker'):
+            self.tracker = ActivityTracker(app, self.db_path)
+        self.tracker.idle_poll_interval = 0.05
+        self.tracker.flush_max_latency = 0.05
+
+    def tearDown(self):
+        """Stop tracker threads and restore the database path"""
+        self.tracker.is_running = False
+        for thread in (self.tracker.worker_thread, self.tracker.alert_thread):
+            if thread:
+                thread.join(timeout=2)
+        app_module.DATABASE = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def session_row(self, session_id):
+        """(activity_count, last_page, last_api_endpoint) for a session"""
+        db = sqlite3.connect(self.db_path)
+        row = db.execute('SELECT activity_count, last_page, last_api_endpoint FROM sessions WHERE id = ?',
+                         (session_id,)).fetchone()
+        db.close()
+        return row
+
+    def test_batch_coalesces_session_updates(self):
+        """One update per session with its latest page, latest API call and activity count"""
+        batch = [make_activity('s1', '/home'), make_activity('s1', '/api/devices', 'api_call'),
+                 make_activity('s1', '/planogram'), make_activity('s2', '/api/routes', 'api_call')]
+        self.assertTrue(self.tracker.process_activity_batch(batch))
+
+        self.assertEqual(self.session_row('s1'), (3, '/planogram', '/api/devices'))
+        self.assertEqual(self.session_row('s2'), (1, None, '/api/routes'))
+
+        # Alert checks are left to the alert stage
+        self.assertIs(self.tracker.alert_queue.get_nowait(), batch)
+        stats = self.tracker.get_writer_stats()
+        self.assertEqual((stats['batches'], stats['records']), (1, 4))
+
+    def test_writer_flushes_on_deadline(self):
+        """A partial batch is written once flush_max_latency passes"""
+        self.tracker.start_background_worker()
+        for page in ('/a', '/b', '/c'):
+            self.tracker.enqueue_activity(make_activity('s1', page))
+
+        deadline = time.time() + 2
+        while self.tracker.get_writer_stats()['records'] < 3 and time.time() < deadline:
+            time.sleep(0.02)
+
+        stats = self.tracker.get_writer_stats()
+        self.assertEqual(stats['records'], 3)
+        self.assertGreaterEqual(stats['flushes_by_deadline'], 1)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(self.session_row('s1')[0], 3)
+
+    def test_full_queue_counts_drops(self):
+        """Activities that do not fit in the queue are dropped and counted"""
+        self.tracker.activity_queue = queue.Queue(maxsize=1)
+        self.assertTrue(self.tracker.enqueue_activity(make_activity('s1', '/a')))
+        self.assertFalse(self.tracker.enqueue_activity(make_activity('s1', '/b')))
+        self.assertEqual(self.tracker.get_writer_stats()['dropped'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
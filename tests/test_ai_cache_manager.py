@@ -0,0 +1,108 @@
+import unittest
+import sqlite3
+import os
+import sys
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_services.pipelines.cache import CacheManager
+
+
+class TestCacheManagerTiers(unittest.TestCase):
+    """Bounded L1, persistent L3 with batched hit counts, batch calls and key digests"""
+
+    def setUp(self):
+        """Create a manager with memory and SQLite tiers"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.cache = CacheManager(sqlite_path=self.db_path, enable_l2=False,
+                                  l1_max_entries=3, l1_max_bytes=100)
+
+    def tearDown(self):
+        """Close the manager and remove the database"""
+        self.cache.close()
+        os.close(self.db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+
+    def hit_counts(self):
+        """hit_count per key as stored in SQLite"""
+        db = sqlite3.connect(self.db_path)
+        rows = dict(db.execute('SELECT cache_key, hit_count FROM ai_cache').fetchall())
+        db.close()
+        return rows
+
+    def test_l1_lru_by_count_and_bytes(self):
+        """Least recently used entries leave L1 to respect both bounds"""
+        self.cache.set('a', 'x' * 30)
+        self.cache.set('b', 'y' * 30)
+        self.cache._get_l1('a')
+        self.cache.set('c', 'z' * 30)
+        self.assertEqual(list(self.cache.memory_cache), ['b', 'a', 'c'])
+
+        self.cache.set('d', 'w' * 30)
+        self.assertEqual(list(self.cache.memory_cache), ['a', 'c', 'd'])
+        self.assertLessEqual(self.cache.memory_bytes, 100)
+        self.assertEqual(self.cache.get_stats()['evictions'], 1)
+
+        # Evicted from L1 but still served from L3, then promoted
+        self.assertEqual(self.cache.get('b'), 'y' * 30)
+        self.assertEqual(self.cache.hits['L3'], 1)
+        self.assertIn('b', self.cache.memory_cache)
+
+    def test_hit_counts_are_batched(self):
+        """L3 hits are buffered and written together"""
+        self.cache.set_many({'k1': {'score': 1}, 'k2': {'score': 2}})
+        self.cache.memory_cache.clear()
+        self.cache.memory_bytes = 0
+
+        for _ in range(3):
+            self.cache.get_many(['k1', 'k2', 'missing'])
+            self.cache.memory_cache.clear()
+            self.cache.memory_bytes = 0
+        self.assertEqual(self.hit_counts(), {'k1': 0, 'k2': 0})
+        self.assertEqual(self.cache.get_stats()['pending_hit_writes'], 6)
+
+        self.cache.flush()
+        self.assertEqual(self.hit_counts(), {'k1': 3, 'k2': 3})
+        self.assertEqual(self.cache.misses, 3)
+
+    def test_get_many_across_tiers(self):
+        """A batch lookup combines L1 and L3 hits and reports latency per tier"""
+        self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.cache._remove_l1('b')
+
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c', 'd']), {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual((self.cache.hits['L1'], self.cache.hits['L3'], self.cache.misses), (2, 1, 1))
+
+        latency = self.cache.get_stats()['latency']
+        self.assertEqual((latency['L1']['count'], latency['L3']['count']), (1, 1))
+        self.assertEqual(sum(latency['L3']['buckets'].values()), 1)
+        self.assertIsNotNone(latency['L3']['p95_ms'])
+
+        self.cache.set('short', 'v', ttl=1)
+        self.cache.memory_cache['short']['expires_at'] = time.time() - 1
+        db = sqlite3.connect(self.db_path)
+        db.execute("UPDATE ai_cache SET expires_at = '2000-01-01 00:00:00' WHERE cache_key = 'short'")
+        db.commit()
+        db.close()
+        self.assertIsNone(self.cache.get('short'))
+
+    def test_keys_are_canonical_digests(self):
+        """Keys ignore dict order, distinguish content and memoize long strings"""
+        planogram = {'slots': [{'row': 0, 'column': 1, 'product_id': 3}], 'device': 7}
+        reordered = {'device': 7, 'slots': [{'product_id': 3, 'column': 1, 'row': 0}]}
+        self.assertEqual(self.cache._generate_key('f', planogram), self.cache._generate_key('f', reordered))
+        self.assertNotEqual(self.cache._generate_key('f', planogram), self.cache._generate_key('g', planogram))
+        self.assertNotEqual(self.cache._generate_key('f', '1'), self.cache._generate_key('f', 1))
+        self.assertNotEqual(self.cache._generate_key('f', a=1), self.cache._generate_key('f', b=1))
+        self.assertEqual(len(self.cache._generate_key('f')), 32)
+
+        prompt = 'Analyze this placement. ' * 50
+        key = self.cache._generate_key('f', prompt)
+        self.assertEqual(len(self.cache._digest_memo), 1)
+        self.assertEqual(self.cache._generate_key('f', prompt), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import os
+import sys
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_services.base.client import AIClient
+from ai_services.base.exceptions import AIServiceError
+from ai_services.base.dispatcher import RequestDispatcher, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+
+
+class FakeTransport:
+    """Records requests and answers them once released"""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = False
+
+    def __call__(self, request):
+        with self.lock:
+            self.calls.append(request)
+        self.release.wait(5)
+        if self.fail:
+            raise ValueError('upstream error')
+        prompt = request['messages'][0]['content']
+        return {
+            'content': f'echo: {prompt}',
+            'model': request['model'],
+            'input_tokens': len(prompt.split()),
+            'output_tokens': 3,
+            'total_tokens': len(prompt.split()) + 3,
+            'stop_reason': 'end_turn'
+        }
+
+
+class TestRequestDispatcher(unittest.TestCase):
+    """Coalescing, priority order, metrics and error propagation against a fake transport"""
+
+    def setUp(self):
+        """Create a single-worker dispatcher over the fake transport"""
+        self.transport = FakeTransport()
+        self.dispatcher = RequestDispatcher(self.transport, max_concurrency=1)
+
+    def tearDown(self):
+        """Release any blocked call and stop the workers"""
+        self.transport.release.set()
+        self.dispatcher.stop()
+
+    def test_identical_requests_share_one_call(self):
+        """Callers asking the same question while it is pending get the same answer"""
+        self.transport.release.clear()
+        futures = [self.dispatcher.submit(prompt='Score slot A1', max_tokens=50) for _ in range(5)]
+        other = self.dispatcher.submit(prompt='Score slot A1', max_tokens=60)
+        self.transport.release.set()
+
+        results = [future.result(5) for future in futures]
+        self.assertEqual({r['content'] for r in results}, {'echo: Score slot A1'})
+        other.result(5)
+        self.assertEqual(len(self.transport.calls), 2)
+
+        stats = self.dispatcher.get_stats()['models'][self.dispatcher.default_model]
+        self.assertEqual((stats['requests'], stats['api_calls'], stats['coalesced']), (6, 2, 4))
+        self.assertEqual(stats['input_tokens'], 6)
+        self.assertEqual(stats['latency']['count'], 2)
+
+        # Completed requests are sent again
+        self.dispatcher.complete(prompt='Score slot A1', max_tokens=50, timeout=5)
+        self.assertEqual(len(self.transport.calls), 3)
+
+    def test_interactive_requests_run_before_batch(self):
+        """With the worker busy, queued interactive work jumps ahead of batch work"""
+        self.transport.release.clear()
+        blocker = self.dispatcher.submit(prompt='blocker')
+        while not self.transport.calls:
+            threading.Event().wait(0.01)
+
+        batch = [self.dispatcher.submit(prompt=f'batch {i}', priority=PRIORITY_BATCH) for i in range(3)]
+        interactive = self.dispatcher.submit(prompt='chat', priority=PRIORITY_INTERACTIVE)
+        # A batch request promoted by an interactive caller moves up too
+        promoted = self.dispatcher.submit(prompt='batch 2', priority=PRIORITY_INTERACTIVE)
+        self.assertIs(promoted, batch[2])
+        self.assertEqual(self.dispatcher.get_stats()['queued'], 4)
+
+        self.transport.release.set()
+        for future in [blocker, interactive] + batch:
+            future.result(5)
+        order = [call['messages'][0]['content'] for call in self.transport.calls]
+        self.assertEqual(order, ['blocker', 'chat', 'batch 2', 'batch 0', 'batch 1'])
+
+    def test_errors_reach_every_waiter(self):
+        """A failed call fails all coalesced callers and is counted per model"""
+        self.transport.fail = True
+        self.transport.release.clear()
+        futures = [self.dispatcher.submit(prompt='broken', model='model-x') for _ in range(3)]
+        self.transport.release.set()
+        for future in futures:
+            with self.assertRaises(AIServiceError):
+                future.result(5)
+        stats = self.dispatcher.get_stats()['models']['model-x']
+        self.assertEqual((stats['api_calls'], stats['errors']), (1, 1))
+
+    def test_async_and_client_integration(self):
+        """acomplete serves asyncio callers and AIClient routes through the dispatcher"""
+        async def ask():
+            return await asyncio.gather(*[self.dispatcher.acomplete(prompt=f'q{i % 2}') for i in range(4)])
+        results = asyncio.run(ask())
+        self.assertEqual([r['content'] for r in results], ['echo: q0', 'echo: q1', 'echo: q0', 'echo: q1'])
+
+        client = AIClient(dispatcher=self.dispatcher)
+        self.assertFalse(client.fallback_mode)
+        response = client.generate_completion('three word prompt', model='model-y', priority=PRIORITY_BATCH, timeout=5)
+        self.assertEqual(response['content'], 'echo: three word prompt')
+        self.assertEqual((client.total_input_tokens, client.total_output_tokens, client.request_count), (3, 3, 1))
+        self.assertEqual(self.transport.calls[-1]['model'], 'model-y')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+import sqlite3
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_services.llm_integration_pipeline import BatchProcessor, TokenBucket
+
+SCHEMA = """
+CREATE TABLE device_types (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE locations (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE devices (id INTEGER PRIMARY KEY, asset TEXT, model TEXT, device_type_id INTEGER,
+                      location_id INTEGER, deleted_at TIMESTAMP);
+CREATE TABLE cabinet_configurations (id INTEGER PRIMARY KEY, device_id INTEGER);
+CREATE TABLE planograms (id INTEGER PRIMARY KEY, cabinet_id INTEGER);
+CREATE TABLE planogram_slots (id INTEGER PRIMARY KEY, planogram_id INTEGER, product_id INTEGER,
+                              product_name TEXT, quantity INTEGER, capacity INTEGER);
+CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE sales (id INTEGER PRIMARY KEY, device_id INTEGER, product_id INTEGER, sale_units INTEGER,
+                    sale_cash REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+"""
+
+
+class FakeClient:
+    """Stands in for anthropic.Anthropic, answering for every device in the prompt"""
+
+    def __init__(self, delay=0.0):
+        self.messages = self
+        self.delay = delay
+        self.calls = []
+        self.fail_device = None
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def create(self, **kwargs):
+        prompt = kwargs['messages'][0]['content']
+        devices = json.loads(prompt[prompt.index('<devices>') + 9:prompt.index('</devices>')])
+        with self.lock:
+            self.calls.append(sorted(int(d) for d in devices))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if self.fail_device and str(self.fail_device) in devices:
+            raise ConnectionError('connection reset')
+        body = {'recommendations': {d: {'expected_impact': 1.5, 'revenue': info['sales_30d']['revenue']}
+                                    for d, info in devices.items()}}
+        return SimpleNamespace(
+            content=[SimpleNamespace(text='Here you go:\n' + json.dumps(body))],
+            usage=SimpleNamespace(input_tokens=1000, output_tokens=200)
+        )
+
+
+class TestBatchProcessor(unittest.TestCase):
+    """Set-based contexts, concurrent rate-limited batches and resumable runs"""
+
+    def setUp(self):
+        """Create a fleet of twelve devices with slots and sales"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        db = sqlite3.connect(self.db_path)
+        db.executescript(SCHEMA)
+        db.execute("INSERT INTO device_types VALUES (1, 'Cooler'), (2, 'Snack')")
+        db.execute("INSERT INTO locations VALUES (1, 'Main Office')")
+        db.executemany("INSERT INTO products VALUES (?, ?)", [(1, 'Cola'), (2, 'Chips'), (3, 'Water')])
+        for device_id in range(1, 13):
+            db.execute("INSERT INTO devices VALUES (?, ?, 'M1', ?, 1, NULL)",
+                       (device_id, f'A{device_id}', 1 if device_id % 2 else 2))
+            db.execute("INSERT INTO cabinet_configurations VALUES (?, ?)", (device_id, device_id))
+            db.execute("INSERT INTO planograms VALUES (?, ?)", (device_id, device_id))
+            db.executemany("INSERT INTO planogram_slots (planogram_id, product_id, product_name, quantity, capacity) "
+                           "VALUES (?, ?, ?, ?, ?)",
+                           [(device_id, 1, 'Cola', 5, 10), (device_id, 2, 'Chips', 10, 10), (device_id, None, None, 0, 10)])
+            db.executemany("INSERT INTO sales (device_id, product_id, sale_units, sale_cash) VALUES (?, ?, ?, ?)",
+                           [(device_id, 1, 4, 6.0), (device_id, 2, 2, 3.0), (device_id, 1, 1, 1.5)])
+        db.execute("INSERT INTO sales (device_id, product_id, sale_units, sale_cash, created_at) "
+                   "VALUES (1, 3, 50, 75.0, datetime('now', '-60 days'))")
+        db.commit()
+        db.close()
+
+        self.client = FakeClient(delay=0.05)
+        self.processor = BatchProcessor(self.client, self.db_path, batch_size=4, max_concurrency=3,
+                                        requests_per_minute=6000, input_tokens_per_minute=10_000_000)
+
+    def tearDown(self):
+        """Remove the database"""
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_batch_context_from_set_queries(self):
+        """Slots and recent sales are aggregated per device for the whole batch"""
+        context = self.processor._prepare_batch_context([1, 2, 99])
+        self.assertEqual(sorted(context['devices']), [1, 2])
+        self.assertEqual(context['venue_types'], {'Cooler': [1], 'Snack': [2]})
+
+        device = context['devices'][1]
+        self.assertEqual(device['slots'], {'total': 3, 'empty': 1, 'fill_percent': 50.0})
+        self.assertEqual(device['planogram_products'], ['Chips', 'Cola'])
+        self.assertEqual(device['sales_30d']['units'], 7)
+        self.assertEqual(device['sales_30d']['revenue'], 10.5)
+        self.assertEqual([p['name'] for p in device['sales_30d']['top_products']], ['Cola', 'Chips'])
+        self.assertEqual(self.processor._get_device_context(
+            sqlite3.connect(self.db_path).cursor(), 2)['location'], 'Main Office')
+
+    def test_batches_run_concurrently_and_report(self):
+        """Batches overlap up to the concurrency limit and the run reports throughput and cost"""
+        results = asyncio.run(self.processor.batch_optimize(list(range(1, 13))))
+        self.assertEqual([r['device_id'] for r in results], list(range(1, 13)))
+        self.assertTrue(all(r['success'] for r in results))
+        self.assertEqual(results[0]['recommendations']['revenue'], 10.5)
+        self.assertEqual(len(self.client.calls), 3)
+        self.assertGreater(self.client.max_active, 1)
+
+        report = self.processor.get_last_report()
+        self.assertEqual((report['devices_processed'], report['devices_failed'], report['batches']), (12, 0, 3))
+        self.assertEqual((report['input_tokens'], report['output_tokens']), (3000, 600))
+        self.assertAlmostEqual(report['cost_usd'], 3 * (1000 * 3 + 200 * 15) / 1_000_000)
+        self.assertGreater(report['devices_per_minute'], 0)
+
+    def test_interrupted_run_resumes(self):
+        """Only devices without a stored success are sent again"""
+        self.client.fail_device = 6
+        results = asyncio.run(self.processor.batch_optimize(list(range(1, 13))))
+        self.assertEqual(sum(1 for r in results if not r['success']), 4)
+        self.assertEqual(self.processor.get_last_report()['failed_batches'], 1)
+
+        self.client.fail_device = None
+        self.client.calls = []
+        results = asyncio.run(self.processor.batch_optimize(list(range(1, 13))))
+        self.assertEqual(self.client.calls, [[5, 6, 7, 8]])
+        self.assertTrue(all(r['success'] for r in results))
+        report = self.processor.get_last_report()
+        self.assertEqual((report['devices_resumed'], report['devices_processed']), (8, 4))
+
+        # A fresh run id starts over
+        asyncio.run(self.processor.batch_optimize([1, 2], run_id='manual'))
+        self.assertEqual(self.client.calls[-1], [1, 2])
+
+    def test_token_bucket_spaces_requests(self):
+        """Acquiring past the burst capacity waits for the refill rate"""
+        bucket = TokenBucket(per_minute=1200, capacity=2)
+
+        async def take(count):
+            for _ in range(count):
+                await bucket.acquire()
+
+        started = time.monotonic()
+        asyncio.run(take(6))
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+        self.assertGreater(bucket.waited_seconds, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import sqlite3
+import os
+import sys
+import shutil
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import ConnectionPool
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Per-thread connection reuse, reset on release and the read-only pool"""
+
+    def setUp(self):
+        """Create a WAL database with one table"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'pool.db')
+        self.pool = ConnectionPool()
+        self.read_pool = ConnectionPool(read_only=True)
+        conn = self.pool.acquire(self.db_path)
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        """Close pooled connections and remove the database"""
+        self.pool.close_all()
+        self.read_pool.close_all()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_connection_reused_and_reset(self):
+        """close() keeps the connection for the thread with state reset"""
+        conn = self.pool.acquire(self.db_path)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute("INSERT INTO items (name) VALUES ('uncommitted')")
+        conn.close()
+
+        again = self.pool.acquire(self.db_path)
+        self.assertIs(again, conn)
+        self.assertIsNone(again.row_factory)
+        self.assertEqual(again.execute('PRAGMA foreign_keys').fetchone(), (0,))
+        self.assertEqual(again.execute('SELECT COUNT(*) FROM items').fetchone(), (0,))
+        self.assertEqual(again.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+        self.assertEqual(again.execute('PRAGMA synchronous').fetchone(), (1,))
+
+        # A nested acquire while one is checked out gets a second connection
+        nested = self.pool.acquire(self.db_path)
+        self.assertIsNot(nested, again)
+        nested.close()
+        again.close()
+        self.assertEqual(self.pool.get_stats()['idle'], 2)
+
+    def test_threads_do_not_share_connections(self):
+        """Each thread is served from its own idle list"""
+        conn = self.pool.acquire(self.db_path)
+        conn.close()
+
+        seen = []
+        worker = threading.Thread(target=lambda: seen.append(self.pool.acquire(self.db_path)))
+        worker.start()
+        worker.join()
+        self.assertIsNot(seen[0], conn)
+        self.assertIs(self.pool.acquire(self.db_path), conn)
+
+    def test_read_only_pool_rejects_writes(self):
+        """Read-only connections see committed data and refuse writes"""
+        writer = self.pool.acquire(self.db_path)
+        writer.execute("INSERT INTO items (name) VALUES ('cola')")
+        writer.commit()
+        writer.close()
+
+        reader = self.read_pool.acquire(self.db_path)
+        self.assertEqual(reader.execute('SELECT name FROM items').fetchall(), [('cola',)])
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.execute("INSERT INTO items (name) VALUES ('water')")
+        reader.close()
+
+    def test_replaced_database_file_not_reused(self):
+        """An idle connection to a file that was replaced is discarded"""
+        conn = self.pool.acquire(self.db_path)
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.close()
+
+        replacement = os.path.join(self.tmp_dir, 'replacement.db')
+        with sqlite3.connect(replacement) as db:
+            db.execute('CREATE TABLE other (id INTEGER)')
+        db.close()
+        os.replace(replacement, self.db_path)
+
+        fresh = self.pool.acquire(self.db_path)
+        self.assertIsNot(fresh, conn)
+        self.assertEqual(self.pool.get_stats()['discarded'], 1)
+        self.assertEqual(fresh.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall(),
+                         [('other',)])
+        fresh.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import sqlite3
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from app import app
+
+
+class TestDeviceListing(unittest.TestCase):
+    """GET /api/devices cabinet aggregation, keyset pagination and projection"""
+
+    def setUp(self):
+        """Create a database with five devices, two cabinets on the odd ones"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.original_database = app_module.DATABASE
+        app_module.DATABASE = self.db_path
+        app.config['DATABASE'] = self.db_path
+        app.config['TESTING'] = True
+        app_module.init_db()
+        self.client = app.test_client()
+
+        db = sqlite3.connect(self.db_path)
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO device_types (id, name, description, allows_additional_cabinets) VALUES (1, 'Cooler', 'Cooler', 1)")
+        cursor.execute("INSERT INTO cabinet_types (id, name, description, rows, cols, icon) VALUES (1, 'Cooler', 'Cooler', 2, 2, 'x')")
+        # Devices 4 and 5 share a created_at to exercise the id tiebreak
+        created = ['2025-01-01 00:00:00', '2025-01-02 00:00:00', '2025-01-03 00:00:00',
+                   '2025-01-04 00:00:00', '2025-01-04 00:00:00']
+        for device_id, created_at in enumerate(created, start=1):
+            cursor.execute("INSERT INTO devices (id, asset, cooler, model, device_type_id, created_at) VALUES (?, ?, 'c', 'm', 1, ?)",
+                           (device_id, f'A{device_id}', created_at))
+            for cabinet_index in range(2 if device_id % 2 else 1):
+                cursor.execute("INSERT INTO cabinet_configurations (device_id, cabinet_type_id, is_parent, cabinet_index, rows, columns) VALUES (?, 1, ?, ?, 2, 2)",
+                               (device_id, cabinet_index == 0, cabinet_index))
+        cursor.execute("UPDATE devices SET deleted_at = CURRENT_TIMESTAMP WHERE id = 2")
+        db.commit()
+        db.close()
+
+    def tearDown(self):
+        """Restore database configuration and remove the temp file"""
+        app_module.DATABASE = self.original_database
+        app.config['DATABASE'] = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_unpaginated_list_keeps_shape(self):
+        """Without limit the endpoint still returns a bare list with cabinets"""
+        devices = self.client.get('/api/devices').get_json()
+        self.assertEqual([device['id'] for device in devices], [5, 4, 3, 1])
+        self.assertEqual(len(devices[0]['cabinetConfiguration']), 2)
+        self.assertEqual(len(devices[1]['cabinetConfiguration']), 1)
+        self.assertTrue(devices[0]['cabinetConfiguration'][0]['isParent'])
+
+    def test_keyset_pagination_walks_all_devices(self):
+        """Following nextCursor visits every device exactly once"""
+        seen = []
+        url = '/api/devices?limit=2'
+        while True:
+            page = self.client.get(url).get_json()
+            seen.extend(device['id'] for device in page['devices'])
+            if not page['pagination']['hasMore']:
+                self.assertIsNone(page['pagination']['nextCursor'])
+                break
+            url = f"/api/devices?limit=2&after={page['pagination']['nextCursor']}"
+        self.assertEqual(seen, [5, 4, 3, 1])
+
+    def test_field_projection(self):
+        """fields limits output keys and rejects unknown names"""
+        devices = self.client.get('/api/devices?fields=id,asset').get_json()
+        self.assertEqual(devices[0], {'id': 5, 'asset': 'A5'})
+
+        response = self.client.get('/api/devices?fields=id,password')
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import unittest
+import sqlite3
+import os
+import io
+import sys
+import shutil
+import tempfile
+import zlib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from app import app
+from dex_content_store import content_hash, blob_path, RawContentWriter
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'documentation', '09-reference', 'examples', 'dex')
+
+
+def read_example(name):
+    """Return the raw bytes of a bundled example DEX file"""
+    with open(os.path.join(EXAMPLES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+class TestDEXDeduplication(unittest.TestCase):
+    """Content-hash deduplication and raw_content storage modes for DEX uploads"""
+
+    def setUp(self):
+        """Create an empty schema-complete database and blob directory"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.blob_dir = tempfile.mkdtemp()
+        self.original_database = app_module.DATABASE
+        self.original_storage = app_module.DEX_CONTENT_STORAGE
+        self.original_blob_dir = app_module.DEX_BLOB_DIR
+        app_module.DATABASE = self.db_path
+        app_module.DEX_BLOB_DIR = self.blob_dir
+        app.config['DATABASE'] = self.db_path
+        app.config['TESTING'] = True
+        app_module.init_db()
+        with app.app_context():
+            app_module.migrate_database_schema()
+        self.client = app.test_client()
+        self.raw = read_example('Vendo 721.txt')
+
+    def tearDown(self):
+        """Restore configuration and remove temp files"""
+        app_module.DATABASE = self.original_database
+        app_module.DEX_CONTENT_STORAGE = self.original_storage
+        app_module.DEX_BLOB_DIR = self.original_blob_dir
+        app.config['DATABASE'] = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+        shutil.rmtree(self.blob_dir)
+
+    def upload(self, raw, filename='Vendo 721.txt'):
+        """POST raw bytes as a single DEX upload"""
+        return self.client.post('/api/dex/parse', data={'file': (io.BytesIO(raw), filename)},
+                                content_type='multipart/form-data')
+
+    def read_count(self):
+        """Number of stored dex_reads rows"""
+        db = sqlite3.connect(self.db_path)
+        count = db.execute('SELECT COUNT(*) FROM dex_reads').fetchone()[0]
+        db.close()
+        return count
+
+    def test_reupload_returns_existing_read(self):
+        """An identical upload resolves to the first read without storing again"""
+        first = self.upload(self.raw).get_json()
+        self.assertNotIn('duplicate', first)
+
+        second = self.upload(self.raw, 'renamed.txt').get_json()
+        self.assertTrue(second['success'])
+        self.assertTrue(second['duplicate'])
+        self.assertEqual(second['dex_read_id'], first['dex_read_id'])
+        self.assertEqual(second['pa_records_count'], first['pa_records_count'])
+        self.assertEqual(second['total_records'], first['total_records'])
+        self.assertEqual(self.read_count(), 1)
+
+    def test_batch_skips_known_and_repeated_files(self):
+        """Batch uploads skip stored files and repeats within the same request"""
+        first = self.upload(self.raw).get_json()
+        crane = read_example('Crane National 187.txt')
+
+        response = self.client.post('/api/dex/parse-batch', data={'files': [
+            (io.BytesIO(self.raw), 'again.txt'),
+            (io.BytesIO(crane), 'crane.txt'),
+            (io.BytesIO(crane), 'crane-copy.txt'),
+        ]}, content_type='multipart/form-data')
+        data = response.get_json()
+        files = {f['filename']: f for f in data['files']}
+
+        self.assertEqual(files['again.txt']['dex_read_id'], first['dex_read_id'])
+        self.assertTrue(files['again.txt']['duplicate'])
+        self.assertEqual(files['crane-copy.txt']['dex_read_id'], files['crane.txt']['dex_read_id'])
+        self.assertEqual(data['stats']['stored'], 1)
+        self.assertEqual(data['stats']['duplicates'], 2)
+        self.assertEqual(self.read_count(), 2)
+
+    def test_compressed_storage_round_trips(self):
+        """zlib and blob modes store less text in SQLite and read back the original"""
+        text = self.raw.decode('utf-8', errors='ignore')
+        for mode, name in (('zlib', 'Vendo 721.txt'), ('blob', 'Crane National 187.txt')):
+            app_module.DEX_CONTENT_STORAGE = mode
+            raw = read_example(name)
+            read_id = self.upload(raw, name).get_json()['dex_read_id']
+
+            db = sqlite3.connect(self.db_path)
+            stored, encoding = db.execute('SELECT raw_content, content_encoding FROM dex_reads WHERE id = ?',
+                                          (read_id,)).fetchone()
+            db.close()
+            self.assertEqual(encoding, mode)
+            if mode == 'zlib':
+                self.assertIsInstance(stored, bytes)
+                self.assertLess(len(stored), len(text))
+            else:
+                self.assertEqual(stored, '')
+                self.assertTrue(os.path.exists(blob_path(self.blob_dir, content_hash(raw))))
+
+            details = self.client.get(f'/api/dex/reads/{read_id}').get_json()
+            self.assertEqual(details['read_info']['raw_content'], raw.decode('utf-8', errors='ignore'))
+
+    def test_writer_builds_content_chunk_by_chunk(self):
+        """Chunks split inside multi-byte characters hash and encode like the whole file"""
+        raw = self.raw + 'Caf\u00e9 \u2013 r\u00e9sum\u00e9'.encode('utf-8')
+        text = raw.decode('utf-8', errors='ignore')
+        for mode in ('text', 'zlib', 'blob'):
+            writer = RawContentWriter(mode, self.blob_dir)
+            for start in range(0, len(raw), 5):
+                writer.update(raw[start:start + 5])
+            digest, stored, encoding = writer.finish()
+            self.assertEqual((digest, encoding), (content_hash(raw), mode))
+            if mode == 'text':
+                self.assertEqual(stored, text)
+            elif mode == 'zlib':
+                self.assertEqual(zlib.decompress(stored).decode('utf-8'), text)
+            else:
+                self.assertFalse(os.path.exists(blob_path(self.blob_dir, digest)))
+                writer.publish()
+                with open(blob_path(self.blob_dir, digest), 'rb') as f:
+                    self.assertEqual(zlib.decompress(f.read()).decode('utf-8'), text)
+        self.assertEqual([n for n in os.listdir(self.blob_dir) if n.endswith('.tmp')], [])
+
+    def test_concurrent_duplicate_returns_existing_read(self):
+        """A unique content_hash conflict after the duplicate check resolves to the stored read"""
+        first = self.upload(self.raw).get_json()
+        crane = read_example('Crane National 187.txt')
+        find = app_module.find_dex_reads_by_hash
+        calls = []
+
+        def miss_first_check(db, hashes):
+            # Each request's pre-check runs before the other upload commits
+            calls.append(hashes)
+            return {} if len(calls) % 2 else find(db, hashes)
+
+        app_module.find_dex_reads_by_hash = miss_first_check
+        try:
+            response = self.upload(self.raw, 'racing.txt')
+            batch = self.client.post('/api/dex/parse-batch', data={'files': [
+                (io.BytesIO(self.raw), 'racing.txt'),
+                (io.BytesIO(crane), 'crane.txt'),
+            ]}, content_type='multipart/form-data').get_json()
+        finally:
+            app_module.find_dex_reads_by_hash = find
+
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertTrue(data['duplicate'])
+        self.assertEqual(data['dex_read_id'], first['dex_read_id'])
+
+        files = {f['filename']: f for f in batch['files']}
+        self.assertTrue(files['racing.txt']['duplicate'])
+        self.assertEqual(files['racing.txt']['dex_read_id'], first['dex_read_id'])
+        self.assertTrue(files['crane.txt']['success'])
+        self.assertEqual(batch['stats']['stored'], 1)
+        self.assertEqual(self.read_count(), 2)
+
+    def test_rejected_upload_leaves_no_blob(self):
+        """Blobs are written only after their row commits"""
+        app_module.DEX_CONTENT_STORAGE = 'blob'
+        truncated = b'\n'.join(self.raw.strip().splitlines()[:-1])
+        self.assertEqual(self.upload(truncated, 'truncated.txt').status_code, 400)
+        self.assertEqual(os.listdir(self.blob_dir), [])
+
+        self.assertEqual(self.upload(self.raw).status_code, 200)
+        self.assertEqual(self.upload(self.raw, 'again.txt').get_json()['duplicate'], True)
+        self.assertEqual(os.listdir(self.blob_dir), [content_hash(self.raw)[:2]])
+        self.assertEqual(os.listdir(os.path.join(self.blob_dir, content_hash(self.raw)[:2])),
+                         [f'{content_hash(self.raw)}.zlib'])
+
+
+if __name__ == '__main__':
+    unittest.main()
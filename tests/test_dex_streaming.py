@@ -0,0 +1,190 @@
+import unittest
+import sqlite3
+import os
+import io
+import sys
+import tempfile
+import zipfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from app import app
+from dex_parser import DEXParser, DEXParseError
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'documentation', '09-reference', 'examples', 'dex')
+
+
+def read_example(name):
+    """Return the raw bytes of a bundled example DEX file"""
+    with open(os.path.join(EXAMPLES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+class TestDEXStreamingParser(unittest.TestCase):
+    """parse_stream must match parse_file while reading line by line"""
+
+    def test_stream_matches_full_parse(self):
+        """Binary streams with a chunked sink give the same records as parse_file"""
+        parser = DEXParser()
+        for name in ('Vendo 721.txt', 'Crane National 187.txt'):
+            raw = read_example(name)
+            expected = parser.parse_file(raw.decode('utf-8', errors='ignore'), name)
+
+            chunks = []
+            result = parser.parse_stream(io.BytesIO(raw), name, record_sink=chunks.append, chunk_size=7)
+            self.assertTrue(expected['success'])
+            self.assertEqual(result['success'], expected['success'])
+            self.assertEqual(result['total_records'], expected['total_records'])
+            self.assertEqual(result['pa_records'], expected['pa_records'])
+            self.assertEqual(result['grid_analysis'], expected['grid_analysis'])
+            self.assertEqual(result['parsed_records'], [])
+            self.assertTrue(all(len(chunk) <= 7 for chunk in chunks))
+            self.assertEqual([record for chunk in chunks for record in chunk], expected['parsed_records'])
+
+    def test_iter_records_requires_trailer(self):
+        """A missing DXE is reported after the last record streams through"""
+        parser = DEXParser()
+        lines = read_example('Vendo 721.txt').decode('utf-8', errors='ignore').strip().splitlines()
+        stream = io.StringIO('\n'.join(lines[:-1]))
+        with self.assertRaises(DEXParseError) as ctx:
+            list(parser.iter_records(stream))
+        self.assertEqual(ctx.exception.error['message'], 'File must end with DXE record')
+
+        result = parser.parse_stream(io.StringIO('ST*001*0001\nDXE*1*1'), 'bad.txt')
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error']['message'], 'File must start with DXS record')
+
+
+class TestDEXParseEndpoint(unittest.TestCase):
+    """DEX upload endpoints store parsed files in a single transaction"""
+
+    def setUp(self):
+        """Create an empty schema-complete database"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.original_database = app_module.DATABASE
+        app_module.DATABASE = self.db_path
+        app.config['DATABASE'] = self.db_path
+        app.config['TESTING'] = True
+        app_module.init_db()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Restore database configuration and remove the temp file"""
+        app_module.DATABASE = self.original_database
+        app.config['DATABASE'] = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def upload(self, raw, filename):
+        """POST raw bytes as a multipart DEX upload"""
+        return self.client.post('/api/dex/parse', data={'file': (io.BytesIO(raw), filename)},
+                                content_type='multipart/form-data')
+
+    def test_upload_stores_read_records_and_pa_records(self):
+        """The read row, every non-PA record and every consolidated PA record are stored"""
+        raw = read_example('Vendo 721.txt')
+        expected = DEXParser().parse_file(raw.decode('utf-8', errors='ignore'), 'Vendo 721.txt')
+
+        response = self.upload(raw, 'Vendo 721.txt')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['pa_records_count'], len(expected['pa_records']))
+
+        db = sqlite3.connect(self.db_path)
+        read = db.execute('SELECT raw_content, total_records, machine_serial FROM dex_reads WHERE id = ?',
+                          (data['dex_read_id'],)).fetchone()
+        self.assertEqual(read[0], raw.decode('utf-8', errors='ignore'))
+        self.assertEqual(read[1], expected['total_records'])
+        self.assertEqual(read[2], expected['machine_info'].get('machine_serial', ''))
+        record_count = db.execute('SELECT COUNT(*) FROM dex_records').fetchone()[0]
+        pa_count = db.execute('SELECT COUNT(*) FROM dex_pa_records').fetchone()[0]
+        db.close()
+        self.assertEqual(record_count, len(expected['parsed_records']))
+        self.assertEqual(pa_count, len(expected['pa_records']))
+
+    def test_invalid_upload_rolls_back(self):
+        """A parse error leaves no partial read or records behind"""
+        lines = read_example('Vendo 721.txt').strip().splitlines()
+        response = self.upload(b'\n'.join(lines[:-1]), 'truncated.txt')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.get_json()['success'])
+
+        db = sqlite3.connect(self.db_path)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM dex_reads').fetchone()[0], 0)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM dex_records').fetchone()[0], 0)
+        db.close()
+
+    def test_batch_upload_accepts_zip_and_files(self):
+        """Zip members and loose files are parsed in the pool and stored together"""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('shift/Vendo 721.txt', read_example('Vendo 721.txt'))
+            zf.writestr('shift/Crane National 187.txt', read_example('Crane National 187.txt'))
+            zf.writestr('shift/notes.md', b'not a dex file')
+        archive.seek(0)
+        truncated = b'\n'.join(read_example('Royal 660.txt').strip().splitlines()[:-1])
+
+        response = self.client.post('/api/dex/parse-batch', data={'files': [
+            (archive, 'shift.zip'),
+            (io.BytesIO(truncated), 'Royal 660.txt'),
+        ]}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+
+        files = {f['filename']: f for f in data['files']}
+        self.assertTrue(files['Vendo 721.txt']['success'])
+        self.assertTrue(files['Crane National 187.txt']['success'])
+        self.assertFalse(files['Royal 660.txt']['success'])
+        self.assertEqual([r['filename'] for r in data['rejected']], ['shift/notes.md'])
+        self.assertEqual(data['stats']['files'], 3)
+        self.assertEqual(data['stats']['stored'], 2)
+        self.assertIn('recordsPerSecond', data['stats'])
+
+        db = sqlite3.connect(self.db_path)
+        stored = dict(db.execute('SELECT filename, COUNT(*) FROM dex_reads GROUP BY filename').fetchall())
+        pa_count = db.execute('SELECT COUNT(*) FROM dex_pa_records WHERE dex_read_id = ?',
+                              (files['Vendo 721.txt']['dex_read_id'],)).fetchone()[0]
+        db.close()
+        self.assertEqual(stored, {'Vendo 721.txt': 1, 'Crane National 187.txt': 1})
+        self.assertEqual(pa_count, files['Vendo 721.txt']['pa_records_count'])
+
+    def test_batch_limits_are_checked_from_the_zip_directory(self):
+        """Member counts and sizes are checked before extraction; .TXT names are accepted"""
+        vendo = read_example('Vendo 721.txt')
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('VENDO.TXT', vendo)
+            zf.writestr('padding.txt', b'DXS' + b' ' * (len(vendo) * 4))
+        original = (app_module.DEX_BATCH_MAX_FILES, app_module.DEX_MAX_FILE_BYTES, app_module.DEX_BATCH_MAX_BYTES)
+
+        def post(*files):
+            return self.client.post('/api/dex/parse-batch', data={'files': [
+                (io.BytesIO(raw), name) for raw, name in files
+            ]}, content_type='multipart/form-data')
+
+        try:
+            app_module.DEX_MAX_FILE_BYTES = len(vendo) * 2
+            response = post((archive.getvalue(), 'shift.ZIP'))
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertEqual([f['filename'] for f in data['files']], ['VENDO.TXT'])
+            self.assertTrue(data['files'][0]['success'])
+            self.assertEqual(data['rejected'][0]['filename'], 'padding.txt')
+
+            app_module.DEX_BATCH_MAX_FILES = 2
+            response = post((vendo, 'extra.txt'), (archive.getvalue(), 'shift.zip'))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()['error']['message'], 'Too many files (max 2)')
+
+            app_module.DEX_BATCH_MAX_FILES = 200
+            app_module.DEX_BATCH_MAX_BYTES = len(vendo) + 1
+            response = post((vendo, 'a.txt'), (vendo, 'b.txt'))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Batch exceeds', response.get_json()['error']['message'])
+        finally:
+            (app_module.DEX_BATCH_MAX_FILES, app_module.DEX_MAX_FILE_BYTES,
+             app_module.DEX_BATCH_MAX_BYTES) = original
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import unittest
+import sqlite3
+import os
+import sys
+import time
+import shutil
+import tempfile
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.knowledge_base_service import KnowledgeBaseService, get_knowledge_base_service
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+ARTICLE = """---
+title: "{title}"
+category: "{category}"
+tags: [{tags}]
+difficulty: "Beginner"
+description: "{description}"
+---
+
+{body}
+"""
+
+
+class TestKnowledgeBaseIndex(unittest.TestCase):
+    """BM25 ranking, multi-term queries, stored snippet spans and incremental reindexing"""
+
+    def setUp(self):
+        """Create a content directory with three articles"""
+        self.content_dir = tempfile.mkdtemp()
+        self.write('dex-import', 'DEX Import', 'Feature Tutorials', '"dex"', 'Importing DEX files',
+                   'Upload a DEX file from the device. The parser reads each DEX record and stores sales.')
+        self.write('route-planning', 'Route Planning', 'Feature Tutorials', '"routes"', 'Planning driver routes',
+                   'Build a route for each driver. Route stops follow service orders for every device.')
+        self.write('backups', 'Database Backups', 'System Administration', '"database"', 'Backing up data',
+                   'Copy the database file nightly. ' + 'Retention keeps older copies for review. ' * 20)
+        self.service = KnowledgeBaseService(content_path=self.content_dir, db_path=':memory:')
+
+    def tearDown(self):
+        """Remove the content directory"""
+        shutil.rmtree(self.content_dir)
+
+    def write(self, name, title, category, tags, description, body):
+        """Write one markdown article"""
+        Path(self.content_dir, f'{name}.md').write_text(ARTICLE.format(
+            title=title, category=category, tags=tags, description=description, body=body))
+
+    def test_bm25_ranks_title_and_repeated_terms_first(self):
+        """Title and frequent matches outrank passing mentions; all terms contribute"""
+        results = self.service.search_articles('dex')
+        self.assertEqual([r['id'] for r in results], ['dex-import'])
+        self.assertEqual(results[0]['match_type'], 'title_and_description_and_tags_and_content')
+
+        results = self.service.search_articles('driver device')
+        self.assertEqual([r['id'] for r in results], ['route-planning', 'dex-import'])
+        self.assertGreater(results[0]['score'], results[1]['score'])
+
+        # The trailing term also matches words it prefixes
+        self.assertEqual([r['id'] for r in self.service.search_articles('database retent')], ['backups'])
+        self.assertEqual(self.service.search_articles('route', category='System Administration'), [])
+
+    def test_snippet_highlights_from_stored_spans(self):
+        """Snippets mark every matched term inside the window around the first match"""
+        snippet = self.service.search_articles('parser record')[0]['snippet']
+        self.assertIn('<mark>parser</mark> reads each DEX <mark>record</mark>', snippet)
+        self.assertTrue(snippet.startswith('DEX Import Upload'))
+
+        snippet = self.service.search_articles('retention')[0]['snippet']
+        self.assertTrue(snippet.endswith('...'))
+        self.assertEqual(snippet.count('<mark>'), snippet.count('</mark>'))
+
+    def test_only_changed_articles_are_reindexed(self):
+        """A rescan reindexes edited files, drops deleted ones and keeps the rest"""
+        self.service.scan_articles()
+        self.assertEqual(self.service.index.get_stats()['indexed'], 3)
+
+        time.sleep(0.01)
+        self.write('dex-import', 'DEX Import', 'Feature Tutorials', '"dex"', 'Importing DEX files',
+                   'Telemetry uploads replace manual imports.')
+        os.unlink(os.path.join(self.content_dir, 'backups.md'))
+        self.service.scan_articles(force_refresh=True)
+
+        stats = self.service.index.get_stats()
+        self.assertEqual((stats['documents'], stats['indexed'], stats['removed'], stats['unchanged']), (2, 4, 1, 1))
+        self.assertEqual([r['id'] for r in self.service.search_articles('telemetry')], ['dex-import'])
+        self.assertEqual(self.service.search_articles('parser'), [])
+        self.assertEqual(self.service.search_articles('database'), [])
+
+    def test_shared_service_keeps_index_between_calls(self):
+        """Request handlers get the same instance for a content directory"""
+        first = get_knowledge_base_service(self.content_dir, ':memory:')
+        self.assertIs(get_knowledge_base_service(self.content_dir, ':memory:'), first)
+        self.assertIsNot(get_knowledge_base_service(self.content_dir, 'other.db'), first)
+
+
+
+class TestKnowledgeBaseRescan(unittest.TestCase):
+    """Incremental rescans, database cache deltas and the file watcher"""
+
+    def setUp(self):
+        """Create a content directory and a database with the article cache table"""
+        self.content_dir = tempfile.mkdtemp()
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        db = sqlite3.connect(self.db_path)
+        with open(os.path.join(MIGRATIONS_DIR, '20250806_knowledge_base_schema.sql')) as f:
+            # The rest of the migration touches tables owned by init_db
+            for statement in f.read().split(';'):
+                if 'CREATE TABLE IF NOT EXISTS knowledge_base_articles' in statement:
+                    db.execute(statement)
+        db.close()
+        for name in ('alpha', 'beta', 'gamma'):
+            self.write(name, f'{name.title()} article body.')
+        self.service = KnowledgeBaseService(content_path=self.content_dir, db_path=self.db_path)
+
+    def tearDown(self):
+        """Stop the watcher and remove the files"""
+        self.service.stop_watcher()
+        shutil.rmtree(self.content_dir)
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def write(self, name, body):
+        """Write one markdown article"""
+        Path(self.content_dir, f'{name}.md').write_text(ARTICLE.format(
+            title=name.title(), category='Best Practices', tags='', description='', body=body))
+
+    def stored(self):
+        """(id, last_indexed) rows in the database cache"""
+        db = sqlite3.connect(self.db_path)
+        rows = dict(db.execute('SELECT id, last_indexed FROM knowledge_base_articles').fetchall())
+        db.close()
+        return rows
+
+    def test_rescan_applies_only_deltas(self):
+        """Unchanged files are not reparsed or rewritten; edits, touches and deletes are handled"""
+        self.service.scan_articles()
+        before = self.stored()
+        self.assertEqual(sorted(before), ['alpha', 'beta', 'gamma'])
+
+        time.sleep(0.01)
+        self.write('alpha', 'Alpha article body, revised.')
+        Path(self.content_dir, 'beta.md').touch()
+        os.unlink(os.path.join(self.content_dir, 'gamma.md'))
+        self.write('delta', 'Delta article body.')
+        articles = self.service.scan_articles(force_refresh=True)
+
+        self.assertEqual([a['id'] for a in articles], ['alpha', 'beta', 'delta'])
+        self.assertIn('revised', articles[0]['content'])
+        stats = self.service.scan_stats
+        self.assertEqual((stats['files_reparsed'], stats['files_removed']), (5, 1))
+        self.assertEqual((stats['db_upserts'], stats['db_deletes']), (5, 1))
+
+        after = self.stored()
+        self.assertEqual(sorted(after), ['alpha', 'beta', 'delta'])
+        self.assertEqual(after['beta'], before['beta'])
+        self.assertNotEqual(after['alpha'], before['alpha'])
+
+        # A new process only rewrites rows whose hash differs
+        restarted = KnowledgeBaseService(content_path=self.content_dir, db_path=self.db_path)
+        restarted.scan_articles()
+        self.assertEqual(restarted.scan_stats['db_upserts'], 0)
+
+    def test_watcher_picks_up_changes(self):
+        """With the watcher running, reads use the cache and file changes appear without a request rescan"""
+        self.service.start_watcher(poll_interval=0.05)
+        self.assertTrue(self.service.is_watching())
+        scans = self.service.scan_stats['scans']
+        self.service.scan_articles()
+        self.assertEqual(self.service.scan_stats['scans'], scans)
+
+        self.write('epsilon', 'Watched article body.')
+        deadline = time.time() + 5
+        while time.time() < deadline and not self.service.search_articles('watched'):
+            time.sleep(0.05)
+        self.assertEqual([r['id'] for r in self.service.search_articles('watched')], ['epsilon'])
+
+        self.service.stop_watcher()
+        self.assertFalse(self.service.is_watching())
+
+
+if __name__ == '__main__':
+    unittest.main()
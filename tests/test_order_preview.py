@@ -0,0 +1,124 @@
+import unittest
+import sqlite3
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from app import app
+from slot_metrics_service import upsert_slot_metrics
+
+
+class TestOrderPreview(unittest.TestCase):
+    """POST /api/service-orders/preview batched engine and per-cabinet memoization"""
+
+    def setUp(self):
+        """Create a database with two devices, three cabinets and slot velocities"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.original_database = app_module.DATABASE
+        app_module.DATABASE = self.db_path
+        app.config['DATABASE'] = self.db_path
+        app.config['TESTING'] = True
+        app_module.init_db()
+        app_module.order_preview_engine.clear()
+        self.client = app.test_client()
+
+        db = sqlite3.connect(self.db_path)
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO device_types (id, name, description, allows_additional_cabinets) VALUES (1, 'Cooler', 'Cooler', 1)")
+        cursor.execute("INSERT INTO cabinet_types (id, name, description, rows, cols, icon) VALUES (1, 'Cooler', 'Cooler', 2, 2, 'x')")
+        cursor.execute("INSERT INTO locations (id, name) VALUES (1, 'Depot')")
+        cursor.executemany("INSERT INTO products (id, name, category, price) VALUES (?, ?, 'Drinks', 1.0)",
+                           [(1, 'EMPTY'), (10, 'Cola'), (11, 'Water')])
+        cursor.execute("INSERT INTO devices (id, asset, cooler, model, device_type_id, location_id) VALUES (1, 'A1', 'c', 'm', 1, 1)")
+        cursor.execute("INSERT INTO devices (id, asset, cooler, model, device_type_id) VALUES (2, 'A2', 'c', 'm', 1)")
+
+        # slot tuples: (position, product_id, quantity, par_level, daily_velocity or None)
+        cabinets = {
+            (1, 0): [('A1', 10, 2, 8, 0.5), ('A2', 10, 5, 6, 0.25), ('A3', 11, 0, 4, None), ('A4', 1, 0, 5, None)],
+            (1, 1): [('A1', 11, 3, 3, None)],
+            (2, 0): [('A1', 11, 1, 4, 2.0)],
+        }
+        self.slot_ids = {}
+        for (device_id, cabinet_index), slots in cabinets.items():
+            cursor.execute("INSERT INTO cabinet_configurations (device_id, cabinet_type_id, model_name, cabinet_index, rows, columns) VALUES (?, 1, 'Cooler', ?, 2, 2)",
+                           (device_id, cabinet_index))
+            cabinet_id = cursor.lastrowid
+            cursor.execute("INSERT INTO planograms (cabinet_id, planogram_key) VALUES (?, ?)",
+                           (cabinet_id, f'{device_id}_{cabinet_index}'))
+            planogram_id = cursor.lastrowid
+            for position, product_id, quantity, par_level, velocity in slots:
+                cursor.execute("""INSERT INTO planogram_slots
+                    (planogram_id, slot_position, product_id, quantity, capacity, par_level)
+                    VALUES (?, ?, ?, ?, 10, ?)""", (planogram_id, position, product_id, quantity, par_level))
+                self.slot_ids[(device_id, cabinet_index, position)] = cursor.lastrowid
+                if velocity is not None:
+                    cursor.execute("INSERT INTO slot_metrics (planogram_slot_id, daily_velocity) VALUES (?, ?)",
+                                   (cursor.lastrowid, velocity))
+        db.commit()
+        db.close()
+
+        self.request = {
+            'routeId': 1,
+            'serviceDate': (datetime.now().date() + timedelta(days=2)).isoformat(),
+            'cabinetSelections': [{'deviceId': 2, 'cabinetIndex': 0}, {'deviceId': 1, 'cabinetIndex': 0},
+                                  {'deviceId': 1, 'cabinetIndex': 1}, {'deviceId': 1, 'cabinetIndex': 7}]
+        }
+
+    def tearDown(self):
+        """Restore database configuration and remove the temp file"""
+        app_module.DATABASE = self.original_database
+        app.config['DATABASE'] = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def preview(self):
+        """POST the preview request and return the JSON body"""
+        response = self.client.post('/api/service-orders/preview', json=self.request)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_preview_orders_by_velocity_and_par(self):
+        """Order quantities add expected sales to units to par; empty cabinets are dropped"""
+        data = self.preview()
+        self.assertEqual([device['deviceId'] for device in data['devices']], [2, 1])
+
+        device_2, device_1 = data['devices']
+        # Water in device 2: 3 to par + 2.0/day * 2 days
+        self.assertEqual(device_2['cabinets'][0]['products'][0]['orderQuantity'], 7)
+        self.assertEqual(device_1['location'], 'Depot')
+        self.assertEqual([cabinet['cabinetIndex'] for cabinet in device_1['cabinets']], [0])
+
+        products = {p['productId']: p for p in device_1['cabinets'][0]['products']}
+        # Cola: (14 - 7) to par + 0.75/day * 2 days = 8.5, rounded half to even
+        self.assertEqual(products[10]['orderQuantity'], 8)
+        self.assertEqual(products[10]['dailyVelocity'], 0.75)
+        self.assertEqual(products[11]['orderQuantity'], 4)
+        self.assertEqual(data['totalUnits'], 19)
+        self.assertEqual(data['totalProducts'], 2)
+
+    def test_memo_invalidates_on_planogram_and_metric_changes(self):
+        """Unchanged cabinets are served from the memo; edits and recalculations reload them"""
+        first = self.preview()
+        self.assertEqual(app_module.order_preview_engine.get_stats()['misses'], 3)
+
+        self.assertEqual(self.preview(), first)
+        self.assertEqual(app_module.order_preview_engine.get_stats()['hits'], 3)
+
+        db = sqlite3.connect(self.db_path)
+        db.execute("UPDATE planogram_slots SET quantity = 4 WHERE id = ?", (self.slot_ids[(2, 0, 'A1')],))
+        upsert_slot_metrics(db.cursor(), [(self.slot_ids[(1, 1, 'A1')], 0, 0, 0, 0, 0, 0, 0, 0.0)])
+        db.commit()
+        db.close()
+
+        data = self.preview()
+        stats = app_module.order_preview_engine.get_stats()
+        self.assertEqual(stats['hits'], 4)
+        self.assertEqual(stats['misses'], 5)
+        # 0 to par + 2.0/day * 2 days
+        self.assertEqual(data['devices'][0]['cabinets'][0]['products'][0]['orderQuantity'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
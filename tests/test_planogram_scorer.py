@@ -0,0 +1,81 @@
+import unittest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_services.base.client import AIClient
+from ai_services.base.exceptions import ValidationError
+from ai_services.core.scoring import PlanogramScorer
+from ai_services.pipelines.cache import CacheManager
+
+
+def build_planogram(rows=6, columns=8):
+    """Grid of slots, roughly half filled with beverages, snacks and candy"""
+    slots = []
+    for row in range(rows):
+        for column in range(columns):
+            product = (row * 3 + column * 5) % 14
+            slots.append({"row": row, "column": column, "product_id": product if product <= 12 else None})
+    return {"slots": slots}
+
+
+class TestPlanogramScoreGrid(unittest.TestCase):
+    """Whole-grid scoring and its per-instance memoization"""
+
+    def setUp(self):
+        """Create a scorer without an API key or persistent cache tiers"""
+        self.scorer = PlanogramScorer(
+            ai_client=AIClient(api_key=None),
+            cache_manager=CacheManager(enable_l2=False, enable_l3=False)
+        )
+        self.scorer.ai_client.fallback_mode = True
+        self.planogram = build_planogram()
+
+    def test_grid_matches_single_placement_scores(self):
+        """Every cell equals score_placement at that slot"""
+        for product_id in (2, 6, 10, 13):
+            grid = self.scorer.score_grid(self.planogram, product_id)
+            self.assertEqual((grid["rows"], grid["columns"]), (6, 8))
+            for slot in self.planogram["slots"]:
+                single = self.scorer.score_placement(
+                    self.planogram, product_id, {"row": slot["row"], "column": slot["column"]})
+                self.assertEqual(grid["scores"][slot["row"]][slot["column"]], single["score"])
+                self.assertEqual(grid["components"]["affinity_score"][slot["row"]][slot["column"]],
+                                 single["components"]["affinity_score"])
+
+            empty = [(s["row"], s["column"]) for s in self.planogram["slots"] if not s["product_id"]]
+            self.assertEqual(sorted((s["row"], s["column"]) for s in grid["empty_slots"]), sorted(empty))
+            self.assertEqual(grid["best_slot"]["score"], max(s["score"] for s in grid["empty_slots"]))
+
+    def test_missing_positions_are_none(self):
+        """Positions without a slot have no score"""
+        planogram = {"slots": [{"row": 0, "column": 0, "product_id": 1}, {"row": 2, "column": 1, "product_id": None}]}
+        grid = self.scorer.score_grid(planogram, 3)
+        self.assertIsNone(grid["scores"][1][1])
+        self.assertEqual([(s["row"], s["column"]) for s in grid["empty_slots"]], [(2, 1)])
+
+        with self.assertRaises(ValidationError):
+            self.scorer.score_grid({"slots": []}, 3)
+
+    def test_memoized_on_planogram_content(self):
+        """Equal planogram content hits the cache; a changed slot misses"""
+        first = self.scorer.score_grid(self.planogram, 6)
+        self.assertIs(self.scorer.score_grid(build_planogram(), 6), first)
+
+        changed = build_planogram()
+        changed["slots"][0]["product_id"] = 7
+        self.assertIsNot(self.scorer.score_grid(changed, 6), first)
+        self.scorer.score_grid(self.planogram, 2)
+
+        stats = self.scorer.get_grid_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 3, 3))
+
+        # score_placement is cached in the scorer's own cache manager
+        position = {"row": 1, "column": 1}
+        self.scorer.score_placement(self.planogram, 6, position)
+        hits = sum(self.scorer.cache_manager.hits.values())
+        self.scorer.score_placement(self.planogram, 6, position)
+        self.assertEqual(sum(self.scorer.cache_manager.hits.values()), hits + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
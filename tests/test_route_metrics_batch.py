@@ -0,0 +1,290 @@
+import unittest
+import sqlite3
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from app import app, RouteMetricsService
+from slot_metrics_service import SlotMetricsWorker, reconcile_slot_metrics, record_sales, mark_dirty
+
+
+class RouteMetricsTestCase(unittest.TestCase):
+    """Shared fixture: one route with three devices, slots and recent sales"""
+
+    def setUp(self):
+        """Create a schema-complete database with three seeded devices"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.original_database = app_module.DATABASE
+        app_module.DATABASE = self.db_path
+        app.config['DATABASE'] = self.db_path
+        app.config['TESTING'] = True
+        app_module.init_db()
+        self.client = app.test_client()
+
+        db = sqlite3.connect(self.db_path)
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO device_types (id, name, description, allows_additional_cabinets) VALUES (1, 'Cooler', 'Cooler', 1)")
+        cursor.execute("INSERT INTO cabinet_types (id, name, description, rows, cols, icon) VALUES (1, 'Cooler', 'Cooler', 2, 2, 'x')")
+        cursor.execute("INSERT INTO routes (id, name) VALUES (1, 'Route 1')")
+        cursor.executemany("INSERT INTO products (id, name, category, price) VALUES (?, ?, 'Drinks', 1.0)",
+                           [(1, 'EMPTY'), (10, 'Cola'), (11, 'Water')])
+
+        # Device 1: two cabinets with sales; device 2: slots but no sales; device 3: nothing
+        for device_id in (1, 2, 3):
+            cursor.execute("INSERT INTO devices (id, asset, cooler, model, device_type_id, route_id) VALUES (?, ?, 'c', 'm', 1, 1)",
+                           (device_id, f'A{device_id}'))
+        slots = {
+            (1, 0): [('A1', 10, 0, 10, 8), ('A2', 11, 4, 10, 8), ('B1', 1, 0, 0, 0)],
+            (1, 1): [('A1', 10, 6, 10, 8)],
+            (2, 0): [('A1', 11, 2, 4, 4), ('A2', 10, 0, 0, 0)],
+        }
+        for (device_id, cabinet_index), cabinet_slots in slots.items():
+            cursor.execute("INSERT INTO cabinet_configurations (device_id, cabinet_type_id, cabinet_index, rows, columns) VALUES (?, 1, ?, 2, 2)",
+                           (device_id, cabinet_index))
+            cabinet_id = cursor.lastrowid
+            cursor.execute("INSERT INTO planograms (cabinet_id, planogram_key) VALUES (?, ?)",
+                           (cabinet_id, f'{device_id}_{cabinet_index}'))
+            planogram_id = cursor.lastrowid
+            cursor.executemany("""INSERT INTO planogram_slots
+                (planogram_id, slot_position, product_id, quantity, capacity, par_level)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                [(planogram_id,) + slot for slot in cabinet_slots])
+
+        cursor.executemany("INSERT INTO sales (device_id, product_id, sale_units, sale_cash, created_at) VALUES (?, ?, ?, 1.0, datetime('now', ?))",
+                           [(1, 10, 4, '-1 days'), (1, 10, 2, '-2 days'), (1, 11, 3, '-3 days'), (1, 11, 5, '-60 days')])
+        cursor.execute("INSERT INTO service_visits (device_id, service_date, service_type) VALUES (1, datetime('now', '-3 days'), 'routine')")
+        db.commit()
+        db.close()
+
+    def tearDown(self):
+        """Restore database configuration and remove the temp file"""
+        app_module.DATABASE = self.original_database
+        app.config['DATABASE'] = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def slot_metrics(self):
+        """Return {(device_id, cabinet_index, slot_position): slot_metrics row}"""
+        db = sqlite3.connect(self.db_path)
+        db.row_factory = sqlite3.Row
+        rows = db.execute('''
+            SELECT cc.device_id, cc.cabinet_index, ps.slot_position, sm.*
+            FROM slot_metrics sm
+            JOIN planogram_slots ps ON sm.planogram_slot_id = ps.id
+            JOIN planograms p ON ps.planogram_id = p.id
+            JOIN cabinet_configurations cc ON p.cabinet_id = cc.id
+        ''').fetchall()
+        db.close()
+        return {(row['device_id'], row['cabinet_index'], row['slot_position']): row for row in rows}
+
+
+class TestRouteMetricsBatch(RouteMetricsTestCase):
+    """Batch device metrics must match the per-device calculations"""
+
+    def test_batch_matches_per_device_metrics(self):
+        """Each batched metric equals the single-device query result"""
+        with app.app_context():
+            batch = RouteMetricsService.calculate_batch_device_metrics([1, 2, 3])
+            self.assertEqual(set(batch), {1, 2, 3})
+            for device_id in (1, 2, 3):
+                metrics = batch[device_id]
+                self.assertEqual(metrics['soldOutCount'], RouteMetricsService.calculate_sold_out_count(device_id))
+                self.assertEqual(metrics['unitsToPar'], RouteMetricsService.calculate_units_to_par(device_id))
+                self.assertEqual(metrics['productLevelPercent'], RouteMetricsService.calculate_product_level(device_id))
+                self.assertEqual(metrics['daysRemainingInventory'],
+                                 RouteMetricsService.calculate_days_remaining_inventory(device_id))
+                self.assertEqual(metrics['dataCollectionRate'], 100.0)
+
+    def test_batch_writes_all_device_metrics_rows(self):
+        """All computed devices are upserted into device_metrics"""
+        with app.app_context():
+            RouteMetricsService.calculate_batch_device_metrics([1, 2, 3])
+            RouteMetricsService.calculate_batch_device_metrics([1, 2])
+            cached = RouteMetricsService.get_cached_device_metrics([1, 2, 3])
+        self.assertEqual(set(cached), {1, 2, 3})
+        self.assertEqual(cached[1]['soldOutCount'], 1)
+
+    def test_batch_endpoint_uses_cache_after_first_call(self):
+        """The batch endpoint recalculates stale devices then serves them from cache"""
+        response = self.client.post('/api/devices/metrics/batch', json={'deviceIds': [1, 2]})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertFalse(data['1']['cached'])
+        self.assertEqual(data['1']['daysSinceService'], 3.0)
+        self.assertIsNone(data['2']['daysSinceService'])
+
+        response = self.client.post('/api/devices/metrics/batch', json={'deviceIds': [1, 2]})
+        data = response.get_json()
+        self.assertTrue(data['1']['cached'])
+        self.assertTrue(data['2']['cached'])
+
+    def test_batch_endpoint_normalizes_device_ids(self):
+        """String ids resolve to the same devices; non-integer ids are rejected"""
+        response = self.client.post('/api/devices/metrics/batch', json={'deviceIds': ['1', 2, '2']})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(set(data), {'1', '2'})
+        self.assertEqual(data['1']['soldOutCount'], 1)
+
+        for bad in (['abc'], [None], [1.5], [True]):
+            response = self.client.post('/api/devices/metrics/batch', json={'deviceIds': bad})
+            self.assertEqual(response.status_code, 400)
+
+    def test_route_devices_groups_route_wide_queries(self):
+        """Route devices carry their own cabinets, metrics and service age"""
+        response = self.client.get('/api/routes/1/devices')
+        self.assertEqual(response.status_code, 200)
+        devices = {device['id']: device for device in response.get_json()['devices']}
+        self.assertEqual(set(devices), {1, 2, 3})
+
+        self.assertEqual([cab['cabinetIndex'] for cab in devices[1]['cabinetConfiguration']], [0, 1])
+        self.assertEqual(devices[3]['cabinetConfiguration'], [])
+        self.assertEqual(devices[1]['metrics']['soldOutCount'], 1)
+        self.assertEqual(devices[1]['metrics']['daysSinceService'], 3.0)
+        self.assertIsNone(devices[2]['metrics']['daysSinceService'])
+        self.assertNotIn('stale', devices[1]['metrics'])
+
+    def test_route_devices_without_recalculation_flags_stale_metrics(self):
+        """recalculate=false serves whatever is cached and never writes metrics"""
+        with app.app_context():
+            RouteMetricsService.calculate_batch_device_metrics([1])
+        db = sqlite3.connect(self.db_path)
+        db.execute("UPDATE device_metrics SET last_calculated = datetime('now', '-1 hour')")
+        db.commit()
+        db.close()
+
+        response = self.client.get('/api/routes/1/devices?recalculate=false')
+        devices = {device['id']: device for device in response.get_json()['devices']}
+        self.assertTrue(devices[1]['metrics']['stale'])
+        self.assertEqual(devices[1]['metrics']['soldOutCount'], 1)
+        self.assertTrue(devices[2]['metrics']['stale'])
+
+        db = sqlite3.connect(self.db_path)
+        count = db.execute("SELECT COUNT(*) FROM device_metrics").fetchone()[0]
+        db.close()
+        self.assertEqual(count, 1)
+
+
+class TestSlotMetricsRecalculation(RouteMetricsTestCase):
+    """POST /api/metrics/calculate grouped aggregation and vectorized metrics"""
+
+    def test_calculate_reports_throughput(self):
+        """Every slot is written once and timing is reported"""
+        response = self.client.post('/api/metrics/calculate')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['processed'], 6)
+        self.assertIn('elapsedSeconds', data)
+        self.assertIn('rowsPerSecond', data)
+        self.assertEqual(len(self.slot_metrics()), 6)
+
+    def test_velocity_windows_and_dri(self):
+        """28-day, historical and default velocities feed DRI per slot"""
+        db = sqlite3.connect(self.db_path)
+        db.execute("INSERT INTO sales (device_id, product_id, sale_units, sale_cash, created_at) VALUES (2, 11, 14, 1.0, datetime('now', '-56 days'))")
+        db.commit()
+        db.close()
+
+        self.client.post('/api/metrics/calculate')
+        metrics = self.slot_metrics()
+
+        # 28-day window: 3 units in 28 days, 4 on hand
+        recent = metrics[(1, 0, 'A2')]
+        self.assertAlmostEqual(recent['daily_velocity'], 3 / 28.0)
+        self.assertEqual(recent['days_remaining_inventory'], 37)
+        self.assertEqual(recent['sales_28_day'], 3)
+        self.assertEqual(recent['sales_all_time'], 8)
+        self.assertEqual(recent['days_with_sales'], 2)
+        self.assertEqual(recent['product_level_percent'], 40)
+        self.assertEqual(recent['units_to_par'], 6)
+
+        # Historical average only: 14 units over 56 days, 2 on hand
+        historical = metrics[(2, 0, 'A1')]
+        self.assertAlmostEqual(historical['daily_velocity'], 0.25, places=3)
+        self.assertEqual(historical['days_remaining_inventory'], 8)
+        self.assertEqual(historical['sales_28_day'], 0)
+
+        # Sold out slot without capacity
+        sold_out = metrics[(2, 0, 'A2')]
+        self.assertEqual(sold_out['is_sold_out'], 1)
+        self.assertEqual(sold_out['days_remaining_inventory'], 0)
+        self.assertEqual(sold_out['product_level_percent'], 0)
+        self.assertEqual(sold_out['daily_velocity'], 0.1)
+
+
+
+class TestIncrementalSlotMetrics(RouteMetricsTestCase):
+    """Sales inserts mark slots dirty and refresh them from the daily counters"""
+
+    def connect(self):
+        """Open a Row-factory connection to the test database"""
+        db = sqlite3.connect(self.db_path)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def metric_values(self):
+        """slot_metrics rows without timestamps, for comparing refresh paths"""
+        return {key: tuple(row)[4:-2] for key, row in self.slot_metrics().items()}
+
+    def test_post_sale_refreshes_touched_slots_inline(self):
+        """Without a running worker, POST /api/sales refreshes its slots before returning"""
+        db = self.connect()
+        reconcile_slot_metrics(db.cursor())
+        db.commit()
+        db.close()
+        before = self.slot_metrics()[(2, 0, 'A1')]['sales_all_time']
+
+        response = self.client.post('/api/sales', json={
+            'deviceId': 2, 'productId': 11, 'saleUnits': 3, 'saleCash': 3.0
+        })
+        self.assertEqual(response.status_code, 201)
+
+        after = self.slot_metrics()[(2, 0, 'A1')]
+        self.assertEqual(after['sales_all_time'], before + 3)
+        self.assertEqual(after['sales_28_day'], 3)
+        db = self.connect()
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM slot_metrics_dirty').fetchone()[0], 0)
+        db.close()
+
+    def test_inline_refresh_leaves_other_dirty_pairs(self):
+        """The request refreshes only the pairs it marked; the rest stay for the worker"""
+        db = self.connect()
+        reconcile_slot_metrics(db.cursor())
+        mark_dirty(db.cursor(), [(1, 10), (1, 11)])
+        db.commit()
+        db.close()
+
+        response = self.client.post('/api/sales', json={
+            'deviceId': 2, 'productId': 11, 'saleUnits': 1, 'saleCash': 1.0
+        })
+        self.assertEqual(response.status_code, 201)
+
+        db = self.connect()
+        remaining = db.execute('SELECT device_id, product_id FROM slot_metrics_dirty ORDER BY product_id').fetchall()
+        db.close()
+        self.assertEqual([tuple(row) for row in remaining], [(1, 10), (1, 11)])
+        self.assertEqual(self.slot_metrics()[(2, 0, 'A1')]['sales_28_day'], 1)
+
+    def test_incremental_refresh_matches_reconciliation(self):
+        """Counter-based refresh produces the same metrics as a full rescan"""
+        db = self.connect()
+        reconcile_slot_metrics(db.cursor())
+        record_sales(db.cursor(), [(1, 10, 5, None), (1, 11, 2, None)])
+        db.execute("INSERT INTO sales (device_id, product_id, sale_units, sale_cash) VALUES (1, 10, 5, 5.0), (1, 11, 2, 2.0)")
+        db.commit()
+
+        worker = SlotMetricsWorker(self.db_path, reconcile_interval=None)
+        worker.run_once(db)
+        self.assertEqual(worker.get_stats()['pairs_processed'], 2)
+        self.assertEqual(worker.get_stats()['rows_written'], 3)
+        incremental = self.metric_values()
+
+        reconcile_slot_metrics(db.cursor())
+        db.commit()
+        db.close()
+        self.assertEqual(incremental, self.metric_values())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import sqlite3
+import os
+import sys
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from security_monitor import SecurityMonitor, SlidingWindowCounter
+
+
+class TestSlidingWindowCounter(unittest.TestCase):
+    """Bucketed sliding window counts"""
+
+    def test_counts_expire_with_window(self):
+        """Events leave the count once their bucket falls out of the window"""
+        counter = SlidingWindowCounter(window_seconds=60, buckets=6)
+        counter.add(1000)
+        counter.add(1015)
+        counter.add(1035)
+        self.assertEqual(counter.count(1040), 3)
+        self.assertEqual(counter.count(1065), 2)
+        self.assertEqual(counter.count(1085), 1)
+        self.assertEqual(counter.count(5000), 0)
+
+        counter.add(5000)
+        self.assertEqual(counter.count(5001), 1)
+
+    def test_subtract_removes_matching_buckets(self):
+        """A per-IP counter can be removed from the shard total"""
+        total = SlidingWindowCounter(window_seconds=60, buckets=6)
+        ip = SlidingWindowCounter(window_seconds=60, buckets=6)
+        for now in (1000, 1010, 1020):
+            total.add(now)
+            ip.add(now)
+        total.add(1025)
+        total.subtract(ip, 1030)
+        self.assertEqual(total.count(1030), 1)
+
+
+class TestSecurityMonitorBruteForce(unittest.TestCase):
+    """Sharded login windows, distributed totals and the in-memory block set"""
+
+    def setUp(self):
+        """Create a monitor against an empty database"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.monitor = SecurityMonitor(self.db_path, None)
+
+    def tearDown(self):
+        """Remove the database file"""
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def block_rows(self):
+        """Rows in ip_blocks"""
+        db = sqlite3.connect(self.db_path)
+        rows = db.execute('SELECT ip_address FROM ip_blocks').fetchall()
+        db.close()
+        return rows
+
+    def test_block_after_threshold_persisted_once(self):
+        """The fifth failure blocks the IP; later failures do not add rows"""
+        results = [self.monitor.check_brute_force('10.0.0.1', user_id=7) for _ in range(7)]
+        self.assertEqual([blocked for blocked, _, _ in results], [False] * 4 + [True] * 3)
+
+        _, should_alert, details = results[4]
+        self.assertTrue(should_alert)
+        self.assertEqual((details['attempt_count'], details['user_targets']), (5, [7]))
+        self.assertTrue(self.monitor.is_ip_blocked('10.0.0.1'))
+        self.assertFalse(self.monitor.is_ip_blocked('10.0.0.2'))
+        self.assertEqual(self.block_rows(), [('10.0.0.1',)])
+
+        # A new process loads active blocks at startup
+        restarted = SecurityMonitor(self.db_path, None)
+        self.assertTrue(restarted.is_ip_blocked('10.0.0.1'))
+
+        self.monitor.unblock_ip('10.0.0.1')
+        self.assertFalse(self.monitor.is_ip_blocked('10.0.0.1'))
+
+    def test_admin_unblock_holds_on_non_utc_host(self):
+        """Blocks are stored in UTC, so the SQL unblock used by the admin endpoint sticks"""
+        original_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'America/New_York'
+        time.tzset()
+        try:
+            for _ in range(5):
+                self.monitor.check_brute_force('10.0.0.9')
+            db = sqlite3.connect(self.db_path)
+            active = db.execute("SELECT COUNT(*) FROM ip_blocks WHERE expires_at > datetime('now')").fetchone()[0]
+            lifted = db.execute("""
+                UPDATE ip_blocks SET expires_at = datetime('now')
+                WHERE ip_address = ? AND expires_at > datetime('now')
+            """, ('10.0.0.9',)).rowcount
+            db.commit()
+            db.close()
+            self.assertEqual((active, lifted), (1, 1))
+
+            self.monitor.unblock_ip('10.0.0.9')
+            self.monitor._load_ip_blocks()
+            self.assertFalse(self.monitor.is_ip_blocked('10.0.0.9'))
+        finally:
+            if original_tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = original_tz
+            time.tzset()
+
+    def test_distributed_total_across_shards(self):
+        """Failures from many IPs count toward the distributed threshold; success clears an IP"""
+        for i in range(8):
+            self.monitor.check_brute_force(f'192.0.2.{i}')
+        self.monitor.check_brute_force('198.51.100.1')
+        self.monitor.check_brute_force('198.51.100.1')
+        _, should_alert, details = self.monitor.check_brute_force('198.51.100.1')
+
+        self.assertTrue(should_alert)
+        self.assertEqual(details['total_failed_attempts'], 11)
+        self.assertTrue(details['is_distributed'])
+        self.assertEqual(details['severity'], 'critical')
+
+        self.monitor.check_brute_force('198.51.100.1', success=True)
+        self.assertEqual(self.monitor._total_failed(time.time()), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_services.llm_integration_pipeline import SemanticCache
+
+PLANOGRAM_PROMPT = """<context>
+Generated at {stamp}. Device 42 in a refrigerated USI Alpine 5000 cabinet.
+</context>
+<slots>
+A1 Coca-Cola quantity 8 capacity 10 revenue 12.50
+A2 Pepsi quantity 3 capacity 10 revenue 9.25
+B1 Sprite quantity 6 capacity 10 revenue 7.75
+B2 Water quantity 10 capacity 10 revenue 4.00
+C1 {product} quantity 5 capacity 10 revenue 6.10
+</slots>
+<task>Score this planogram from 0 to 100 and list the three most valuable changes.</task>"""
+
+
+class TestSemanticCache(unittest.TestCase):
+    """Full-prompt keys, indexed expiry and MinHash near-duplicate lookups"""
+
+    def setUp(self):
+        """Create a cache in a temporary directory"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = SemanticCache(cache_dir=self.cache_dir, near_duplicates=True)
+
+    def tearDown(self):
+        """Close the cache and remove its directory"""
+        self.cache.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_keys_cover_the_full_prompt(self):
+        """Prompts sharing their first 1000 characters no longer collide"""
+        exact = SemanticCache(cache_dir=self.cache_dir)
+        prefix = 'x' * 1000
+        exact.set(prefix + ' device 1', 'model-a', {'score': 1})
+        exact.set(prefix + ' device 2', 'model-a', {'score': 2})
+
+        self.assertEqual(exact.get(prefix + ' device 1', 'model-a')['response'], {'score': 1})
+        self.assertEqual(exact.get(prefix + ' device 2', 'model-a')['response'], {'score': 2})
+        self.assertIsNone(exact.get(prefix + ' device 1', 'model-b'))
+        self.assertIsNone(exact.get(prefix + ' device 3', 'model-a'))
+        self.assertEqual(exact.get_stats()['entries'], 2)
+        exact.close()
+
+    def test_prompts_differing_in_timestamps_reuse_responses(self):
+        """Timestamps are normalized away; edited content only matches under a lower threshold"""
+        first = PLANOGRAM_PROMPT.format(stamp='2025-08-06T09:15:02Z', product='Lemonade')
+        self.cache.set(first, 'model-a', {'score': 82})
+
+        later = PLANOGRAM_PROMPT.format(stamp='2025-08-07 14:40:11', product='Lemonade')
+        hit = self.cache.get(later, 'model-a')
+        self.assertEqual(hit['response'], {'score': 82})
+        self.assertEqual((hit['match'], hit['similarity']), ('normalized', 1.0))
+        self.assertIsNone(self.cache.get(later, 'model-b'))
+
+        unrelated = 'Forecast weekly demand for snack products at the airport location ' * 3
+        self.assertIsNone(self.cache.get(unrelated, 'model-a'))
+
+        self.assertEqual(self.cache.get(first, 'model-a')['match'], 'exact')
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['exact_hits'], stats['normalized_hits'], stats['misses']), (1, 1, 2))
+
+        # Shingle similarity catches small edits once the threshold allows them
+        reworded = PLANOGRAM_PROMPT.format(stamp='', product='Lemonade').replace('three', '3')
+        changed = PLANOGRAM_PROMPT.format(stamp='2025-08-07', product='Iced Tea')
+        self.assertIsNone(self.cache.get(reworded, 'model-a'))
+        self.assertIsNone(self.cache.get(changed, 'model-a'))
+        self.cache.similarity_threshold = 0.8
+        hit = self.cache.get(reworded, 'model-a')
+        self.assertEqual(hit['match'], 'similar')
+        self.assertLess(hit['similarity'], 1.0)
+        self.assertEqual(self.cache.get(changed, 'model-a')['response'], {'score': 82})
+
+    def test_expired_entries_are_ignored_and_removed(self):
+        """Expiry is a range delete on the indexed expires_at column"""
+        self.cache.set('keep me', 'model-a', {'v': 1})
+        self.cache.set('drop me', 'model-a', {'v': 2})
+        self.cache.conn.execute("UPDATE llm_cache SET expires_at = ? WHERE prompt = 'drop me'", (time.time() - 1,))
+        self.cache.conn.commit()
+
+        self.assertIsNone(self.cache.get('drop me', 'model-a'))
+        self.assertEqual(self.cache.clear_expired(), 1)
+        self.assertEqual(self.cache.get_stats()['entries'], 1)
+        bands = self.cache.conn.execute("SELECT COUNT(DISTINCT cache_key) FROM llm_cache_bands").fetchone()[0]
+        self.assertEqual(bands, 1)
+
+        plan = ' '.join(row[-1] for row in self.cache.conn.execute(
+            "EXPLAIN QUERY PLAN DELETE FROM llm_cache WHERE expires_at <= 0"))
+        self.assertIn('idx_llm_cache_expires', plan)
+
+        # Entries survive a restart
+        self.cache.close()
+        self.cache = SemanticCache(cache_dir=self.cache_dir, near_duplicates=True)
+        self.assertEqual(self.cache.get('keep me', 'model-a')['response'], {'v': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
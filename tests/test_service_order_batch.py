@@ -0,0 +1,119 @@
+import unittest
+import sqlite3
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from app import app, ServiceOrderService
+
+
+class TestServiceOrderBatch(unittest.TestCase):
+    """Set-based cabinet resolution, pick list and item inserts for service orders"""
+
+    def setUp(self):
+        """Create a database with two devices and three stocked cabinets"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.original_database = app_module.DATABASE
+        app_module.DATABASE = self.db_path
+        app.config['DATABASE'] = self.db_path
+        app.config['TESTING'] = True
+        app_module.init_db()
+
+        db = sqlite3.connect(self.db_path)
+        cursor = db.cursor()
+        # Deployed databases carry routes.driver_id, which init_db does not create
+        cursor.execute("ALTER TABLE routes ADD COLUMN driver_id INTEGER")
+        cursor.execute("INSERT INTO device_types (id, name, description, allows_additional_cabinets) VALUES (1, 'Cooler', 'Cooler', 1)")
+        cursor.execute("INSERT INTO cabinet_types (id, name, description, rows, cols, icon) VALUES (1, 'Cooler', 'Cooler', 2, 2, 'x')")
+        cursor.execute("INSERT INTO routes (id, name, driver_id) VALUES (1, 'Route 1', 7)")
+        cursor.executemany("INSERT INTO products (id, name, category, price) VALUES (?, ?, ?, 1.0)",
+                           [(1, 'EMPTY', 'None'), (10, 'Cola', 'Soda'), (11, 'Water', 'Drinks')])
+        for device_id in (1, 2):
+            cursor.execute("INSERT INTO devices (id, asset, cooler, model, device_type_id, route_id) VALUES (?, ?, 'c', 'm', 1, 1)",
+                           (device_id, f'A{device_id}'))
+
+        # slot tuples: (position, product_id, product_name, quantity, par_level)
+        cabinets = {
+            (1, 0): [('A1', 10, 'Cola', 2, 8), ('A2', 10, 'Cola', 5, 6), ('A3', 11, 'Water', 0, 4), ('A4', 1, 'EMPTY', 0, 5)],
+            (1, 1): [('A1', 11, 'Water', 1, 3), ('A2', 10, 'Cola', 9, 8)],
+            (2, 0): [('A1', 10, 'Cola', 0, 2)],
+        }
+        self.cabinet_ids = {}
+        for (device_id, cabinet_index), slots in cabinets.items():
+            cursor.execute("INSERT INTO cabinet_configurations (device_id, cabinet_type_id, cabinet_index, rows, columns) VALUES (?, 1, ?, 2, 2)",
+                           (device_id, cabinet_index))
+            cabinet_id = cursor.lastrowid
+            self.cabinet_ids[(device_id, cabinet_index)] = cabinet_id
+            cursor.execute("INSERT INTO planograms (cabinet_id, planogram_key) VALUES (?, ?)",
+                           (cabinet_id, f'{device_id}_{cabinet_index}'))
+            planogram_id = cursor.lastrowid
+            cursor.executemany("""INSERT INTO planogram_slots
+                (planogram_id, slot_position, product_id, product_name, quantity, capacity, par_level)
+                VALUES (?, ?, ?, ?, ?, 10, ?)""",
+                [(planogram_id,) + slot for slot in slots])
+        db.commit()
+        db.close()
+
+    def tearDown(self):
+        """Restore database configuration and remove the temp file"""
+        app_module.DATABASE = self.original_database
+        app.config['DATABASE'] = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_pick_list_aggregates_selected_cabinets(self):
+        """Needs are summed per product across cabinets; missing cabinets are skipped"""
+        selections = [{'deviceId': 1, 'cabinetIndex': 0}, {'deviceId': 1, 'cabinetIndex': 1},
+                      {'deviceId': 2, 'cabinetIndex': 0}, {'deviceId': 2, 'cabinetIndex': 5}]
+        with app.app_context():
+            pick_list = ServiceOrderService.calculate_pick_list(selections)
+        self.assertEqual(pick_list, [
+            {'productId': 11, 'productName': 'Water', 'category': 'Drinks', 'quantity': 6},
+            {'productId': 10, 'productName': 'Cola', 'category': 'Soda', 'quantity': 9},
+        ])
+
+    def test_create_writes_cabinets_and_items(self):
+        """One cabinet row per selection and one item row per cabinet product"""
+        selections = [{'deviceId': 1, 'cabinetIndex': 0}, {'deviceId': 1, 'cabinetIndex': 1},
+                      {'deviceId': 2, 'cabinetIndex': 0}]
+        with app.app_context():
+            result = ServiceOrderService.create_service_order(1, selections, 'tester')
+        self.assertEqual(result['totalUnits'], 15)
+        self.assertEqual(result['estimatedMinutes'], 30)
+
+        db = sqlite3.connect(self.db_path)
+        order = db.execute('SELECT driver_id, total_units FROM service_orders WHERE id = ?',
+                           (result['orderId'],)).fetchone()
+        items = db.execute('''
+            SELECT soc.cabinet_configuration_id, i.product_id, i.quantity_needed
+            FROM service_order_cabinet_items i
+            JOIN service_order_cabinets soc ON i.service_order_cabinet_id = soc.id
+            WHERE soc.service_order_id = ?
+            ORDER BY 1, 2
+        ''', (result['orderId'],)).fetchall()
+        db.close()
+
+        self.assertEqual(order, (7, 15))
+        self.assertEqual(items, [
+            (self.cabinet_ids[(1, 0)], 10, 7),
+            (self.cabinet_ids[(1, 0)], 11, 4),
+            (self.cabinet_ids[(1, 1)], 11, 2),
+            (self.cabinet_ids[(2, 0)], 10, 2),
+        ])
+
+    def test_create_rejects_unknown_cabinet(self):
+        """An unknown cabinet fails the whole order without partial rows"""
+        selections = [{'deviceId': 1, 'cabinetIndex': 0}, {'deviceId': 2, 'cabinetIndex': 3}]
+        with app.app_context():
+            with self.assertRaises(ValueError):
+                ServiceOrderService.create_service_order(1, selections)
+
+        db = sqlite3.connect(self.db_path)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM service_orders').fetchone()[0], 0)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM service_order_cabinets').fetchone()[0], 0)
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
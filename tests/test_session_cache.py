@@ -0,0 +1,120 @@
+import unittest
+import sqlite3
+import os
+import sys
+import tempfile
+from werkzeug.security import generate_password_hash
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from app import app, auth_manager
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+class TestSessionCache(unittest.TestCase):
+    """AuthManager session validation cache and its explicit invalidation"""
+
+    def setUp(self):
+        """Create a database with an admin and a driver account"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.original_database = app_module.DATABASE
+        app_module.DATABASE = self.db_path
+        app.config['DATABASE'] = self.db_path
+        app.config['TESTING'] = True
+        app_module.init_db()
+        auth_manager.clear_session_cache()
+
+        db = sqlite3.connect(self.db_path)
+        # Session activity columns come from 002_activity_monitoring.sql and the
+        # soft delete columns from 001_user_soft_delete.py, neither run by init_db
+        with open(os.path.join(MIGRATIONS_DIR, '002_activity_monitoring.sql')) as f:
+            db.executescript(f.read())
+        db.execute('ALTER TABLE users ADD COLUMN is_deleted BOOLEAN DEFAULT 0')
+        db.execute('ALTER TABLE users ADD COLUMN deleted_at TIMESTAMP NULL')
+        db.execute('ALTER TABLE users ADD COLUMN deleted_by INTEGER NULL')
+        db.executemany('INSERT INTO users (id, username, email, password_hash, role) VALUES (?, ?, ?, ?, ?)', [
+            (1, 'boss', 'boss@example.com', generate_password_hash('secret'), 'admin'),
+            (2, 'driver1', 'driver1@example.com', generate_password_hash('secret'), 'driver'),
+        ])
+        db.commit()
+        db.close()
+
+        self.admin = self.login('boss')
+        self.driver = self.login('driver1')
+
+    def tearDown(self):
+        """Restore database configuration and remove the temp file"""
+        app_module.DATABASE = self.original_database
+        app.config['DATABASE'] = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def login(self, username):
+        """Log in on a fresh client and return it"""
+        client = app.test_client()
+        response = client.post('/api/auth/login', json={'username': username, 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        return client
+
+    def current_user(self, client):
+        """GET /api/auth/current-user and return the response"""
+        return client.get('/api/auth/current-user')
+
+    def test_repeat_requests_hit_cache(self):
+        """After the first validation, requests are answered without querying sessions"""
+        self.current_user(self.driver)
+        before = auth_manager.get_session_cache_stats()
+        for _ in range(3):
+            self.assertEqual(self.current_user(self.driver).status_code, 200)
+        after = auth_manager.get_session_cache_stats()
+
+        # before_request and require_auth each validate once per request
+        self.assertEqual(after['hits'] - before['hits'], 6)
+        self.assertEqual(after['misses'], before['misses'])
+
+        stats = self.admin.get('/api/admin/auth/session-cache').get_json()
+        self.assertGreater(stats['hit_rate'], 0)
+        self.assertEqual(stats['size'], 2)
+
+    def test_logout_invalidates_session(self):
+        """A logged-out session id is rejected even while it would still be cached"""
+        with self.driver.session_transaction() as flask_session:
+            session_id = flask_session['session_id']
+        self.driver.post('/api/auth/logout')
+
+        with self.driver.session_transaction() as flask_session:
+            flask_session['session_id'] = session_id
+        self.assertEqual(self.current_user(self.driver).status_code, 401)
+
+    def test_admin_changes_invalidate_target_sessions(self):
+        """Role changes, termination and deactivation take effect on the next request"""
+        self.current_user(self.driver)
+
+        self.admin.put('/api/users/2', json={'role': 'viewer'})
+        self.assertEqual(self.current_user(self.driver).get_json()['user']['role'], 'viewer')
+
+        with self.driver.session_transaction() as flask_session:
+            session_id = flask_session['session_id']
+        self.admin.post(f'/api/admin/sessions/{session_id}/terminate')
+        self.assertEqual(self.current_user(self.driver).status_code, 401)
+
+        driver = self.login('driver1')
+        self.current_user(driver)
+        self.admin.delete('/api/users/2')
+        self.assertEqual(self.current_user(driver).status_code, 401)
+
+    def test_batch_deactivate_invalidates_string_ids(self):
+        """Ids sent as JSON strings still drop the cached sessions after the commit"""
+        self.current_user(self.driver)
+
+        results = self.admin.post('/api/users/batch-deactivate',
+                                  json={'user_ids': ['2', '1', 'abc']}).get_json()['results']
+        self.assertEqual([(r['user_id'], r['status']) for r in results],
+                         [(2, 'success'), (1, 'failed'), ('abc', 'failed')])
+        self.assertEqual(results[1]['reason'], 'Cannot deactivate your own account')
+        self.assertEqual(results[2]['reason'], 'Invalid user ID')
+        self.assertEqual(self.current_user(self.driver).status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import sqlite3
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+import numpy as np
+from scipy import stats
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module
+from activity_trends_service import ActivityTrendsService, TrendAnalyzer
+from activity_trend_store import prune_trend_store
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+START = date(2024, 1, 1)
+DAYS = 60
+
+
+def users_on(offset):
+    """Synthetic unique_users series with a trend and weekly noise"""
+    return 50 + offset + (offset * 7) % 11
+
+
+class TestTrendStore(unittest.TestCase):
+    """Materialized moving averages and regression prefix sums"""
+
+    def setUp(self):
+        """Create a database with 60 days of summaries written outside the service"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.original_database = app_module.DATABASE
+        app_module.DATABASE = self.db_path
+        app_module.init_db()
+
+        db = sqlite3.connect(self.db_path)
+        with open(os.path.join(MIGRATIONS_DIR, '002_activity_monitoring.sql')) as f:
+            db.executescript(f.read())
+        db.executemany(
+            'INSERT INTO activity_summary_daily (date, unique_users, total_sessions) VALUES (?, ?, ?)',
+            [((START + timedelta(days=i)).isoformat(), users_on(i), 100 + i % 5) for i in range(DAYS)]
+        )
+        db.commit()
+        db.close()
+
+        self.service = ActivityTrendsService(self.db_path)
+        self.values = [users_on(i) for i in range(DAYS)]
+
+    def tearDown(self):
+        """Restore the database path and remove the file"""
+        app_module.DATABASE = self.original_database
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def read_range(self, first, last, **kwargs):
+        """unique_users points and fits for day offsets first..last"""
+        return self.service.get_trends_with_regression(
+            START + timedelta(days=first), START + timedelta(days=last), ['unique_users'], **kwargs)
+
+    def test_averages_use_preceding_days(self):
+        """Window averages at the start of a range include days before it"""
+        trends, _ = self.read_range(40, 49, windows=[14])
+        points = trends['unique_users']
+        self.assertEqual(len(points), 10)
+        for offset, point in zip(range(40, 50), points):
+            self.assertEqual(point['value'], self.values[offset])
+            self.assertAlmostEqual(point['7day_avg'], round(np.mean(self.values[offset - 6:offset + 1]), 2))
+            self.assertAlmostEqual(point['30day_avg'], round(np.mean(self.values[offset - 29:offset + 1]), 2))
+            self.assertAlmostEqual(point['14day_avg'], round(np.mean(self.values[offset - 13:offset + 1]), 2))
+
+    def test_regression_from_prefix_sums(self):
+        """Range regression matches a direct least-squares fit and feeds the summary"""
+        trends, regression = self.read_range(10, 45)
+        expected = stats.linregress(np.arange(36), self.values[10:46])
+
+        fit = regression['unique_users']
+        self.assertEqual(fit['n'], 36)
+        self.assertAlmostEqual(fit['slope'], expected.slope, places=6)
+        self.assertAlmostEqual(fit['intercept'], expected.intercept, places=6)
+        self.assertAlmostEqual(fit['r_value'], expected.rvalue, places=6)
+
+        summary = self.service.calculate_summary(trends, regression)['unique_users']
+        self.assertEqual(summary['trend_slope'], round(expected.slope, 3))
+        self.assertEqual(summary['peak_date'], (START + timedelta(days=int(np.argmax(self.values[10:46])) + 10)).isoformat())
+
+        analyzer = TrendAnalyzer()
+        self.assertEqual(analyzer.calculate_trend(trends['unique_users'], regression=fit),
+                         analyzer.calculate_trend(trends['unique_users']))
+
+    def test_changed_and_pruned_summaries_resync(self):
+        """A summary rewritten outside the writer is detected and rematerialized; pruning keeps fits valid"""
+        self.read_range(0, DAYS - 1)
+
+        changed = (START + timedelta(days=30)).isoformat()
+        db = sqlite3.connect(self.db_path)
+        db.execute('UPDATE activity_summary_daily SET unique_users = 500 WHERE date = ?', (changed,))
+        db.execute('DELETE FROM activity_summary_daily WHERE date < ?', ((START + timedelta(days=5)).isoformat(),))
+        prune_trend_store(db.cursor(), START + timedelta(days=5))
+        db.commit()
+        db.close()
+        self.values[30] = 500
+
+        trends, regression = self.read_range(25, 35)
+        point = trends['unique_users'][5]
+        self.assertEqual(point['value'], 500)
+        self.assertAlmostEqual(point['7day_avg'], round(np.mean(self.values[24:31]), 2))
+        self.assertAlmostEqual(regression['unique_users']['slope'],
+                               stats.linregress(np.arange(11), self.values[25:36]).slope, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import os
+import sys
+import time
+import threading
+from datetime import date, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trends_cache import TrendsCache, CacheWarmer
+
+
+class TestTrendsCache(unittest.TestCase):
+    """Byte budget, coalesced misses, stale-while-revalidate and hot-key warming"""
+
+    def setUp(self):
+        """Create a cache with a small byte budget"""
+        self.cache = TrendsCache(max_size=100, default_ttl=60, max_bytes=1000, stale_ttl=60)
+        self.today = date.today()
+
+    def test_evicts_by_bytes(self):
+        """Least recently used entries are evicted to stay within max_bytes"""
+        self.cache.set('a', 'x' * 400)
+        self.cache.set('b', 'y' * 400)
+        self.cache.get('a')
+        self.cache.set('c', 'z' * 400)
+
+        self.assertEqual(list(self.cache.cache), ['a', 'c'])
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertLessEqual(stats['bytes'], 1000)
+
+        self.cache.set('huge', 'h' * 2000)
+        self.assertIsNone(self.cache.get('huge'))
+        self.assertEqual(self.cache.get_stats()['oversize'], 1)
+
+    def test_concurrent_misses_share_one_load(self):
+        """Only the first miss runs the loader; the others wait for its result"""
+        key = self.cache.generate_key(self.today - timedelta(days=365), self.today, ['unique_users'])
+        calls = []
+        release = threading.Event()
+
+        def loader():
+            calls.append(1)
+            release.wait(2)
+            return {'rows': 365}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_load(key, loader)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + 2
+        while self.cache.get_stats()['coalesced_misses'] < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(source for _, source in results), ['coalesced'] * 4 + ['loaded'])
+        self.assertTrue(all(data == {'rows': 365} for data, _ in results))
+        self.assertEqual(self.cache.get_stats()['families']['365d'], {'hits': 0, 'misses': 5, 'hit_rate': 0})
+
+    def test_stale_entry_served_while_refreshing(self):
+        """An expired entry in its stale window is returned and refreshed once in the background"""
+        self.cache.set('k', 'old', ttl=60)
+        self.cache.cache['k']['expires_at'] = time.time() - 1
+
+        refreshed = threading.Event()
+
+        def loader():
+            refreshed.set()
+            return 'new'
+
+        self.assertEqual(self.cache.get_or_load('k', loader), ('old', 'stale'))
+        self.assertTrue(refreshed.wait(2))
+        deadline = time.time() + 2
+        while self.cache.in_flight and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.cache.get_or_load('k', loader), ('new', 'hit'))
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['stale_hits'], stats['refreshes']), (1, 1))
+
+    def test_warmer_uses_hot_keys(self):
+        """Warming targets the most requested ranges, re-anchored to today"""
+        hot = self.cache.generate_key(self.today - timedelta(days=14), self.today, ['total_sessions'])
+        cold = self.cache.generate_key(self.today - timedelta(days=3), self.today, ['unique_users'])
+        for _ in range(3):
+            self.cache.get(hot)
+        self.cache.get(cold)
+
+        warmer = CacheWarmer(self.cache, service=None, hot_key_limit=1,
+                             loader=lambda start, end, metrics: {'start': start.isoformat()})
+        self.assertEqual(warmer.get_ranges(),
+                         [(self.today - timedelta(days=14), self.today, ['total_sessions'])])
+
+        warmer.warm_cache()
+        self.assertIsNotNone(self.cache.get(hot))
+        self.assertIsNone(self.cache.get(cold))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,38 +8,71 @@ import time
 import hashlib
 import json
 from collections import OrderedDict
-from threading import RLock
+from threading import Event, RLock, Thread
 from datetime import datetime, timedelta, date
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class _Flight:
+    """A load in progress for one key; concurrent callers wait on it"""
+
+    def __init__(self):
+        self.done = Event()
+        self.data = None
+        self.error = None
+
+
 class TrendsCache:
     """
     Thread-safe in-memory cache with TTL and LRU eviction
     Designed for desktop clients that can handle larger payloads
+
+    Entries are bounded both by count and by their serialized size. Expired
+    entries are kept for a short stale window so get_or_load can serve them
+    while a single background load refreshes the key, and concurrent misses
+    for the same key share one load.
     """
     
-    def __init__(self, max_size: int = 100, default_ttl: int = 3600):
+    def __init__(self, max_size: int = 100, default_ttl: int = 3600,
+                 max_bytes: int = 32 * 1024 * 1024, stale_ttl: int = 300,
+                 load_timeout: float = 30.0):
         """
         Initialize the cache
         
         Args:
             max_size: Maximum number of entries in cache
             default_ttl: Default time-to-live in seconds (1 hour)
+            max_bytes: Memory budget for cached payloads (serialized size)
+            stale_ttl: Seconds an expired entry may still be served while refreshing
+            load_timeout: Seconds a coalesced miss waits for the leading load
         """
         self.cache = OrderedDict()
         self.max_size = max_size
         self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.load_timeout = load_timeout
         self.lock = RLock()
+        self.bytes = 0
+        self.in_flight = {}
+        # Parameters behind each generated key, used for families and hot-key warming
+        self.key_info = OrderedDict()
+        self.max_key_info = 1000
         self.stats = {
             'hits': 0,
             'misses': 0,
             'evictions': 0,
-            'sets': 0
+            'sets': 0,
+            'stale_hits': 0,
+            'coalesced_misses': 0,
+            'refreshes': 0,
+            'load_errors': 0,
+            'oversize': 0
         }
+        self.family_stats = {}
     
     def generate_key(self, start_date: date, end_date: date, metrics: List[str]) -> str:
         """
@@ -60,7 +93,84 @@ class TrendsCache:
         }
         
         key_string = json.dumps(key_data, sort_keys=True)
-        return hashlib.md5(key_string.encode()).hexdigest()
+        key = hashlib.md5(key_string.encode()).hexdigest()
+        self._remember_key(key, key_data)
+        return key
+    
+    def _remember_key(self, key: str, key_data: Dict):
+        """
+        Record the date range behind a key relative to today
+        
+        Args:
+            key: Cache key
+            key_data: Parameters the key was generated from
+        """
+        try:
+            start = date.fromisoformat(key_data['start'][:10])
+            end = date.fromisoformat(key_data['end'][:10])
+        except ValueError:
+            return
+        
+        span_days = (end - start).days
+        with self.lock:
+            info = self.key_info.get(key)
+            if info is None:
+                info = {
+                    'span_days': span_days,
+                    'metrics': key_data['metrics'],
+                    'family': f"{span_days}d",
+                    'requests': 0
+                }
+                self.key_info[key] = info
+                while len(self.key_info) > self.max_key_info:
+                    self.key_info.popitem(last=False)
+            # Ranges are warmed relative to the day they were last asked for
+            info['end_offset'] = (datetime.now().date() - end).days
+            self.key_info.move_to_end(key)
+    
+    def _record_request(self, key: str, hit: bool):
+        """Count a lookup against the key and its family"""
+        info = self.key_info.get(key)
+        family = info['family'] if info else 'other'
+        if info:
+            info['requests'] += 1
+            info['last_requested'] = time.time()
+        
+        counts = self.family_stats.setdefault(family, {'hits': 0, 'misses': 0})
+        counts['hits' if hit else 'misses'] += 1
+    
+    @staticmethod
+    def _estimate_size(data: Any) -> int:
+        """Approximate payload size as its serialized JSON length"""
+        try:
+            return len(json.dumps(data, default=str))
+        except (TypeError, ValueError):
+            return len(repr(data))
+    
+    def _lookup(self, key: str):
+        """
+        Find an entry and classify it
+        
+        Returns:
+            Tuple of (entry, state) where state is 'fresh', 'stale' or None
+        """
+        entry = self.cache.get(key)
+        if entry is None:
+            return None, None
+        
+        now = time.time()
+        if now <= entry['expires_at']:
+            return entry, 'fresh'
+        if now <= entry['expires_at'] + self.stale_ttl:
+            return entry, 'stale'
+        
+        self._remove(key)
+        return None, None
+    
+    def _remove(self, key: str):
+        """Drop an entry and release its bytes"""
+        entry = self.cache.pop(key)
+        self.bytes -= entry['size']
     
     def get(self, key: str) -> Optional[Any]:
         """
@@ -73,24 +183,105 @@ class TrendsCache:
             Cached data or None if not found/expired
         """
         with self.lock:
-            if key not in self.cache:
-                self.stats['misses'] += 1
-                return None
-            
-            entry = self.cache[key]
-            
-            # Check expiration
-            if time.time() > entry['expires_at']:
-                del self.cache[key]
+            entry, state = self._lookup(key)
+            if state != 'fresh':
                 self.stats['misses'] += 1
+                self._record_request(key, False)
                 return None
             
             # Move to end (most recently used)
             self.cache.move_to_end(key)
             self.stats['hits'] += 1
+            self._record_request(key, True)
             
             return entry['data']
     
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[int] = None):
+        """
+        Return cached data, loading it at most once per key on a miss
+        
+        A fresh entry is returned directly. An entry inside its stale window
+        is returned immediately and refreshed by one background load. On a
+        miss the first caller runs the loader; concurrent callers for the same
+        key wait for that result instead of loading again.
+        
+        Args:
+            key: Cache key
+            loader: Callable producing the data to cache
+            ttl: Time-to-live in seconds (uses default if None)
+        
+        Returns:
+            Tuple of (data, source) where source is 'hit', 'stale',
+            'coalesced' or 'loaded'
+        """
+        with self.lock:
+            entry, state = self._lookup(key)
+            if state == 'fresh':
+                self.cache.move_to_end(key)
+                self.stats['hits'] += 1
+                self._record_request(key, True)
+                return entry['data'], 'hit'
+            
+            if state == 'stale':
+                self.cache.move_to_end(key)
+                self.stats['stale_hits'] += 1
+                self._record_request(key, True)
+                if key not in self.in_flight:
+                    self.in_flight[key] = _Flight()
+                    self.stats['refreshes'] += 1
+                    refresh = Thread(target=self._load, args=(key, loader, ttl),
+                                     name='TrendsCacheRefresh', daemon=True)
+                    refresh.start()
+                return entry['data'], 'stale'
+            
+            self.stats['misses'] += 1
+            self._record_request(key, False)
+            flight = self.in_flight.get(key)
+            if flight is None:
+                self.in_flight[key] = _Flight()
+            else:
+                self.stats['coalesced_misses'] += 1
+        
+        if flight is None:
+            return self._load(key, loader, ttl), 'loaded'
+        
+        if flight.done.wait(self.load_timeout):
+            if flight.error is not None:
+                raise flight.error
+            return flight.data, 'coalesced'
+        
+        # The leading load is taking too long; do not hold this request hostage
+        logger.warning(f"Timed out waiting for in-flight load of {key}; loading directly")
+        return loader(), 'loaded'
+    
+    def _load(self, key: str, loader: Callable[[], Any], ttl: Optional[int]):
+        """
+        Run the loader for a key registered in in_flight and publish the result
+        
+        Args:
+            key: Cache key
+            loader: Callable producing the data
+            ttl: Time-to-live in seconds
+        
+        Returns:
+            Loaded data (exceptions are re-raised after waking waiters)
+        """
+        flight = self.in_flight[key]
+        try:
+            flight.data = loader()
+            self.set(key, flight.data, ttl)
+            return flight.data
+        except Exception as e:
+            flight.error = e
+            with self.lock:
+                self.stats['load_errors'] += 1
+            logger.error(f"Cache load failed for {key}: {e}")
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+            flight.done.set()
+    
     def set(self, key: str, data: Any, ttl: Optional[int] = None):
         """
         Store item in cache with TTL
@@ -103,23 +294,33 @@ class TrendsCache:
         if ttl is None:
             ttl = self.default_ttl
         
+        size = self._estimate_size(data)
+        
         with self.lock:
-            # Evict oldest if at capacity
-            if len(self.cache) >= self.max_size and key not in self.cache:
+            if key in self.cache:
+                self._remove(key)
+            
+            if size > self.max_bytes:
+                self.stats['oversize'] += 1
+                logger.warning(f"Not caching {key}: {size} bytes exceeds budget of {self.max_bytes}")
+                return
+            
+            # Evict least recently used until the new entry fits
+            while self.cache and (len(self.cache) >= self.max_size or self.bytes + size > self.max_bytes):
                 oldest_key = next(iter(self.cache))
-                del self.cache[oldest_key]
+                self._remove(oldest_key)
                 self.stats['evictions'] += 1
                 logger.debug(f"Evicted cache entry: {oldest_key}")
             
+            now = time.time()
             self.cache[key] = {
                 'data': data,
-                'expires_at': time.time() + ttl,
-                'created_at': time.time(),
-                'ttl': ttl
+                'expires_at': now + ttl,
+                'created_at': now,
+                'ttl': ttl,
+                'size': size
             }
-            
-            # Move to end (most recently used)
-            self.cache.move_to_end(key)
+            self.bytes += size
             self.stats['sets'] += 1
     
     def get_ttl(self, key: str) -> int:
@@ -140,10 +341,29 @@ class TrendsCache:
             remaining = max(0, entry['expires_at'] - time.time())
             return int(remaining)
     
+    def get_hot_keys(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Most requested keys with the date range they cover
+        
+        Args:
+            limit: Maximum number of keys to return
+        
+        Returns:
+            List of key info dictionaries, most requested first
+        """
+        with self.lock:
+            ranked = sorted(
+                ((key, info) for key, info in self.key_info.items() if info['requests'] > 0),
+                key=lambda item: item[1]['requests'],
+                reverse=True
+            )
+            return [dict(info, key=key) for key, info in ranked[:limit]]
+    
     def clear(self):
         """Clear all cache entries"""
         with self.lock:
             self.cache.clear()
+            self.bytes = 0
             logger.info("Cache cleared")
     
     def get_stats(self) -> Dict[str, Any]:
@@ -154,30 +374,49 @@ class TrendsCache:
             Dictionary with cache statistics
         """
         with self.lock:
-            total_requests = self.stats['hits'] + self.stats['misses']
-            hit_rate = (self.stats['hits'] / total_requests * 100) if total_requests > 0 else 0
+            total_requests = self.stats['hits'] + self.stats['stale_hits'] + self.stats['misses']
+            served = self.stats['hits'] + self.stats['stale_hits']
+            hit_rate = (served / total_requests * 100) if total_requests > 0 else 0
+            
+            families = {}
+            for family, counts in self.family_stats.items():
+                family_total = counts['hits'] + counts['misses']
+                families[family] = {
+                    'hits': counts['hits'],
+                    'misses': counts['misses'],
+                    'hit_rate': round(counts['hits'] / family_total * 100, 2) if family_total else 0
+                }
             
             return {
                 'size': len(self.cache),
                 'max_size': self.max_size,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
                 'hits': self.stats['hits'],
+                'stale_hits': self.stats['stale_hits'],
                 'misses': self.stats['misses'],
+                'coalesced_misses': self.stats['coalesced_misses'],
                 'hit_rate': round(hit_rate, 2),
                 'evictions': self.stats['evictions'],
-                'sets': self.stats['sets']
+                'sets': self.stats['sets'],
+                'refreshes': self.stats['refreshes'],
+                'load_errors': self.stats['load_errors'],
+                'oversize': self.stats['oversize'],
+                'in_flight': len(self.in_flight),
+                'families': families
             }
     
     def cleanup_expired(self):
-        """Remove expired entries from cache"""
+        """Remove entries past their stale window from cache"""
         with self.lock:
-            current_time = time.time()
+            cutoff = time.time() - self.stale_ttl
             expired_keys = [
                 key for key, entry in self.cache.items()
-                if current_time > entry['expires_at']
+                if cutoff > entry['expires_at']
             ]
             
             for key in expired_keys:
-                del self.cache[key]
+                self._remove(key)
             
             if expired_keys:
                 logger.debug(f"Cleaned up {len(expired_keys)} expired cache entries")
@@ -186,60 +425,88 @@ class TrendsCache:
 class CacheWarmer:
     """
     Preload cache with commonly requested data
+
+    Keys requested most often are re-anchored to today's date and refreshed;
+    the fixed common ranges are used until requests have been observed.
     """
     
-    def __init__(self, cache: TrendsCache, service):
+    def __init__(self, cache: TrendsCache, service, loader: Optional[Callable] = None,
+                 hot_key_limit: int = 10):
         """
         Initialize cache warmer
         
         Args:
             cache: TrendsCache instance
             service: ActivityTrendsService instance
+            loader: Callable(start_date, end_date, metrics) building the cached
+                response; defaults to trends plus summary
+            hot_key_limit: Number of hot keys to warm
         """
         self.cache = cache
         self.service = service
+        self.loader = loader or self._build_response
+        self.hot_key_limit = hot_key_limit
     
-    def warm_cache(self):
+    def _build_response(self, start_date: date, end_date: date, metrics: List[str]) -> Dict:
+        """Default response payload: trend data and summary"""
+        data = self.service.get_trends(start_date, end_date, metrics)
+        summary = self.service.calculate_summary(data)
+        
+        return {
+            'period': {
+                'start': start_date.isoformat(),
+                'end': end_date.isoformat()
+            },
+            'metrics': data,
+            'summary': summary
+        }
+    
+    def get_ranges(self) -> List[tuple]:
         """
-        Preload cache with common date ranges
-        Run this after server startup or cache clear
+        Ranges to warm: observed hot keys re-anchored to today, or common defaults
+        
+        Returns:
+            List of (start_date, end_date, metrics) tuples
         """
-        logger.info("Starting cache warming...")
+        today = datetime.now().date()
+        ranges = []
+        for info in self.cache.get_hot_keys(self.hot_key_limit):
+            end_date = today - timedelta(days=info['end_offset'])
+            start_date = end_date - timedelta(days=info['span_days'])
+            ranges.append((start_date, end_date, info['metrics']))
+        
+        if ranges:
+            return ranges
         
+        default_metrics = ['unique_users', 'total_sessions', 'total_page_views']
         common_ranges = [
             # Last 7 days
-            (datetime.now().date() - timedelta(days=7), datetime.now().date()),
+            (today - timedelta(days=7), today),
             # Last 30 days
-            (datetime.now().date() - timedelta(days=30), datetime.now().date()),
+            (today - timedelta(days=30), today),
             # Last 90 days
-            (datetime.now().date() - timedelta(days=90), datetime.now().date()),
+            (today - timedelta(days=90), today),
             # Current month
-            (datetime.now().date().replace(day=1), datetime.now().date()),
+            (today.replace(day=1), today),
             # Last month
             self._get_last_month_range()
         ]
-        
-        default_metrics = ['unique_users', 'total_sessions', 'total_page_views']
+        return [(start_date, end_date, default_metrics) for start_date, end_date in common_ranges]
+    
+    def warm_cache(self):
+        """
+        Preload cache with hot or common date ranges
+        Run this after server startup or cache clear
+        """
+        logger.info("Starting cache warming...")
         
         warmed_count = 0
-        for start_date, end_date in common_ranges:
+        for start_date, end_date, metrics in self.get_ranges():
             try:
-                # Fetch data
-                data = self.service.get_trends(start_date, end_date, default_metrics)
-                summary = self.service.calculate_summary(data)
-                
-                # Format response
-                response_data = {
-                    'period': {
-                        'start': start_date.isoformat(),
-                        'end': end_date.isoformat()
-                    },
-                    'metrics': data,
-                    'summary': summary
-                }
+                response_data = self.loader(start_date, end_date, metrics)
                 
                 # Cache it
-                cache_key = self.cache.generate_key(start_date, end_date, default_metrics)
+                cache_key = self.cache.generate_key(start_date, end_date, metrics)
                 self.cache.set(cache_key, response_data)
                 
                 warmed_count += 1
@@ -356,6 +623,26 @@ class RedisCache:
         except Exception as e:
             logger.error(f"Redis set error: {e}")
     
+    def get_or_load(self, key: str, loader, ttl: Optional[int] = None):
+        """
+        Same contract as TrendsCache.get_or_load, without coalescing
+        
+        Args:
+            key: Cache key
+            loader: Callable producing the data to cache
+            ttl: Time-to-live in seconds
+        
+        Returns:
+            Tuple of (data, source)
+        """
+        data = self.get(key)
+        if data is not None:
+            return data, 'hit'
+        
+        data = loader()
+        self.set(key, data, ttl)
+        return data, 'loaded'
+    
     def get_ttl(self, key: str) -> int:
         """
         Get remaining TTL from Redis